@@ -0,0 +1,368 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Control plane throughput and latency
+
+Runs a FosAgent with the simulated OS plugin and the no-op runtime plugin (benchmarks/plugins)
+against the in-process store (benchmarks/memstore.py) and drives it through the API:
+
+- plugin load: from the plugin request in the desired store to the plugin listed in the actual store
+- store: put, get, dput and getAll operations per second of fog05.store.Store
+- lifecycle: N entities go concurrently through define, configure, run, stop, clean and undefine,
+  latency of every action and actions per second, for every N in --concurrency
+
+The results are written as JSON, two results are compared with the compare command,
+which exits with 1 when a metric got worse than the threshold
+
+    python3 benchmarks/bench_agent.py run [-c 1,10,100,1000] [--latency s] [--failure-rate p] [-o result.json]
+    python3 benchmarks/bench_agent.py compare base.json new.json [--threshold 10]
+'''
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import memstore
+from fog05 import Metrics
+from fog05.store import Store
+from fog05.fosagent import FosAgent
+from fog05.api import API
+
+
+PLUGINS_DIR = os.path.join(BENCH_DIR, 'plugins')
+RUNTIME = 'noop_native'
+ACTIONS = ('define', 'configure', 'run', 'stop', 'clean', 'undefine')
+TIMEOUT = 60
+
+_devnull = open(os.devnull, 'w')
+
+AGENT_CONF = '''[agent]
+SYSID = 0
+YAKS = {yaks}
+HEARTBEAT = {heartbeat}
+
+[plugins]
+autoload = false
+isolated = []
+
+[logging]
+handlers = ["file"]
+file = {log}
+level = WARNING
+'''
+
+
+def start_agent(yaks, work_dir, heartbeat=2.0):
+    '''
+    :param yaks: name of the in-process store shared with the API
+    :param work_dir: directory for the configuration, the log and the local state
+    :return: the running agent
+    '''
+    os.makedirs(work_dir, exist_ok=True)
+    conf = os.path.join(work_dir, 'agent.ini')
+    with open(conf, 'w') as f:
+        f.write(AGENT_CONF.format(yaks=yaks, heartbeat=heartbeat, log=os.path.join(work_dir, 'agent.log')))
+    # the banner and the records logged before the configuration is read are not part of the results
+    with contextlib.redirect_stdout(_devnull):
+        return FosAgent(debug=True, plugins_path=PLUGINS_DIR, configuration=conf).run()
+
+
+def stop_agent(agent):
+    try:
+        agent.stop()
+    except SystemExit:
+        pass
+
+
+def load_runtime(api, agent, configuration):
+    '''
+    Ask the agent to load the no-op runtime through the desired store, as the API does
+
+    :return: seconds until the plugin is listed in the actual store
+    '''
+    with open(os.path.join(PLUGINS_DIR, RUNTIME, '{}_plugin.json'.format(RUNTIME))) as f:
+        manifest = json.load(f)
+    manifest.update({'status': 'add', 'configuration': configuration})
+    uri = '{}/plugins'.format(agent.ahome)
+    start = time.time()
+    agent.dstore.put('{}/plugins'.format(agent.dhome), json.dumps({'plugins': [manifest]}))
+    while time.time() - start < TIMEOUT:
+        plugins = json.loads(api.store.actual.get(uri) or '{}').get('plugins', [])
+        if any(p.get('name') == RUNTIME for p in plugins):
+            return time.time() - start
+        time.sleep(0.0005)
+    raise RuntimeError('{} not loaded after {}s'.format(RUNTIME, TIMEOUT))
+
+
+class Waiter(object):
+    '''
+    Follows the status of an entity or instance in the actual store,
+    it subscribes before the action is requested so no update is missed
+    '''
+
+    def __init__(self, store, uri):
+        self.store = store
+        self.uri = uri
+        self.cond = threading.Condition()
+        self.status = None
+        self.subscription = store.observe(uri, self.__react)
+
+    def wait(self, status):
+        '''
+        :return: the status reached, status or error
+        '''
+        deadline = time.time() + TIMEOUT
+        with self.cond:
+            while self.status not in [status, 'error']:
+                if not self.cond.wait(deadline - time.time()):
+                    raise RuntimeError('{} not {} after {}s'.format(self.uri, status, TIMEOUT))
+            res = self.status
+            self.status = None
+            return res
+
+    def wait_removed(self):
+        '''
+        :return: removed or error
+        '''
+        # removals are not notified, the key is polled
+        deadline = time.time() + TIMEOUT
+        value = self.store.get(self.uri)
+        while value is not None:
+            if json.loads(value).get('status') == 'error':
+                return 'error'
+            if time.time() > deadline:
+                raise RuntimeError('{} not removed after {}s'.format(self.uri, TIMEOUT))
+            time.sleep(0.0005)
+            value = self.store.get(self.uri)
+        return 'removed'
+
+    def close(self):
+        self.store.overlook(self.subscription)
+
+    def __react(self, key, value, v):
+        if value is None or value == '':
+            return
+        with self.cond:
+            self.status = json.loads(value).get('status')
+            self.cond.notify_all()
+
+
+def lifecycle(api, node_uuid, handler, samples, errors):
+    entity_uuid = str(uuid.uuid4())
+    instance_uuid = str(uuid.uuid4())
+    manifest = {'uuid': entity_uuid, 'name': 'bench', 'type': 'native',
+                'entity_data': {'name': 'bench', 'uuid': entity_uuid, 'command': 'true', 'source': '', 'args': []}}
+    e_uri = '{}/{}/runtime/{}/entity/{}'.format(api.a_root, node_uuid, handler, entity_uuid)
+    i_uri = '{}/instance/{}'.format(e_uri, instance_uuid)
+    entity = Waiter(api.store.actual, e_uri)
+    instance = Waiter(api.store.actual, i_uri)
+    steps = [
+        ('define', lambda: api.entity.define(manifest, node_uuid), lambda: entity.wait('defined')),
+        ('configure', lambda: api.entity.configure(entity_uuid, node_uuid, instance_uuid), lambda: instance.wait('configured')),
+        ('run', lambda: api.entity.run(entity_uuid, node_uuid, instance_uuid), lambda: instance.wait('run')),
+        ('stop', lambda: api.entity.stop(entity_uuid, node_uuid, instance_uuid), lambda: instance.wait('stop')),
+        ('clean', lambda: api.entity.clean(entity_uuid, node_uuid, instance_uuid), instance.wait_removed),
+        ('undefine', lambda: api.entity.undefine(entity_uuid, node_uuid), entity.wait_removed)]
+    try:
+        for action, request, wait in steps:
+            start = time.time()
+            request()
+            status = wait()
+            if status == 'error':
+                errors.append(action)
+                return
+            samples.get(action).append(time.time() - start)
+    except Exception as e:
+        errors.append('{}: {}'.format(action, e))
+    finally:
+        entity.close()
+        instance.close()
+
+
+def run_lifecycles(api, node_uuid, handler, n):
+    '''
+    :return: ({action: [latencies]}, errors, wall clock seconds)
+    '''
+    samples = dict((a, []) for a in ACTIONS)
+    errors = []
+    threads = [threading.Thread(target=lifecycle, args=(api, node_uuid, handler, samples, errors), daemon=True)
+               for _ in range(0, n)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, errors, time.time() - start
+
+
+def store_rates(yaks, n):
+    '''
+    :return: {operation: operations per second} of fog05.store.Store
+    '''
+    store = Store(memstore.MemYAKS.login(yaks), '/bench', '/bench/node', 1024)
+    keys = ['/bench/node/key{}'.format(i) for i in range(0, 100)]
+    value = json.dumps({'status': 'run', 'entity_data': {'name': 'bench', 'args': ['a', 'b'], 'cpu': 1, 'memory': 512}})
+    operations = [
+        ('put', lambda i: store.put(keys[i % 100], value)),
+        ('get', lambda i: store.get(keys[i % 100])),
+        ('dput', lambda i: store.dput('{}#status=stop&entity_data.cpu={}'.format(keys[i % 100], i))),
+        ('getAll', lambda i: store.getAll('/bench/node/*'))]
+    res = {}
+    for name, op in operations:
+        start = time.time()
+        for i in range(0, n):
+            op(i)
+        res.update({name: n / (time.time() - start)})
+    store.close()
+    return res
+
+
+def summary(values):
+    values = sorted(values)
+    if len(values) == 0:
+        return None
+    return {'mean': sum(values) / len(values), 'p50': values[int(0.5 * (len(values) - 1))],
+            'p95': values[int(round(0.95 * (len(values) - 1)))], 'max': values[-1]}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    memstore.install()
+    yaks = 'bench-{}'.format(uuid.uuid4())
+    work_dir = tempfile.mkdtemp(prefix='fos_bench_')
+    metrics = {}
+
+    def add(name, value, unit, better):
+        metrics.update({name: {'value': value, 'unit': unit, 'better': better}})
+
+    for op, rate in store_rates(yaks, args.store_ops).items():
+        add('store.{}'.format(op), rate, 'ops/s', 'higher')
+        print('store {:<8} {:>12.0f} ops/s'.format(op, rate))
+
+    agent = start_agent(yaks, work_dir)
+    api = API(endpoint=yaks)
+    try:
+        load = load_runtime(api, agent, {'latency': args.latency, 'failure_rate': args.failure_rate})
+        add('plugin_load.total', load, 's', 'lower')
+        for _, lbl, value in Metrics.REGISTRY.gauge('fos_plugin_load_seconds', '', ['plugin']).samples():
+            if lbl.get('plugin') == RUNTIME:
+                add('plugin_load.run', value, 's', 'lower')
+        print('plugin load {:.4f}s'.format(load))
+
+        handler = json.loads(api.store.actual.get('{}/plugins'.format(agent.ahome)))
+        handler = [p.get('uuid') for p in handler.get('plugins') if p.get('name') == RUNTIME][0]
+        for n in args.concurrency:
+            samples, errors, wall = run_lifecycles(api, str(agent.uuid), handler, n)
+            done = sum(len(v) for v in samples.values())
+            add('lifecycle.{}.throughput'.format(n), done / wall, 'actions/s', 'higher')
+            add('lifecycle.{}.errors'.format(n), len(errors), 'actions', 'lower')
+            print('N={:<5} {:>9.1f} actions/s {} errors'.format(n, done / wall, len(errors)))
+            for e in sorted(set(errors)):
+                print('    error: {}'.format(e))
+            for action in ACTIONS:
+                s = summary(samples.get(action))
+                if s is None:
+                    continue
+                for k in ['mean', 'p50', 'p95', 'max']:
+                    add('lifecycle.{}.{}.{}'.format(n, action, k), s.get(k), 's', 'lower')
+                print('    {:<10} mean {:.4f}s p50 {:.4f}s p95 {:.4f}s max {:.4f}s'.format(
+                    action, s.get('mean'), s.get('p50'), s.get('p95'), s.get('max')))
+    finally:
+        api.close()
+        stop_agent(agent)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        memstore.reset()
+
+    result = {'meta': {'commit': git_commit(), 'python': platform.python_version(), 'time': time.time(),
+                       'concurrency': args.concurrency, 'latency': args.latency, 'failure_rate': args.failure_rate},
+              'metrics': metrics}
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print('results written to {}'.format(args.output))
+    return 0
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f).get('metrics')
+    with open(args.new) as f:
+        new = json.load(f).get('metrics')
+    regressions = []
+    for name in sorted(set(base.keys()) & set(new.keys())):
+        old, cur = base.get(name).get('value'), new.get(name).get('value')
+        if old == 0:
+            change = 0.0 if cur == 0 else float('inf')
+        else:
+            change = (cur - old) / abs(old) * 100
+        worse = change if new.get(name).get('better') == 'lower' else -change
+        flag = ''
+        if worse > args.threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif worse < -args.threshold:
+            flag = 'improved'
+        print('{:<40} {:>14.6g} {:>14.6g} {:>+8.1f}% {}'.format(name, old, cur, change, flag))
+    for name in sorted(set(base.keys()) ^ set(new.keys())):
+        print('{:<40} only in {}'.format(name, args.base if name in base else args.new))
+    print('{} regressions over {}%'.format(len(regressions), args.threshold))
+    return 1 if len(regressions) > 0 else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Control plane throughput and latency')
+    commands = parser.add_subparsers(dest='command')
+    p = commands.add_parser('run', help='run the benchmark')
+    p.add_argument('-c', '--concurrency', type=lambda s: [int(x) for x in s.split(',')], default=[1, 10, 100, 1000],
+                   help='comma separated numbers of concurrent entities')
+    p.add_argument('--latency', type=float, default=0.0, help='seconds spent by the runtime in every action')
+    p.add_argument('--failure-rate', type=float, default=0.0, help='probability that a runtime action fails')
+    p.add_argument('--store-ops', type=int, default=10000, help='operations per store measure')
+    p.add_argument('-o', '--output', default=None, help='JSON file for the results')
+    p = commands.add_parser('compare', help='compare two results')
+    p.add_argument('base')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=10.0, help='percent change reported as regression')
+    args = parser.parse_args()
+    if args.command == 'run':
+        sys.exit(run(args))
+    elif args.command == 'compare':
+        sys.exit(compare(args))
+    parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Config drive creation time for sequential KVM configures
+
+Compares templates/create_config_drive.sh (temporary files, mkisofs) as called by the
+KVM plugin before, with the in-process KVMLibvirtConfigDrive, for new instances and
+for the same contents built again. The script needs mkisofs and is skipped without it
+
+    python3 benchmarks/bench_config_drive.py [-n configures]
+'''
+
+import os
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+
+
+KVM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plugins', 'KVMLibvirt')
+SCRIPT = os.path.join(KVM_DIR, 'templates', 'create_config_drive.sh')
+USER_DATA = '#cloud-config\npackages:\n  - nginx\n' * 10
+SSH_KEY = 'ssh-rsa AAAAB3NzaC1yc2E bench'
+
+
+def load_config_drive():
+    # loading the module file directly avoids importing libvirt with the plugin
+    spec = importlib.util.spec_from_file_location('KVMLibvirtConfigDrive', os.path.join(KVM_DIR, 'KVMLibvirtConfigDrive.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def vendor_data(instance_uuid, entity_uuid):
+    with open(os.path.join(KVM_DIR, 'templates', 'vendor_data.yaml')) as f:
+        template = f.read()
+    return template.replace('{{ instanceid }}', instance_uuid).replace('{{ entityid }}', entity_uuid).replace('{{ nodeid }}', 'bench')
+
+
+def write(path, content):
+    with open(path, 'wb' if isinstance(content, bytes) else 'w') as f:
+        f.write(content)
+
+
+def script_configure(work_dir, entity_uuid, instance_uuid):
+    vendor = os.path.join(work_dir, 'vendor_{}.yaml'.format(instance_uuid))
+    user = os.path.join(work_dir, 'userdata_{}'.format(entity_uuid))
+    key = os.path.join(work_dir, 'key_{}.pub'.format(entity_uuid))
+    write(vendor, vendor_data(instance_uuid, entity_uuid))
+    write(user, USER_DATA)
+    write(key, SSH_KEY)
+    cmd = [SCRIPT, '--hostname', 'vm-bench', '--uuid', entity_uuid, '--vendor-data', vendor, '--user-data', user,
+           '--ssh-key', key, os.path.join(work_dir, '{}_config.iso'.format(instance_uuid))]
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+    for f in [vendor, user, key]:
+        os.remove(f)
+
+
+def native_configure(drive, work_dir, entity_uuid, instance_uuid):
+    iso = drive.build(entity_uuid, 'vm-bench', vendor_data(instance_uuid, entity_uuid), USER_DATA, SSH_KEY)
+    write(os.path.join(work_dir, '{}_config.iso'.format(instance_uuid)), iso)
+
+
+def timed(fun, n):
+    start = time.time()
+    for _ in range(0, n):
+        fun()
+    return (time.time() - start) / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Config drive creation time for sequential KVM configures')
+    parser.add_argument('-n', type=int, default=100, help='number of sequential configures')
+    args = parser.parse_args()
+
+    ConfigDrive = load_config_drive().ConfigDrive
+    entity_uuid = str(uuid.uuid4())
+    same = str(uuid.uuid4())
+    work_dir = tempfile.mkdtemp(prefix='fos_bench_drive')
+    try:
+        print('{:<24} {:>12}'.format('config drive', 'ms/configure'))
+        if shutil.which('mkisofs') is not None:
+            print('{:<24} {:>12.2f}'.format('script', timed(lambda: script_configure(work_dir, entity_uuid, str(uuid.uuid4())), args.n)))
+        else:
+            print('{:<24} {:>12}'.format('script', 'no mkisofs'))
+        drive = ConfigDrive()
+        print('{:<24} {:>12.2f}'.format('native', timed(lambda: native_configure(drive, work_dir, entity_uuid, str(uuid.uuid4())), args.n)))
+        print('{:<24} {:>12.2f}'.format('native same contents', timed(lambda: native_configure(drive, work_dir, entity_uuid, same), args.n)))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Memory used by entity instances
+
+Builds N container instances of one entity and measures them with tracemalloc:
+the old layout (plain objects, each instance with its own copy of the manifest fragments,
+as when they are rebuilt from the local state) against the slotted classes,
+with copied and with shared fragments
+
+    python3 benchmarks/bench_entities.py [-n instances]
+'''
+
+import os
+import sys
+import json
+import uuid
+import argparse
+import tracemalloc
+import importlib.util
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def load(name, path):
+    # loading the module files directly avoids importing the whole fog05 package
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, *path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules.update({name: module})
+    spec.loader.exec_module(module)
+    return module
+
+
+class PlainInstance(object):
+    # same fields as LXDEntityInstance before the slotted layout
+
+    def __init__(self, uuid, name, networks, image, user_file, ssh_key, storage, profiles, entity_uuid):
+        self.state = None
+        self.uuid = uuid
+        self.name = name
+        self.entity_uuid = entity_uuid
+        self.networks = networks
+        self.image = image
+        self.user_file = user_file
+        self.ssh_key = ssh_key
+        self.storage = storage
+        self.profiles = profiles
+        self.devices = None
+        self.conf = None
+
+
+def manifest():
+    networks = [{'intf_name': 'eth{}'.format(i), 'br_name': 'br{}'.format(i), 'type': 'bridge',
+                 'connection_point': {'connection_point_uuid': str(uuid.uuid4()), 'virtual_link_uuid': str(uuid.uuid4())}}
+                for i in range(0, 4)]
+    return {'networks': networks,
+            'image': {'uuid': str(uuid.uuid4()), 'name': 'ct_img', 'base_image': '/opt/fos/lxd/images/ct.tar.gz',
+                      'type': 'lxd', 'format': 'tar.gz'},
+            'user_file': '#cloud-config\npackages:\n  - nginx\n  - htop\nruncmd:\n  - systemctl start nginx\n' * 20,
+            'ssh_key': 'ssh-rsa {} fos@node'.format('A' * 372),
+            'storage': [{'name': 'root', 'pool': 'default', 'path': '/'}],
+            'profiles': ['default']}
+
+
+def build(cls, entity_uuid, data, n, copied):
+    instances = {}
+    for i in range(0, n):
+        d = json.loads(json.dumps(data)) if copied else data
+        k = str(uuid.uuid4())
+        instances.update({k: cls(k, 'ct{}'.format(i), d.get('networks'), d.get('image'), d.get('user_file'),
+                                 d.get('ssh_key'), d.get('storage'), d.get('profiles'), entity_uuid)})
+    return instances
+
+
+def measure(cls, entity_uuid, data, n, copied):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = build(cls, entity_uuid, data, n, copied)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del instances
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory used by entity instances')
+    parser.add_argument('-n', type=int, default=10000, help='number of instances')
+    args = parser.parse_args()
+
+    load('fog05.interfaces.States', ['fog05', 'interfaces', 'States.py'])
+    load('fog05.interfaces.EntityInstance', ['fog05', 'interfaces', 'EntityInstance.py'])
+    LXDEntityInstance = load('LXDEntityInstance', ['plugins', 'LXD', 'LXDEntityInstance.py']).LXDEntityInstance
+
+    entity_uuid = str(uuid.uuid4())
+    data = manifest()
+    cases = [('plain, copied', PlainInstance, True),
+             ('slots, copied', LXDEntityInstance, True),
+             ('slots, shared', LXDEntityInstance, False)]
+
+    print('{:<16} {:>12} {:>12}'.format('layout', 'total KiB', 'B/instance'))
+    for name, cls, copied in cases:
+        size = measure(cls, entity_uuid, data, args.n, copied)
+        print('{:<16} {:>12.0f} {:>12.0f}'.format(name, size / 1024, size / args.n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Logging overhead per event
+
+Compares the eager call style ('...'.format(...) at the call site) with the lazy one
+(fmt, *args) for a store event carrying a JSON value, when the record is filtered by level,
+when the logger is disabled and when the record is emitted to a NullHandler
+
+    python3 benchmarks/bench_logging.py [-n events]
+'''
+
+import os
+import json
+import timeit
+import logging
+import argparse
+import importlib.util
+
+
+def load_dlogger():
+    # loading the module file directly avoids importing the whole fog05 package
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fog05', 'DLogger.py')
+    spec = importlib.util.spec_from_file_location('DLogger', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.DLogger
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DLogger overhead per event')
+    parser.add_argument('-n', type=int, default=200000, help='number of events')
+    args = parser.parse_args()
+
+    DLogger = load_dlogger()
+    root = DLogger(debug_flag=True)
+    for h in list(root.logger.handlers):
+        root.logger.removeHandler(h)
+    root.logger.addHandler(logging.NullHandler())
+    root.logger.propagate = False
+    logger = root.component('bench')
+
+    uri = '/dfos/0/a1b2c3/runtime/d4e5f6/entity/0a1b2c3d'
+    value = json.dumps({'status': 'define', 'entity_data': {'name': 'vm', 'cpu': 1, 'memory': 512, 'disk_size': 10,
+                                                            'networks': [{'mac': 'd2:e3:ed:6f:e3:ef', 'br_name': 'br0'}]}})
+    v = 0
+
+    def eager():
+        logger.debug('__react_to_cache()', 'React to to URI: {} Value: {} Version: {}'.format(uri, value, v))
+
+    def lazy():
+        logger.debug('__react_to_cache()', 'React to to URI: %s Value: %s Version: %s', uri, value, v)
+
+    # case name, level of the component, logger enabled
+    cases = [('filtered', 'INFO', True), ('disabled', 'DEBUG', False), ('emitted', 'DEBUG', True)]
+
+    print('{:<10} {:>12} {:>12}'.format('case', 'eager ns/ev', 'lazy ns/ev'))
+    for name, level, enabled in cases:
+        root.set_level(level, 'bench')
+        if enabled:
+            root.enable()
+        else:
+            root.disable()
+        te = min(timeit.repeat(eager, number=args.n, repeat=3)) / args.n * 1e9
+        tl = min(timeit.repeat(lazy, number=args.n, repeat=3)) / args.n * 1e9
+        print('{:<10} {:>12.1f} {:>12.1f}'.format(name, te, tl))
+    root.enable()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Manifest validations per second
+
+Compares jsonschema.validate (validator rebuilt and schema checked at every call)
+with the cached validators of fog05.Schemas, on VM and container manifests
+
+    python3 benchmarks/bench_schemas.py [-n validations] [--networks N]
+'''
+
+import os
+import time
+import uuid
+import argparse
+import importlib.util
+import jsonschema
+
+
+def load_schemas():
+    # loading the module file directly avoids importing the whole fog05 package
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fog05', 'Schemas.py')
+    spec = importlib.util.spec_from_file_location('Schemas', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def networks(n):
+    return [{'intf_name': 'eth{}'.format(i), 'br_name': 'br{}'.format(i), 'mac_address': 'be:ef:be:ef:00:{:02x}'.format(i % 256),
+             'connection_point': {'connection_point_uuid': str(uuid.uuid4()), 'virtual_link_uuid': str(uuid.uuid4())}}
+            for i in range(0, n)]
+
+
+def vm_manifest(n):
+    return {'name': 'vm-bench', 'uuid': str(uuid.uuid4()), 'cpu': 2, 'memory': 2048, 'disk_size': 20,
+            'base_image': 'http://192.168.1.142/xenial-server-cloudimg-amd64-disk1.img',
+            'user-data': '#cloud-config\npackages:\n  - nginx\n' * 10, 'ssh-key': 'ssh-rsa AAAAB3NzaC1yc2E bench',
+            'networks': networks(n)}
+
+
+def container_manifest(n):
+    return {'name': 'ct-bench', 'uuid': str(uuid.uuid4()),
+            'base_image': 'http://192.168.1.142/ubuntu-xenial-lxd.tar.gz',
+            'storage': {'name': 'default', 'path': '/var/lib/lxd', 'pool': 'default'}, 'profile': 'default',
+            'networks': networks(n)}
+
+
+def rate(fun, manifest, n):
+    start = time.time()
+    for _ in range(0, n):
+        fun(manifest)
+    return n / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manifest validations per second')
+    parser.add_argument('-n', type=int, default=2000, help='number of validations')
+    parser.add_argument('--networks', type=int, default=8, help='network interfaces in each manifest')
+    args = parser.parse_args()
+
+    Schemas = load_schemas()
+    cases = [('vm', vm_manifest(args.networks)), ('container', container_manifest(args.networks))]
+
+    print('{:<10} {:>14} {:>14}'.format('manifest', 'jsonschema/s', 'cached/s'))
+    for name, manifest in cases:
+        schema = Schemas.get_schema(name)
+        plain = rate(lambda m: jsonschema.validate(m, schema), manifest, args.n)
+        cached = rate(lambda m: Schemas.validate(m, name), manifest, args.n)
+        print('{:<10} {:>14.0f} {:>14.0f}'.format(name, plain, cached))
+
+
+if __name__ == '__main__':
+    main()
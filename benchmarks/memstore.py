@@ -0,0 +1,180 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+In-process store with the YAKS client interface used by fog05.store
+
+Agents and APIs that log in with the same server address share the same key space,
+so a whole fog05 system can run in one process without a YAKS server.
+install() makes fog05.store and fog05.fosagent use it:
+
+    memstore.install()
+    agent = FosAgent(...)            # YAKS = <any name>
+    api = API(endpoint=<same name>)
+
+As with YAKS, every notification is delivered in its own thread
+'''
+
+import re
+import threading
+import itertools
+from yaks import Selector
+
+
+class MemServer(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.subscriptions = {}
+        self.ids = itertools.count()
+        self.operations = 0
+
+    def put(self, key, value):
+        with self.lock:
+            self.data.update({key: value})
+            self.operations += 1
+            matching = [cb for (regex, cb) in self.subscriptions.values() if regex.match(key)]
+        for cb in matching:
+            threading.Thread(target=cb, args=([{'key': key, 'value': value}],), daemon=True).start()
+        return True
+
+    def get(self, selector):
+        with self.lock:
+            self.operations += 1
+            if '*' not in selector:
+                v = self.data.get(selector, None)
+                return [] if v is None else [{'key': selector, 'value': v}]
+            regex = _compile(selector)
+            return [{'key': k, 'value': v} for k, v in self.data.items() if regex.match(k)]
+
+    def remove(self, key):
+        with self.lock:
+            self.operations += 1
+            self.data.pop(key, None)
+        return True
+
+    def subscribe(self, selector, callback):
+        with self.lock:
+            sid = next(self.ids)
+            self.subscriptions.update({sid: (_compile(selector), callback)})
+        return sid
+
+    def unsubscribe(self, sid):
+        with self.lock:
+            self.subscriptions.pop(sid, None)
+        return True
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_server(address):
+    with _servers_lock:
+        server = _servers.get(address, None)
+        if server is None:
+            server = MemServer()
+            _servers.update({address: server})
+        return server
+
+
+def reset():
+    '''
+    Drop all the in-process servers
+    '''
+    with _servers_lock:
+        _servers.clear()
+
+
+def _compile(selector):
+    # '*' matches one path segment, '**' any number of them
+    parts = []
+    for token in re.split(r'(\*\*|\*)', selector):
+        if token == '**':
+            parts.append('.*')
+        elif token == '*':
+            parts.append('[^/]*')
+        else:
+            parts.append(re.escape(token))
+    return re.compile('^{}$'.format(''.join(parts)))
+
+
+class MemWorkspace(object):
+
+    def __init__(self, server, path):
+        self.server = server
+        self.path = path
+        self.subscriptions = []
+
+    def put(self, path, value):
+        return self.server.put(str(path), value)
+
+    def update(self, path, value):
+        return self.server.put(str(path), value)
+
+    def remove(self, path):
+        return self.server.remove(str(path))
+
+    def get(self, selector, paths_as_strings=True):
+        if isinstance(selector, Selector):
+            selector = selector.get_path()
+        return self.server.get(selector)
+
+    def subscribe(self, selector, callback=None, paths_as_strings=True):
+        if isinstance(selector, Selector):
+            selector = selector.get_path()
+        sid = self.server.subscribe(selector, callback)
+        self.subscriptions.append(sid)
+        return sid
+
+    def unsubscribe(self, subscription_id):
+        if subscription_id in self.subscriptions:
+            self.subscriptions.remove(subscription_id)
+        return self.server.unsubscribe(subscription_id)
+
+    def eval(self, path, computation, paths_as_strings=True):
+        return True
+
+    def dispose(self):
+        for sid in list(self.subscriptions):
+            self.unsubscribe(sid)
+        return True
+
+
+class MemYAKS(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.is_connected = True
+
+    @classmethod
+    def login(cls, server_address, server_port=7887, properties={}):
+        return cls(get_server(server_address))
+
+    def workspace(self, path, properties=None):
+        return MemWorkspace(self.server, path)
+
+    def logout(self):
+        self.is_connected = False
+
+
+def install():
+    '''
+    Make the fog05 agent and API use the in-process store
+    '''
+    import fog05.store
+    import fog05.fosagent
+    fog05.store.YAKS = MemYAKS
+    fog05.fosagent.YAKS = MemYAKS
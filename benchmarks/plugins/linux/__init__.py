@@ -0,0 +1,28 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+
+import sys
+import os
+import uuid
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(os.path.abspath(file_dir))
+VERSION = 1
+
+
+def run(*args, **kwargs):
+    from sim_linux_plugin import SimLinux
+    l = SimLinux('linux', VERSION, kwargs.get('agent'), str(uuid.uuid4()))
+    return l
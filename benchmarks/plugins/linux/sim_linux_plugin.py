@@ -0,0 +1,175 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Simulated OS plugin for the benchmarks
+
+The node inventory is synthetic and nothing is executed, files only live in memory,
+so many agents can run in the same process. The inventory of the next nodes is chosen with
+
+    SimLinux.inventory = lambda plugin: {'cpus': 4, 'ram': 8192, 'disk': 64, 'interfaces': 2}
+
+agents keep their local state in <SimLinux.BASE_DIR>/<node uuid>
+'''
+
+import os
+import uuid
+import tempfile
+import threading
+from fog05.interfaces.OSPlugin import OSPlugin
+
+
+DEFAULT_INVENTORY = {'cpus': 4, 'ram': 8192, 'disk': 64, 'interfaces': 2}
+
+
+class SimLinux(OSPlugin):
+
+    BASE_DIR = os.path.join(tempfile.gettempdir(), 'fos_bench')
+    inventory = None
+
+    def __init__(self, name, version, agent, plugin_uuid):
+        super(SimLinux, self).__init__(version, plugin_uuid)
+        self.name = name
+        self.agent = agent
+        self.logger = self.agent.logger.component(name)
+        self.node_uuid = str(uuid.uuid4())
+        self.hostname = 'sim-{}'.format(self.node_uuid[:8])
+        inventory = dict(DEFAULT_INVENTORY)
+        if SimLinux.inventory is not None:
+            inventory.update(SimLinux.inventory(self))
+        self.cpus = inventory.get('cpus')
+        self.ram = inventory.get('ram')
+        self.disk = inventory.get('disk')
+        self.interfaces = inventory.get('interfaces')
+        self.files = {}
+        self.lock = threading.Lock()
+        self.io_devices = []
+        self.accelerator_devices = []
+        self.nw_devices = self.__generate_interfaces()
+        self.logger.info('__init__()', ' Hello from Simulated Linux Plugin - {} cpus {}MB'.format(self.cpus, self.ram))
+
+    def get_base_path(self):
+        return os.path.join(SimLinux.BASE_DIR, self.node_uuid)
+
+    def execute_command(self, command, blocking=False, external=False):
+        return ''
+
+    def install_package(self, packages):
+        return True
+
+    def remove_package(self, packages):
+        return True
+
+    def store_file(self, content, file_path, filename):
+        with self.lock:
+            self.files.update({os.path.join(file_path, filename): content})
+
+    def read_file(self, file_path, root=False):
+        with self.lock:
+            return self.files.get(file_path, '')
+
+    def read_binary_file(self, file_path):
+        return self.read_file(file_path).encode()
+
+    def download_file(self, url, file_path):
+        self.store_file('', os.path.dirname(file_path), os.path.basename(file_path))
+
+    def file_exists(self, file_path):
+        with self.lock:
+            return file_path in self.files
+
+    def dir_exists(self, path):
+        # only the local state directory lives on disk
+        return os.path.isdir(path)
+
+    def create_dir(self, path):
+        if path == self.get_base_path() and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def create_file(self, path):
+        self.store_file('', os.path.dirname(path), os.path.basename(path))
+
+    def remove_dir(self, path):
+        with self.lock:
+            for k in [k for k in self.files.keys() if k.startswith(path)]:
+                self.files.pop(k)
+
+    def remove_file(self, path):
+        with self.lock:
+            self.files.pop(path, None)
+
+    def check_if_pid_exists(self, pid):
+        return False
+
+    def send_signal(self, signal, pid):
+        return True
+
+    def get_uuid(self):
+        return self.node_uuid
+
+    def get_hostname(self):
+        return self.hostname
+
+    def get_processor_information(self):
+        return [{'model': 'Simulated CPU', 'frequency': 2400, 'arch': 'x86_64'} for _ in range(0, self.cpus)]
+
+    def get_memory_information(self):
+        return {'size': float(self.ram)}
+
+    def get_disks_information(self):
+        return [{'local_address': '/dev/sim0', 'dimension': float(self.disk), 'mount_point': '/', 'filesystem': 'ext4'}]
+
+    def get_io_informations(self):
+        return self.io_devices
+
+    def get_accelerators_informations(self):
+        return self.accelerator_devices
+
+    def get_network_informations(self):
+        return self.nw_devices
+
+    def get_position_information(self):
+        raise NotImplementedError
+
+    def add_know_host(self, hostname, ip):
+        pass
+
+    def remove_know_host(self, hostname):
+        pass
+
+    def get_intf_type(self, name):
+        return 'loopback' if name == 'lo' else 'ethernet'
+
+    def set_interface_unaviable(self, intf_name):
+        self.__set_interface(intf_name, False)
+
+    def set_interface_available(self, intf_name):
+        self.__set_interface(intf_name, True)
+
+    def __set_interface(self, intf_name, available):
+        for dev in self.nw_devices:
+            if dev.get('intf_name') == intf_name:
+                dev.update({'available': available})
+
+    def __generate_interfaces(self):
+        nets = []
+        seed = int(self.node_uuid[:4], 16)
+        for i in range(0, self.interfaces):
+            name = 'eth{}'.format(i)
+            conf = {'ipv4_address': '10.{}.{}.{}'.format(i, seed >> 8, (seed & 0xff) or 1), 'ipv4_netmask': '255.255.0.0',
+                    'ipv4_gateway': '', 'ipv6_address': '', 'ipv6_netmask': ''}
+            mac = '02:00:{:02x}:{:02x}:{:02x}:{:02x}'.format(i, seed >> 8, seed & 0xff, 1)
+            nets.append({'intf_name': name, 'inft_configuration': conf, 'intf_mac_address': mac, 'intf_speed': 1000,
+                         'type': self.get_intf_type(name), 'available': i != 0, 'default_gw': i == 0})
+        return nets
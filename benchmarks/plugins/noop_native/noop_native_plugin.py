@@ -0,0 +1,231 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+No-op runtime plugin for the benchmarks
+
+It goes through the same store documents, state machine and tracing as the native plugin
+but runs nothing, so the measures are the cost of the control plane. The name contains
+"native", the API uses it for the entities of type native. Configuration:
+
+    latency: seconds spent in every action
+    failure_rate: probability [0, 1] that an action fails, the status becomes error
+'''
+
+import json
+import time
+import random
+from fog05 import Tracing
+from fog05.interfaces.States import STATUS
+from fog05.interfaces.Entity import Entity
+from fog05.interfaces.EntityInstance import EntityInstance
+from fog05.interfaces.RuntimePlugin import *
+
+
+class NoopEntity(Entity):
+
+    __slots__ = ('data',)
+
+    def __init__(self, uuid, name, data):
+        super(NoopEntity, self).__init__()
+        self.uuid = uuid
+        self.name = name
+        self.data = data
+
+
+class NoopEntityInstance(EntityInstance):
+
+    __slots__ = ()
+
+    def __init__(self, uuid, name, entity_uuid):
+        super(NoopEntityInstance, self).__init__(uuid, entity_uuid)
+        self.name = name
+
+
+class NoopNative(RuntimePlugin):
+
+    def __init__(self, name, version, agent, plugin_uuid, configuration=None):
+        super(NoopNative, self).__init__(version, plugin_uuid)
+        self.name = name
+        self.agent = agent
+        self.logger = self.agent.logger.component(name)
+        configuration = configuration or {}
+        self.latency = float(configuration.get('latency', 0))
+        self.failure_rate = float(configuration.get('failure_rate', 0))
+        self.random = random.Random()
+        self.HOME = 'runtime/{}/entity'.format(self.uuid)
+        self.INSTANCE = 'instance'
+        self.logger.info('__init__()', ' Hello from No-op Native Plugin - latency {}s failure rate {}'.format(
+            self.latency, self.failure_rate))
+        self.start_runtime()
+
+    def start_runtime(self):
+        uri = '{}/{}/**'.format(self.agent.dhome, self.HOME)
+        self.logger.info('start_runtime()', ' No-op Native Plugin - Observing {}'.format(uri))
+        self.agent.dstore.observe(uri, Tracing.traced(self.__react_to_cache))
+        return self.uuid
+
+    def stop_runtime(self):
+        for k in list(self.current_entities.keys()):
+            entity = self.current_entities.get(k)
+            for i in list(entity.instances.keys()):
+                self.__pop_actual_store_instance(k, i)
+            self.__pop_actual_store(k)
+        self.current_entities = {}
+        return True
+
+    def restore_runtime(self):
+        # nothing survives a restart
+        return
+
+    def get_entities(self):
+        return self.current_entities
+
+    def define_entity(self, *args, **kwargs):
+        entity_uuid = kwargs.get('entity_uuid')
+        self.__work()
+        entity = NoopEntity(entity_uuid, kwargs.get('name'), kwargs)
+        t = self.states.begin('define', entity, entity_uuid)
+        self.current_entities.update({entity_uuid: entity})
+        # committed before the status is written, the next action may arrive as soon as the API sees it
+        self.states.commit(t)
+        self.__update_actual_store(entity_uuid, {'uuid': entity_uuid, 'name': entity.name,
+                                                 'status': STATUS.get('define')})
+        return entity_uuid
+
+    def undefine_entity(self, entity_uuid):
+        entity = self.__get_entity(entity_uuid)
+        self.__work()
+        t = self.states.begin('undefine', entity, entity_uuid)
+        for i in list(entity.instances.keys()):
+            self.__pop_actual_store_instance(entity_uuid, i)
+        self.current_entities.pop(entity_uuid, None)
+        self.__pop_actual_store(entity_uuid)
+        self.states.commit(t)
+        return True
+
+    def configure_entity(self, entity_uuid, instance_uuid=None):
+        entity = self.__get_entity(entity_uuid)
+        self.__work()
+        t = self.states.begin('configure', None, entity_uuid, instance_uuid)
+        instance = NoopEntityInstance(instance_uuid, '{}{}'.format(entity.name, len(entity.instances)), entity_uuid)
+        entity.add_instance(instance)
+        self.states.commit(t, instance)
+        self.__update_actual_store_instance(entity_uuid, instance_uuid, STATUS.get('configure'))
+        return True
+
+    def clean_entity(self, entity_uuid, instance_uuid=None):
+        entity, instance = self.__get_instance(entity_uuid, instance_uuid)
+        self.__work()
+        t = self.states.begin('clean', instance, entity_uuid, instance_uuid)
+        entity.remove_instance(instance)
+        self.__pop_actual_store_instance(entity_uuid, instance_uuid)
+        self.states.commit(t)
+        return True
+
+    def run_entity(self, entity_uuid, instance_uuid=None):
+        return self.__instance_action('run', entity_uuid, instance_uuid)
+
+    def stop_entity(self, entity_uuid, instance_uuid=None):
+        return self.__instance_action('stop', entity_uuid, instance_uuid)
+
+    def pause_entity(self, entity_uuid, instance_uuid=None):
+        return self.__instance_action('pause', entity_uuid, instance_uuid)
+
+    def resume_entity(self, entity_uuid, instance_uuid=None):
+        return self.__instance_action('resume', entity_uuid, instance_uuid)
+
+    def __instance_action(self, action, entity_uuid, instance_uuid):
+        _, instance = self.__get_instance(entity_uuid, instance_uuid)
+        self.__work()
+        t = self.states.begin(action, instance, entity_uuid, instance_uuid)
+        self.states.commit(t)
+        self.__update_actual_store_instance(entity_uuid, instance_uuid, STATUS.get(action))
+        return True
+
+    def __work(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if self.failure_rate > 0 and self.random.random() < self.failure_rate:
+            raise RuntimeError('Simulated failure')
+
+    def __get_entity(self, entity_uuid):
+        entity = self.current_entities.get(entity_uuid, None)
+        if entity is None:
+            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
+        return entity
+
+    def __get_instance(self, entity_uuid, instance_uuid):
+        entity = self.__get_entity(entity_uuid)
+        instance = entity.get_instance(instance_uuid)
+        if instance is None:
+            raise EntityNotExistingException('Instance not existing', 'Instance {} not in entity {}'.format(instance_uuid, entity_uuid))
+        return entity, instance
+
+    def __update_actual_store(self, entity_uuid, value):
+        uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid)
+        self.agent.astore.put(uri, json.dumps(Tracing.stamp(value)))
+
+    def __pop_actual_store(self, entity_uuid):
+        uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid)
+        self.agent.astore.remove(uri)
+
+    def __update_actual_store_instance(self, entity_uuid, instance_uuid, status):
+        uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
+        value = {'uuid': instance_uuid, 'entity_uuid': entity_uuid, 'status': status}
+        self.agent.astore.put(uri, json.dumps(Tracing.stamp(value)))
+
+    def __pop_actual_store_instance(self, entity_uuid, instance_uuid):
+        uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
+        self.agent.astore.remove(uri)
+
+    def __react_to_cache(self, uri, value, v):
+        if value is None or value == '':
+            return
+        value = json.loads(value)
+        action = value.get('status')
+        try:
+            if uri.split('/')[-2] == 'entity':
+                entity_uuid = uri.split('/')[-1]
+                if action == 'define':
+                    entity_data = value.get('entity_data', {})
+                    entity_data.update({'entity_uuid': entity_uuid})
+                    self.define_entity(**entity_data)
+                elif action == 'undefine':
+                    self.undefine_entity(entity_uuid)
+            elif uri.split('/')[-2] == self.INSTANCE:
+                instance_uuid = uri.split('/')[-1]
+                entity_uuid = uri.split('/')[-3]
+                react_func = self.__react(action)
+                if react_func is not None:
+                    react_func(entity_uuid, instance_uuid)
+        except Exception as e:
+            self.logger.error('__react_to_cache()', 'No-op Native Plugin - {} failed on {}: {}'.format(action, uri, e))
+            self.__report_error(uri, action)
+
+    def __report_error(self, uri, action):
+        # the waiters on the API side stop on the error status
+        uri = uri.replace(self.agent.dhome, self.agent.ahome, 1)
+        self.agent.astore.put(uri, json.dumps(Tracing.stamp({'status': 'error', 'action': action})))
+
+    def __react(self, action):
+        r = {
+            'configure': self.configure_entity,
+            'clean': self.clean_entity,
+            'run': self.run_entity,
+            'stop': self.stop_entity,
+            'pause': self.pause_entity,
+            'resume': self.resume_entity
+        }
+        return r.get(action, None)
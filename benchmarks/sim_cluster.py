@@ -0,0 +1,296 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Cluster simulator
+
+Starts simulated agents in this process, all sharing the in-process store (benchmarks/memstore.py).
+Every agent runs the simulated OS plugin, with an inventory drawn from PROFILES, and the no-op
+runtime plugin with the given latency and failure rate (benchmarks/plugins).
+The cluster grows through the sizes in --nodes, at every size the API side is measured:
+
+- node_list: latency of API.node.list(), heartbeats included
+- deploy: one entity defined, configured and run on every node at the same time
+- entity_list: latency of API.entity.list() with one instance per node
+- add: latency of API.add() of an application with --components components spread on the nodes,
+  and time until the onboarding document reached the actual store of every node (fan-out)
+
+The results use the bench_agent.py format, so two runs can be compared with
+
+    python3 benchmarks/bench_agent.py compare base.json new.json
+
+    python3 benchmarks/sim_cluster.py [-n 10,50,100,250,500] [--latency s] [--failure-rate p] [-o result.json]
+'''
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+
+from bench_agent import Waiter, start_agent, stop_agent, load_runtime, summary, git_commit, PLUGINS_DIR, RUNTIME, TIMEOUT
+
+sys.path.insert(0, os.path.join(PLUGINS_DIR, 'linux'))
+
+import memstore
+from sim_linux_plugin import SimLinux
+from fog05.api import API
+
+
+PROFILES = [
+    {'cpus': 2, 'ram': 2048, 'disk': 16, 'interfaces': 1},
+    {'cpus': 4, 'ram': 8192, 'disk': 64, 'interfaces': 2},
+    {'cpus': 8, 'ram': 16384, 'disk': 256, 'interfaces': 2},
+    {'cpus': 32, 'ram': 131072, 'disk': 1024, 'interfaces': 4}]
+
+
+class Cluster(object):
+
+    def __init__(self, yaks, work_dir, runtime_conf, heartbeat):
+        self.yaks = yaks
+        self.work_dir = work_dir
+        self.runtime_conf = runtime_conf
+        self.heartbeat = heartbeat
+        # node uuid -> (agent, runtime uuid)
+        self.nodes = {}
+        self.api = API(endpoint=yaks)
+
+    def grow(self, n):
+        '''
+        Start agents until the cluster has n nodes
+
+        :return: seconds taken by every agent to start and load its runtime
+        '''
+        times = []
+        while len(self.nodes) < n:
+            start = time.time()
+            agent = start_agent(self.yaks, os.path.join(self.work_dir, str(len(self.nodes))), self.heartbeat)
+            load_runtime(self.api, agent, self.runtime_conf)
+            plugins = json.loads(agent.astore.get('{}/plugins'.format(agent.ahome))).get('plugins')
+            handler = [p.get('uuid') for p in plugins if p.get('name') == RUNTIME][0]
+            self.nodes.update({str(agent.uuid): (agent, handler)})
+            times.append(time.time() - start)
+        return times
+
+    def stop(self):
+        self.api.close()
+        for agent, _ in self.nodes.values():
+            try:
+                stop_agent(agent)
+            except Exception:
+                # the log pipeline is shared and already stopped by the first agent
+                pass
+        self.nodes = {}
+
+
+def manifest(entity_uuid):
+    return {'uuid': entity_uuid, 'name': 'sim', 'type': 'native',
+            'entity_data': {'name': 'sim', 'uuid': entity_uuid, 'command': 'true', 'source': '', 'args': []}}
+
+
+def deploy(api, node_uuid, handler, deployed, samples, errors):
+    entity_uuid = str(uuid.uuid4())
+    instance_uuid = str(uuid.uuid4())
+    e_uri = '{}/{}/runtime/{}/entity/{}'.format(api.a_root, node_uuid, handler, entity_uuid)
+    entity = Waiter(api.store.actual, e_uri)
+    instance = Waiter(api.store.actual, '{}/instance/{}'.format(e_uri, instance_uuid))
+    start = time.time()
+    try:
+        api.entity.define(manifest(entity_uuid), node_uuid)
+        if entity.wait('defined') == 'error':
+            errors.append('define')
+            return
+        api.entity.configure(entity_uuid, node_uuid, instance_uuid)
+        if instance.wait('configured') == 'error':
+            errors.append('configure')
+            return
+        api.entity.run(entity_uuid, node_uuid, instance_uuid)
+        if instance.wait('run') == 'error':
+            errors.append('run')
+            return
+        samples.append(time.time() - start)
+        deployed.append((node_uuid, entity_uuid, instance_uuid))
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        entity.close()
+        instance.close()
+
+
+def undeploy(api, node_uuid, handler, entity_uuid, instance_uuid):
+    # not measured, the next actions must not find the instance still running
+    e_uri = '{}/{}/runtime/{}/entity/{}'.format(api.a_root, node_uuid, handler, entity_uuid)
+    entity = Waiter(api.store.actual, e_uri)
+    instance = Waiter(api.store.actual, '{}/instance/{}'.format(e_uri, instance_uuid))
+    try:
+        api.entity.stop(entity_uuid, node_uuid, instance_uuid)
+        instance.wait('stop')
+        api.entity.clean(entity_uuid, node_uuid, instance_uuid)
+        instance.wait_removed()
+        api.entity.undefine(entity_uuid, node_uuid)
+        entity.wait_removed()
+    except Exception:
+        pass
+    finally:
+        entity.close()
+        instance.close()
+
+
+def in_parallel(target, calls):
+    threads = [threading.Thread(target=target, args=args, daemon=True) for args in calls]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.time() - start
+
+
+def timed(fun, repeat):
+    samples = []
+    res = None
+    for _ in range(0, repeat):
+        start = time.time()
+        res = fun()
+        samples.append(time.time() - start)
+    return summary(samples), res
+
+
+def measure_add(cluster, components):
+    '''
+    :return: (seconds of API.add, seconds until every node has the onboarding document, errors)
+    '''
+    api = cluster.api
+    nodes = list(cluster.nodes.keys())
+    app_uuid = str(uuid.uuid4())
+    comps = []
+    for i in range(0, components):
+        comps.append({'name': 'c{}'.format(i), 'need': [], 'node': nodes[i % len(nodes)],
+                      'manifest': manifest(str(uuid.uuid4()))})
+    app = {'uuid': app_uuid, 'name': 'sim-app', 'networks': [], 'components': comps}
+    res = {}
+    start = time.time()
+    # API.add has no timeout, a component whose status update was missed would block it forever
+    adding = threading.Thread(target=lambda: res.update(api.add(app)), daemon=True)
+    adding.start()
+    adding.join(TIMEOUT)
+    added = time.time() - start
+    errors = 0 if 'entity' in res else 1
+    uri = '{}/*/onboard/{}'.format(api.a_root, app_uuid)
+    while len(api.store.actual.getAll(uri)) < len(nodes) and time.time() < start + TIMEOUT:
+        time.sleep(0.001)
+    fan_out = time.time() - start
+    handlers = dict((k, h) for k, (_, h) in cluster.nodes.items())
+    deployed = res.get('entity', {}).get(app_uuid, {})
+    calls = []
+    for c in comps:
+        eid = c.get('manifest').get('uuid')
+        if eid in deployed:
+            calls.append((api, c.get('node'), handlers.get(c.get('node')), eid, deployed.get(eid)))
+    in_parallel(undeploy, calls)
+    for n in nodes:
+        api.store.desired.remove('{}/{}/onboard/{}'.format(api.d_root, n, app_uuid))
+    return added, fan_out, errors
+
+
+def run(args):
+    memstore.install()
+    rnd = random.Random(args.seed)
+    SimLinux.inventory = lambda plugin: rnd.choice(PROFILES)
+    yaks = 'sim-{}'.format(uuid.uuid4())
+    work_dir = tempfile.mkdtemp(prefix='fos_sim_')
+    SimLinux.BASE_DIR = work_dir
+    metrics = {}
+
+    def add(name, value, unit, better):
+        metrics.update({name: {'value': value, 'unit': unit, 'better': better}})
+
+    cluster = Cluster(yaks, work_dir, {'latency': args.latency, 'failure_rate': args.failure_rate}, args.heartbeat)
+    api = cluster.api
+    print('{:>6} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>8}'.format(
+        'nodes', 'start', 'node_list', 'deploy95', 'ent_list', 'add', 'fan_out', 'errors'))
+    try:
+        for n in args.nodes:
+            starts = cluster.grow(n)
+            s = summary(starts)
+            if s is not None:
+                add('nodes.{}.agent_start.mean'.format(n), s.get('mean'), 's', 'lower')
+
+            node_list, listed = timed(api.node.list, args.repeat)
+            add('nodes.{}.node_list.mean'.format(n), node_list.get('mean'), 's', 'lower')
+            add('nodes.{}.node_list.p95'.format(n), node_list.get('p95'), 's', 'lower')
+            add('nodes.{}.node_list.alive'.format(n), len(listed), 'nodes', 'higher')
+
+            deployed, samples, errors = [], [], []
+            wall = in_parallel(deploy, [(api, k, h, deployed, samples, errors) for k, (_, h) in cluster.nodes.items()])
+            d = summary(samples) or {'mean': 0, 'p95': 0}
+            add('nodes.{}.deploy.mean'.format(n), d.get('mean'), 's', 'lower')
+            add('nodes.{}.deploy.p95'.format(n), d.get('p95'), 's', 'lower')
+            add('nodes.{}.deploy.throughput'.format(n), len(samples) / wall, 'instances/s', 'higher')
+            add('nodes.{}.deploy.errors'.format(n), len(errors), 'instances', 'lower')
+
+            entity_list, _ = timed(api.entity.list, args.repeat)
+            add('nodes.{}.entity_list.mean'.format(n), entity_list.get('mean'), 's', 'lower')
+            add('nodes.{}.entity_list.p95'.format(n), entity_list.get('p95'), 's', 'lower')
+
+            handlers = dict((k, h) for k, (_, h) in cluster.nodes.items())
+            in_parallel(undeploy, [(api, k, handlers.get(k), eid, iid) for k, eid, iid in deployed])
+
+            added, fan_out, add_errors = measure_add(cluster, min(args.components, n))
+            add('nodes.{}.add.latency'.format(n), added, 's', 'lower')
+            add('nodes.{}.add.fan_out'.format(n), fan_out, 's', 'lower')
+            add('nodes.{}.add.errors'.format(n), add_errors, 'applications', 'lower')
+
+            print('{:>6} {:>9.4f}s {:>9.4f}s {:>9.4f}s {:>9.4f}s {:>9.4f}s {:>9.4f}s {:>8}'.format(
+                n, s.get('mean') if s else 0, node_list.get('mean'), d.get('p95'), entity_list.get('mean'),
+                added, fan_out, len(errors) + add_errors))
+    finally:
+        cluster.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        memstore.reset()
+
+    result = {'meta': {'commit': git_commit(), 'python': platform.python_version(), 'time': time.time(),
+                       'nodes': args.nodes, 'latency': args.latency, 'failure_rate': args.failure_rate,
+                       'components': args.components, 'seed': args.seed},
+              'metrics': metrics}
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print('results written to {}'.format(args.output))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cluster simulator')
+    parser.add_argument('-n', '--nodes', type=lambda s: [int(x) for x in s.split(',')], default=[10, 50, 100, 250, 500],
+                        help='comma separated cluster sizes, increasing')
+    # API.add waits subscribing after the request, a runtime faster than the subscription would never be seen
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds spent by the runtimes in every action')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='probability that a runtime action fails')
+    parser.add_argument('--components', type=int, default=10, help='components of the application given to API.add')
+    parser.add_argument('--heartbeat', type=float, default=2.0, help='seconds between two heartbeats of the agents')
+    parser.add_argument('--repeat', type=int, default=20, help='calls per list measure')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the node inventories')
+    parser.add_argument('-o', '--output', default=None, help='JSON file for the results')
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,12 +12,63 @@
 #
 # Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
 
+import json
+import queue
 import logging
 import logging.handlers
 import time
 import sys
 
 
+class RingQueueHandler(logging.handlers.QueueHandler):
+    '''
+    QueueHandler on a bounded queue, it never blocks the caller:
+    when the queue is full the oldest record is dropped and counted
+    '''
+
+    def __init__(self, record_queue):
+        super(RingQueueHandler, self).__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if not hasattr(record, 'caller'):
+            record.caller = ''
+        return super(RingQueueHandler, self).prepare(record)
+
+    def enqueue(self, record):
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class RingQueueListener(logging.handlers.QueueListener):
+
+    def enqueue_sentinel(self):
+        # the sentinel must not be dropped, wait for room in the queue
+        self.queue.put(self._sentinel)
+
+
+class JSONFormatter(logging.Formatter):
+    '''
+    One JSON document per record: time, level, logger, caller, message
+    and the structured fields given to the DLogger call (eg. entity_uuid, instance_uuid, latency)
+    '''
+
+    def format(self, record):
+        doc = {'time': record.created, 'level': record.levelname, 'logger': record.name,
+               'caller': getattr(record, 'caller', ''), 'message': record.getMessage()}
+        doc.update(getattr(record, 'fields', {}))
+        return json.dumps(doc, default=str)
+
+
 class DLogger:
     class __SingletonLogger:
         def __init__(self, file_name=None, debug_flag=False):
@@ -27,67 +78,187 @@ class DLogger:
                 # str('fosagent_log_%d.log' % int(time.time()))
             else:
                 self.log_file = file_name
+            self.file_enabled = file_name is not None
 
             self.debug_flag = debug_flag
-
-            log_format = '[%(asctime)s] - [%(levelname)s] > %(message)s'
+            self.log_format = '[%(asctime)s] - [%(levelname)s] > < %(caller)s > %(message)s'
             log_level = logging.INFO
 
             self.logger = logging.getLogger(__name__ + '.fog05.agent')
-
             self.logger.setLevel(log_level)
-            formatter = logging.Formatter(log_format)
-            if not debug_flag:
-                platform = sys.platform
-                if platform == 'linux':
-                    handler = logging.handlers.SysLogHandler('/dev/log')
-                elif platform == 'darwin':
-                    handler = logging.handlers.SysLogHandler('/var/run/syslog')
-                elif platform in ['windows', 'Windows', 'win32']:
-                    handler = logging.handlers.SysLogHandler()
-            else:
-                handler = logging.StreamHandler(sys.stdout)
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
+            self.logger.propagate = False
 
-        def info(self, caller, message):
-            self.logger.info('< {} > {}'.format(caller, message))
+            handlers = ['stdout'] if debug_flag else ['syslog']
+            if file_name is not None:
+                handlers.append('file')
+            self.queue_handler = None
+            self.listener = None
+            self.start(handlers, 'text', 10000, 10485760, 5)
 
-        def warning(self, caller, message):
-            self.logger.warning('< {} > {}'.format(caller, message))
+        def start(self, handlers, log_format, queue_size, max_bytes, backup_count):
+            '''
+            Records are put on a bounded queue by the calling thread
+            and written to the actual handlers by the listener thread
+            '''
+            if log_format == 'json':
+                formatter = JSONFormatter()
+            else:
+                formatter = logging.Formatter(self.log_format)
+            targets = []
+            for h in handlers:
+                if h == 'syslog':
+                    platform = sys.platform
+                    if platform == 'linux':
+                        handler = logging.handlers.SysLogHandler('/dev/log')
+                    elif platform == 'darwin':
+                        handler = logging.handlers.SysLogHandler('/var/run/syslog')
+                    elif platform in ['windows', 'Windows', 'win32']:
+                        handler = logging.handlers.SysLogHandler()
+                elif h == 'stdout':
+                    handler = logging.StreamHandler(sys.stdout)
+                elif h == 'file':
+                    handler = logging.handlers.RotatingFileHandler(self.log_file, maxBytes=max_bytes,
+                                                                   backupCount=backup_count)
+                else:
+                    raise ValueError('Unknown log handler {}'.format(h))
+                handler.setFormatter(formatter)
+                targets.append(handler)
 
-        def error(self, caller, message):
-            self.logger.error('< {} > {}'.format(caller, message))
+            dropped = 0
+            if self.queue_handler is not None:
+                dropped = self.queue_handler.dropped
+                self.stop()
+            self.queue_handler = RingQueueHandler(queue.Queue(queue_size))
+            self.queue_handler.dropped = dropped
+            self.listener = RingQueueListener(self.queue_handler.queue, *targets)
+            self.logger.addHandler(self.queue_handler)
+            self.listener.start()
 
-        def debug(self, caller, message):
-            self.logger.debug('< {} > {}'.format(caller, message))
+        def stop(self):
+            self.logger.removeHandler(self.queue_handler)
+            self.listener.stop()
+            for h in self.listener.handlers:
+                h.close()
 
     instance = None
     enabled = True
+    RESERVED_OPTIONS = ['level', 'handlers', 'file', 'format', 'queue_size', 'max_bytes', 'backup_count']
 
-    def __init__(self, file_name=None, debug_flag=False):
+    def __init__(self, file_name=None, debug_flag=False, component=None):
+        '''
+        All the DLogger share the same handlers, a DLogger created with a component
+        name logs through a child logger, so its level can be set independently,
+        component names are case insensitive
 
+        :param file_name: log file name, if given records are also written to this file
+        :param debug_flag: log to stdout instead of syslog
+        :param component: name of the component (eg. a plugin name)
+        '''
         if not DLogger.instance:
             DLogger.instance = DLogger.__SingletonLogger(file_name, debug_flag)
+        self.name = component
+        if component is None:
+            self.logger = DLogger.instance.logger
+        else:
+            self.logger = DLogger.instance.logger.getChild(component.lower())
+
+    def component(self, name):
+        '''
+        Get the logger for a component
+
+        :param name: component name
+        :return: DLogger
+        '''
+        return DLogger(component=name)
+
+    def set_level(self, level, component=None):
+        '''
+        Set the log level of the agent or of a component,
+        a component without an explicit level inherits the agent one
+
+        :param level: level name (eg. DEBUG, INFO, WARNING, ERROR) or logging constant
+        :param component: component name, None for the agent
+        '''
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+        if component is None:
+            DLogger.instance.logger.setLevel(level)
+        else:
+            DLogger.instance.logger.getChild(component.lower()).setLevel(level)
 
     def enable(self):
-        self.enabled = True
+        DLogger.enabled = True
 
     def disable(self):
-        self.enabled = False
+        DLogger.enabled = False
+
+    def is_enabled_for(self, level):
+        return DLogger.enabled and self.logger.isEnabledFor(level)
+
+    def configure(self, options):
+        '''
+        Configure the log pipeline from the [logging] section of the agent configuration
+
+        :param options: dictionary of strings, handlers (JSON list of syslog, stdout, file),
+        file (without handlers it is added to the default ones), format (text or json), queue_size, max_bytes, backup_count, level,
+        every other key is a component name and its value the level of that component
+        '''
+        inst = DLogger.instance
+        if 'file' in options:
+            inst.log_file = options.get('file')
+            inst.file_enabled = True
+        handlers = ['stdout'] if inst.debug_flag else ['syslog']
+        if inst.file_enabled:
+            handlers.append('file')
+        if 'handlers' in options:
+            handlers = json.loads(options.get('handlers'))
+        inst.start(handlers, options.get('format', 'text'), int(options.get('queue_size', 10000)),
+                   int(options.get('max_bytes', 10485760)), int(options.get('backup_count', 5)))
+        for k, level in options.items():
+            if k == 'level':
+                self.set_level(level)
+            elif k not in self.RESERVED_OPTIONS:
+                self.set_level(level, k)
+
+    def dropped(self):
+        '''
+        :return: number of records dropped because the log queue was full
+        '''
+        return DLogger.instance.queue_handler.dropped
+
+    def queue_depth(self):
+        '''
+        :return: number of records waiting to be written
+        '''
+        return DLogger.instance.queue_handler.queue.qsize()
+
+    def stop(self):
+        '''
+        Flush the records still in the queue and close the handlers
+        '''
+        DLogger.instance.stop()
+
+    def __log(self, level, caller, message, args, fields):
+        # the message is formatted only if the record is going to be emitted,
+        # without arguments it is passed as is, so a '%' in it is never interpreted
+        extra = {'caller': caller, 'fields': fields}
+        if args:
+            self.logger.log(level, message, *args, extra=extra)
+        else:
+            self.logger.log(level, '%s', message, extra=extra)
 
-    def info(self, caller, message):
-        if self.enabled:
-            self.instance.info(caller, message)
+    def info(self, caller, message, *args, **fields):
+        if DLogger.enabled and self.logger.isEnabledFor(logging.INFO):
+            self.__log(logging.INFO, caller, message, args, fields)
 
-    def warning(self, caller, message):
-        if self.enabled:
-            self.instance.warning(caller, message)
+    def warning(self, caller, message, *args, **fields):
+        if DLogger.enabled and self.logger.isEnabledFor(logging.WARNING):
+            self.__log(logging.WARNING, caller, message, args, fields)
 
-    def error(self, caller, message):
-        if self.enabled:
-            self.instance.error(caller, message)
+    def error(self, caller, message, *args, **fields):
+        if DLogger.enabled and self.logger.isEnabledFor(logging.ERROR):
+            self.__log(logging.ERROR, caller, message, args, fields)
 
-    def debug(self, caller, message):
-        if self.enabled:
-            self.instance.debug(caller, message)
+    def debug(self, caller, message, *args, **fields):
+        if DLogger.enabled and self.logger.isEnabledFor(logging.DEBUG):
+            self.__log(logging.DEBUG, caller, message, args, fields)
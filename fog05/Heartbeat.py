@@ -0,0 +1,149 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Node liveness
+
+Every agent increments a small counter in <aroot>/<node uuid>/heartbeat every period seconds:
+
+    {"seq": 42, "period": 2.0}
+
+FailureDetector follows the heartbeats of all the nodes with a single subscription,
+a node is dead when its counter did not move for misses periods. Arrival times are taken
+with the local monotonic clock, so the clocks of the nodes do not need to be in sync
+'''
+
+import json
+import time
+import threading
+
+
+HEARTBEAT_KEY = 'heartbeat'
+
+
+class Heartbeat(object):
+    '''
+    Agent side, periodically writes the heartbeat of the node
+    '''
+
+    def __init__(self, store, home, period=2.0):
+        '''
+        :param store: actual store
+        :param home: node home in the actual store
+        :param period: seconds between two heartbeats
+        '''
+        self.store = store
+        self.uri = '{}/{}'.format(home, HEARTBEAT_KEY)
+        self.period = period
+        self.seq = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__beat_loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, remove=True):
+        '''
+        :param remove: remove the heartbeat key, the node is immediately seen as gone
+        '''
+        self.stopped.set()
+        self.thread.join(self.period)
+        if remove:
+            self.store.remove(self.uri)
+
+    def __beat_loop(self):
+        while not self.stopped.is_set():
+            self.seq += 1
+            try:
+                self.store.put(self.uri, json.dumps({'seq': self.seq, 'period': self.period}))
+            except Exception:
+                # the store may be temporarily unreachable, next beat will retry
+                pass
+            self.stopped.wait(self.period)
+
+
+class FailureDetector(object):
+    '''
+    API side, tells which nodes are alive from their heartbeats
+    '''
+
+    def __init__(self, store, aroot, misses=3):
+        '''
+        :param store: actual store
+        :param aroot: actual store root
+        :param misses: heartbeats that can be missed before a node is considered dead
+        '''
+        self.store = store
+        self.aroot = aroot
+        self.misses = misses
+        self.lock = threading.Lock()
+        # node uuid -> [seq, period, local arrival time]
+        self.nodes = {}
+        self.subscription = None
+
+    def start(self):
+        '''
+        Subscribe to the heartbeats and read the current ones,
+        nodes that are already beating are given a full timeout from now
+        '''
+        if self.subscription is not None:
+            return self
+        uri = '{}/*/{}'.format(self.aroot, HEARTBEAT_KEY)
+        self.subscription = self.store.observe(uri, self.__react_to_heartbeat)
+        for k, v, _ in self.store.getAll(uri):
+            self.__react_to_heartbeat(k, v, 0)
+        return self
+
+    def stop(self):
+        if self.subscription is not None:
+            self.store.overlook(self.subscription)
+            self.subscription = None
+
+    def is_alive(self, node_uuid):
+        '''
+        :param node_uuid: uuid of the node
+        :return: True if a heartbeat of the node was seen within the timeout
+        '''
+        self.start()
+        with self.lock:
+            hb = self.nodes.get(node_uuid, None)
+        if hb is None:
+            return False
+        return time.monotonic() - hb[2] <= hb[1] * self.misses
+
+    def alive(self):
+        '''
+        :return: list of the uuids of the nodes alive
+        '''
+        self.start()
+        now = time.monotonic()
+        with self.lock:
+            return [k for k, hb in self.nodes.items() if now - hb[2] <= hb[1] * self.misses]
+
+    def __react_to_heartbeat(self, key, value, v):
+        node_uuid = key.split('/')[-2]
+        if value is None or value == '':
+            # heartbeat removed, the agent exited
+            with self.lock:
+                self.nodes.pop(node_uuid, None)
+            return
+        try:
+            hb = json.loads(value)
+        except ValueError:
+            return
+        with self.lock:
+            last = self.nodes.get(node_uuid, None)
+            if last is None or last[0] != hb.get('seq'):
+                self.nodes.update({node_uuid: [hb.get('seq'), float(hb.get('period', 2.0)), time.monotonic()]})
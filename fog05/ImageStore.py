@@ -0,0 +1,296 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import urllib.request
+from contextlib import contextmanager
+from fog05 import Metrics
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+CHUNK_SIZE = 1024 * 1024
+IMAGE_REQUESTS = Metrics.REGISTRY.counter('fos_image_requests_total', 'Images requested to the image store', ['result'])
+IMAGE_BYTES = Metrics.REGISTRY.gauge('fos_image_store_bytes', 'Size of the files in the image store', ['path'])
+
+
+class ImageChecksumException(Exception):
+    def __init__(self, message, errors=0):
+
+        super(ImageChecksumException, self).__init__(message)
+        self.errors = errors
+
+
+class ImageStore(object):
+    '''
+    Content addressed store of the images used by the runtime plugins of a node
+
+    Files are named by the sha256 of their content, so the same image added with different
+    uuids or urls is stored once. Every user of an image holds a reference (eg. <plugin uuid>/<image uuid>),
+    files without references are kept as a cache and evicted least recently used first
+    when the store goes over its quota, or removed as soon as they are released if there is no quota.
+
+    Downloads are streamed in a partial file that is resumed if the download is retried,
+    the checksum of the manifest (eg. sha256:<hex>, any hashlib algorithm) is verified before the file is added.
+    Concurrent requests for the same url wait for a single download, the partial file is also
+    locked so plugins running in other processes on the same store do not write it at the same time.
+
+    Plugins of the same process share the store with ImageStore.shared(path)
+    '''
+
+    __stores = {}
+    __stores_lock = threading.Lock()
+
+    def __init__(self, path, quota=None):
+        '''
+        :param path: directory of the store
+        :param quota: max size in bytes of the store, None to keep only the referenced images
+        '''
+        self.path = path
+        self.quota = quota
+        self.partial_path = os.path.join(path, 'partial')
+        os.makedirs(self.partial_path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.downloads = {}
+        self.db = sqlite3.connect(os.path.join(path, 'index.db'), check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS refs (ref TEXT PRIMARY KEY, digest TEXT NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL)')
+        self.__update_size()
+
+    @classmethod
+    def shared(cls, path, quota=None):
+        '''
+        Get the store in path, creating it the first time
+
+        :param path: directory of the store
+        :param quota: if not None replaces the quota of the store
+        :return: ImageStore
+        '''
+        path = os.path.abspath(path)
+        with cls.__stores_lock:
+            store = cls.__stores.get(path, None)
+            if store is None:
+                store = cls(path, quota)
+                cls.__stores.update({path: store})
+            elif quota is not None:
+                store.quota = quota
+            return store
+
+    def acquire(self, ref, url, checksum=None):
+        '''
+        Get the file of an image, downloading it if it is not in the store
+
+        :param ref: who uses the image
+        :param url: http(s):// or file:// url of the image
+        :param checksum: optional <algorithm>:<hex digest> or sha256 hex digest of the image
+        :return: path of the image file
+        '''
+        algorithm, expected = self.__parse_checksum(checksum)
+        while True:
+            with self.lock:
+                digest = self.__cached(ref, url, algorithm, expected)
+                if digest is not None:
+                    IMAGE_REQUESTS.inc(result='hit')
+                    return self.__reference(ref, url, digest)
+                # keyed as the partial file, requests with and without checksum share the download
+                key = url
+                download = self.downloads.get(key, None)
+                if download is None:
+                    download = {'event': threading.Event(), 'error': None}
+                    self.downloads.update({key: download})
+                    break
+            # somebody else is downloading it, the next round will find it in the store
+            download.get('event').wait()
+            if download.get('error') is not None:
+                raise download.get('error')
+
+        try:
+            with self.__partial_lock(url):
+                with self.lock:
+                    # another process could have added it while we waited for the lock
+                    digest = self.__cached(ref, url, algorithm, expected)
+                    if digest is not None:
+                        IMAGE_REQUESTS.inc(result='hit')
+                        return self.__reference(ref, url, digest)
+                IMAGE_REQUESTS.inc(result='miss')
+                digest, size = self.__download(url, algorithm, expected)
+                with self.lock:
+                    self.db.execute('INSERT OR REPLACE INTO blobs (digest, size, last_used) VALUES (?, ?, ?)',
+                                    (digest, size, time.time()))
+                    path = self.__reference(ref, url, digest)
+                    self.__evict()
+                return path
+        except Exception as e:
+            download.update({'error': e})
+            raise
+        finally:
+            with self.lock:
+                self.downloads.pop(key, None)
+            download.get('event').set()
+
+    def release(self, ref):
+        '''
+        Drop a reference to an image, the file is removed or kept as cache depending on the quota
+
+        :param ref: who used the image
+        :return: bool
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT digest FROM refs WHERE ref = ?', (ref,)).fetchone()
+            if row is None:
+                return False
+            self.db.execute('DELETE FROM refs WHERE ref = ?', (ref,))
+            self.__evict()
+            return True
+
+    def get_path(self, ref):
+        '''
+        :param ref: who uses the image
+        :return: path of the image file or None
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT digest FROM refs WHERE ref = ?', (ref,)).fetchone()
+        if row is None or not os.path.isfile(self.__blob_path(row[0])):
+            return None
+        return self.__blob_path(row[0])
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __cached(self, ref, url, algorithm, expected):
+        row = self.db.execute('SELECT digest FROM refs WHERE ref = ?', (ref,)).fetchone()
+        if row is None and algorithm == 'sha256' and expected is not None:
+            row = (expected,)
+        if row is None:
+            row = self.db.execute('SELECT digest FROM urls WHERE url = ?', (url,)).fetchone()
+        if row is None or not os.path.isfile(self.__blob_path(row[0])):
+            return None
+        if expected is not None and algorithm != 'sha256':
+            # the store only knows the sha256, other checksums are verified on the file
+            if self.__hash_file(self.__blob_path(row[0]), algorithm).hexdigest() != expected:
+                return None
+        elif expected is not None and row[0] != expected:
+            return None
+        return row[0]
+
+    def __reference(self, ref, url, digest):
+        self.db.execute('INSERT OR REPLACE INTO refs (ref, digest) VALUES (?, ?)', (ref, digest))
+        self.db.execute('INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)', (url, digest))
+        self.db.execute('UPDATE blobs SET last_used = ? WHERE digest = ?', (time.time(), digest))
+        return self.__blob_path(digest)
+
+    def __partial_file(self, url):
+        return os.path.join(self.partial_path, hashlib.sha1(url.encode()).hexdigest())
+
+    @contextmanager
+    def __partial_lock(self, url):
+        if fcntl is None:
+            yield
+            return
+        with open('{}.lock'.format(self.__partial_file(url)), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def __download(self, url, algorithm, expected):
+        partial = self.__partial_file(url)
+        offset = os.path.getsize(partial) if os.path.isfile(partial) else 0
+        source, offset = self.__open(url, offset)
+        sha = self.__hash_file(partial, 'sha256') if offset > 0 else hashlib.sha256()
+        check = None
+        if algorithm is not None and algorithm != 'sha256':
+            check = self.__hash_file(partial, algorithm) if offset > 0 else hashlib.new(algorithm)
+        with source, open(partial, 'ab' if offset > 0 else 'wb') as f:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                f.write(chunk)
+                sha.update(chunk)
+                if check is not None:
+                    check.update(chunk)
+        digest = sha.hexdigest()
+        computed = digest if check is None else check.hexdigest()
+        if expected is not None and computed != expected:
+            os.remove(partial)
+            raise ImageChecksumException('Image {} checksum mismatch expected {} got {}'.format(url, expected, computed))
+        size = os.path.getsize(partial)
+        os.replace(partial, self.__blob_path(digest))
+        return digest, size
+
+    def __open(self, url, offset):
+        # returns the source positioned at offset, or at 0 if it cannot be resumed
+        if url.startswith('file://'):
+            source = open(url[len('file://'):], 'rb')
+            if offset > os.fstat(source.fileno()).st_size:
+                offset = 0
+            source.seek(offset)
+            return source, offset
+        if not url.startswith('http'):
+            raise ValueError('Unsupported image url {}'.format(url))
+        req = urllib.request.Request(url)
+        if offset > 0:
+            req.add_header('Range', 'bytes={}-'.format(offset))
+        source = urllib.request.urlopen(req)
+        if offset > 0 and source.status != 206:
+            offset = 0
+        return source, offset
+
+    def __evict(self):
+        unused = self.db.execute('SELECT digest, size FROM blobs WHERE digest NOT IN (SELECT digest FROM refs) '
+                                 'ORDER BY last_used').fetchall()
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+        for digest, size in unused:
+            if self.quota is not None and total <= self.quota:
+                break
+            self.db.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+            self.db.execute('DELETE FROM urls WHERE digest = ?', (digest,))
+            if os.path.isfile(self.__blob_path(digest)):
+                os.remove(self.__blob_path(digest))
+            total -= size
+        IMAGE_BYTES.set(total, path=self.path)
+
+    def __update_size(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+        IMAGE_BYTES.set(total, path=self.path)
+
+    def __blob_path(self, digest):
+        return os.path.join(self.path, digest)
+
+    def __hash_file(self, path, algorithm):
+        h = hashlib.new(algorithm)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+        return h
+
+    def __parse_checksum(self, checksum):
+        if checksum is None or checksum == '':
+            return None, None
+        if ':' in checksum:
+            algorithm, expected = checksum.split(':', 1)
+        else:
+            algorithm, expected = 'sha256', checksum
+        algorithm = algorithm.lower()
+        if algorithm not in hashlib.algorithms_available:
+            raise ValueError('Unsupported checksum algorithm {}'.format(algorithm))
+        return algorithm, expected.lower()
@@ -0,0 +1,73 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+import json
+import sqlite3
+import threading
+
+
+class LocalState(object):
+    '''
+    Local snapshot of the agent and plugins state, backed by sqlite
+
+    Every record is identified by (owner, kind, key), where owner is 'agent' or a plugin uuid,
+    kind is the type of record (eg. entity, instance, image, flavor, plugin) and key is the uuid of the record.
+    Records are written incrementally, so the snapshot is always up to date and can be used
+    to warm restart the agent without redefining all the entities
+    '''
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(file_name, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS state ('
+                        'owner TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                        'PRIMARY KEY (owner, kind, key))')
+
+    def put(self, owner, kind, key, value):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO state (owner, kind, key, value) VALUES (?, ?, ?, ?)',
+                            (str(owner), kind, str(key), json.dumps(value)))
+
+    def get(self, owner, kind, key):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM state WHERE owner = ? AND kind = ? AND key = ?',
+                                  (str(owner), kind, str(key))).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def get_all(self, owner, kind):
+        with self.lock:
+            rows = self.db.execute('SELECT key, value FROM state WHERE owner = ? AND kind = ?',
+                                   (str(owner), kind)).fetchall()
+        return {k: json.loads(v) for (k, v) in rows}
+
+    def remove(self, owner, kind, key):
+        with self.lock:
+            self.db.execute('DELETE FROM state WHERE owner = ? AND kind = ? AND key = ?',
+                            (str(owner), kind, str(key)))
+
+    def clear(self, owner=None):
+        with self.lock:
+            if owner is None:
+                self.db.execute('DELETE FROM state')
+            else:
+                self.db.execute('DELETE FROM state WHERE owner = ?', (str(owner),))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,321 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Agent metrics
+
+Counters, gauges and histograms kept in a process wide registry (REGISTRY),
+updating a metric only takes its lock and touches a number, the text is built
+when the registry is scraped. The agent serves the registry in the Prometheus
+text exposition format with MetricsServer:
+
+    curl http://127.0.0.1:9105/metrics
+
+A family, as returned by collect() and by the collectors, is a tuple
+(name, type, help, [(suffix, {label: value}, value), ...])
+'''
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metric(object):
+
+    TYPE = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(l, '')) for l in self.label_names)
+
+    def labels(self, **labels):
+        '''
+        Bind a label set, updates through the returned child skip the label lookup,
+        use it on hot paths
+
+        :return: BoundMetric
+        '''
+        return BoundMetric(self, self._key(labels))
+
+    def remove(self, **labels):
+        '''
+        Forget a label set, eg. when an instance is cleaned
+        '''
+        with self.lock:
+            self.values.pop(self._key(labels), None)
+
+    def samples(self):
+        with self.lock:
+            return [('', dict(zip(self.label_names, k)), v) for k, v in self.values.items()]
+
+    def family(self):
+        return self.name, self.TYPE, self.documentation, self.samples()
+
+
+class Counter(Metric):
+
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._inc(self._key(labels), amount)
+
+    def _inc(self, k, amount):
+        with self.lock:
+            self.values[k] = self.values.get(k, 0) + amount
+
+
+class Gauge(Counter):
+
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        self._set(self._key(labels), value)
+
+    def _set(self, k, value):
+        with self.lock:
+            self.values[k] = value
+
+    def dec(self, amount=1, **labels):
+        self._inc(self._key(labels), -amount)
+
+
+class Histogram(Metric):
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        self._observe(self._key(labels), value)
+
+    def _observe(self, k, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            h = self.values.get(k, None)
+            if h is None:
+                # counts per bucket (the last one is +Inf), sum
+                h = [[0] * (len(self.buckets) + 1), 0.0]
+                self.values[k] = h
+            h[0][i] += 1
+            h[1] += value
+
+    def samples(self):
+        with self.lock:
+            values = [(k, list(h[0]), h[1]) for k, h in self.values.items()]
+        res = []
+        for k, counts, total in values:
+            labels = dict(zip(self.label_names, k))
+            acc = 0
+            for b, c in zip(self.buckets + (float('inf'),), counts):
+                acc += c
+                le = dict(labels)
+                le.update({'le': '+Inf' if b == float('inf') else repr(b)})
+                res.append(('_bucket', le, acc))
+            res.append(('_sum', labels, total))
+            res.append(('_count', labels, acc))
+        return res
+
+
+class BoundMetric(object):
+
+    __slots__ = ('metric', 'key')
+
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount=1):
+        self.metric._inc(self.key, amount)
+
+    def dec(self, amount=1):
+        self.metric._inc(self.key, -amount)
+
+    def set(self, value):
+        self.metric._set(self.key, value)
+
+    def observe(self, value):
+        self.metric._observe(self.key, value)
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+
+    def __get_or_create(self, cls, name, *args):
+        with self.lock:
+            m = self.metrics.get(name, None)
+            if m is None:
+                m = cls(name, *args)
+                self.metrics.update({name: m})
+            return m
+
+    def counter(self, name, documentation, labels=()):
+        return self.__get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self.__get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.__get_or_create(Histogram, name, documentation, labels, buckets)
+
+    def add_collector(self, collector):
+        '''
+        Register a function called at every scrape, for values that are cheaper
+        to read when needed (eg. queue depths) or that live in another process
+
+        :param collector: function() returning a list of families
+        '''
+        with self.lock:
+            self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self.lock:
+            if collector in self.collectors:
+                self.collectors.remove(collector)
+
+    def collect(self):
+        '''
+        :return: list of families, families with the same name are merged
+        '''
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        families = {}
+        for name, kind, documentation, samples in [m.family() for m in metrics]:
+            families.update({name: (name, kind, documentation, samples)})
+        for c in collectors:
+            try:
+                collected = c()
+            except Exception:
+                continue
+            for name, kind, documentation, samples in collected:
+                f = families.get(name, None)
+                if f is None:
+                    families.update({name: (name, kind, documentation, list(samples))})
+                else:
+                    f[3].extend(samples)
+        return list(families.values())
+
+    def expose(self):
+        '''
+        :return: the registry in Prometheus text format
+        '''
+        lines = []
+        for name, kind, documentation, samples in sorted(self.collect(), key=lambda f: f[0]):
+            lines.append('# HELP {} {}'.format(name, documentation.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for suffix, labels, value in samples:
+                if len(labels) > 0:
+                    lbl = ','.join('{}="{}"'.format(k, _escape(v)) for k, v in sorted(labels.items()))
+                    lines.append('{}{}{{{}}} {}'.format(name, suffix, lbl, _number(value)))
+                else:
+                    lines.append('{}{} {}'.format(name, suffix, _number(value)))
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+def with_labels(families, **labels):
+    '''
+    Add labels to every sample of a list of families,
+    used to tell apart the metrics coming from a plugin host process
+
+    :param families: list of families
+    :return: list of families
+    '''
+    res = []
+    for name, kind, documentation, samples in families:
+        tagged = []
+        for suffix, lbl, value in samples:
+            lbl = dict(lbl)
+            lbl.update(labels)
+            tagged.append((suffix, lbl, value))
+        res.append((name, kind, documentation, tagged))
+    return res
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    '''
+    Serve a registry on http://<address>:<port>/metrics
+    '''
+
+    def __init__(self, registry=REGISTRY, address='127.0.0.1', port=9105):
+        self.registry = registry
+        self.address = address
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ['/', '/metrics']:
+                    self.send_error(404)
+                    return
+                body = registry.expose().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self.server = _ThreadingHTTPServer((self.address, self.port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
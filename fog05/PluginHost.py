@@ -0,0 +1,389 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Out-of-process plugin hosting
+
+A plugin listed as isolated in the agent configuration is started in a child process
+(python -m fog05.PluginHost <socket>), the agent keeps a PluginProxy that forwards every
+method call over a Unix socket. Messages are length prefixed pickles:
+
+    ('call', id, target, method, args, kwargs)
+    ('reply', id, ok, value)
+
+The channel is symmetric, so the hosted plugin can call back the agent (eg. to reach the network plugins)
+'''
+
+import os
+import sys
+import pickle
+import socket
+import struct
+import threading
+import subprocess
+import itertools
+import traceback
+from fog05 import Metrics
+
+
+# seconds a scrape waits for the metrics of a plugin host
+METRICS_TIMEOUT = 2
+
+
+class PluginHostException(Exception):
+    def __init__(self, message, errors=0):
+        super(PluginHostException, self).__init__(message)
+        self.errors = errors
+
+
+class RPCChannel(object):
+
+    HEADER = struct.Struct('!I')
+
+    def __init__(self, sock, handler, timeout=None):
+        '''
+        :param sock: connected Unix socket
+        :param handler: function(target, method, args, kwargs) serving the calls from the other side
+        :param timeout: seconds a call waits for its reply, None to wait forever
+        '''
+        self.sock = sock
+        self.handler = handler
+        self.timeout = timeout
+        self.wlock = threading.Lock()
+        self.plock = threading.Lock()
+        self.pending = {}
+        self.ids = itertools.count()
+        self.closed = False
+        self.reader = threading.Thread(target=self.__read_loop, daemon=True)
+
+    def start(self):
+        self.reader.start()
+        return self
+
+    def call(self, target, method, *args, **kwargs):
+        return self.call_timeout(self.timeout, target, method, *args, **kwargs)
+
+    def call_timeout(self, timeout, target, method, *args, **kwargs):
+        '''
+        Call a method on the other side and wait for the reply
+
+        :param timeout: seconds to wait for the reply, None to wait forever
+        :return: what the method returned, its exception is raised
+        '''
+        call_id = next(self.ids)
+        ev = threading.Event()
+        # the reader sets closed under plock, so a call registered here is always woken
+        with self.plock:
+            if self.closed:
+                raise PluginHostException('Plugin host channel is closed')
+            self.pending.update({call_id: [ev, None]})
+        try:
+            self.__send(('call', call_id, target, method, args, kwargs))
+        except OSError as e:
+            with self.plock:
+                self.pending.pop(call_id, None)
+            raise PluginHostException('Cannot send {} to the plugin host: {}'.format(method, e))
+        if not ev.wait(timeout):
+            with self.plock:
+                self.pending.pop(call_id, None)
+            raise PluginHostException('Plugin host did not reply to {} in {}s'.format(method, timeout))
+        with self.plock:
+            _, res = self.pending.pop(call_id)
+        ok, value = res
+        if not ok:
+            raise value
+        return value
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __send(self, msg):
+        data = pickle.dumps(msg, pickle.HIGHEST_PROTOCOL)
+        with self.wlock:
+            self.sock.sendall(self.HEADER.pack(len(data)) + data)
+
+    def __recv_exactly(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                return None
+            buf.extend(chunk)
+        return bytes(buf)
+
+    def __read_loop(self):
+        while True:
+            try:
+                header = self.__recv_exactly(self.HEADER.size)
+                data = None if header is None else self.__recv_exactly(self.HEADER.unpack(header)[0])
+            except OSError:
+                data = None
+            if data is None:
+                break
+            msg = pickle.loads(data)
+            if msg[0] == 'call':
+                threading.Thread(target=self.__serve, args=msg[1:], daemon=True).start()
+            elif msg[0] == 'reply':
+                with self.plock:
+                    p = self.pending.get(msg[1], None)
+                if p is not None:
+                    p[1] = (msg[2], msg[3])
+                    p[0].set()
+
+        with self.plock:
+            self.closed = True
+            for p in self.pending.values():
+                p[1] = (False, PluginHostException('Plugin host channel closed'))
+                p[0].set()
+
+    def __serve(self, call_id, target, method, args, kwargs):
+        try:
+            res = (True, self.handler(target, method, args, kwargs))
+        except Exception as e:
+            res = (False, e)
+        try:
+            self.__send(('reply', call_id) + res)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self.__send(('reply', call_id, False, PluginHostException('{}'.format(res[1]))))
+        except OSError:
+            pass
+
+
+class PluginProxy(object):
+    '''
+    Agent side stand-in of a plugin running in a child process,
+    any method of the plugin interface is forwarded to the child
+    '''
+
+    def __init__(self, name, version, plugin_uuid, channel, process, on_exit=None):
+        '''
+        :param on_exit: function(proxy, returncode) called if the child exits while the proxy is open
+        '''
+        self.name = name
+        self.version = version
+        self.uuid = plugin_uuid
+        self.channel = channel
+        self.process = process
+        self.on_exit = on_exit
+        self.closing = False
+        self.watcher = threading.Thread(target=self.__watch, daemon=True)
+        self.watcher.start()
+
+    def __getattr__(self, method):
+        if method.startswith('__'):
+            raise AttributeError(method)
+
+        def remote_call(*args, **kwargs):
+            return self.channel.call('plugin', method, *args, **kwargs)
+        return remote_call
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def pending(self):
+        '''
+        :return: number of calls waiting for a reply from the child
+        '''
+        return len(self.channel.pending)
+
+    def metrics(self):
+        '''
+        Collector of the metrics registry of the child, samples are labelled with the plugin name
+
+        :return: list of families
+        '''
+        return Metrics.with_labels(self.channel.call_timeout(METRICS_TIMEOUT, 'host', 'metrics'), host=self.name)
+
+    def close(self):
+        self.closing = True
+        self.channel.close()
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+    def __watch(self):
+        returncode = self.process.wait()
+        if self.closing:
+            return
+        # the pending calls fail as soon as the channel is closed
+        self.channel.close()
+        if self.on_exit is not None:
+            self.on_exit(self, returncode)
+
+
+class RemoteNetworkPlugin(object):
+    '''
+    Plugin side stand-in of a network plugin owned by the agent
+    '''
+
+    def __init__(self, channel, plugin_uuid):
+        self.channel = channel
+        self.uuid = plugin_uuid
+
+    def __getattr__(self, method):
+        if method.startswith('__'):
+            raise AttributeError(method)
+
+        def remote_call(*args, **kwargs):
+            return self.channel.call('network', method, self.uuid, *args, **kwargs)
+        return remote_call
+
+
+def start_plugin_host(agent, plugin, plugin_uuid, configuration, plugins_path, timeout=None, on_exit=None):
+    '''
+    Spawn the child process hosting the plugin and wait for it to be ready
+
+    :param agent: the FosAgent
+    :param plugin: plugin entry as returned by PluginLoader.locate_plugin
+    :param plugin_uuid: uuid of the plugin
+    :param configuration: plugin configuration
+    :param plugins_path: plugins directory
+    :param timeout: seconds a call to the plugin waits for its reply, None to wait forever
+    :param on_exit: function(proxy, returncode) called if the child dies
+    :return: PluginProxy
+    '''
+    sock_path = os.path.join(agent.base_path, '{}.sock'.format(plugin_uuid))
+    if os.path.exists(sock_path):
+        os.remove(sock_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(sock_path)
+    server.listen(1)
+
+    env = dict(os.environ)
+    env.update({'PYTHONPATH': os.pathsep.join([p for p in sys.path if p])})
+    process = subprocess.Popen([sys.executable, '-m', 'fog05.PluginHost', sock_path], env=env)
+    server.settimeout(60)
+    try:
+        conn, _ = server.accept()
+    except socket.timeout:
+        process.kill()
+        raise PluginHostException('Plugin host for {} did not connect'.format(plugin.get('name')))
+    finally:
+        server.close()
+        os.remove(sock_path)
+    conn.settimeout(None)
+
+    def handler(target, method, args, kwargs):
+        if target == 'network':
+            if method == 'list':
+                return list(agent.get_network_plugin(None).keys())
+            nw = agent.get_network_plugin(args[0])
+            return getattr(nw, method)(*args[1:], **kwargs)
+        raise PluginHostException('Unknown target {}'.format(target))
+
+    channel = RPCChannel(conn, handler, timeout).start()
+    params = {'name': plugin.get('name'), 'info': plugin.get('info'), 'plugins_path': plugins_path,
+              'uuid': plugin_uuid, 'configuration': configuration, 'node_uuid': str(agent.uuid),
+              'sys_id': agent.sys_id, 'yaks': agent.yaks_server, 'base_path': agent.base_path,
+              'debug': agent.debug, 'log_conf': agent.log_conf, 'state_file': agent.state_file if agent.warm_restart else None,
+              'profiling': agent.profiling_conf}
+    try:
+        # loading the plugin can take longer than a call
+        name, version, remote_uuid = channel.call_timeout(None, 'host', 'init', params)
+    except Exception:
+        channel.close()
+        process.kill()
+        raise
+    return PluginProxy(name, version, remote_uuid, channel, process, on_exit)
+
+
+class HostAgent(object):
+    '''
+    Agent context given to a plugin running in a child process,
+    it has its own connection to the store and its own OS plugin
+    '''
+
+    def __init__(self, params, channel):
+        from fog05.DLogger import DLogger
+        from fog05.LocalState import LocalState
+        from fog05.PluginLoader import PluginLoader
+        from fog05.Profiler import PluginProfiler
+        from fog05.store import Store
+        from fog05.interfaces.Constants import append_to_path, aroot, droot
+        from yaks.api import YAKS
+
+        self.channel = channel
+        self.logger = DLogger(debug_flag=params.get('debug'))
+        log_conf = dict(params.get('log_conf', {}))
+        # the rotating file cannot be shared with the agent
+        log_conf.update({'file': '{}.{}'.format(log_conf.get('file', 'fosagent_log.log'), params.get('name'))})
+        self.logger.configure(log_conf)
+        self.uuid = params.get('node_uuid')
+        self.sys_id = params.get('sys_id')
+        self.base_path = params.get('base_path')
+        self.pl = PluginLoader(params.get('plugins_path'))
+        self.pl.get_plugins()
+        platform = 'windows' if sys.platform in ['windows', 'Windows', 'win32'] else 'linux'
+        self.__osPlugin = self.pl.load_plugin(self.pl.locate_plugin(platform)).run(agent=self)
+        self.state = None
+        if params.get('state_file') is not None:
+            self.state = LocalState(params.get('state_file'))
+
+        self.yaks = YAKS.login(params.get('yaks'))
+        self.droot = append_to_path(droot, self.sys_id)
+        self.dhome = '{}/{}'.format(self.droot, self.uuid)
+        self.dstore = Store(self.yaks, self.droot, self.dhome, 1024)
+        self.aroot = append_to_path(aroot, self.sys_id)
+        self.ahome = '{}/{}'.format(self.aroot, self.uuid)
+        self.astore = Store(self.yaks, self.aroot, self.ahome, 1024)
+        self.profiler = PluginProfiler(self, params.get('profiling'))
+
+    def get_os_plugin(self):
+        return self.__osPlugin
+
+    def get_network_plugin(self, cnetwork_uuid):
+        if cnetwork_uuid is None:
+            return dict((k, RemoteNetworkPlugin(self.channel, k)) for k in self.channel.call('network', 'list'))
+        else:
+            return RemoteNetworkPlugin(self.channel, cnetwork_uuid)
+
+
+def main(sock_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(sock_path)
+    hosted = {}
+
+    def handler(target, method, args, kwargs):
+        if target == 'host' and method == 'init':
+            params = args[0]
+            agent = HostAgent(params, channel)
+            plugin = agent.pl.load_plugin(agent.pl.locate_plugin(params.get('name')))
+            plugin = plugin.run(agent=agent, uuid=params.get('uuid'), configuration=params.get('configuration'))
+            agent.profiler.wrap(plugin)
+            agent.profiler.start()
+            hosted.update({'plugin': plugin})
+            return plugin.name, plugin.version, plugin.uuid
+        if target == 'host' and method == 'metrics':
+            return Metrics.REGISTRY.collect()
+        if target == 'plugin':
+            return getattr(hosted.get('plugin'), method)(*args, **kwargs)
+        raise PluginHostException('Unknown target {}'.format(target))
+
+    channel = RPCChannel(sock, handler).start()
+    channel.reader.join()
+
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv[1])
+    except Exception:
+        traceback.print_exc()
+        sys.exit(-1)
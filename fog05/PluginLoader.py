@@ -13,10 +13,15 @@
 # Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
 
 import importlib
-import importlib.machinery
+import importlib.util
+import json
 import os
 import sys
-import pip
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fog05 import Metrics
+from fog05.PluginHost import start_plugin_host
 
 
 class PluginLoader(object):
@@ -25,26 +30,137 @@ class PluginLoader(object):
         self.PluginFolder = plugin_path
         self.MainModule = "__init__"
         self.plugins = []
+        # name -> {'info', 'mtime', 'manifest', 'manifest_mtime'}
+        self.__discovery_cache = {}
+        # name -> (mtimes of the plugin .py files, module)
+        self.__modules = {}
+        # plugin uuid -> PluginProxy
+        self.hosts = {}
+        # sorted requirements tuple -> Future(bool)
+        self.__requirements_cache = {}
+        self.__requirements_lock = threading.Lock()
+        self.__installer = ThreadPoolExecutor(max_workers=1)
 
     def get_plugins(self):
+        '''
+        Enumerate the plugins in the plugin folder, directories and manifests
+        that did not change since the last call are taken from the cache
+
+        :return: list of {'name', 'info', 'manifest'}
+        '''
         self.plugins = []
         possible_plugins = os.listdir(self.PluginFolder)
         for p in possible_plugins:
             location = os.path.join(self.PluginFolder, p)
-            if not os.path.isdir(location) or not '{}.py'.format(self.MainModule) in os.listdir(location):
+            info = os.path.join(location, '{}.py'.format(self.MainModule))
+            try:
+                mtime = os.stat(info).st_mtime
+            except (FileNotFoundError, NotADirectoryError):
+                self.__discovery_cache.pop(p, None)
                 continue
 
-            info = os.path.join(location, '{}.py'.format(self.MainModule))
-            self.plugins.append({"name": p, "info": info})
-            sys.path.append(os.path.join(sys.path[0], self.PluginFolder, p))
+            cached = self.__discovery_cache.get(p, None)
+            mfile = os.path.join(location, '{}_plugin.json'.format(p))
+            try:
+                manifest_mtime = os.stat(mfile).st_mtime
+            except FileNotFoundError:
+                manifest_mtime = None
+
+            if cached is None or cached.get('mtime') != mtime or cached.get('manifest_mtime') != manifest_mtime:
+                manifest = None
+                if manifest_mtime is not None:
+                    with open(mfile, 'r') as f:
+                        manifest = json.loads(f.read())
+                cached = {'info': info, 'mtime': mtime, 'manifest': manifest, 'manifest_mtime': manifest_mtime}
+                self.__discovery_cache.update({p: cached})
+                self.__add_to_path(os.path.join(sys.path[0], self.PluginFolder, p))
+
+            self.plugins.append({"name": p, "info": info, "manifest": cached.get('manifest')})
         return self.plugins
 
+    def get_manifest(self, name):
+        '''
+        Return the cached manifest (<name>_plugin.json) of a plugin
+
+        :param name: plugin name
+        :return: dict or None
+        '''
+        cached = self.__discovery_cache.get(name, None)
+        if cached is None:
+            return None
+        return cached.get('manifest')
+
     def load_plugin(self, name):
+        '''
+        Load the plugin module, the module body is executed lazily at the first
+        attribute access, and the module is reused until one of the .py files of the plugin changes,
+        then the plugin modules imported by the old one are dropped from sys.modules so they are imported again
 
-        module = importlib.machinery.SourceFileLoader(name['name'], name['info']).load_module()
-        sys.path.append(os.path.abspath(name['info']))
+        :param name: plugin entry as returned by locate_plugin
+        :return: the plugin module
+        '''
+        location = os.path.dirname(os.path.abspath(name['info']))
+        mtimes = self.__source_mtimes(location)
+        cached = self.__modules.get(name['name'], None)
+        if cached is not None and cached[0] == mtimes:
+            return cached[1]
+        if cached is not None:
+            self.__evict_modules(location)
+
+        spec = importlib.util.spec_from_file_location(name['name'], name['info'])
+        spec.loader = importlib.util.LazyLoader(spec.loader)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name['name']] = module
+        spec.loader.exec_module(module)
+        self.__add_to_path(location)
+        self.__modules.update({name['name']: (mtimes, module)})
         return module
 
+    def __source_mtimes(self, location):
+        mtimes = []
+        for f in sorted(os.listdir(location)):
+            if f.endswith('.py'):
+                mtimes.append((f, os.stat(os.path.join(location, f)).st_mtime))
+        return tuple(mtimes)
+
+    def __evict_modules(self, location):
+        for k, m in list(sys.modules.items()):
+            f = getattr(m, '__file__', None)
+            if f is not None and os.path.dirname(os.path.abspath(f)) == location:
+                sys.modules.pop(k, None)
+
+    def host_plugin(self, name, agent, plugin_uuid, configuration=None, timeout=None, on_exit=None):
+        '''
+        Start the plugin in a child process instead of loading it in the agent
+
+        :param name: plugin entry as returned by locate_plugin
+        :param agent: the agent
+        :param plugin_uuid: uuid of the plugin
+        :param configuration: plugin configuration
+        :param timeout: seconds a call to the plugin waits for its reply, None to wait forever
+        :param on_exit: function(proxy, returncode) called if the child dies
+        :return: a PluginProxy exposing the plugin interface
+        '''
+        proxy = start_plugin_host(agent, name, plugin_uuid, configuration, self.PluginFolder, timeout, on_exit)
+        self.hosts.update({proxy.uuid: proxy})
+        Metrics.REGISTRY.add_collector(proxy.metrics)
+        return proxy
+
+    def remove_host(self, plugin_uuid):
+        '''
+        Forget a plugin host, eg. when its process died
+
+        :param plugin_uuid: uuid of the plugin
+        '''
+        proxy = self.hosts.pop(plugin_uuid, None)
+        if proxy is not None:
+            Metrics.REGISTRY.remove_collector(proxy.metrics)
+        return proxy
+
+    def close_hosts(self):
+        for k in list(self.hosts.keys()):
+            self.remove_host(k).close()
+
     def locate_plugin(self, name):
         located = [x for x in self.plugins if x["name"] == name]
         if len(located) > 0:
@@ -52,8 +168,37 @@ class PluginLoader(object):
         return None
 
     def install_requirements(self, requirements):
-        pip_args = ['install']
-        for r in requirements:
-            pip_args.append(r)
+        return self.install_requirements_async(requirements).result()
+
+    def install_requirements_async(self, requirements, callback=None):
+        '''
+        Install the requirements in background, one pip at a time.
+        A requirement set already installed, or being installed, is not installed again
+
+        :param requirements: list of pip requirements
+        :param callback: function(ok) called when the installation is done
+        :return: Future with the installation result
+        '''
+        key = tuple(sorted(set(requirements)))
+        with self.__requirements_lock:
+            f = self.__requirements_cache.get(key, None)
+            # a failed installation is tried again
+            if f is None or (f.done() and (f.exception() is not None or not f.result())):
+                f = self.__installer.submit(self.__pip_install, key)
+                self.__requirements_cache.update({key: f})
+        if callback is not None:
+            f.add_done_callback(lambda x: callback(x.result()))
+        return f
+
+    def __pip_install(self, requirements):
+        if len(requirements) == 0:
+            return True
+        cmd = [sys.executable, '-m', 'pip', 'install'] + list(requirements)
+        try:
+            return subprocess.call(cmd) == 0
+        except Exception:
+            return False
 
-        pip.main(pip_args)
+    def __add_to_path(self, path):
+        if path not in sys.path:
+            sys.path.append(path)
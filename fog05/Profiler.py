@@ -0,0 +1,286 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Plugin handlers profiling
+
+The entry points of runtime and network plugins are wrapped, when profiling is enabled
+every call is profiled and the calls slower than the threshold are kept:
+
+- cprofile mode: the call runs under cProfile, the stats are dumped to <plugin>.<method>.<time>.prof
+- sample mode: the stack of the calling thread is sampled every interval seconds,
+  the samples are dumped in collapsed format (one stack per line, root first, with its count)
+  to <plugin>.<method>.<time>.folded, ready for flamegraph.pl
+
+The slowest calls of each plugin are written to <base path>/profiles/<plugin>.json and to
+the actual store in <ahome>/profiling/<plugin>. Profiling is toggled at runtime with
+
+    <dhome>/profiling = {"enabled": true, "mode": "sample", "threshold": 0.5}
+'''
+
+import os
+import sys
+import json
+import time
+import heapq
+import pstats
+import cProfile
+import threading
+import functools
+import traceback
+from collections import Counter
+
+
+RUNTIME_ENTRY_POINTS = ('define_entity', 'undefine_entity', 'configure_entity', 'clean_entity', 'run_entity',
+                        'stop_entity', 'pause_entity', 'resume_entity', 'scale_entity', 'migrate_entity',
+                        'before_migrate_entity_actions', 'after_migrate_entity_actions')
+
+NETWORK_ENTRY_POINTS = ('create_virtual_interface', 'create_virtual_bridge', 'allocate_bandwidth',
+                        'create_virtual_network', 'assign_interface_to_network', 'delete_virtual_interface',
+                        'delete_virtual_bridge', 'remove_interface_from_network', 'delete_virtual_network',
+                        'create_virtual_link', 'create_connection_point')
+
+MODES = ('cprofile', 'sample')
+
+
+class PluginProfiler(object):
+
+    def __init__(self, agent, options=None):
+        '''
+        :param agent: the agent, its stores are used for the toggle key and the offenders
+        :param options: dictionary with enabled, mode, threshold (seconds), interval (seconds), top
+        '''
+        self.agent = agent
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.enabled = False
+        self.mode = 'sample'
+        self.threshold = 0.5
+        self.interval = 0.01
+        self.top = 10
+        self.path = os.path.join(agent.base_path, 'profiles')
+        self.offenders = {}
+        self.sampled = {}
+        self.sampler = None
+        self.subscription = None
+        self.configure(options or {})
+
+    def configure(self, options):
+        '''
+        Change the profiling options, also used by the toggle key
+
+        :param options: dictionary with enabled, mode, threshold, interval, top
+        '''
+        enabled = options.get('enabled', self.enabled)
+        if isinstance(enabled, str):
+            enabled = enabled.lower() in ['true', 'yes', 'on', '1']
+        mode = options.get('mode', self.mode)
+        if mode not in MODES:
+            self.agent.logger.warning('configure()', '[ WARN ] Profiler - Unknown mode {}, using sample'.format(mode))
+            mode = 'sample'
+        with self.lock:
+            self.mode = mode
+            self.threshold = float(options.get('threshold', self.threshold))
+            self.interval = float(options.get('interval', self.interval))
+            self.top = int(options.get('top', self.top))
+            self.enabled = enabled
+            if enabled and not os.path.exists(self.path):
+                os.makedirs(self.path)
+            if enabled and self.mode == 'sample' and self.sampler is None:
+                self.sampler = threading.Thread(target=self.__sample_loop, daemon=True)
+                self.sampler.start()
+        self.agent.logger.info('configure()', 'Profiler - enabled: {} mode: {} threshold: {}s'.format(
+            self.enabled, self.mode, self.threshold))
+
+    def start(self):
+        '''
+        Observe the toggle key in the desired store
+        '''
+        uri = '{}/profiling'.format(self.agent.dhome)
+        self.subscription = self.agent.dstore.observe(uri, self.__react_to_toggle)
+        return self
+
+    def stop(self):
+        if self.subscription is not None:
+            self.agent.dstore.overlook(self.subscription)
+            self.subscription = None
+        with self.lock:
+            self.enabled = False
+
+    def wrap(self, plugin):
+        '''
+        Wrap the entry points of a runtime or network plugin,
+        the wrappers are set on the instance so internal calls go through them as well
+
+        :param plugin: the plugin
+        :return: the plugin
+        '''
+        for method in RUNTIME_ENTRY_POINTS + NETWORK_ENTRY_POINTS:
+            fun = getattr(plugin, method, None)
+            if fun is not None and callable(fun):
+                setattr(plugin, method, self.__wrap(plugin.name, method, fun))
+        return plugin
+
+    def get_offenders(self, plugin_name):
+        '''
+        :return: the slowest calls kept for the plugin, slowest first
+        '''
+        with self.lock:
+            return sorted(self.offenders.get(plugin_name, []), key=lambda o: o[0], reverse=True)
+
+    def __wrap(self, plugin_name, method, fun):
+
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            # nested entry points (eg. run_entity calling configure_entity) are part of the outer profile
+            if not self.enabled or getattr(self.local, 'active', False):
+                return fun(*args, **kwargs)
+            self.local.active = True
+            try:
+                if self.mode == 'cprofile':
+                    return self.__call_cprofile(plugin_name, method, fun, args, kwargs)
+                return self.__call_sampled(plugin_name, method, fun, args, kwargs)
+            finally:
+                self.local.active = False
+        return wrapper
+
+    def __call_cprofile(self, plugin_name, method, fun, args, kwargs):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active in this interpreter
+            return fun(*args, **kwargs)
+        start = time.time()
+        try:
+            return fun(*args, **kwargs)
+        finally:
+            profile.disable()
+            latency = time.time() - start
+            if latency >= self.threshold:
+                self.__record(plugin_name, method, latency, profile, None)
+
+    def __call_sampled(self, plugin_name, method, fun, args, kwargs):
+        samples = Counter()
+        key = object()
+        with self.lock:
+            self.sampled.update({key: (threading.get_ident(), samples)})
+        start = time.time()
+        try:
+            return fun(*args, **kwargs)
+        finally:
+            latency = time.time() - start
+            with self.lock:
+                self.sampled.pop(key, None)
+                # the sampler could still be adding to the counter it listed before
+                samples = Counter(samples)
+            if latency >= self.threshold:
+                self.__record(plugin_name, method, latency, None, samples)
+
+    def __sample_loop(self):
+        while True:
+            with self.lock:
+                if not self.enabled or self.mode != 'sample':
+                    self.sampler = None
+                    return
+                interval = self.interval
+                sampled = list(self.sampled.values())
+            if len(sampled) > 0:
+                frames = sys._current_frames()
+                stacks = [(samples, _collapse(frames.get(tid))) for tid, samples in sampled if frames.get(tid) is not None]
+                with self.lock:
+                    for samples, stack in stacks:
+                        samples[stack] += 1
+            time.sleep(interval)
+
+    def __record(self, plugin_name, method, latency, profile, samples):
+        ts = time.time()
+        name = '{}.{}.{}'.format(plugin_name, method, int(ts * 1000))
+        try:
+            if profile is not None:
+                file_name = os.path.join(self.path, '{}.prof'.format(name))
+                profile.dump_stats(file_name)
+                hot = _top_functions(profile, 5)
+            else:
+                file_name = os.path.join(self.path, '{}.folded'.format(name))
+                with open(file_name, 'w') as f:
+                    for stack, count in samples.most_common():
+                        f.write('{} {}\n'.format(stack, count))
+                hot = [{'function': stack.split(';')[-1], 'samples': count}
+                       for stack, count in _leaves(samples).most_common(5)]
+        except Exception as e:
+            self.agent.logger.error('__record()', 'Profiler - Cannot save profile of {}.{}: {}'.format(plugin_name, method, e))
+            return
+        offender = {'plugin': plugin_name, 'method': method, 'latency': latency, 'time': ts,
+                    'profile': file_name, 'hot': hot}
+        self.agent.logger.warning('__record()', 'Profiler - {}.{} took {:.3f}s, profile in {}'.format(
+            plugin_name, method, latency, file_name))
+        with self.lock:
+            kept = self.offenders.setdefault(plugin_name, [])
+            # (latency, time, offender), a min heap keeps the slowest top calls
+            if len(kept) < self.top:
+                heapq.heappush(kept, (latency, ts, offender))
+            elif latency > kept[0][0]:
+                dropped = heapq.heapreplace(kept, (latency, ts, offender))[2]
+                self.__remove_profile(dropped.get('profile'))
+            else:
+                self.__remove_profile(file_name)
+                return
+            top = [o[2] for o in sorted(kept, key=lambda o: o[0], reverse=True)]
+        self.__save_offenders(plugin_name, top)
+
+    def __remove_profile(self, file_name):
+        try:
+            os.remove(file_name)
+        except OSError:
+            pass
+
+    def __save_offenders(self, plugin_name, top):
+        value = json.dumps({'plugin': plugin_name, 'offenders': top})
+        try:
+            with open(os.path.join(self.path, '{}.json'.format(plugin_name)), 'w') as f:
+                f.write(value)
+            self.agent.astore.put('{}/profiling/{}'.format(self.agent.ahome, plugin_name), value)
+        except Exception as e:
+            self.agent.logger.error('__save_offenders()', 'Profiler - Cannot save offenders of {}: {}'.format(plugin_name, e))
+
+    def __react_to_toggle(self, uri, value, v):
+        if value is None or value == '':
+            return
+        try:
+            self.configure(json.loads(value))
+        except (ValueError, TypeError) as e:
+            self.agent.logger.error('__react_to_toggle()', 'Profiler - Wrong profiling options {}: {}'.format(value, e))
+
+
+def _collapse(frame):
+    stack = []
+    for fs in traceback.extract_stack(frame):
+        stack.append('{}:{}:{}'.format(os.path.basename(fs.filename), fs.name, fs.lineno))
+    return ';'.join(stack)
+
+
+def _leaves(samples):
+    leaves = Counter()
+    for stack, count in samples.items():
+        leaves[stack.split(';')[-1]] += count
+    return leaves
+
+
+def _top_functions(profile, n):
+    stats = pstats.Stats(profile).stats
+    # (file, line, function): (calls, primitive calls, total time, cumulative time, callers)
+    top = sorted(stats.items(), key=lambda s: s[1][2], reverse=True)[:n]
+    return [{'function': '{}:{}:{}'.format(os.path.basename(f), fn, l), 'calls': st[0], 'tottime': st[2],
+             'cumtime': st[3]} for (f, l, fn), st in top]
@@ -14,8 +14,29 @@
 
 import json
 import os
-resource_package = 'fog05'
-resource_path = '/'.join(('json_objects', 'network.schema'))
+import threading
+from jsonschema import validators
+
+SCHEMA_FILES = {
+    'network': 'network.schema',
+    'atomic_entity': 'atomic_entity_definition.schema',
+    'vm': 'vm.schema',
+    'native': 'native_define.schema',
+    'container': 'container.schema',
+    'ros2': 'ros2_define.schema',
+    'entity': 'entity_definition.schema'
+}
+
+__schemas = {}
+__validators = {}
+__lock = threading.Lock()
+
+
+class ManifestValidationError(Exception):
+    def __init__(self, message, errors=0):
+        super(ManifestValidationError, self).__init__(message)
+        self.message = message
+        self.errors = errors
 
 
 def read_file(file_path):
@@ -24,10 +45,70 @@ def read_file(file_path):
     return data
 
 
-network_schema = json.loads(read_file(os.path.join(os.path.dirname(__file__), 'json_objects', 'network.schema')))
-atomic_entity_schema = json.loads(read_file(os.path.join(os.path.dirname(__file__), 'json_objects', 'atomic_entity_definition.schema')))
-vm_schema = json.loads(read_file(os.path.join(os.path.dirname(__file__), 'json_objects', 'vm.schema')))
-native_schema = json.loads(read_file(os.path.join(os.path.dirname(__file__), 'json_objects', 'native_define.schema')))
-container_schema = json.loads(read_file(os.path.join(os.path.dirname(__file__), 'json_objects', 'container.schema')))
-ros2_schema = json.loads(read_file(os.path.join(os.path.dirname(__file__), 'json_objects', 'ros2_define.schema')))
-entity_schema = json.loads(read_file(os.path.join(os.path.dirname(__file__), 'json_objects', 'entity_definition.schema')))
+def get_schema(name):
+    '''
+    Load a schema the first time it is needed
+
+    :param name: schema name (eg. vm, container, network)
+    :return: dictionary
+    '''
+    schema = __schemas.get(name)
+    if schema is None:
+        if name not in SCHEMA_FILES:
+            raise ValueError('Unknown schema {}'.format(name))
+        schema = json.loads(read_file(os.path.join(os.path.dirname(__file__), 'json_objects', SCHEMA_FILES.get(name))))
+        __schemas.update({name: schema})
+    return schema
+
+
+def get_validator(name):
+    '''
+    The validator class is selected by the $schema of the schema,
+    the schema itself is checked only once, when the validator is created
+
+    :param name: schema name
+    :return: jsonschema validator
+    '''
+    v = __validators.get(name)
+    if v is None:
+        with __lock:
+            v = __validators.get(name)
+            if v is None:
+                schema = get_schema(name)
+                cls = validators.validator_for(schema)
+                cls.check_schema(schema)
+                v = cls(schema)
+                __validators.update({name: v})
+    return v
+
+
+def iter_errors(manifest, name):
+    '''
+    Lazily yield the validation errors of the manifest
+
+    :param manifest: dictionary
+    :param name: schema name
+    :return: generator of jsonschema ValidationError
+    '''
+    return get_validator(name).iter_errors(manifest)
+
+
+def validate(manifest, name):
+    '''
+    Validate the manifest collecting all the errors
+
+    :param manifest: dictionary
+    :param name: schema name
+    :raise ManifestValidationError: with all the errors in errors
+    '''
+    errors = sorted(iter_errors(manifest, name), key=lambda e: [str(x) for x in e.path])
+    if len(errors) > 0:
+        msg = '; '.join(['{}: {}'.format('/'.join([str(x) for x in e.path]), e.message) for e in errors])
+        raise ManifestValidationError(msg, errors)
+
+
+def __getattr__(attr):
+    # keeps Schemas.<name>_schema working, without reading all the files at import time
+    if attr.endswith('_schema') and attr[:-len('_schema')] in SCHEMA_FILES:
+        return get_schema(attr[:-len('_schema')])
+    raise AttributeError(attr)
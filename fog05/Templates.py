@@ -0,0 +1,70 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+import os
+import threading
+from jinja2 import Environment
+
+
+class TemplateService(object):
+    '''
+    Jinja2 templates of the plugins, compiled once
+
+    Every template file is read and compiled the first time it is rendered and kept
+    with the modification time of the file, it is compiled again only when the file changes
+    '''
+
+    def __init__(self):
+        self.environment = Environment()
+        self.templates = {}
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        '''
+        :param path: path of the template file
+        :return: the compiled jinja2.Template
+        '''
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime
+        with self.lock:
+            cached = self.templates.get(path, None)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'r') as f:
+            template = self.environment.from_string(f.read())
+        with self.lock:
+            self.templates.update({path: (mtime, template)})
+        return template
+
+    def render(self, path, **values):
+        '''
+        :param path: path of the template file
+        :param values: template variables
+        :return: the rendered string
+        '''
+        return self.get(path).render(**values)
+
+    def clear(self):
+        with self.lock:
+            self.templates = {}
+
+
+TEMPLATES = TemplateService()
+
+
+def render(path, **values):
+    '''
+    Render a template file through the shared TemplateService
+    '''
+    return TEMPLATES.render(path, **values)
@@ -0,0 +1,260 @@
+# Copyright (c) 2014,2018 Contributors to the Eclipse Foundation
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
+
+'''
+Lifecycle tracing
+
+The API stamps a trace context in the desired store document of the entity or instance:
+
+    'trace': {'trace_id': ..., 'action': 'configure', 'requested': <time>}
+
+the plugin observer activates it (traced()) while the action is handled, the steps of the
+plugin are recorded as spans (span()) and the context is written back in the actual store
+document (stamp()) with the received and committed times:
+
+    'trace': {'trace_id': ..., 'action': ..., 'requested': ..., 'received': ..., 'committed': ...,
+              'spans': [{'name': 'qemu-img', 'start': ..., 'end': ...}, ...]}
+
+TraceCollector gathers these documents on the API side and reports the latency of each phase.
+Times are taken on different machines, so dispatch and total include the clock offset between
+the API host and the node
+'''
+
+import json
+import time
+import uuid
+import threading
+import functools
+from contextlib import contextmanager
+
+
+TRACE_KEY = 'trace'
+
+_local = threading.local()
+
+
+def new_context(action, trace_id=None):
+    '''
+    :param action: the action requested (define, configure, run, ...)
+    :param trace_id: trace the action belongs to, a new one is generated if None
+    :return: trace context to be put in the desired store document
+    '''
+    if trace_id is None:
+        trace_id = str(uuid.uuid4())
+    return {'trace_id': trace_id, 'action': action, 'requested': time.time()}
+
+
+def to_uri(ctx):
+    '''
+    :return: the context as dput uri values, to be appended to '#status=<action>'
+    '''
+    return '&'.join('{}.{}={}'.format(TRACE_KEY, k, v) for k, v in ctx.items())
+
+
+def current():
+    '''
+    :return: the trace context active in this thread, None if there is no one
+    '''
+    return getattr(_local, 'ctx', None)
+
+
+@contextmanager
+def context(ctx):
+    '''
+    Activate a trace context in this thread
+
+    :param ctx: the trace context read from the desired store, if None nothing is traced
+    '''
+    if ctx is None:
+        yield None
+        return
+    previous = current()
+    ctx = dict(ctx)
+    ctx.update({'received': time.time(), 'spans': []})
+    _local.ctx = ctx
+    try:
+        yield ctx
+    finally:
+        _local.ctx = previous
+
+
+@contextmanager
+def span(name):
+    '''
+    Record a step of the action in the active trace, does nothing if no trace is active
+
+    :param name: name of the step, eg. qemu-img
+    '''
+    ctx = current()
+    if ctx is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        ctx.get('spans').append({'name': name, 'start': start, 'end': time.time()})
+
+
+def traced(callback):
+    '''
+    Wrap a store observer callback(key, value, version), the trace context found
+    in the JSON value is active while the callback runs
+
+    :param callback: the observer
+    :return: the wrapped observer
+    '''
+
+    @functools.wraps(callback)
+    def wrapper(key, value, v):
+        ctx = None
+        # most documents carry no trace, do not decode them twice
+        if value is not None and '"{}"'.format(TRACE_KEY) in value:
+            try:
+                ctx = json.loads(value).get(TRACE_KEY)
+            except (ValueError, AttributeError):
+                ctx = None
+        with context(ctx):
+            return callback(key, value, v)
+    return wrapper
+
+
+def stamp(value):
+    '''
+    Add the active trace context to a document before it is written in the actual store
+
+    :param value: dictionary
+    :return: the dictionary
+    '''
+    ctx = current()
+    if ctx is not None:
+        ctx = dict(ctx)
+        ctx.update({'committed': time.time(), 'spans': list(ctx.get('spans'))})
+        value.update({TRACE_KEY: ctx})
+    return value
+
+
+def phases(ctx):
+    '''
+    :param ctx: trace context read from the actual store
+    :return: list of (phase, seconds)
+    '''
+    res = []
+    requested = _time(ctx.get('requested'))
+    received = _time(ctx.get('received'))
+    committed = _time(ctx.get('committed'))
+    if requested is not None and received is not None:
+        res.append(('dispatch', received - requested))
+    for s in ctx.get('spans', []):
+        res.append((s.get('name'), s.get('end') - s.get('start')))
+    if received is not None and committed is not None:
+        res.append(('plugin', committed - received))
+    if requested is not None and committed is not None:
+        res.append(('total', committed - requested))
+    return res
+
+
+def _time(value):
+    # values written with dput are strings
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TraceCollector(object):
+    '''
+    API side collector of the traces written back in the actual store
+    '''
+
+    def __init__(self, store, aroot):
+        '''
+        :param store: actual store
+        :param aroot: actual store root
+        '''
+        self.store = store
+        self.aroot = aroot
+        self.lock = threading.Lock()
+        self.trace_id = None
+        self.traces = {}
+        self.subscription = None
+
+    def start(self, trace_id=None):
+        '''
+        Start collecting a trace, the entity actions issued by the API are stamped with it
+        until stop() is called, so a whole deployment can be reported at once
+
+        :param trace_id: trace id, a new one is generated if None
+        :return: the trace id
+        '''
+        if trace_id is None:
+            trace_id = str(uuid.uuid4())
+        with self.lock:
+            self.trace_id = trace_id
+            self.traces = {}
+        if self.subscription is None:
+            uri = '{}/*/runtime/*/entity/**'.format(self.aroot)
+            self.subscription = self.store.observe(uri, self.__react_to_actual)
+        return trace_id
+
+    def stop(self):
+        '''
+        Stop collecting, the report of the collected trace is still available
+        '''
+        if self.subscription is not None:
+            self.store.overlook(self.subscription)
+            self.subscription = None
+        with self.lock:
+            self.trace_id = None
+
+    def context(self, action):
+        '''
+        :return: the trace context for a new action, part of the collected trace if any
+        '''
+        return new_context(action, self.trace_id)
+
+    def report(self):
+        '''
+        :return: dictionary phase -> {'count', 'mean', 'p50', 'p95', 'max'} in seconds
+        '''
+        samples = {}
+        with self.lock:
+            traces = list(self.traces.values())
+        for ctx in traces:
+            for name, seconds in phases(ctx):
+                samples.setdefault(name, []).append(seconds)
+        res = {}
+        for name, values in samples.items():
+            values.sort()
+            res.update({name: {'count': len(values), 'mean': sum(values) / len(values),
+                               'p50': _percentile(values, 0.5), 'p95': _percentile(values, 0.95),
+                               'max': values[-1]}})
+        return res
+
+    def __react_to_actual(self, key, value, v):
+        if value is None or '"{}"'.format(TRACE_KEY) not in value:
+            return
+        try:
+            ctx = json.loads(value).get(TRACE_KEY)
+        except (ValueError, AttributeError):
+            return
+        with self.lock:
+            if ctx is None or ctx.get('trace_id') != self.trace_id:
+                return
+            # the same document is written again by the monitoring loops, keep the last commit
+            self.traces.update({(key, ctx.get('action'), ctx.get('requested')): ctx})
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
@@ -12,8 +12,10 @@
 #
 # Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
 
-from jsonschema import validate, ValidationError
 from fog05 import Schemas
+from fog05 import Tracing
+from fog05.Heartbeat import FailureDetector
+from fog05.Schemas import ManifestValidationError
 # from dstore import Store
 from enum import Enum
 import re
@@ -45,13 +47,16 @@ class API(object):
         self.node = self.Node(self.store)
         self.plugin = self.Plugin(self.store)
         self.network = self.Network(self.store)
-        self.entity = self.Entity(self.store)
+        self.trace = Tracing.TraceCollector(self.store.actual, self.a_root)
+        self.entity = self.Entity(self.store, self.trace)
         self.image = self.Image(self.store)
         self.flavor = self.Flavor(self.store)
         self.onboard = self.add
         self.offload = self.remove
 
     def close(self):
+        self.node.detector.stop()
+        self.trace.stop()
         self.store.close()
 
     def add(self, manifest):
@@ -69,8 +74,8 @@ class API(object):
         networks_uuid = []
 
         try:
-            validate(manifest, Schemas.entity_schema)
-        except ValidationError as ve:
+            Schemas.validate(manifest, 'entity')
+        except ManifestValidationError as ve:
             print(ve.message)
             exit(-1)
         nws = manifest.get('networks')
@@ -101,6 +106,9 @@ class API(object):
                 component = search[0]
                 # print('Onboarding: {}'.format(component))
                 mf = component.get('manifest')
+                if not self.node.is_alive(component.get('node')):
+                    raise Exception('Error on define entity {} -> {} on {}   (node is not alive)'.format(
+                        manifest.get('uuid'), mf.get('uuid'), component.get('node')))
                 res = self.entity.define(
                     manifest=mf, node_uuid=component.get('node'), wait=True)
                 # print(res)
@@ -220,32 +228,28 @@ class API(object):
                 t = manifest.get('type')
                 try:
                     if t == 'vm':
-                        validate(manifest.get('entity_data'),
-                                 Schemas.vm_schema)
+                        Schemas.validate(manifest.get('entity_data'), 'vm')
                     elif t == 'container':
-                        validate(manifest.get('entity_data'),
-                                 Schemas.container_schema)
+                        Schemas.validate(manifest.get('entity_data'), 'container')
                     elif t == 'native':
-                        validate(manifest.get('entity_data'),
-                                 Schemas.native_schema)
+                        Schemas.validate(manifest.get('entity_data'), 'native')
                     elif t == 'ros2':
-                        validate(manifest.get('entity_data'),
-                                 Schemas.ros2_schema)
+                        Schemas.validate(manifest.get('entity_data'), 'ros2')
                     elif t == 'usvc':
                         return False
                     else:
                         return False
-                except ValidationError as ve:
+                except ManifestValidationError as ve:
                     return False
             if manifest_type == self.Type.NETWORK:
                 try:
-                    validate(manifest, Schemas.network_schema)
-                except ValidationError as ve:
+                    Schemas.validate(manifest, 'network')
+                except ManifestValidationError as ve:
                     return False
             if manifest_type == self.Type.ENTITY:
                 try:
-                    validate(manifest, Schemas.entity_schema)
-                except ValidationError as ve:
+                    Schemas.validate(manifest, 'entity')
+                except ManifestValidationError as ve:
                     return False
 
             return True
@@ -271,21 +275,34 @@ class API(object):
             if store is None:
                 raise RuntimeError('store cannot be none in API!')
             self.store = store
+            self.detector = FailureDetector(self.store.actual, self.store.aroot)
 
-        def list(self):
+        def list(self, include_dead=False):
             '''
             Get all nodes in the current system/tenant
 
+            :param include_dead: also return the nodes whose agent stopped sending heartbeats
             :return: list of tuples (uuid, hostname)
             '''
             nodes = []
             uri = '{}/*'.format(self.store.aroot)
             infos = self.store.actual.resolveAll(uri)
+            alive = None if include_dead else self.detector.alive()
             for i in infos:
                 node_info = json.loads(i[1])
-                nodes.append((node_info.get('uuid'), node_info.get('name')))
+                if alive is None or node_info.get('uuid') in alive:
+                    nodes.append((node_info.get('uuid'), node_info.get('name')))
             return nodes
 
+        def is_alive(self, node_uuid):
+            '''
+            Check the heartbeats of a node, a node is dead when it missed three heartbeats
+
+            :param node_uuid: the uuid of the node
+            :return: boolean
+            '''
+            return self.detector.is_alive(node_uuid)
+
         def info(self, node_uuid):
             """
             Provide all information about a specific node
@@ -551,10 +568,16 @@ class API(object):
 
         '''
 
-        def __init__(self, store=None):
+        def __init__(self, store=None, tracer=None):
             if store is None:
                 raise RuntimeError('store cannot be none in API!')
             self.store = store
+            self.tracer = tracer
+
+        def __trace(self, action):
+            if self.tracer is None:
+                return Tracing.new_context(action)
+            return self.tracer.context(action)
 
         def __search_plugin_by_name(self, name, node_uuid):
             uri = '{}/{}/plugins'.format(self.store.aroot, node_uuid)
@@ -669,16 +692,16 @@ class API(object):
             try:
                 if t in ['kvm', 'xen']:
                     handler = self.__search_plugin_by_name(t, node_uuid)
-                    validate(manifest.get('entity_data'), Schemas.vm_schema)
+                    Schemas.validate(manifest.get('entity_data'), 'vm')
                 elif t in ['container', 'lxd','docker']:
                     handler = self.__search_plugin_by_name(t, node_uuid)
-                    validate(manifest.get('entity_data'), Schemas.container_schema)
+                    Schemas.validate(manifest.get('entity_data'), 'container')
                 elif t == 'native':
                     handler = self.__search_plugin_by_name('native', node_uuid)
-                    validate(manifest.get('entity_data'), Schemas.native_schema)
+                    Schemas.validate(manifest.get('entity_data'), 'native')
                 elif t == 'ros2':
                     handler = self.__search_plugin_by_name('ros2', node_uuid)
-                    validate(manifest.get('entity_data'), Schemas.ros2_schema)
+                    Schemas.validate(manifest.get('entity_data'), 'ros2')
                 elif t == 'usvc':
                     print('microservice not yet')
                 else:
@@ -687,7 +710,7 @@ class API(object):
                 if handler is None or handler == 'None':
                     print('Handler not found!! (Is none)')
                     return False
-            except ValidationError as ve:
+            except ManifestValidationError as ve:
                 print('Validation error: {}'.format(ve.message))
                 return False
 
@@ -696,6 +719,7 @@ class API(object):
                 return False
 
             entity_uuid = manifest.get('uuid')
+            manifest.update({Tracing.TRACE_KEY: self.__trace('define')})
             entity_definition = manifest
             json_data = json.dumps(entity_definition)
             uri = '{}/{}/runtime/{}/entity/{}'.format(self.store.droot, node_uuid, handler.get('uuid'), entity_uuid)
@@ -720,7 +744,7 @@ class API(object):
             :return: boolean
             '''
             handler = self.__get_entity_handler_by_uuid(node_uuid, entity_uuid)
-            uri = '{}/{}/runtime/{}/entity/{}#status=undefine'.format(self.store.droot, node_uuid, handler, entity_uuid)
+            uri = '{}/{}/runtime/{}/entity/{}#status=undefine&{}'.format(self.store.droot, node_uuid, handler, entity_uuid, Tracing.to_uri(self.__trace('undefine')))
             res = self.store.desired.dput(uri)
             return True
             # if res >= 0:
@@ -743,7 +767,7 @@ class API(object):
             if instance_uuid is None:
                 instance_uuid = '{}'.format(uuid.uuid4())
 
-            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=configure'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid)
+            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=configure&{}'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid, Tracing.to_uri(self.__trace('configure')))
             res = self.store.desired.dput(uri)
             # print('RES is {}'.format(res))
             if res >= 0:
@@ -765,7 +789,7 @@ class API(object):
             :return: boolean
             '''
             handler = self.__get_entity_handler_by_uuid(node_uuid, entity_uuid)
-            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=clean'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid)
+            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=clean&{}'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid, Tracing.to_uri(self.__trace('clean')))
             res = self.store.desired.dput(uri)
             # if res >= 0:
             #     return True
@@ -785,7 +809,7 @@ class API(object):
             :return: boolean
             '''
             handler = self.__get_entity_handler_by_uuid(node_uuid, entity_uuid)
-            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=run'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid)
+            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=run&{}'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid, Tracing.to_uri(self.__trace('run')))
             res = self.store.desired.dput(uri)
             # print('RES is {}'.format(res))
             if res >= 0:
@@ -808,7 +832,7 @@ class API(object):
             '''
 
             handler = self.__get_entity_handler_by_uuid(node_uuid, entity_uuid)
-            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=stop'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid)
+            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=stop&{}'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid, Tracing.to_uri(self.__trace('stop')))
             res = self.store.desired.dput(uri)
             if res >= 0:
                 if wait:
@@ -829,7 +853,7 @@ class API(object):
             :return: boolean
             '''
             handler = self.__get_entity_handler_by_uuid(node_uuid, entity_uuid)
-            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=pause'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid)
+            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=pause&{}'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid, Tracing.to_uri(self.__trace('pause')))
             res = self.store.desired.dput(uri)
             if res >= 0:
                 if wait:
@@ -851,7 +875,7 @@ class API(object):
             '''
 
             handler = self.__get_entity_handler_by_uuid(node_uuid, entity_uuid)
-            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=resume'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid)
+            uri = '{}/{}/runtime/{}/entity/{}/instance/{}#status=resume&{}'.format(self.store.droot, node_uuid, handler, entity_uuid, instance_uuid, Tracing.to_uri(self.__trace('resume')))
             res = self.store.desired.dput(uri)
             if res >= 0:
                 if wait:
@@ -20,10 +20,17 @@ import traceback
 import sys
 import json
 import uuid
+import os
+from fog05 import Metrics
 from fog05.DLogger import DLogger
+from fog05.Heartbeat import Heartbeat
+from fog05.LocalState import LocalState
 from .store import Store
 from fog05.PluginLoader import PluginLoader
+from fog05.Profiler import PluginProfiler
 from fog05.interfaces.Agent import Agent
+from fog05.interfaces.RuntimePlugin import RuntimePlugin
+from fog05.interfaces.NetworkPlugin import NetworkPlugin
 from yaks.api import YAKS
 from fog05.interfaces.Constants import *
 
@@ -37,6 +44,7 @@ class FosAgent(Agent):
               '|_|  \___/ \__, |\____/ |____/ \n'
               '           |___/ \n')
 
+        self.debug = debug
         self.logger = DLogger(debug_flag=debug)
         print('\n\n##### OUTPUT TO LOGFILE #####\n\n')
         self.logger.info('__init__()', 'FosAgent Starting...')
@@ -64,6 +72,7 @@ class FosAgent(Agent):
             self.__monPlugins = {}
             self.__manPlugins = {}
             self.__orchPlugins = {}
+            self.__installing_plugins = []
             self.logger.info('__init__()', '[ INIT ] Loading OS Plugin...')
             self.__load_os_plugin()
             self.logger.info('__init__()', '[ DONE ] Loading OS Plugin...')
@@ -74,8 +83,20 @@ class FosAgent(Agent):
             self.sys_id = 0
             self.__PLUGIN_AUTOLOAD = True
             self.__autoload_list = []
+            self.__isolated_list = []
+            self.__host_call_timeout = 300
             self.yaks_server = '127.0.0.1'
             self.export = True
+            self.warm_restart = False
+            self.state_file = os.path.join(self.base_path, 'agent_state.db')
+            self.log_conf = {}
+            self.heartbeat_period = 2.0
+            self.heartbeat = None
+            self.metrics_enabled = False
+            self.metrics_address = '127.0.0.1'
+            self.metrics_port = 9105
+            self.metrics_server = None
+            self.profiling_conf = {}
 
             # Configuration Parsing
 
@@ -88,11 +109,33 @@ class FosAgent(Agent):
                     self.yaks_server = self.config['agent']['YAKS']
                 if 'EXPORT' in self.config['agent']:
                     self.export = self.config['agent'].getboolean('EXPORT')
+                if 'WARM_RESTART' in self.config['agent']:
+                    self.warm_restart = self.config['agent'].getboolean('WARM_RESTART')
+                if 'STATE_FILE' in self.config['agent']:
+                    self.state_file = self.config['agent']['STATE_FILE']
+                if 'HEARTBEAT' in self.config['agent']:
+                    self.heartbeat_period = float(self.config['agent']['HEARTBEAT'])
             if 'plugins' in self.config:
                 if 'autoload' in self.config['plugins']:
                     self.__PLUGIN_AUTOLOAD = self.config['plugins'].getboolean('autoload')
                 if 'auto' in self.config['plugins']:
                     self.__autoload_list = json.loads(self.config['plugins']['auto'])
+                if 'isolated' in self.config['plugins']:
+                    self.__isolated_list = json.loads(self.config['plugins']['isolated'])
+                if 'call_timeout' in self.config['plugins']:
+                    self.__host_call_timeout = float(self.config['plugins']['call_timeout'])
+            if 'logging' in self.config:
+                self.log_conf = dict(self.config['logging'].items())
+                self.logger.configure(self.log_conf)
+            if 'metrics' in self.config:
+                if 'enabled' in self.config['metrics']:
+                    self.metrics_enabled = self.config['metrics'].getboolean('enabled')
+                if 'address' in self.config['metrics']:
+                    self.metrics_address = self.config['metrics']['address']
+                if 'port' in self.config['metrics']:
+                    self.metrics_port = int(self.config['metrics']['port'])
+            if 'profiling' in self.config:
+                self.profiling_conf = dict(self.config['profiling'].items())
             sid = str(self.uuid)
 
             self.yaks = YAKS.login(self.yaks_server)
@@ -104,8 +147,17 @@ class FosAgent(Agent):
             self.logger.info('__init__()', '[ INIT ] YAKS SEVER: {}'.format(self.yaks_server))
             self.logger.info('__init__()', '[ INIT ] Plugins directory : {}'.format(self.__PLUGINDIR))
             self.logger.info('__init__()', '[ INIT ] AUTOLOAD Plugins: {}'.format(self.__PLUGIN_AUTOLOAD))
+            self.logger.info('__init__()', '[ INIT ] WARM RESTART: {} State file: {}'.format(self.warm_restart, self.state_file))
+            self.logger.info('__init__()', '[ INIT ] HEARTBEAT every {}s'.format(self.heartbeat_period))
             self.logger.info('__init__()', '[ INIT ] Plugins to autoload: {} (empty means all plugin in the directory)'.format(' '.join(self.__autoload_list)))
+            self.logger.info('__init__()', '[ INIT ] Plugins running in their own process: {}'.format(' '.join(self.__isolated_list)))
+            self.logger.info('__init__()', '[ INIT ] METRICS: {} on {}:{}'.format(self.metrics_enabled, self.metrics_address, self.metrics_port))
             self.logger.info('__init__()', '[ INIT ] #############################')
+
+            self.plugin_load_time = Metrics.REGISTRY.gauge('fos_plugin_load_seconds', 'Time taken to load the plugin', ['plugin'])
+            Metrics.REGISTRY.add_collector(self.__collect_metrics)
+            if self.metrics_enabled:
+                self.metrics_server = Metrics.MetricsServer(Metrics.REGISTRY, self.metrics_address, self.metrics_port).start()
             
             # self.sroot = append_to_path(sroot, self.sys_id)
             # self.shome = '{}/{}'.format(self.sroot, 'info')
@@ -172,6 +224,13 @@ class FosAgent(Agent):
             # self.logger.info('__init__()', '[ INIT ] Networks: {}'.format(json.dumps(self.networks)))
             # self.logger.info('__init__()', '[ INIT ] #############################')
             
+            # Local state snapshot, used to warm restart the agent
+            if not self.__osPlugin.dir_exists(os.path.dirname(self.state_file)):
+                self.__osPlugin.create_dir(os.path.dirname(self.state_file))
+            self.state = LocalState(self.state_file)
+            if not self.warm_restart:
+                self.state.clear()
+
             # Desired Store. containing the desired state
             self.droot = append_to_path(droot, self.sys_id)
             self.dhome = '{}/{}'.format(self.droot, sid)
@@ -186,6 +245,8 @@ class FosAgent(Agent):
             self.astore = Store(self.yaks, self.aroot, self.ahome, 1024)
             self.logger.info('__init__()', '[ DONE ] Creating Actual State Store')
 
+            self.profiler = PluginProfiler(self, self.profiling_conf)
+
             if self.export:
                 self.logger.info('__init__()', '[ INIT ] Populating Actual Store with data from OS Plugin')
                 val = {'version': self.__osPlugin.version, 'description': '{} plugin'.format(self.__osPlugin.name)}
@@ -217,9 +278,8 @@ class FosAgent(Agent):
                 plugins = self.pl.plugins
                 for p in plugins:
                     if p['name'] in self.__autoload_list or len(self.__autoload_list) == 0:
-                        mfile = p.get('info').replace('__init__.py', '{}_plugin.json'.format(p.get('name')))
-                        if self.__osPlugin.file_exists(mfile):
-                            manifest = json.loads(self.__osPlugin.read_file(mfile))
+                        manifest = p.get('manifest')
+                        if manifest is not None:
                             name = manifest.get('name')
                             plugin_uuid = manifest.get('uuid')
                             conf = manifest.get('configuration', None)
@@ -237,9 +297,8 @@ class FosAgent(Agent):
                                     else:
                                         load_method(name, plugin_uuid, conf)
                 for p in load_after:
-                    mfile = p.get('info').replace('__init__.py', '{}_plugin.json'.format(p.get('name')))
-                    if self.__osPlugin.file_exists(mfile):
-                        manifest = json.loads(self.__osPlugin.read_file(mfile))
+                    manifest = p.get('manifest')
+                    if manifest is not None:
                         name = manifest.get('name')
                         self.logger.info('__init__()', '[ INFO ] {}'.format(manifest))
                         plugin_uuid = manifest.get('uuid')
@@ -252,7 +311,8 @@ class FosAgent(Agent):
                                 load_method(name, plugin_uuid, conf)
                         else:
                             self.logger.warning('__react_to_plugins()', '[ WARN ] Plugins of type {} are not yet supported...'.format(manifest.get('type')))
-
+            if self.warm_restart:
+                self.__restore_plugins()
 
         except FileNotFoundError as fne:
             self.logger.error('__init__()', 'File Not Found Aborting {} '.format(fne.strerror))
@@ -308,9 +368,13 @@ class FosAgent(Agent):
         rt = self.pl.locate_plugin(plugin_name)
         if rt is not None:
             self.logger.info('__load_runtime_plugin()', '[ INIT ] Loading a Runtime plugin: {}'.format(plugin_name))
-            rt = self.pl.load_plugin(rt)
-            rt = rt.run(agent=self, uuid=plugin_uuid, configuration=configuration)
+            rt = self.__run_plugin(rt, plugin_uuid, configuration)
             self.__rtPlugins.update({rt.uuid: rt})
+            if self.warm_restart:
+                try:
+                    rt.restore_runtime()
+                except NotImplementedError:
+                    self.logger.warning('__load_runtime_plugin()', '[ WARN ] Runtime: {} cannot be restored from local state'.format(plugin_name))
             val = {'version': rt.version, 'description': str('runtime {}'.format(rt.name)), 'plugin': ''}
             uri = '{}/plugins/{}/{}'.format(self.ahome, rt.name, rt.uuid)
             self.astore.put(uri, json.dumps(val))
@@ -319,6 +383,7 @@ class FosAgent(Agent):
                                 'type': 'runtime', 'status': 'loaded'}]}
             uri = '{}/plugins'.format(self.ahome)
             self.astore.dput(uri, json.dumps(val))
+            self.__save_plugin_state('runtime', rt.name, rt.uuid, configuration)
             self.logger.info('__load_runtime_plugin()', '[ DONE ] Loading a Runtime plugin: {}'.format(plugin_name))
 
             return rt
@@ -331,8 +396,7 @@ class FosAgent(Agent):
         net = self.pl.locate_plugin(plugin_name)
         if net is not None:
             self.logger.info('__load_network_plugin()', '[ INIT ] Loading a Network plugin: {}'.format(plugin_name))
-            net = self.pl.load_plugin(net)
-            net = net.run(agent=self, uuid=plugin_uuid, configuration=configuration)
+            net = self.__run_plugin(net, plugin_uuid, configuration)
             self.__nwPlugins.update({net.uuid: net})
 
             val = {'version': net.version, 'description': 'network {}'.format(net.name),
@@ -344,6 +408,7 @@ class FosAgent(Agent):
                                 'type': 'network', 'status': 'loaded'}]}
             uri = '{}/plugins'.format(self.ahome)
             self.astore.dput(uri, json.dumps(val))
+            self.__save_plugin_state('network', net.name, net.uuid, configuration)
             self.logger.info('__load_network_plugin()', '[ DONE ] Loading a Network plugin: {}'.format(plugin_name))
 
             return net
@@ -356,8 +421,7 @@ class FosAgent(Agent):
         mon = self.pl.locate_plugin(plugin_name)
         if mon is not None:
             self.logger.info('__load_monitoring_plugin()', '[ INIT ] Loading a Monitoring plugin: {}'.format(plugin_name))
-            mon = self.pl.load_plugin(mon)
-            mon = mon.run(agent=self, uuid=plugin_uuid, configuration=configuration)
+            mon = self.__run_plugin(mon, plugin_uuid, configuration)
             self.__monPlugins.update({mon.uuid: mon})
 
             val = {'version': mon.version, 'description': 'monitoring {}'.format(mon.name), 'plugin': ''}
@@ -368,6 +432,7 @@ class FosAgent(Agent):
                                 'type': 'monitoring', 'status': 'loaded'}]}
             uri = '{}/plugins'.format(self.ahome)
             self.astore.dput(uri, json.dumps(val))
+            self.__save_plugin_state('monitoring', mon.name, mon.uuid, configuration)
             self.logger.info('__load_monitoring_plugin()', '[ DONE ] Loading a Monitoring plugin: {}'.format(plugin_name))
 
             return mon
@@ -380,8 +445,7 @@ class FosAgent(Agent):
         orch = self.pl.locate_plugin(plugin_name)
         if orch is not None:
             self.logger.info('__load_orchestration_plugin()', '[ INIT ] Loading a Orchestration plugin: {}'.format(plugin_name))
-            orch = self.pl.load_plugin(orch)
-            orch = orch.run(agent=self, uuid=plugin_uuid, configuration=configuration)
+            orch = self.__run_plugin(orch, plugin_uuid, configuration)
             self.__orchPlugins.update({orch.uuid: orch})
 
             val = {'version': orch.version, 'description': 'orchestration {}'.format(orch.name), 'plugin': ''}
@@ -392,6 +456,7 @@ class FosAgent(Agent):
                                 'type': 'orchestration', 'status': 'loaded'}]}
             uri = '{}/plugins'.format(self.ahome)
             self.astore.dput(uri, json.dumps(val))
+            self.__save_plugin_state('orchestration', orch.name, orch.uuid, configuration)
             self.logger.info('__load_orchestration_plugin()', '[ DONE ] Loading a Orchestration plugin: {}'.format(plugin_name))
 
             return orch
@@ -405,8 +470,7 @@ class FosAgent(Agent):
         self.logger.info('__load_manager_plugin()', 'Manager plugin: {}'.format(man))
         if man is not None:
             self.logger.info('__load_manager_plugin()', '[ INIT ] Loading a Manager plugin: {}'.format(plugin_name))
-            man = self.pl.load_plugin(man)
-            man = man.run(agent=self, uuid=plugin_uuid, configuration=configuration)
+            man = self.__run_plugin(man, plugin_uuid, configuration)
             self.__manPlugins.update({man.uuid: man})
         
             val = {'version': man.version, 'description': 'manager {}'.format(man.name), 'plugin': ''}
@@ -417,6 +481,7 @@ class FosAgent(Agent):
                                 'type': 'manager', 'status': 'loaded'}]}
             uri = '{}/plugins'.format(self.ahome)
             self.astore.dput(uri, json.dumps(val))
+            self.__save_plugin_state('manager', man.name, man.uuid, configuration)
             self.logger.info('__load_manager_plugin()', '[ DONE ] Loading a Manager plugin: {}'.format(plugin_name))
         
             return man
@@ -424,6 +489,58 @@ class FosAgent(Agent):
             self.logger.warning('__load_manager_plugin()', '[ WARN ] Manager: {} plugin not found!'.format(plugin_name))
             return None
 
+    def __run_plugin(self, plugin, plugin_uuid, configuration):
+        start = time.time()
+        if plugin.get('name') in self.__isolated_list:
+            self.logger.info('__run_plugin()', '[ INIT ] Starting {} in its own process'.format(plugin.get('name')))
+            res = self.pl.host_plugin(plugin, self, plugin_uuid, configuration, self.__host_call_timeout,
+                                      lambda proxy, code, plugin=plugin: self.__plugin_host_exited(plugin, proxy, code))
+        else:
+            module = self.pl.load_plugin(plugin)
+            res = module.run(agent=self, uuid=plugin_uuid, configuration=configuration)
+            if isinstance(res, (RuntimePlugin, NetworkPlugin)):
+                self.profiler.wrap(res)
+        self.plugin_load_time.set(time.time() - start, plugin=plugin.get('name'))
+        return res
+
+    def __plugin_host_exited(self, plugin, proxy, returncode):
+        self.logger.error('__plugin_host_exited()', '[ ERRO ] Plugin host of {} exited with code {}'.format(plugin.get('name'), returncode))
+        self.pl.remove_host(proxy.uuid)
+        self.__update_plugin_status({'name': plugin.get('name'), 'uuid': proxy.uuid}, 'failed',
+                                    'plugin host exited with code {}'.format(returncode))
+
+    def __collect_metrics(self):
+        hosts = list(self.pl.hosts.values())
+        return [('fos_log_queue_depth', 'gauge', 'Log records waiting to be written', [('', {}, self.logger.queue_depth())]),
+                ('fos_log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full',
+                 [('', {}, self.logger.dropped())]),
+                ('fos_plugins_installing', 'gauge', 'Plugins waiting for their requirements to be installed',
+                 [('', {}, len(self.__installing_plugins))]),
+                ('fos_plugin_host_up', 'gauge', 'Plugin host process is running',
+                 [('', {'plugin': p.name}, 1 if p.is_alive() else 0) for p in hosts]),
+                ('fos_plugin_host_pending_calls', 'gauge', 'Calls waiting for a reply from the plugin host process',
+                 [('', {'plugin': p.name}, p.pending()) for p in hosts])]
+
+    def __save_plugin_state(self, plugin_type, plugin_name, plugin_uuid, configuration):
+        val = {'name': plugin_name, 'uuid': str(plugin_uuid), 'type': plugin_type, 'configuration': configuration}
+        self.state.put('agent', 'plugin', plugin_uuid, val)
+
+    def __restore_plugins(self):
+        loaded = list(self.__rtPlugins.keys()) + list(self.__nwPlugins.keys()) + list(self.__monPlugins.keys()) + \
+                 list(self.__orchPlugins.keys()) + list(self.__manPlugins.keys())
+        loaded = [str(x) for x in loaded]
+        saved = self.state.get_all('agent', 'plugin')
+        for p in [v for (k, v) in saved.items() if k not in loaded]:
+            self.logger.info('__restore_plugins()', '[ INIT ] Restoring plugin {} from local state'.format(p.get('name')))
+            load_method = self.__load_plugin_method_selection(p.get('type'))
+            if load_method is None:
+                load_method = self.__load_plugin_method_selection_mano(p.get('type'))
+            if load_method is not None:
+                if p.get('configuration') is None:
+                    load_method(p.get('name'), p.get('uuid'))
+                else:
+                    load_method(p.get('name'), p.get('uuid'), p.get('configuration'))
+
     def __populate_node_information(self):
 
         node_info = {}
@@ -441,9 +558,9 @@ class FosAgent(Agent):
         self.astore.put(uri, json.dumps(node_info))
 
     def __react_to_plugins(self, uri, value, v):
-        self.logger.info('__react_to_plugins()', ' Received a plugin action on Desired Store URI: {} Value: {} Version: {}'.format(uri, value, v))
+        self.logger.debug('__react_to_plugins()', ' Received a plugin action on Desired Store URI: %s Value: %s Version: %s', uri, value, v)
         if value is None:
-            self.logger.error('__react_to_plugins()', 'ERROR RECEIVED VALUE {}'.format(value))
+            self.logger.error('__react_to_plugins()', 'ERROR RECEIVED VALUE %s', value)
             return
         value = json.loads(value)
         value = value.get('plugins')
@@ -451,24 +568,43 @@ class FosAgent(Agent):
             uri = '{}/plugins'.format(self.ahome)
             all_plugins = json.loads(self.astore.get(uri))
             s = [x for x in all_plugins.get('plugins') if v.get('name') in x.get('name')]
-            if v.get('status') == 'add' and len(s) == 0:
-                name = v.get('name')
-                plugin_uuid = v.get('uuid')
-                conf = v.get('configuration', None)
+            if v.get('status') == 'add' and len(s) == 0 and v.get('uuid') not in self.__installing_plugins:
                 req = v.get('requirements', None)
                 if req is not None:
-                    self.pl.install_requirements(req)
-                load_method = self.__load_plugin_method_selection(v.get('type'))
-                if load_method is not None:
-                    if conf is None:
-                        load_method(name, plugin_uuid)
-                    else:
-                        load_method(name, plugin_uuid, conf)
+                    self.__installing_plugins.append(v.get('uuid'))
+                    self.__update_plugin_status(v, 'installing')
+                    self.pl.install_requirements_async(req, lambda ok, v=v: self.__activate_plugin(v, ok))
                 else:
-                    if len(s) != 0:
-                        self.logger.warning('__react_to_plugins()', '[ WARN ] Plugins of type {} are not yet supported...'.format(v.get('type')))
-                    else:
-                        self.logger.warning('__react_to_plugins()', '[ WARN ] Plugin already loaded')
+                    self.__activate_plugin(v, True)
+
+    def __update_plugin_status(self, plugin, status, error=None):
+        val = {'status': status}
+        if error is not None:
+            val.update({'error': error})
+        uri = '{}/plugins/{}/{}'.format(self.ahome, plugin.get('name'), plugin.get('uuid'))
+        self.astore.dput(uri, json.dumps(val))
+
+    def __activate_plugin(self, plugin, requirements_ok):
+        if plugin.get('uuid') in self.__installing_plugins:
+            self.__installing_plugins.remove(plugin.get('uuid'))
+        if not requirements_ok:
+            self.logger.error('__activate_plugin()', '[ ERRO ] Requirements installation failed for {}'.format(plugin.get('name')))
+            self.__update_plugin_status(plugin, 'failed', 'requirements installation failed')
+            return
+        load_method = self.__load_plugin_method_selection(plugin.get('type'))
+        if load_method is None:
+            self.logger.warning('__activate_plugin()', '[ WARN ] Plugins of type {} are not yet supported...'.format(plugin.get('type')))
+            return
+        conf = plugin.get('configuration', None)
+        try:
+            if conf is None:
+                load_method(plugin.get('name'), plugin.get('uuid'))
+            else:
+                load_method(plugin.get('name'), plugin.get('uuid'), conf)
+            self.__update_plugin_status(plugin, 'ready')
+        except Exception as e:
+            self.logger.error('__activate_plugin()', '[ ERRO ] Loading {} failed {}'.format(plugin.get('name'), e))
+            self.__update_plugin_status(plugin, 'failed', '{}'.format(e))
 
     def __load_plugin_method_selection(self, type):
         r = {
@@ -486,17 +622,17 @@ class FosAgent(Agent):
         return r.get(type, None)
 
     def __react_to_onboarding(self, uri, value, v):
-        self.logger.info('__react_to_onboarding()', 'Received a onboard action on Desired Store with URI:{} Value:{} Version:{}'.format(uri, value, v))
+        self.logger.debug('__react_to_onboarding()', 'Received a onboard action on Desired Store with URI:%s Value:%s Version:%s', uri, value, v)
         application_uuid = uri.split('/')[-1]
         dvalue = json.loads(value)
         if dvalue.get('status') == 'undefine':
-            self.logger.info('__react_to_onboarding()', 'This is a remove for URI: %s' % uri)
+            self.logger.info('__react_to_onboarding()', 'This is a remove for URI: %s', uri)
             nuri = '{}/onboard/{}'.format(self.ahome, application_uuid)
             self.astore.remove(nuri)
         else:
             nuri = '{}/onboard/{}'.format(self.ahome,application_uuid)
             self.astore.put(nuri,value)
-            self.logger.info('__react_to_onboarding()', 'Received a onboard information storing to -> {}'.format(nuri))
+            self.logger.info('__react_to_onboarding()', 'Received a onboard information storing to -> %s', nuri)
             application_uuid = uri.split('/')[-1]
 
     def __get_manifest(self, manifest_path):
@@ -521,7 +657,9 @@ class FosAgent(Agent):
             except Exception as e:
                 self.logger.error('__exit_gracefully()', '{}'.format(e))
                 pass
-        keys = list(self.__rtPlugins.keys())
+        if self.warm_restart:
+            self.logger.info('__exit_gracefully()', 'Warm restart enabled, leaving entities and networks in place')
+        keys = list(self.__rtPlugins.keys()) if not self.warm_restart else []
         for k in keys:
             try:
                 self.__rtPlugins.get(k).stop_runtime()
@@ -529,7 +667,7 @@ class FosAgent(Agent):
                 self.logger.error('__exit_gracefully()', '{}'.format(e))
                 #traceback.print_exc()
                 pass
-        keys = list(self.__nwPlugins.keys())
+        keys = list(self.__nwPlugins.keys()) if not self.warm_restart else []
         for k in keys:
             try:
                 self.__nwPlugins.get(k).stop_network()
@@ -557,15 +695,25 @@ class FosAgent(Agent):
 
         self.sstore.close()
         '''
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
         # self.dstore.remove('{}/**'.format(self.dhome))
         # self.astore.remove('{}/**'.format(self.ahome))
-        [self.dstore.remove(x) for (x,_,_) in self.dstore.getAll('{}/**'.format(self.dhome))]
-        [self.astore.remove(x) for (x,_,_) in self.astore.getAll('{}/**'.format(self.ahome))]
-        self.astore.remove('{}'.format(self.ahome))
-        self.dstore.remove('{}'.format(self.dhome))
+        if not self.warm_restart:
+            [self.dstore.remove(x) for (x,_,_) in self.dstore.getAll('{}/**'.format(self.dhome))]
+            [self.astore.remove(x) for (x,_,_) in self.astore.getAll('{}/**'.format(self.ahome))]
+            self.astore.remove('{}'.format(self.ahome))
+            self.dstore.remove('{}'.format(self.dhome))
+            self.state.clear()
+        self.profiler.stop()
+        self.pl.close_hosts()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.state.close()
         self.dstore.close()
         self.astore.close()
-        self.logger.info('__exit_gracefully()', '[ DONE ] Bye')
+        self.logger.info('__exit_gracefully()', '[ DONE ] Bye - Log records dropped: %d', self.logger.dropped())
+        self.logger.stop()
         sys.exit(0)
 
     def run(self):
@@ -578,6 +726,12 @@ class FosAgent(Agent):
         self.dstore.observe(uri, self.__react_to_plugins)
         self.logger.info('run()', 'fosAgent Observing plugins on: {}'.format(uri))
 
+        self.profiler.start()
+        self.logger.info('run()', 'fosAgent Observing profiling options on: {}/profiling'.format(self.dhome))
+
+        self.heartbeat = Heartbeat(self.astore, self.ahome, self.heartbeat_period).start()
+        self.logger.info('run()', 'fosAgent Sending heartbeats on: {}/heartbeat'.format(self.ahome))
+
         '''
         uri = '{}/entities'.format(self.shome)
         self.sstore.observe(uri,
@@ -19,6 +19,14 @@ from fog05.interfaces.States import State
 
 class Entity(object):
 
+    '''
+    Entities and instances use __slots__, a node can hold thousands of them.
+    Manifest fragments (networks, user file, ssh key...) are kept once by the entity
+    and the instances reference them
+    '''
+
+    __slots__ = ('state', 'uuid', 'name', 'instances')
+
     def __init__(self):
         self.state = State.UNDEFINED
         self.uuid = ''
@@ -71,3 +79,17 @@ class Entity(object):
 
     def get_instance(self, instance_uuid):
         return self.instances.get(instance_uuid, None)
+
+    def shared(self, name, value):
+        '''
+        Return the entity copy of an attribute when it is equal to value,
+        used when rebuilding instances so they do not keep their own copy
+
+        :param name: attribute name
+        :param value: value of the instance
+        :return: the entity attribute if equal to value, value otherwise
+        '''
+        mine = getattr(self, name, None)
+        if mine is not None and mine == value:
+            return mine
+        return value
@@ -20,6 +20,8 @@ from fog05.interfaces.States import State
 
 class EntityInstance(object):
 
+    __slots__ = ('state', 'uuid', 'name', 'entity_uuid')
+
     def __init__(self,uuid, entity_uuid):
         self.state = State.CONFIGURED
         self.uuid = uuid
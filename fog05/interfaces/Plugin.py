@@ -13,6 +13,7 @@
 # Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
 
 import uuid
+from fog05 import Templates
 
 
 class Plugin(object):
@@ -27,5 +28,16 @@ class Plugin(object):
     def get_version(self):
         return self.version
 
+    def render_template(self, path, **values):
+        '''
+        Render a jinja2 template file, templates are compiled once and
+        compiled again only when the file changes
+
+        :param path: path of the template file
+        :param values: template variables
+        :return: String
+        '''
+        return Templates.render(path, **values)
+
     def react_to_cache(self, key, value, version):
         raise NotImplementedError
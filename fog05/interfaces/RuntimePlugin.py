@@ -14,7 +14,16 @@
 
 
 import uuid
+from fog05 import Metrics
 from fog05.interfaces.Plugin import Plugin
+from fog05.interfaces.States import StateMachine, StateTransitionNotAllowedException
+
+
+LIFECYCLE_LATENCY = Metrics.REGISTRY.histogram('fos_lifecycle_seconds', 'Latency of the entity and instance lifecycle operations', ['plugin', 'action'])
+LIFECYCLE_TRANSITIONS = Metrics.REGISTRY.counter('fos_lifecycle_transitions_total', 'State transitions of entities and instances', ['plugin', 'src', 'dst'])
+INSTANCE_CPU = Metrics.REGISTRY.gauge('fos_instance_cpu_seconds', 'CPU time used by the instance', ['plugin', 'entity_uuid', 'instance_uuid'])
+INSTANCE_MEMORY = Metrics.REGISTRY.gauge('fos_instance_memory_bytes', 'Memory used by the instance', ['plugin', 'entity_uuid', 'instance_uuid'])
+INSTANCE_PROCESSES = Metrics.REGISTRY.gauge('fos_instance_processes', 'Processes running in the instance', ['plugin', 'entity_uuid', 'instance_uuid'])
 
 
 class RuntimePlugin(Plugin):
@@ -24,6 +33,8 @@ class RuntimePlugin(Plugin):
         self.pid = -1
         self.name = ''
         self.current_entities = {}
+        self.states = StateMachine()
+        self.states.add_hook(self.__observe_transition)
 
     def start_runtime(self):
         '''
@@ -38,6 +49,13 @@ class RuntimePlugin(Plugin):
         '''
         raise NotImplementedError('This is and interface!')
 
+    def restore_runtime(self):
+        '''
+        reload entities, instances, images and flavors from the agent local state snapshot
+        and reconcile them with what is actually running, used on warm restart of the agent
+        '''
+        raise NotImplementedError('This is and interface!')
+
     def get_entities(self):
         raise NotImplementedError('This is and interface!')
 
@@ -214,6 +232,36 @@ class RuntimePlugin(Plugin):
         '''
         raise NotImplementedError('This is and interface!')
 
+    def update_instance_usage(self, entity_uuid, instance_uuid, cpu_seconds=None, memory_bytes=None, processes=None):
+        '''
+        Export the resource usage of an instance, called by the monitoring loops of the plugins
+
+        :param entity_uuid: uuid of the entity
+        :param instance_uuid: uuid of the instance
+        :param cpu_seconds: CPU time used by the instance
+        :param memory_bytes: memory used by the instance
+        :param processes: number of processes in the instance
+        '''
+        labels = {'plugin': self.name, 'entity_uuid': entity_uuid, 'instance_uuid': instance_uuid}
+        if cpu_seconds is not None:
+            INSTANCE_CPU.set(cpu_seconds, **labels)
+        if memory_bytes is not None:
+            INSTANCE_MEMORY.set(memory_bytes, **labels)
+        if processes is not None:
+            INSTANCE_PROCESSES.set(processes, **labels)
+
+    def remove_instance_usage(self, entity_uuid, instance_uuid):
+        '''
+        Stop exporting the resource usage of an instance, eg. when it is stopped or cleaned
+        '''
+        labels = {'plugin': self.name, 'entity_uuid': entity_uuid, 'instance_uuid': instance_uuid}
+        for m in [INSTANCE_CPU, INSTANCE_MEMORY, INSTANCE_PROCESSES]:
+            m.remove(**labels)
+
+    def __observe_transition(self, action, src, dst, entity_uuid, instance_uuid, latency):
+        LIFECYCLE_LATENCY.observe(latency, plugin=self.name, action=action)
+        LIFECYCLE_TRANSITIONS.inc(plugin=self.name, src=src.name, dst=dst.name)
+
     def is_uuid(self, uuid_string):
         try:
             val = uuid.UUID(uuid_string, version=4)
@@ -241,10 +289,3 @@ class MigrationNotAllowedException(Exception):
 
         super(MigrationNotAllowedException, self).__init__(message)
         self.errors = errors
-
-
-class StateTransitionNotAllowedException(Exception):
-    def __init__(self, message, errors=0):
-
-        super(StateTransitionNotAllowedException, self).__init__(message)
-        self.errors = errors
@@ -13,6 +13,8 @@
 # Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Initial implementation and API
 
 
+import time
+import threading
 from enum import Enum
 
 
@@ -33,3 +35,130 @@ class State(Enum):
     # Migration concurrent states
     TAKING_OFF = 8
     LANDING = 9
+
+
+class StateTransitionNotAllowedException(Exception):
+    def __init__(self, message, errors=0):
+
+        super(StateTransitionNotAllowedException, self).__init__(message)
+        self.errors = errors
+
+
+# (action, current state) -> next state
+TRANSITIONS = {
+    ('define', State.UNDEFINED): State.DEFINED,
+    ('undefine', State.DEFINED): State.UNDEFINED,
+    ('configure', State.UNDEFINED): State.CONFIGURED,
+    ('clean', State.CONFIGURED): State.UNDEFINED,
+    ('run', State.CONFIGURED): State.RUNNING,
+    ('stop', State.RUNNING): State.CONFIGURED,
+    ('pause', State.RUNNING): State.PAUSED,
+    ('resume', State.PAUSED): State.RUNNING
+}
+
+# action -> status written in the actual store
+STATUS = {
+    'define': 'defined',
+    'configure': 'configured',
+    'run': 'run',
+    'stop': 'stop',
+    'pause': 'pause',
+    'resume': 'run'
+}
+
+
+class Transition(object):
+
+    __slots__ = ['action', 'obj', 'src', 'dst', 'entity_uuid', 'instance_uuid', 'start']
+
+    def __init__(self, action, obj, src, dst, entity_uuid, instance_uuid):
+        self.action = action
+        self.obj = obj
+        self.src = src
+        self.dst = dst
+        self.entity_uuid = entity_uuid
+        self.instance_uuid = instance_uuid
+        self.start = time.time()
+
+
+class StateMachine(object):
+    '''
+    Table driven state machine shared by the runtime plugins
+
+    Legality of a transition is a single lookup in the transition table, a transition
+    is started with begin() and completed with commit(), hooks can be registered per action
+    and are called when the transition is committed
+    with hook(action, src, dst, entity_uuid, instance_uuid, latency),
+    the latency of every action is accumulated in the statistics
+    '''
+
+    def __init__(self, transitions=TRANSITIONS):
+        self.transitions = transitions
+        self.hooks = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def next_state(self, action, state):
+        '''
+        :param action: action name (eg. run, stop)
+        :param state: current State
+        :return: the next State or None if the transition is not allowed
+        '''
+        return self.transitions.get((action, state))
+
+    def allowed(self, action, state):
+        return (action, state) in self.transitions
+
+    def add_hook(self, hook, action=None):
+        '''
+        :param hook: function(action, src, dst, entity_uuid, instance_uuid, latency)
+        :param action: action name, None to be called for every action
+        '''
+        self.hooks.setdefault(action, []).append(hook)
+
+    def begin(self, action, obj, entity_uuid, instance_uuid=None):
+        '''
+        Start a transition of an entity or an instance
+
+        :param action: action name
+        :param obj: Entity or EntityInstance, None if the object is created by the transition (eg. configure)
+        :param entity_uuid: uuid of the entity
+        :param instance_uuid: uuid of the instance, None for entity transitions
+        :return: Transition to be given to commit() when the work is done
+        :raise StateTransitionNotAllowedException: if the transition is not in the table
+        '''
+        src = State.UNDEFINED if obj is None else obj.get_state()
+        dst = self.transitions.get((action, src))
+        if dst is None:
+            raise StateTransitionNotAllowedException('Cannot {} from state {}'.format(action, src.name),
+                                                     '{} cannot {} from state {}'.format(instance_uuid or entity_uuid, action, src.name))
+        return Transition(action, obj, src, dst, entity_uuid, instance_uuid)
+
+    def commit(self, transition, obj=None):
+        '''
+        Complete a transition, the object is moved to the next state,
+        the latency is accounted and the hooks are called
+
+        :param transition: the Transition returned by begin()
+        :param obj: the object created by the transition, if it was None in begin()
+        :return: latency of the transition in seconds
+        '''
+        obj = transition.obj if obj is None else obj
+        if obj is not None:
+            obj.set_state(transition.dst)
+        latency = time.time() - transition.start
+        with self.lock:
+            s = self.stats.setdefault(transition.action, {'count': 0, 'total': 0.0, 'max': 0.0})
+            s['count'] += 1
+            s['total'] += latency
+            s['max'] = max(s['max'], latency)
+        for hook in self.hooks.get(transition.action, []) + self.hooks.get(None, []):
+            hook(transition.action, transition.src, transition.dst, transition.entity_uuid, transition.instance_uuid, latency)
+        return latency
+
+    def get_stats(self):
+        '''
+        :return: dictionary action -> {count, total, max} latencies in seconds
+        '''
+        with self.lock:
+            return dict((k, dict(v)) for k, v in self.stats.items())
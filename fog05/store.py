@@ -1,4 +1,6 @@
 import json
+import time
+from fog05 import Metrics
 from yaks import YAKS
 from yaks import Path
 from yaks import Selector
@@ -47,6 +49,9 @@ class FOSStore(object):
         self.y.logout()
 
 
+STORE_LATENCY = Metrics.REGISTRY.histogram('fos_store_seconds', 'Latency of the store operations', ['op'])
+
+
 class Store(object):
 
     def __init__(self, api, root_path, home_path, cachesize):
@@ -56,16 +61,25 @@ class Store(object):
         self.cachesize = cachesize
         self.workspace = self.yaks.workspace(Path(root_path))
         self.subscriptions = []
+        self.__get_latency = STORE_LATENCY.labels(op='get')
+        self.__getall_latency = STORE_LATENCY.labels(op='getAll')
+        self.__put_latency = STORE_LATENCY.labels(op='put')
+        self.__dput_latency = STORE_LATENCY.labels(op='dput')
+        self.__remove_latency = STORE_LATENCY.labels(op='remove')
 
     def get(self, k):
+        start = time.time()
         r = self.workspace.get(Selector(k))
+        self.__get_latency.observe(time.time() - start)
         if r is not None and len(r) > 0:
             v = r[0].get('value').get_value()
             return v
         return None
 
     def getAll(self, k):
+        start = time.time()
         r = self.workspace.get(Selector(k))
+        self.__getall_latency.observe(time.time() - start)
         if r is not None and len(r) > 0:
             res = []
             for e in r:
@@ -81,9 +95,13 @@ class Store(object):
         return self.getAll(k)
 
     def put(self, k, v):
-        return self.workspace.put(Path(k), Value(v))
+        start = time.time()
+        res = self.workspace.put(Path(k), Value(v))
+        self.__put_latency.observe(time.time() - start)
+        return res
 
     def dput(self, uri, value=None):
+        start = time.time()
         data = self.get(uri)
         uri_values = ''
         if value is None:
@@ -107,10 +125,15 @@ class Store(object):
             data = self.data_merge(data, jvalues)
         value = json.dumps(data)
 
-        return self.workspace.put(Path(uri), Value(value))
+        res = self.workspace.put(Path(uri), Value(value))
+        self.__dput_latency.observe(time.time() - start)
+        return res
 
     def remove(self, k):
-        return self.workspace.remove(Path(k))
+        start = time.time()
+        res = self.workspace.remove(Path(k))
+        self.__remove_latency.observe(time.time() - start)
+        return res
 
     def eval(self, k, callback):
         self.workspace.eval(k, callback)
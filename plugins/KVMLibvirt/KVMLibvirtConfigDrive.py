@@ -0,0 +1,181 @@
+# Copyright (c) 2014,2018 ADLINK Technology Inc.
+#
+# See the NOTICE file(s) distributed with this work for additional
+# information regarding copyright ownership.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Eclipse Public License 2.0 which is available at
+# http://www.eclipse.org/legal/epl-2.0, or the Apache License, Version 2.0
+# which is available at https://www.apache.org/licenses/LICENSE-2.0.
+#
+# SPDX-License-Identifier: EPL-2.0 OR Apache-2.0
+#
+# Contributors: Gabriele Baldoni, ADLINK Technology Inc. - Base plugins set
+
+import time
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+SECTOR = 2048
+VOLUME_ID = 'cidata'
+# system area, then primary, Joliet and terminator descriptors, path tables and root directories
+PVD_SECTOR = 16
+SVD_SECTOR = 17
+TERMINATOR_SECTOR = 18
+PATH_TABLES_SECTOR = 19
+ROOT_SECTOR = 23
+JOLIET_ROOT_SECTOR = 24
+DATA_SECTOR = 25
+
+
+def _both16(n):
+    return struct.pack('<H', n) + struct.pack('>H', n)
+
+
+def _both32(n):
+    return struct.pack('<I', n) + struct.pack('>I', n)
+
+
+def _pad(data, size, fill=b' '):
+    return data[:size] + fill * (size - len(data[:size]))
+
+
+def _sectors(size):
+    return max(1, (size + SECTOR - 1) // SECTOR)
+
+
+class ConfigDrive(object):
+    '''
+    NoCloud seed image (ISO9660 with Joliet names, volume cidata) for cloud-init,
+    the same content of templates/create_config_drive.sh built in memory,
+    without temporary files or external tools
+
+    Images are cached by content, a drive with the same files is built once
+    '''
+
+    def __init__(self, cache_size=32):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def build(self, instance_id, hostname, vendor_data=None, user_data=None, ssh_key=None):
+        '''
+        :param instance_id: cloud-init instance-id
+        :param hostname: hostname of the vm
+        :param vendor_data: vendor-data content
+        :param user_data: user-data content
+        :param ssh_key: public key added to meta-data
+        :return: bytes of the ISO image
+        '''
+        meta_data = 'instance-id: {0}\nhostname: {1}\nlocal-hostname: {1}\n'.format(instance_id, hostname)
+        if ssh_key is not None and ssh_key != '':
+            meta_data = meta_data + 'public-keys:\n  - |\n    {}\n'.format(ssh_key)
+        files = [('meta-data', meta_data), ('user-data', user_data or '')]
+        if vendor_data is not None:
+            files.append(('vendor-data', vendor_data))
+        files = [(name, content.encode('utf-8') if isinstance(content, str) else content) for name, content in files]
+
+        h = hashlib.sha256()
+        for name, content in files:
+            h.update(name.encode())
+            h.update(struct.pack('<Q', len(content)))
+            h.update(content)
+        key = h.hexdigest()
+        with self.lock:
+            image = self.cache.get(key, None)
+            if image is not None:
+                self.cache.move_to_end(key)
+                return image
+        image = self.__iso(files)
+        with self.lock:
+            self.cache.update({key: image})
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return image
+
+    def __iso(self, files):
+        extents = []
+        lba = DATA_SECTOR
+        for name, content in files:
+            extents.append((name, lba, content))
+            lba += _sectors(len(content))
+        total = lba
+        date = self.__record_date()
+
+        image = bytearray(total * SECTOR)
+        image[PVD_SECTOR * SECTOR:(PVD_SECTOR + 1) * SECTOR] = self.__volume_descriptor(1, total, date)
+        image[SVD_SECTOR * SECTOR:(SVD_SECTOR + 1) * SECTOR] = self.__volume_descriptor(2, total, date)
+        image[TERMINATOR_SECTOR * SECTOR:TERMINATOR_SECTOR * SECTOR + 7] = b'\xffCD001\x01'
+        for i, root in enumerate([ROOT_SECTOR, ROOT_SECTOR, JOLIET_ROOT_SECTOR, JOLIET_ROOT_SECTOR]):
+            # little endian then big endian table, for the primary and the Joliet tree
+            fmt = '<' if i % 2 == 0 else '>'
+            table = b'\x01\x00' + struct.pack(fmt + 'I', root) + struct.pack(fmt + 'H', 1) + b'\x00\x00'
+            start = (PATH_TABLES_SECTOR + i) * SECTOR
+            image[start:start + len(table)] = table
+
+        for sector, joliet in [(ROOT_SECTOR, False), (JOLIET_ROOT_SECTOR, True)]:
+            records = self.__record(b'\x00', sector, SECTOR, date, True) + self.__record(b'\x01', sector, SECTOR, date, True)
+            for name, extent, content in extents:
+                records += self.__record(self.__file_id(name, joliet), extent, len(content), date, False)
+            image[sector * SECTOR:sector * SECTOR + len(records)] = records
+
+        for name, extent, content in extents:
+            image[extent * SECTOR:extent * SECTOR + len(content)] = content
+        return bytes(image)
+
+    def __volume_descriptor(self, kind, total, date):
+        joliet = kind == 2
+        text = (lambda s, n: _pad(s.encode('utf-16-be'), n, b'\x00 ')[:n]) if joliet else (lambda s, n: _pad(s.upper().encode(), n))
+        d = bytearray(SECTOR)
+        d[0:7] = bytes([kind]) + b'CD001\x01'
+        d[8:40] = text('LINUX', 32)
+        d[40:72] = text(VOLUME_ID, 32)
+        d[80:88] = _both32(total)
+        if joliet:
+            # UCS-2 level 3
+            d[88:91] = b'%/E'
+        d[120:124] = _both16(1)
+        d[124:128] = _both16(1)
+        d[128:132] = _both16(SECTOR)
+        d[132:140] = _both32(10)
+        root = JOLIET_ROOT_SECTOR if joliet else ROOT_SECTOR
+        tables = PATH_TABLES_SECTOR + (2 if joliet else 0)
+        d[140:144] = struct.pack('<I', tables)
+        d[148:152] = struct.pack('>I', tables + 1)
+        d[156:190] = self.__record(b'\x00', root, SECTOR, date, True)
+        for offset, size in [(190, 128), (318, 128), (446, 128), (574, 128), (702, 37), (739, 37), (776, 37)]:
+            d[offset:offset + size] = text('', size)
+        created = time.strftime('%Y%m%d%H%M%S00', time.gmtime()).encode() + b'\x00'
+        d[813:830] = created
+        d[830:847] = created
+        d[847:864] = b'0' * 16 + b'\x00'
+        d[864:881] = b'0' * 16 + b'\x00'
+        d[881] = 1
+        return bytes(d)
+
+    def __record(self, file_id, extent, size, date, directory):
+        length = 33 + len(file_id) + (1 if len(file_id) % 2 == 0 else 0)
+        r = bytearray(length)
+        r[0] = length
+        r[2:10] = _both32(extent)
+        r[10:18] = _both32(size)
+        r[18:25] = date
+        r[25] = 2 if directory else 0
+        r[28:32] = _both16(1)
+        r[32] = len(file_id)
+        r[33:33 + len(file_id)] = file_id
+        return bytes(r)
+
+    def __file_id(self, name, joliet):
+        if joliet:
+            return '{};1'.format(name).encode('utf-16-be')
+        # 8.3 d-characters, the guest reads the Joliet names
+        base = ''.join(c if c.isalnum() else '_' for c in name.upper())[:8]
+        return '{}.;1'.format(base).encode()
+
+    def __record_date(self):
+        t = time.gmtime()
+        return bytes([t.tm_year - 1900, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, 0])
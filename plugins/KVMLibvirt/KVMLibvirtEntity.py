@@ -23,6 +23,8 @@ from fog05.interfaces.Entity import Entity
 
 class KVMLibvirtEntity(Entity):
 
+    __slots__ = ('image_id', 'flavor_id', 'user_file', 'ssh_key', 'networks')
+
     def __init__(self, uuid, name, image_id, flavor_id):  # , cpu, ram, disk_size, networks, image, user_file, ssh_key):
 
         super(KVMLibvirtEntity, self).__init__()
@@ -23,6 +23,8 @@ import json
 
 class KVMLibvirtEntityInstance(EntityInstance):
 
+    __slots__ = ('disk', 'cdrom', 'networks', 'user_file', 'ssh_key', 'image_uuid', 'flavor_uuid', 'xml')
+
     def __init__(self, uuid, name, disk, cdrom, networks, user_file, ssh_key, entity_uuid, flavor_id, image_id):
 
         super(KVMLibvirtEntityInstance, self).__init__(uuid, entity_uuid)
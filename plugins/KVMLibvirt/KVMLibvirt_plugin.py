@@ -15,30 +15,123 @@
 import sys
 import os
 import uuid
-from fog05.interfaces.States import State
+import copy
+from fog05.interfaces.States import State, STATUS
+from fog05 import Tracing
+from fog05 import Metrics
+from fog05.ImageStore import ImageStore, ImageChecksumException
 from fog05.interfaces.RuntimePlugin import *
 from KVMLibvirtEntity import KVMLibvirtEntity
 from KVMLibvirtEntityInstance import KVMLibvirtEntityInstance
-from jinja2 import Environment
+from KVMLibvirtConfigDrive import ConfigDrive
 import json
 import random
 import time
-import re
 import libvirt
 import ipaddress
 import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from fog05 import MVar
 
 
 # TODO Plugins should not be aware of the Agent - The Agent is in OCaml no way to access his store, his logger and the OS plugin
 
+LIBVIRT_URI = 'qemu:///system'
+PROVISIONING_MODES = ['overlay', 'clone']
+# lifecycle event -> domain state it leads to
+EVENT_STATES = {
+    libvirt.VIR_DOMAIN_EVENT_STARTED: libvirt.VIR_DOMAIN_RUNNING,
+    libvirt.VIR_DOMAIN_EVENT_RESUMED: libvirt.VIR_DOMAIN_RUNNING,
+    libvirt.VIR_DOMAIN_EVENT_SUSPENDED: libvirt.VIR_DOMAIN_PAUSED,
+    libvirt.VIR_DOMAIN_EVENT_STOPPED: libvirt.VIR_DOMAIN_SHUTOFF,
+    libvirt.VIR_DOMAIN_EVENT_CRASHED: libvirt.VIR_DOMAIN_CRASHED,
+    libvirt.VIR_DOMAIN_EVENT_PMSUSPENDED: libvirt.VIR_DOMAIN_PMSUSPENDED
+}
+PROVISIONING_LATENCY = Metrics.REGISTRY.histogram('fos_kvm_provisioning_seconds', 'Time taken to create the disk of a VM instance', ['mode'])
+MIGRATION_LATENCY = Metrics.REGISTRY.histogram('fos_kvm_migration_seconds', 'Time taken by the live migration of a VM instance', ['policy'])
+# named migration policies, the plugin configuration can add or replace them
+#   bandwidth: MiB/s, compression: xbzrle and/or mt, postcopy_after: pre-copy passes before switching to post-copy
+MIGRATION_POLICIES = {
+    'default': {},
+    'converge': {'auto_converge': True, 'compression': ['xbzrle']},
+    'postcopy': {'postcopy': True, 'postcopy_after': 2},
+    'edge': {'bandwidth': 50, 'auto_converge': True, 'compression': ['xbzrle']}
+}
+MIGRATION_PROGRESS_INTERVAL = 1
+# shared: the disks are on storage seen by both nodes, incremental: only the qcow2 overlay is copied
+MIGRATION_STORAGE_MODES = ['incremental', 'shared']
+# disk formats looked for on shared storage when the image of a migrating instance is not on the destination
+SHARED_DISK_FORMATS = ['qcow2', 'raw', 'vmdk', 'vdi', 'vhdx']
+MIGRATION_BYTES = Metrics.REGISTRY.histogram('fos_kvm_migration_bytes', 'Bytes sent by the live migration of a VM instance', ['storage'],
+                                             buckets=[2 ** x for x in range(20, 40, 2)])
+MIGRATION_DOWNTIME = Metrics.REGISTRY.histogram('fos_kvm_migration_downtime_seconds', 'Downtime of the migrated VM instances', ['storage'])
+STATS_LATENCY = Metrics.REGISTRY.histogram('fos_kvm_stats_seconds', 'Time taken to collect the statistics of all the VM instances', [])
+# groups asked to getAllDomainStats
+STATS_TYPES = (libvirt.VIR_DOMAIN_STATS_STATE | libvirt.VIR_DOMAIN_STATS_CPU_TOTAL | libvirt.VIR_DOMAIN_STATS_BALLOON |
+               libvirt.VIR_DOMAIN_STATS_VCPU | libvirt.VIR_DOMAIN_STATS_INTERFACE | libvirt.VIR_DOMAIN_STATS_BLOCK)
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+
+def _start_event_loop():
+    # the default event implementation has to be registered before the connection is opened
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            libvirt.virEventRegisterDefaultImpl()
+            _event_loop = threading.Thread(target=_run_event_loop, name='libvirt-events', daemon=True)
+            _event_loop.start()
+
+
+def _run_event_loop():
+    while True:
+        libvirt.virEventRunDefaultImpl()
+
+
+def _significant(value, digits=2):
+    # rates compared with two significant digits, small fluctuations do not count as a change
+    if value is None or value == 0:
+        return value
+    return float('{:.{}g}'.format(value, digits))
+
+
+def _stats_signature(stats):
+    '''
+    Part of the domain statistics that decides if they are published again:
+    state, vcpus, memory in MiB and the rates, not the counters that grow at every sample
+    '''
+    memory = stats.get('memory')
+    return (stats.get('state'), stats.get('vcpu').get('current'), stats.get('vcpu').get('maximum'),
+            memory.get('current') // 1048576, memory.get('used') // 1048576, _significant(stats.get('cpu').get('percent')),
+            tuple((d.get('name'), d.get('capacity'), _significant(d.get('rd_bytes_rate')), _significant(d.get('wr_bytes_rate')),
+                   _significant(d.get('rd_reqs_rate')), _significant(d.get('wr_reqs_rate'))) for d in stats.get('disks')),
+            tuple((n.get('name'), _significant(n.get('rx_bytes_rate')), _significant(n.get('tx_bytes_rate')),
+                   _significant(n.get('rx_pkts_rate')), _significant(n.get('tx_pkts_rate')), n.get('rx_errs'), n.get('tx_errs'))
+                  for n in stats.get('network')))
+
+
+class OperationCancelled(Exception):
+    def __init__(self, message, errors=0):
+
+        super(OperationCancelled, self).__init__(message)
+        self.errors = errors
+
+
 class KVMLibvirt(RuntimePlugin):
 
-    def __init__(self, name, version, agent, plugin_uuid):
+    def __init__(self, name, version, agent, plugin_uuid, configuration={}):
         super(KVMLibvirt, self).__init__(version, plugin_uuid)
         self.name = name
         self.agent = agent
-        self.agent.logger.info('__init__()', ' Hello from KVM Plugin')
+        self.logger = self.agent.logger.component(name)
+        self.configuration = configuration or {}
+        self.logger.info('__init__()', ' Hello from KVM Plugin')
+        self.provisioning = self.configuration.get('provisioning', 'overlay')
+        if self.provisioning not in PROVISIONING_MODES:
+            self.logger.warning('__init__()', '[ WARN ] KVM Plugin - Unknown provisioning mode {}, using overlay'.format(self.provisioning))
+            self.provisioning = 'overlay'
         self.BASE_DIR = os.path.join(self.agent.base_path, 'kvm')
         self.DISK_DIR = 'disks'
         self.IMAGE_DIR = 'images'
@@ -51,28 +144,73 @@ class KVMLibvirt(RuntimePlugin):
         file_dir = os.path.dirname(__file__)
         self.DIR = os.path.abspath(file_dir)
         self.conn = None
+        self.conn_lock = threading.Lock()
+        self.domains = {}
+        self.domains_lock = threading.Lock()
+        self.domain_states = {}
+        self.domain_changed = threading.Condition()
+        self.expected = {}
+        self.action_timeout = float(self.configuration.get('action_timeout', 30))
+        self.shutdown_timeout = float(self.configuration.get('shutdown_timeout', 10))
+        self.migration_timeout = float(self.configuration.get('migration_timeout', 600))
+        self.migration_policies = dict(MIGRATION_POLICIES)
+        self.migration_policies.update(self.configuration.get('migration_policies', {}))
+        self.migration_policy = self.configuration.get('migration_policy', 'default')
+        self.migration_storage = self.configuration.get('migration_storage', 'incremental')
+        if self.migration_storage not in MIGRATION_STORAGE_MODES:
+            self.logger.warning('__init__()', '[ WARN ] KVM Plugin - Unknown migration storage {}, using incremental'.format(self.migration_storage))
+            self.migration_storage = 'incremental'
+        self.stats_interval = float(self.configuration.get('stats_interval', 5))
+        self.stats_samples = {}
+        self.published_stats = {}
+        self.monitoring = threading.Event()
+        self.config_drive = ConfigDrive()
         self.images = {}
         self.flavors = {}
+        self.entities_info = {}
+        self.instances_info = {}
         self.lock = threading.Lock()
+        # actions on the same entity or instance run in order on the workers, different ones in parallel
+        self.workers = ThreadPoolExecutor(max_workers=int(self.configuration.get('workers', 8)))
+        self.queues = {}
+        self.queues_lock = threading.Lock()
+        self.stopping = False
+        self.cancelled = set()
+        self.aborted = set()
+        self.entity_locks = {}
+        self.undefining = set()
+        # instances migrated out with shared storage, their disks now belong to the destination
+        self.migrated_out = set()
+        self.record_locks = {}
+        self.reserved_names = set()
+        # disk provisioning and config drives running at the same time
+        self.io_slots = threading.BoundedSemaphore(int(self.configuration.get('io_concurrency', 2)))
+        quota = self.configuration.get('image_cache_quota', None)
+        self.image_store = ImageStore.shared(os.path.join(self.agent.base_path, 'images'),
+                                             None if quota is None else int(float(quota) * 1024 ** 3))
 
         self.start_runtime()
 
     def start_runtime(self):
-        self.agent.logger.info('startRuntime()', ' KVM Plugin - Connecting to KVM')
-        self.conn = libvirt.open('qemu:///system')
-        self.agent.logger.info('startRuntime()', '[ DONE ] KVM Plugin - Connecting to KVM')
+        self.logger.info('startRuntime()', ' KVM Plugin - Connecting to KVM')
+        _start_event_loop()
+        self.__reconnect(None)
+        self.logger.info('startRuntime()', '[ DONE ] KVM Plugin - Connecting to KVM')
         uri = '{}/{}/**'.format(self.agent.dhome, self.HOME_ENTITY)
-        self.agent.logger.info('startRuntime()', ' KVM Plugin - Observing {} for entity'.format(uri))
+        self.logger.info('startRuntime()', ' KVM Plugin - Observing {} for entity'.format(uri))
         self.agent.dstore.observe(uri, self.__react_to_cache_entity)
 
         uri = '{}/{}/**'.format(self.agent.dhome, self.HOME_FLAVOR)
-        self.agent.logger.info('startRuntime()', ' KVM Plugin - Observing {} for flavor'.format(uri))
+        self.logger.info('startRuntime()', ' KVM Plugin - Observing {} for flavor'.format(uri))
         self.agent.dstore.observe(uri, self.__react_to_cache_flavor)
 
         uri = '{}/{}/**'.format(self.agent.dhome, self.HOME_IMAGE)
-        self.agent.logger.info('startRuntime()', ' KVM Plugin - Observing {} for image'.format(uri))
+        self.logger.info('startRuntime()', ' KVM Plugin - Observing {} for image'.format(uri))
         self.agent.dstore.observe(uri, self.__react_to_cache_image)
 
+        if self.stats_interval > 0:
+            threading.Thread(target=self.__monitor_domains, name='kvm-stats', daemon=True).start()
+
         '''check if dirs exists if not exists create'''
         if self.agent.get_os_plugin().dir_exists(self.BASE_DIR):
             if not self.agent.get_os_plugin().dir_exists(os.path.join(self.BASE_DIR, self.DISK_DIR)):
@@ -89,7 +227,15 @@ class KVMLibvirt(RuntimePlugin):
         return self.uuid
 
     def stop_runtime(self):
-        self.agent.logger.info('stopRuntime()', ' KVM Plugin - Destroying running domains')
+        self.monitoring.set()
+        # pending actions are dropped and the running ones finished before the instances are torn down
+        with self.queues_lock:
+            self.stopping = True
+            keys = list(self.queues.keys())
+        for k in keys:
+            self.__cancel(k)
+        self.workers.shutdown(wait=True)
+        self.logger.info('stopRuntime()', ' KVM Plugin - Destroying running domains')
         for k in list(self.current_entities.keys()):
             entity = self.current_entities.get(k)
             for i in list(entity.instances.keys()):
@@ -106,36 +252,91 @@ class KVMLibvirt(RuntimePlugin):
             self.conn.close()
         except libvirt.libvirtError as err:
             pass
-        self.agent.logger.info('stopRuntime()', '[ DONE ] KVM Plugin - Bye Bye')
+        with self.domains_lock:
+            self.domains = {}
+        self.logger.info('stopRuntime()', '[ DONE ] KVM Plugin - Bye Bye')
+
+    def restore_runtime(self):
+        if self.agent.state is None:
+            return
+        self.logger.info('restore_runtime()', ' KVM Plugin - Restoring state from local snapshot')
+        for k, flavor in self.agent.state.get_all(self.uuid, 'flavor').items():
+            self.flavors.update({k: flavor})
+        for k, img in self.agent.state.get_all(self.uuid, 'image').items():
+            if self.image_store.get_path(self.__image_ref(k)) is not None:
+                self.images.update({k: img})
+            else:
+                self.logger.warning('restore_runtime()', '[ WARN ] KVM Plugin - Image {} file is missing, dropping it'.format(k))
+                self.image_store.release(self.__image_ref(k))
+                self.agent.state.remove(self.uuid, 'image', k)
+
+        for k, record in self.agent.state.get_all(self.uuid, 'entity').items():
+            data = record.get('data')
+            entity = KVMLibvirtEntity(k, data.get('name'), data.get('image_id'), data.get('flavor_id'))
+            entity.set_user_file(data.get('user_file'))
+            entity.set_ssh_key(data.get('ssh_key'))
+            entity.set_networks(data.get('networks'))
+            entity.on_defined()
+            self.current_entities.update({k: entity})
+            self.__update_actual_store_entity(k, record.get('info'))
+
+        domains = self.__libvirt_call(lambda conn: conn.listAllDomains(0))
+        domains = dict((d.UUIDString(), d) for d in domains)
+        with self.domains_lock:
+            self.domains.update(domains)
+
+        for k, record in self.agent.state.get_all(self.uuid, 'instance').items():
+            entity_uuid = record.get('entity_uuid')
+            entity = self.current_entities.get(entity_uuid, None)
+            dom = domains.get(k, None)
+            if entity is None or dom is None:
+                self.logger.warning('restore_runtime()', '[ WARN ] KVM Plugin - Instance {} is gone, dropping it'.format(k))
+                self.agent.state.remove(self.uuid, 'instance', k)
+                continue
+            data = record.get('data')
+            instance = KVMLibvirtEntityInstance(k, data.get('name'), data.get('disk'), data.get('cdrom'),
+                                                entity.shared('networks', data.get('networks')),
+                                                entity.shared('user_file', data.get('user_file')),
+                                                entity.shared('ssh_key', data.get('ssh_key')),
+                                                entity_uuid, data.get('flavor_id'), data.get('image_id'))
+            instance.on_configured(dom.XMLDesc(0))
+            state = self.__domain_state(dom)
+            instance.set_state(state)
+            entity.add_instance(instance)
+            info = record.get('info')
+            if state.name != record.get('state'):
+                self.logger.info('restore_runtime()', ' KVM Plugin - Instance {} was {} now is {}'.format(k, record.get('state'), state.name))
+                info.update({'status': {State.RUNNING: 'run', State.PAUSED: 'pause'}.get(state, 'stop')})
+            self.__update_actual_store_instance(entity_uuid, k, info)
+
+        self.logger.info('restore_runtime()', '[ DONE ] KVM Plugin - Restored {} entities'.format(len(self.current_entities)))
 
     def get_entities(self):
         return self.current_entities
 
     def define_entity(self, *args, **kwargs):
         
-        self.agent.logger.info('define_entity()', ' KVM Plugin - Defining a VM')
+        self.logger.info('define_entity()', ' KVM Plugin - Defining a VM')
 
         entity = None
         img = None
         flavor = None
 
         if len(kwargs) > 0:
-            self.agent.logger.info('define_entity()', ' KVM Plugin - Called with **kwargs')
+            self.logger.info('define_entity()', ' KVM Plugin - Called with **kwargs')
             entity_uuid = kwargs.get('entity_uuid')
             base_image = kwargs.get('base_image')
             name = kwargs.get('name')
 
             if self.is_uuid(base_image):
-                self.lock.acquire()
-                img = self.images.get(base_image, None)
+                with self.lock:
+                    img = self.images.get(base_image, None)
                 if img is None:
-                    self.agent.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find image {}'.format(base_image))
+                    self.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find image {}'.format(base_image))
                     self.__write_error_entity(entity_uuid, 'Image not found!')
-                    self.lock.release()
                     return
-                self.lock.release()
             else:
-                self.agent.logger.warning('define_entity()', '[ WARN ] KVM Plugin - No image id specified defining from manifest information new image id uuid:{}'.format(entity_uuid))
+                self.logger.warning('define_entity()', '[ WARN ] KVM Plugin - No image id specified defining from manifest information new image id uuid:{}'.format(entity_uuid))
                 img_info = {}
                 img_info.update({'uuid': entity_uuid})
                 img_info.update({'name': '{}_img'.format(name)})
@@ -145,13 +346,13 @@ class KVMLibvirt(RuntimePlugin):
                 self.__add_image(img_info)
                 img = self.images.get(entity_uuid, None)
                 if img is None:
-                    self.agent.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find image {}'.format(entity_uuid))
+                    self.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find image {}'.format(entity_uuid))
                     self.__write_error_entity(entity_uuid, 'Image not found!')
                     
                     return
 
             if kwargs.get('flavor_id', None) is None:
-                self.agent.logger.warning('define_entity()', '[ WARN ] KVM Plugin - No flavor specified defining from manifest information new flavor uuid:{}'.format(entity_uuid))
+                self.logger.warning('define_entity()', '[ WARN ] KVM Plugin - No flavor specified defining from manifest information new flavor uuid:{}'.format(entity_uuid))
                 cpu = kwargs.get('cpu')
                 mem = kwargs.get('memory')
                 disk_size = kwargs.get('disk_size')
@@ -165,36 +366,35 @@ class KVMLibvirt(RuntimePlugin):
                 self.__add_flavor(flavor_info)
                 flavor = self.flavors.get(entity_uuid, None)
                 if flavor is None:
-                    self.agent.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find flavor {}'.format(entity_uuid))
+                    self.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find flavor {}'.format(entity_uuid))
                     self.__write_error_entity(entity_uuid, 'Flavor not found!')
                     
                     return
             else:
-                self.lock.acquire()
-                flavor = self.flavors.get(kwargs.get('flavor_id'), None)
+                with self.lock:
+                    flavor = self.flavors.get(kwargs.get('flavor_id'), None)
                 if flavor is None:
-                    self.agent.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find flavor {}'.format(kwargs.get('flavor_id')))
+                    self.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find flavor {}'.format(kwargs.get('flavor_id')))
                     self.__write_error_entity(entity_uuid, 'Flavor not found!')
-                    self.lock.release()
                     return
-                self.lock.release()
 
             entity = KVMLibvirtEntity(entity_uuid, name, img.get('uuid'), flavor.get('uuid'))
             entity.set_user_file(kwargs.get('user-data'))
             entity.set_ssh_key(kwargs.get('ssh-key'))
             entity.set_networks(kwargs.get('networks'))
         else:
-            self.agent.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Wrong parameters args:{} kwargs:{}'.format(args, kwargs))
+            self.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Wrong parameters args:{} kwargs:{}'.format(args, kwargs))
             e = {'errors': 'wrong parameters to define_entity'}
             self.__update_actual_store(self.ERRORS, e)
             
             return
 
+        t = self.states.begin('define', entity, entity_uuid)
         entity.on_defined()
         self.current_entities.update({entity_uuid: entity})
         uri = '{}/{}/{}'.format(self.agent.dhome, self.HOME_ENTITY, entity_uuid)
         vm_info = json.loads(self.agent.dstore.get(uri))
-        vm_info.update({'status': 'defined'})
+        vm_info.update({'status': STATUS.get('define')})
         data = vm_info.get('entity_data')
 
         data.update({'flavor_id': flavor.get('uuid')})
@@ -205,7 +405,8 @@ class KVMLibvirt(RuntimePlugin):
 
         vm_info.update({'entity_data': data})
         self.__update_actual_store_entity(entity_uuid, vm_info)
-        self.agent.logger.info('define_entity()', '[ DONE ] KVM Plugin - VM Defined uuid: {}'.format(entity_uuid))
+        self.states.commit(t)
+        self.logger.info('define_entity()', '[ DONE ] KVM Plugin - VM Defined uuid: {}'.format(entity_uuid))
         
         return entity_uuid
 
@@ -213,30 +414,28 @@ class KVMLibvirt(RuntimePlugin):
         
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('undefine_entity()', ' KVM Plugin - Undefine a VM uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('undefine_entity()', 'KVM Plugin - Entity not exists')
-            self.__write_error_entity(entity_uuid, 'Entity not exist')
-            
-            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('undefine_entity()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
-            self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
-            
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
+        self.logger.info('undefine_entity()', ' KVM Plugin - Undefine a VM uuid {}'.format(entity_uuid))
+        entity = self.__get_entity('undefine_entity()', entity_uuid)
+        t = self.states.begin('undefine', entity, entity_uuid)
+        # configures still running see the entity undefining and roll back, the others already added their instance
+        with self.__entity_lock(entity_uuid):
+            self.undefining.add(entity_uuid)
+            instances = list(entity.instances.keys())
+
+        for i in instances:
+            self.__force_entity_instance_termination(entity_uuid, i)
+
+        with self.__entity_lock(entity_uuid):
             if (self.current_entities.pop(entity_uuid, None)) is None:
-                self.agent.logger.warning('undefine_entity()', 'KVM Plugin - pop from entities dict returned none')
-
-            for i in list(entity.instances.keys()):
-                self.__force_entity_instance_termination(entity_uuid, i)
-
-            self.__pop_actual_store_entity(entity_uuid)
-            self.agent.logger.info('undefine_entity()', '[ DONE ] KVM Plugin - Undefine a VM uuid {} '.format(entity_uuid))
-            
-            return True
+                self.logger.warning('undefine_entity()', 'KVM Plugin - pop from entities dict returned none')
+            self.undefining.discard(entity_uuid)
+        self.__pop_actual_store_entity(entity_uuid)
+        self.states.commit(t)
+        with self.queues_lock:
+            self.entity_locks.pop(entity_uuid, None)
+        self.logger.info('undefine_entity()', '[ DONE ] KVM Plugin - Undefine a VM uuid {} '.format(entity_uuid))
+        
+        return True
 
     def configure_entity(self, entity_uuid, instance_uuid=None):
         '''
@@ -247,388 +446,262 @@ class KVMLibvirt(RuntimePlugin):
         
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('configure_entity()', ' KVM Plugin - Configure a VM uuid {} '.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('configure_entity()', 'KVM Plugin - Entity not exists')
-            self.__write_error_entity(entity_uuid, 'Entity not exist')
-            
-            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('configure_entity()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
-            self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
+        start = time.time()
+        self.logger.info('configure_entity()', ' KVM Plugin - Configure a VM uuid {} '.format(entity_uuid))
+        entity = self.__get_entity('configure_entity()', entity_uuid)
+
+        if instance_uuid is None:
+            instance_uuid = str(uuid.uuid4())
+
+        if entity.has_instance(instance_uuid):
+            print('This instance already existis!!')
             
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
         else:
 
-            if instance_uuid is None:
-                instance_uuid = str(uuid.uuid4())
-
-            if entity.has_instance(instance_uuid):
-                print('This instance already existis!!')
+            flavor = self.flavors.get(entity.flavor_id, None)
+            img = self.images.get(entity.image_id, None)
+            if flavor is None:
+                self.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find flavor {}'.format(entity.flavor_id))
+                self.__write_error_instance(entity_uuid, instance_uuid, 'Flavor not found!')
                 
-            else:
-
-                id = len(entity.instances)
-                name = '{}{}'.format(entity.name, id)
-                flavor = self.flavors.get(entity.flavor_id, None)
-                img = self.images.get(entity.image_id, None)
-                if flavor is None:
-                    self.agent.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find flavor {}'.format(entity.flavor_id))
-                    self.__write_error_instance(entity_uuid, instance_uuid, 'Flavor not found!')
-                    
-                    return
-
-                if img is None:
-                    self.agent.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find image {}'.format(entity.image_id))
-                    self.__write_error_instance(entity_uuid, instance_uuid, 'Image not found!')
-                    
-                    return
+                return
 
-                disk_path = '{}.{}'.format(instance_uuid, img.get('format'))
-                cdrom_path = '{}_config.iso'.format(instance_uuid)
-                disk_path = os.path.join(self.BASE_DIR, self.DISK_DIR, disk_path)
-                cdrom_path = os.path.join(self.BASE_DIR, self.DISK_DIR, cdrom_path)
-
-                # uuid, name, disk, cdrom, networks, user_file, ssh_key, entity_uuid, flavor_id, image_id):
-                instance = KVMLibvirtEntityInstance(instance_uuid, name, disk_path, cdrom_path, entity.networks, entity.user_file,
-                                                    entity.ssh_key, entity_uuid, flavor.get('uuid'), img.get('uuid'))
-
-
-                ### vm networking TODO: add support for SR-IOV
-                if instance.networks is not None:
-                    for i, n in enumerate(instance.networks):
-                        if n.get('type') in ['wifi']:
-
-                            nw_ifaces = self.agent.get_os_plugin().get_network_informations()
-                            for iface in nw_ifaces:
-                                if self.agent.get_os_plugin().get_intf_type(iface.get('intf_name')) == 'wireless' and iface.get('available') is True:
-                                    self.agent.get_os_plugin().set_interface_unaviable(iface.get('intf_name'))
-                                    n.update({'direct_intf': iface.get('intf_name')})
-                            # TODO get available interface from os plugin
-                        if n.get('network_uuid') is not None:
-                            nws = self.agent.get_network_plugin(None).get(list(self.agent.get_network_plugin(None).keys())[0])
-                            # print(nws.getNetworkInfo(n.get('network_uuid')))
-                            br_name = nws.get_network_info(n.get('network_uuid')).get('virtual_device')
-                            # print(br_name)
-                            n.update({'br_name': br_name})
-                        if n.get('intf_name') is None:
-                            n.update({'intf_name': 'veth{0}'.format(i)})
-                ######
-
-                vm_xml = self.__generate_dom_xml(instance, flavor, img)
-
-                vendor_conf = self.__generate_vendor_data(instance_uuid, entity_uuid, self.agent.get_os_plugin().get_uuid())
-                vendor_filename = 'vendor_{}.yaml'.format(instance_uuid)
-                self.agent.get_os_plugin().store_file(vendor_conf, self.BASE_DIR, vendor_filename)
-                vendor_filename = os.path.join(self.BASE_DIR, vendor_filename)
-                ### creating cloud-init initial drive TODO: check all the possibilities provided by OSM
-                conf_cmd = '{} --hostname {} --uuid {} --vendor-data {}'.format(os.path.join(self.DIR, 'templates',
-                                                                            'create_config_drive.sh'), entity.name, entity_uuid,
-                                                                              vendor_filename)
-
-                rm_temp_cmd = 'rm'
-                if instance.user_file is not None and instance.user_file != '':
-                    data_filename = 'userdata_{}'.format(entity_uuid)
-                    self.agent.get_os_plugin().store_file(entity.user_file, self.BASE_DIR, data_filename)
-                    data_filename = os.path.join(self.BASE_DIR, data_filename)
-                    conf_cmd = conf_cmd + ' --user-data {}'.format(data_filename)
-                if instance.ssh_key is not None and instance.ssh_key != '':
-                    key_filename = 'key_{}.pub'.format(entity_uuid)
-                    self.agent.get_os_plugin().store_file(instance.ssh_key, self.BASE_DIR, key_filename)
-                    key_filename = os.path.join(self.BASE_DIR, key_filename)
-                    conf_cmd = conf_cmd + ' --ssh-key {}'.format(key_filename)
-
-
-                conf_cmd = conf_cmd + ' {}'.format(instance.cdrom)
-                #############
-
-                qemu_cmd = 'qemu-img create -f {} {} {}G'.format(img.get('format'), instance.disk, flavor.get('disk_size'))
-
-                # As in the first example, but the output format will be qcow2 instead of a raw  disk:
-                #
-                # qemu-img create -f qcow2 -o preallocation=metadata newdisk.qcow2 15G
-                # virt-resize --expand /dev/sda2 olddisk newdisk.qcow2
-
-                dd_cmd = 'dd if={} of={}'.format(img.get('path'), instance.disk)
-
-                self.agent.get_os_plugin().execute_command(qemu_cmd, True)
-                self.agent.get_os_plugin().execute_command(conf_cmd, True)
-                self.agent.get_os_plugin().execute_command(dd_cmd, True)
-
-                if instance.ssh_key is not None and instance.ssh_key != '':
-                    self.agent.get_os_plugin().remove_file(key_filename)
-                if instance.user_file is not None and instance.user_file != '':
-                    self.agent.get_os_plugin().remove_file(data_filename)
-
-                self.agent.get_os_plugin().remove_file(vendor_filename)
+            if img is None:
+                self.logger.error('define_entity()', '[ ERRO ] KVM Plugin - Cannot find image {}'.format(entity.image_id))
+                self.__write_error_instance(entity_uuid, instance_uuid, 'Image not found!')
+                
+                return
 
-                try:
-                    self.conn.defineXML(vm_xml)
-                except libvirt.libvirtError as err:
-                    self.conn = libvirt.open('qemu:///system')
-                    self.conn.defineXML(vm_xml)
+            name = self.__reserve_name(entity)
 
-                instance.on_configured(vm_xml)
-                entity.add_instance(instance)
-                self.current_entities.update({entity_uuid: entity})
+            t = self.states.begin('configure', None, entity_uuid, instance_uuid)
+            disk_path = '{}.{}'.format(instance_uuid, self.__disk_format(img))
+            cdrom_path = '{}_config.iso'.format(instance_uuid)
+            disk_path = os.path.join(self.BASE_DIR, self.DISK_DIR, disk_path)
+            cdrom_path = os.path.join(self.BASE_DIR, self.DISK_DIR, cdrom_path)
 
-                uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid)
-                vm_info = json.loads(self.agent.astore.get(uri))
-                vm_info.update({'status': 'configured'})
-                vm_info.update({'name': instance.name})
-                data = vm_info.get('entity_data')
-                data.update({'flavor_id': flavor.get('uuid')})
-                data.update({'base_image': img.get('uuid')})
-                vm_info.update({'entity_data': data})
+            # uuid, name, disk, cdrom, networks, user_file, ssh_key, entity_uuid, flavor_id, image_id):
+            instance = KVMLibvirtEntityInstance(instance_uuid, name, disk_path, cdrom_path, entity.networks, entity.user_file,
+                                                entity.ssh_key, entity_uuid, flavor.get('uuid'), img.get('uuid'))
+
+
+            ### vm networking TODO: add support for SR-IOV
+            if instance.networks is not None:
+                for i, n in enumerate(instance.networks):
+                    if n.get('type') in ['wifi']:
+
+                        nw_ifaces = self.agent.get_os_plugin().get_network_informations()
+                        for iface in nw_ifaces:
+                            if self.agent.get_os_plugin().get_intf_type(iface.get('intf_name')) == 'wireless' and iface.get('available') is True:
+                                self.agent.get_os_plugin().set_interface_unaviable(iface.get('intf_name'))
+                                n.update({'direct_intf': iface.get('intf_name')})
+                        # TODO get available interface from os plugin
+                    if n.get('network_uuid') is not None:
+                        nws = self.agent.get_network_plugin(None).get(list(self.agent.get_network_plugin(None).keys())[0])
+                        # print(nws.getNetworkInfo(n.get('network_uuid')))
+                        br_name = nws.get_network_info(n.get('network_uuid')).get('virtual_device')
+                        # print(br_name)
+                        n.update({'br_name': br_name})
+                    if n.get('intf_name') is None:
+                        n.update({'intf_name': 'veth{0}'.format(i)})
+            ######
+
+            vm_xml = self.__generate_dom_xml(instance, flavor, img)
+
+            vendor_conf = self.__generate_vendor_data(instance_uuid, entity_uuid, self.agent.get_os_plugin().get_uuid())
+
+            try:
+                with self.io_slots:
+                    self.__checkpoint(instance_uuid)
+                    provisioning_time = self.__provision_disk(instance, img, flavor)
+                    self.__checkpoint(instance_uuid)
+                    ### creating cloud-init initial drive TODO: check all the possibilities provided by OSM
+                    with Tracing.span('config-drive'):
+                        self.__write_config_drive(instance, entity_uuid, entity.name, vendor_conf)
+                self.__checkpoint(instance_uuid)
+
+                # undefine_entity pops the entity under the same lock, the instance is added only if the entity is still there
+                with self.__entity_lock(entity_uuid):
+                    if self.current_entities.get(entity_uuid, None) is not entity or entity_uuid in self.undefining:
+                        raise OperationCancelled('Entity {} was undefined'.format(entity_uuid))
+                    with Tracing.span('libvirt-define'):
+                        self.__libvirt_call(lambda conn: conn.defineXML(vm_xml))
+
+                    instance.on_configured(vm_xml)
+                    entity.add_instance(instance)
+                    self.reserved_names.discard(name)
+
+                    vm_info = self.__actual_info(entity_uuid)
+                    vm_info.update({'status': STATUS.get('configure')})
+                    vm_info.update({'name': instance.name})
+                    vm_info.update({'provisioning': {'mode': self.provisioning, 'seconds': provisioning_time}})
+                    data = vm_info.get('entity_data')
+                    data.update({'flavor_id': flavor.get('uuid')})
+                    data.update({'base_image': img.get('uuid')})
+                    vm_info.update({'entity_data': data})
 
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, vm_info)
+                    self.__update_actual_store_instance(entity_uuid, instance_uuid, vm_info)
+                    self.states.commit(t, instance)
+            except OperationCancelled as e:
+                self.logger.info('configure_entity()', ' KVM Plugin - Configure of {} cancelled: {}'.format(instance_uuid, e))
+                self.agent.get_os_plugin().remove_file(instance.disk)
+                self.agent.get_os_plugin().remove_file(instance.cdrom)
+                if entity_uuid in self.current_entities and entity_uuid not in self.undefining:
+                    self.aborted.add(instance_uuid)
+                self.reserved_names.discard(name)
+                return False
+            except Exception:
+                self.reserved_names.discard(name)
+                raise
 
-                self.agent.logger.info('configure_entity()', '[ DONE ] KVM Plugin - Configure a VM uuid {}'.format(instance_uuid))
-                
-                return True
+            self.logger.info('configure_entity()', '[ DONE ] KVM Plugin - Configure a VM uuid %s', instance_uuid,
+                             entity_uuid=entity_uuid, instance_uuid=instance_uuid, latency=time.time() - start,
+                             provisioning=self.provisioning, provisioning_latency=provisioning_time)
+            
+            return True
 
     def clean_entity(self, entity_uuid, instance_uuid=None):
-        
+
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('clean_entity()', ' KVM Plugin - Clean a VM uuid {} '.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('clean_entity()', 'KVM Plugin - Entity not exists')
-            self.__write_error_entity(entity_uuid, 'Entity not exist')
-            
-            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('clean_entity()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
-            self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
-            
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
+        start = time.time()
+        self.logger.info('clean_entity()', ' KVM Plugin - Clean a VM uuid {} '.format(entity_uuid))
+        entity, instance = self.__get_instance('clean_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return
+        t = self.__begin_transition('clean_entity()', 'clean', entity_uuid, instance_uuid, instance)
+        dom = self.__lookup_by_uuid(instance_uuid)
+        if dom is not None:
+            dom.undefine()
+            self.__forget_domain(instance_uuid)
         else:
+            self.logger.error('clean_entity()', 'KVM Plugin - Domain not found!!')
+            self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance KVM domain not found')
 
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('clean_entity()', 'KVM Plugin - Instance not found!!')
-                self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance not exist')
-                
-                return
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.CONFIGURED:
-                    self.agent.logger.error('clean_entity()', 'KVM Plugin - Instance state is wrong, or transition not allowed')
-                    self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance state transition not allowed')
-                    
-                    raise StateTransitionNotAllowedException('Instance is not in CONFIGURED state', 'Instance {} is not in CONFIGURED state'.format(instance_uuid))
-                else:
-                    dom = self.__lookup_by_uuid(instance_uuid)
-                    if dom is not None:
-                        dom.undefine()
-                    else:
-                        self.agent.logger.error('clean_entity()', 'KVM Plugin - Domain not found!!')
-                        self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance KVM domain not found')
-
-                    self.agent.get_os_plugin().remove_file(instance.cdrom)
-                    self.agent.get_os_plugin().remove_file(instance.disk)
-                    self.agent.get_os_plugin().remove_file(os.path.join(self.BASE_DIR, self.LOG_DIR, instance_uuid))
-
-                    entity.remove_instance(instance)
-
-                    self.current_entities.update({entity_uuid: entity})
-                    self.__pop_actual_store_instance(entity_uuid, instance_uuid)
-                    self.agent.logger.info('clean_entity()', '[ DONE ] KVM Plugin - Clean a VM uuid {} '.format(entity_uuid))
-                
-                return True
+        if instance_uuid in self.migrated_out:
+            self.migrated_out.discard(instance_uuid)
+        else:
+            self.agent.get_os_plugin().remove_file(instance.cdrom)
+            self.agent.get_os_plugin().remove_file(instance.disk)
+        self.agent.get_os_plugin().remove_file(os.path.join(self.BASE_DIR, self.LOG_DIR, instance_uuid))
+
+        entity.remove_instance(instance)
+
+        self.current_entities.update({entity_uuid: entity})
+        self.__pop_actual_store_instance(entity_uuid, instance_uuid)
+        self.states.commit(t)
+        self.logger.info('clean_entity()', '[ DONE ] KVM Plugin - Clean a VM uuid %s', entity_uuid,
+                         entity_uuid=entity_uuid, instance_uuid=instance_uuid, latency=time.time() - start)
+
+        return True
 
     def run_entity(self, entity_uuid, instance_uuid=None):
-        
+
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('run_entity()', 'KVM Plugin - Starting a VM uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('run_entity()', 'KVM Plugin - Entity not exists')
-            self.__write_error_entity(entity_uuid, 'Entity not exist')
-            
-            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('run_entity()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
-            self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
-            
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'KVM Plugin - Instance not found!!')
-                self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance not exist')
-                
-                return
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() == State.RUNNING:
-                    self.agent.logger.error('run_entity()',
-                                            'KVM Plugin - Instance already running')
-                    
-                    return True
-                if instance.get_state() != State.CONFIGURED:
-                    self.agent.logger.error('clean_entity()', 'KVM Plugin - Instance state is wrong, or transition not allowed')
-                    
-                    raise StateTransitionNotAllowedException('Instance is not in CONFIGURED state', 'Instance {} is not in CONFIGURED state'.format(instance_uuid))
-                else:
-                    dom = self.__lookup_by_uuid(instance_uuid)
-                    dom.create()
-                    while dom.state()[0] != 1:
-                        pass
+        start = time.time()
+        self.logger.info('run_entity()', 'KVM Plugin - Starting a VM uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('run_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return
+        if instance.get_state() == State.RUNNING:
+            self.logger.error('run_entity()', 'KVM Plugin - Instance already running')
+            return True
+        t = self.__begin_transition('run_entity()', 'run', entity_uuid, instance_uuid, instance)
+        with Tracing.span('libvirt-create'), self.__expecting(instance_uuid):
+            dom = self.__lookup_by_uuid(instance_uuid)
+            self.__track_domain(dom)
+            dom.create()
+            if not self.__wait_domain(dom, [libvirt.VIR_DOMAIN_RUNNING], self.action_timeout):
+                self.logger.warning('run_entity()', '[ WARN ] KVM Plugin - VM {} not running after {}s'.format(instance_uuid, self.action_timeout))
 
-                    instance.on_start()
-                    # log_filename = '{}/{}/{}_log.log'.format(self.BASE_DIR, self.LOG_DIR, instance_uuid)
-                    # if instance.user_file is not None and instance.user_file != '':
-                    #     self.__wait_boot(log_filename, True)
-                    # else:
-                    #     self.__wait_boot(log_filename)
-                    #     self.__wait_boot(log_filename)
-
-                    self.agent.logger.info('run_entity()', ' KVM Plugin - VM {} Started!'.format(instance))
-                    uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
-                    vm_info = json.loads(self.agent.astore.get(uri))
-                    vm_info.update({'status': 'run'})
-                    self.__update_actual_store_instance(entity_uuid, instance_uuid, vm_info)
-                    self.current_entities.update({entity_uuid: entity})
-                    self.agent.logger.info('run_entity()', '[ DONE ] KVM Plugin - Starting a VM uuid {}'.format(entity_uuid))
-                    
-                    return True
+        instance.on_start()
+
+        self.logger.info('run_entity()', ' KVM Plugin - VM {} Started!'.format(instance))
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.current_entities.update({entity_uuid: entity})
+        self.logger.info('run_entity()', '[ DONE ] KVM Plugin - Starting a VM uuid %s', entity_uuid,
+                         entity_uuid=entity_uuid, instance_uuid=instance_uuid, latency=time.time() - start)
+
+        return True
 
     def stop_entity(self, entity_uuid, instance_uuid=None):
-        
+
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('stop_entity()', ' KVM Plugin - Stop a VM uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('stop_entity()', 'KVM Plugin - Entity not exists')
-            self.__write_error_entity(entity_uuid, 'Entity not exist')
-            
-            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
-            self.agent.logger.error('stop_entity()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
-            
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'KVM Plugin - Instance not found!!')
-                
-                return
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.RUNNING:
-                    self.agent.logger.error('clean_entity()', 'KVM Plugin - Instance state is wrong, or transition not allowed')
-                    self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance not exist')
-                    
-                    raise StateTransitionNotAllowedException('Instance is not in RUNNING state', 'Instance {} is not in RUNNING state'.format(instance_uuid))
-                else:
-                    dom = self.__lookup_by_uuid(instance_uuid)
-                    dom.shutdown()
-                    retries = 100
-                    for i in range(0, retries):
-                        if dom.state()[0] != 5:
-                            break
-                        else:
-                            time.sleep(0.015)
-
-                    if dom.state()[0] != 5:
-                        dom.destroy()
-
-                    instance.on_stop()
-                    self.current_entities.update({entity_uuid: entity})
-
-                    uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
-                    vm_info = json.loads(self.agent.astore.get(uri))
-                    vm_info.update({'status': 'stop'})
-                    self.__update_actual_store_instance(entity_uuid, instance_uuid, vm_info)
-                    self.agent.logger.info('stop_entity()', '[ DONE ] KVM Plugin - Stop a VM uuid {}'.format(instance_uuid))
-            
-            return True
+        start = time.time()
+        self.logger.info('stop_entity()', ' KVM Plugin - Stop a VM uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('stop_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return
+        t = self.__begin_transition('stop_entity()', 'stop', entity_uuid, instance_uuid, instance)
+        dom = self.__lookup_by_uuid(instance_uuid)
+        with self.__expecting(instance_uuid):
+            self.__track_domain(dom)
+            dom.shutdown()
+            if not self.__wait_domain(dom, [libvirt.VIR_DOMAIN_SHUTOFF], self.shutdown_timeout):
+                self.logger.warning('stop_entity()', '[ WARN ] KVM Plugin - VM {} ignored the shutdown, destroying it'.format(instance_uuid))
+                dom.destroy()
+                self.__wait_domain(dom, [libvirt.VIR_DOMAIN_SHUTOFF], self.action_timeout)
+
+        instance.on_stop()
+        self.current_entities.update({entity_uuid: entity})
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.logger.info('stop_entity()', '[ DONE ] KVM Plugin - Stop a VM uuid %s', instance_uuid,
+                         entity_uuid=entity_uuid, instance_uuid=instance_uuid, latency=time.time() - start)
+
+        return True
 
     def pause_entity(self, entity_uuid, instance_uuid=None):
-        
+
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('pause_entity()', ' KVM Plugin - Pause a VM uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('pause_entity()', 'KVM Plugin - Entity not exists')
-            self.__write_error_entity(entity_uuid, 'Entity not exist')
-            
-            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('pause_entity()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
-            self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
-            
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'KVM Plugin - Instance not found!!')
-                self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance not exist')
-                
-                return
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.RUNNING:
-                    self.agent.logger.error('clean_entity()', 'KVM Plugin - Instance state is wrong, or transition not allowed')
-                    self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance state transition not allowed')
-                    
-                    raise StateTransitionNotAllowedException('Instance is not in RUNNING state', 'Instance {} is not in RUNNING state'.format(instance_uuid))
-                else:
-                    self.__lookup_by_uuid(instance_uuid).suspend()
-                    instance.on_pause()
-                    self.current_entities.update({entity_uuid: entity})
-                    uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
-                    vm_info = json.loads(self.agent.astore.get(uri))
-                    vm_info.update({'status': 'pause'})
-                    self.__update_actual_store_instance(entity_uuid, instance_uuid, vm_info)
-                    self.agent.logger.info('pause_entity()', '[ DONE ] KVM Plugin - Pause a VM uuid {}'.format(instance_uuid))
-                    
-                    return True
+        start = time.time()
+        self.logger.info('pause_entity()', ' KVM Plugin - Pause a VM uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('pause_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return
+        t = self.__begin_transition('pause_entity()', 'pause', entity_uuid, instance_uuid, instance)
+        dom = self.__lookup_by_uuid(instance_uuid)
+        with self.__expecting(instance_uuid):
+            self.__track_domain(dom)
+            dom.suspend()
+            self.__wait_domain(dom, [libvirt.VIR_DOMAIN_PAUSED], self.action_timeout)
+        instance.on_pause()
+        self.current_entities.update({entity_uuid: entity})
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.logger.info('pause_entity()', '[ DONE ] KVM Plugin - Pause a VM uuid %s', instance_uuid,
+                         entity_uuid=entity_uuid, instance_uuid=instance_uuid, latency=time.time() - start)
+
+        return True
 
     def resume_entity(self, entity_uuid, instance_uuid=None):
-        
+
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('resume_entity()', ' KVM Plugin - Resume a VM uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('resume_entity()', 'KVM Plugin - Entity not exists')
-            self.__write_error_entity(entity_uuid, 'Entity not exist')
-            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('resume_entity()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
-            self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'KVM Plugin - Instance not found!!')
-                self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance not exist')
-                return
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.PAUSED:
-                    self.agent.logger.error('clean_entity()', 'KVM Plugin - Instance state is wrong, or transition not allowed')
-                    self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance state transition not allowed')
-                    raise StateTransitionNotAllowedException('Instance is not in PAUSED state', 'Instance {} is not in PAUSED state'.format(entity_uuid))
-                else:
-                    self.__lookup_by_uuid(instance_uuid).resume()
-                    instance_uuid.on_resume()
-                    self.current_entities.update({entity_uuid: entity})
-                    uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
-                    vm_info = json.loads(self.agent.dstore.get(uri))
-                    vm_info.update({'status': 'run'})
-                    self.__update_actual_store_instance(entity_uuid, instance_uuid, vm_info)
-                    self.agent.logger.info('resume_entity()', '[ DONE ] KVM Plugin - Resume a VM uuid {}'.format(instance_uuid))
-                    return True
+        start = time.time()
+        self.logger.info('resume_entity()', ' KVM Plugin - Resume a VM uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('resume_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return
+        t = self.__begin_transition('resume_entity()', 'resume', entity_uuid, instance_uuid, instance)
+        dom = self.__lookup_by_uuid(instance_uuid)
+        with self.__expecting(instance_uuid):
+            self.__track_domain(dom)
+            dom.resume()
+            self.__wait_domain(dom, [libvirt.VIR_DOMAIN_RUNNING], self.action_timeout)
+        instance.on_resume()
+        self.current_entities.update({entity_uuid: entity})
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.logger.info('resume_entity()', '[ DONE ] KVM Plugin - Resume a VM uuid %s', instance_uuid,
+                         entity_uuid=entity_uuid, instance_uuid=instance_uuid, latency=time.time() - start)
+        return True
 
     # TODO rethink the migration workflow to be faster, copy the disk first and copy the base image only when migration ended
     def migrate_entity(self, entity_uuid, dst=False, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('migrate_entity()', ' KVM Plugin - Migrate a VM uuid {}'.format(entity_uuid))
+        self.logger.info('migrate_entity()', ' KVM Plugin - Migrate a VM uuid {}'.format(entity_uuid))
         entity = self.current_entities.get(entity_uuid, None)
         if entity is None or entity.get_instance(instance_uuid) is None:
 
@@ -663,43 +736,39 @@ class KVMLibvirt(RuntimePlugin):
             '''
             if dst is True:
 
-                self.agent.logger.info('migrate_entity()', ' KVM Plugin - I\'m the Destination Node')
+                self.logger.info('migrate_entity()', ' KVM Plugin - I\'m the Destination Node')
                 self.before_migrate_entity_actions(entity_uuid, True, instance_uuid)
 
-                while True:  # wait for migration to be finished
-                    dom = self.__lookup_by_uuid(instance_uuid)
-                    if dom is None:
-                        self.agent.logger.info('migrate_entity()', ' KVM Plugin - Domain not already in this host')
-                    else:
-                        if dom.isActive() == 1:
-                            break
-                        else:
-                            self.agent.logger.info('migrate_entity()', ' KVM Plugin - Domain in this host but not running')
-                    time.sleep(5)
+                # the domain is resumed here when the migration is finished
+                with self.__expecting(instance_uuid):
+                    if not self.__wait_domain_uuid(instance_uuid, [libvirt.VIR_DOMAIN_RUNNING], self.migration_timeout):
+                        self.logger.error('migrate_entity()', 'KVM Plugin - Domain not running after {}s'.format(self.migration_timeout))
+                        self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance migration timeout on destination')
+                        return False
 
                 self.after_migrate_entity_actions(entity_uuid, True, instance_uuid)
-                self.agent.logger.info('migrate_entity()', '[ DONE ] KVM Plugin - Migrate a VM uuid {}'.format(entity_uuid))
+                self.logger.info('migrate_entity()', '[ DONE ] KVM Plugin - Migrate a VM uuid {}'.format(entity_uuid))
                 return True
 
             else:
-                self.agent.logger.error('migrate_entity()', 'KVM Plugin - Entity not exists')
+                self.logger.error('migrate_entity()', 'KVM Plugin - Entity not exists')
                 self.__write_error_entity(entity_uuid, 'Entity not exist')
                 raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
         elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('migrate_entity()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
+            self.logger.error('migrate_entity()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
             self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
             raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
         else:
             instance = entity.get_instance(instance_uuid)
             if instance.get_state() not in [State.RUNNING, State.TAKING_OFF]:
-                self.agent.logger.error('clean_entity()', 'KVM Plugin - Instance state is wrong, or transition not allowed')
+                self.logger.error('clean_entity()', 'KVM Plugin - Instance state is wrong, or transition not allowed')
                 self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance not exist')
                 raise StateTransitionNotAllowedException('Instance is not in RUNNING state', 'Instance {} is not in RUNNING state'.format(entity_uuid))
 
-            self.agent.logger.info('migrate_entity()', ' KVM Plugin - I\'m the Source Node')
+            self.logger.info('migrate_entity()', ' KVM Plugin - I\'m the Source Node')
             res = self.before_migrate_entity_actions(entity_uuid, instance_uuid=instance_uuid)
             if not res:
-                self.agent.logger.error('migrate_entity()', ' KVM Plugin - Error source node before migration, aborting')
+                self.logger.error('migrate_entity()', ' KVM Plugin - Error source node before migration, aborting')
                 self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance migration error on source')
                 return
 
@@ -742,24 +811,53 @@ class KVMLibvirt(RuntimePlugin):
 
             # ## ACTUAL MIGRATIION ##################
             dst_host = 'qemu+ssh://{}/system'.format(dst_ip)
-            dest_conn = libvirt.open(dst_host)
-            if dest_conn is None:
-                self.agent.logger.error('before_migrate_entity_actions()', 'KVM Plugin - Before Migration Source: Error on libvirt connection')
-                self.__write_error_instance(entity_uuid, instance_uuid, 'Source Error on libvirt connection')
-                return
-            flags = libvirt.VIR_MIGRATE_LIVE | libvirt.VIR_MIGRATE_PERSIST_DEST
-            new_dom = dom.migrate(dest_conn, flags, name, None, 0)
-            # new_dom = dom.migrate(dest_conn, libvirt.VIR_MIGRATE_LIVE and libvirt.VIR_MIGRATE_PERSIST_DEST and libvirt.VIR_MIGRATE_NON_SHARED_DISK, name, None, 0)
-            if new_dom is None:
-                self.agent.logger.error('before_migrate_entity_actions()', 'KVM Plugin - Before Migration Source: Migration failed')
-                self.__write_error_instance(entity_uuid, instance_uuid, 'Source Error Migration failed')
-                return
-            self.agent.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: Migration succeeds')
-            dest_conn.close()
+            dest_conn = None
+            try:
+                try:
+                    dest_conn = libvirt.open(dst_host)
+                except libvirt.libvirtError as err:
+                    self.logger.error('migrate_entity()', 'KVM Plugin - Cannot connect to {}: {}'.format(dst_host, err))
+                if dest_conn is None:
+                    self.logger.error('before_migrate_entity_actions()', 'KVM Plugin - Before Migration Source: Error on libvirt connection')
+                    self.__write_error_instance(entity_uuid, instance_uuid, 'Source Error on libvirt connection')
+                    return
+                policy_name, policy = self.__migration_policy(instance_info.get('entity_data'), self.flavors.get(instance.flavor_uuid, {}))
+                flags, params = self.__migration_params(policy, name)
+                self.logger.info('migrate_entity()', ' KVM Plugin - Migrating {} with policy {}'.format(instance_uuid, policy_name))
+                done = threading.Event()
+                watcher = threading.Thread(target=self.__watch_migration, args=(entity_uuid, instance_uuid, dom, policy_name, policy, done),
+                                           daemon=True)
+                start = time.time()
+                watcher.start()
+                try:
+                    new_dom = dom.migrate3(dest_conn, params, flags)
+                except libvirt.libvirtError as err:
+                    self.logger.error('migrate_entity()', 'KVM Plugin - Migration of {} failed: {}'.format(instance_uuid, err))
+                    new_dom = None
+                finally:
+                    done.set()
+                    watcher.join()
+                MIGRATION_LATENCY.observe(time.time() - start, policy=policy_name)
+                if new_dom is None:
+                    self.logger.error('before_migrate_entity_actions()', 'KVM Plugin - Before Migration Source: Migration failed')
+                    self.__write_error_instance(entity_uuid, instance_uuid, 'Source Error Migration failed')
+                    return
+                report = self.__migration_report(new_dom)
+                if report is not None:
+                    MIGRATION_BYTES.observe(report.get('bytes'), storage=self.migration_storage)
+                    MIGRATION_DOWNTIME.observe(report.get('downtime_ms') / 1000.0, storage=self.migration_storage)
+                self.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: Migration succeeds',
+                                 instance_uuid=instance_uuid, storage=self.migration_storage, report=report)
+            finally:
+                if dest_conn is not None:
+                    try:
+                        dest_conn.close()
+                    except libvirt.libvirtError:
+                        pass
+                # ## REMOVING AFTER MIGRATION
+                self.agent.get_os_plugin().remove_know_host(dst_hostname)
             # #######################################
 
-            # ## REMOVING AFTER MIGRATION
-            self.agent.get_os_plugin().remove_know_host(dst_hostname)
             instance.on_stop()
             self.current_entities.update({entity_uuid: entity})
 
@@ -767,44 +865,53 @@ class KVMLibvirt(RuntimePlugin):
 
             res = self.after_migrate_entity_actions(entity_uuid, instance_uuid=instance_uuid)
             if not res:
-                self.agent.logger.error('migrate_entity()', ' KVM Plugin - Error source node after migration, aborting')
+                self.logger.error('migrate_entity()', ' KVM Plugin - Error source node after migration, aborting')
                 return
 
     def before_migrate_entity_actions(self, entity_uuid, dst=False, instance_uuid=None):
         if dst is True:
 
-            self.agent.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Destination: Create Domain and destination files')
+            self.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Destination: Create Domain and destination files')
             uri = '{}/{}/{}/{}/{}'.format(self.agent.dhome, self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
             instance_info = json.loads(self.agent.dstore.get(uri))
             vm_info = instance_info.get('entity_data')
 
             # waiting flavor
-            self.agent.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Waiting flavor')
+            self.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Waiting flavor')
             while True:
                 flavor_id = vm_info.get('flavor_id')
                 if flavor_id in self.flavors.keys():
                     break
 
-            # waiting image
-            self.agent.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Waiting image')
-            while True:
-                base_image = vm_info.get('base_image')
-                if base_image in self.images.keys():
-                    break
+            # waiting image, with shared storage the disk is already there and does not need it
+            base_image = vm_info.get('base_image')
+            if self.migration_storage == 'incremental':
+                self.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Waiting image')
+                while True:
+                    if base_image in self.images.keys():
+                        break
 
             # waiting entity
-            self.agent.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Waiting entity')
+            self.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Waiting entity')
             while True:
                 if entity_uuid in self.current_entities.keys():
                     break
-            self.agent.logger.info('before_migrate_entity_actions()', ' Entity {} defined!!!'.format(entity_uuid))
+            self.logger.info('before_migrate_entity_actions()', ' Entity {} defined!!!'.format(entity_uuid))
 
-            img_info = self.images.get(base_image)
+            img_info = self.images.get(base_image, {'uuid': base_image})
             flavor_info = self.flavors.get(flavor_id)
             entity = self.current_entities.get(entity_uuid)
 
+            if self.migration_storage == 'shared':
+                disk_format = self.__shared_disk_format(instance_uuid, img_info)
+                if disk_format is None:
+                    self.logger.error('before_migrate_entity_actions()', 'KVM Plugin - Disk of {} not found on shared storage, aborting'.format(instance_uuid))
+                    self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance disk not found on shared storage')
+                    return False
+                img_info = dict(img_info, format=disk_format)
+
             name = vm_info.get('name')
-            disk_path = '{}.{}'.format(instance_uuid, img_info.get('format'))
+            disk_path = '{}.{}'.format(instance_uuid, self.__disk_format(img_info))
             cdrom_path = '{}_config.iso'.format(instance_uuid)
             disk_path = os.path.join(self.BASE_DIR, self.DISK_DIR, disk_path)
             cdrom_path = os.path.join(self.BASE_DIR, self.DISK_DIR, cdrom_path)
@@ -817,31 +924,12 @@ class KVMLibvirt(RuntimePlugin):
             vm_xml = self.__generate_dom_xml(instance, flavor_info, img_info)
 
             instance.xml = vm_xml
-            qemu_cmd = 'qemu-img create -f {} {} {}G'.format(img_info.get('format'), instance.disk, flavor_info.get('disk_size'))
-            self.agent.get_os_plugin().execute_command(qemu_cmd, True)
-            self.agent.get_os_plugin().create_file(instance.cdrom)
+            if self.migration_storage == 'incremental':
+                # the image is already here, with overlays an incremental migration only fills the new overlay
+                self.__provision_disk(instance, img_info, flavor_info)
+                self.__write_config_drive(instance, instance_uuid, instance.name)
             self.agent.get_os_plugin().create_file(os.path.join(self.BASE_DIR, self.LOG_DIR, '{}_log.log'.format(instance_uuid)))
 
-            conf_cmd = '{} --hostname {} --uuid {}'.format(os.path.join(self.DIR, 'templates',
-                                                                        'create_config_drive.sh'), instance.name, instance_uuid)
-            rm_temp_cmd = 'rm'
-            if instance.user_file is not None and instance.user_file != '':
-                data_filename = 'userdata_{}'.format(instance_uuid)
-                self.agent.get_os_plugin().store_file(instance.user_file, self.BASE_DIR, data_filename)
-                data_filename = os.path.join(self.BASE_DIR, data_filename)
-                conf_cmd = conf_cmd + ' --user-data {}'.format(data_filename)
-                # rm_temp_cmd = rm_temp_cmd + ' {}'.format(data_filename)
-            if instance.ssh_key is not None and instance.ssh_key != '':
-                key_filename = 'key_{}.pub'.format(instance_uuid)
-                self.agent.get_os_plugin().store_file(instance.ssh_key, self.BASE_DIR, key_filename)
-                key_filename = os.path.join(self.BASE_DIR, key_filename)
-                conf_cmd = conf_cmd + ' --ssh-key {}'.format(key_filename)
-                # rm_temp_cmd = rm_temp_cmd + ' {}'.format(key_filename)
-
-            conf_cmd = conf_cmd + ' {}'.format(instance.cdrom)
-
-            self.agent.get_os_plugin().execute_command(conf_cmd, True)
-
             instance_info.update({'entity_data': vm_info})
             instance_info.update({'status': 'landing'})
 
@@ -852,7 +940,7 @@ class KVMLibvirt(RuntimePlugin):
 
             return True
         else:
-            self.agent.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: get information about destination node')
+            self.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: get information about destination node')
 
 
             local_var = MVar()
@@ -885,44 +973,49 @@ class KVMLibvirt(RuntimePlugin):
             runtimes = [x for x in all_plugins if x.get('type') == 'runtime']
             search = [x for x in runtimes if 'KVMLibvirt' in x.get('name')]
             if len(search) == 0:
-                self.agent.logger.error('before_migrate_entity_actions()', 'KVM Plugin - Before Migration Source: No KVM Plugin, Aborting!!!')
+                self.logger.error('before_migrate_entity_actions()', 'KVM Plugin - Before Migration Source: No KVM Plugin, Aborting!!!')
                 self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance Migration error')
                 return False
             else:
                 kvm_uuid = search[0].get('uuid')
 
-            self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - check if flavor is present on destination')
+            self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - check if flavor is present on destination')
             uri_flavor = '{}/{}/runtime/{}/flavor/{}'.format(self.agent.aroot, destination_node_uuid, kvm_uuid, flavor_info.get('uuid'))
             if self.agent.astore.get(uri_flavor) is None:
-                self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - sending flavor to destination')
+                self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - sending flavor to destination')
                 uri_flavor = '{}/{}/runtime/{}/flavor/{}'.format(self.agent.droot, destination_node_uuid, kvm_uuid, flavor_info.get('uuid'))
                 self.agent.dstore.put(uri_flavor, json.dumps(flavor_info))
             # wait to be defined flavor
-            # self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - waiting flavor in destination')
+            # self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - waiting flavor in destination')
             # while True:
             #     time.sleep(0.1)
             #     uri_flavor = '{}/{}/runtime/{}/flavor/{}'.format(self.agent.aroot, destination_node_uuid, kvm_uuid, flavor_info.get('uuid'))
             #     f_i = self.agent.astore.get(uri_flavor)
             #     print('{}'.format(f_i))
             #     if f_i is not None:
-            #         self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Flavor in destination!')
+            #         self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Flavor in destination!')
             #         break
 
-            self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - check if image is present on destination')
+            self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - check if image is present on destination')
             uri_img = '{}/{}/runtime/{}/image/{}'.format(self.agent.aroot, destination_node_uuid, kvm_uuid, img_info.get('uuid'))
-            if self.agent.astore.get(uri_img) is None:
-                self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - sending image to destination')
+            if self.migration_storage == 'incremental' and self.agent.astore.get(uri_img) is None:
+                self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - sending image to destination')
+                img_manifest = copy.deepcopy(img_info)
+                img_manifest.pop('path', None)
+                if not img_manifest.get('checksum'):
+                    # overlays copied by the migration need the same base image on the destination, the store file is named by its sha256
+                    img_manifest.update({'checksum': 'sha256:{}'.format(os.path.basename(img_info.get('path')))})
                 uri_img = '{}/{}/runtime/{}/image/{}'.format(self.agent.droot, destination_node_uuid, kvm_uuid, img_info.get('uuid'))
-                self.agent.dstore.put(uri_img, json.dumps(img_info))
+                self.agent.dstore.put(uri_img, json.dumps(img_manifest))
 
             # wait to be defined image
-            # self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Waiting image in destination')
+            # self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Waiting image in destination')
             # while True:
             #     time.sleep(0.1)
             #     uri_img = '{}/{}/runtime/{}/image/{}'.format(self.agent.aroot, destination_node_uuid, kvm_uuid, img_info.get('uuid'))
             #     i_i = self.agent.astore.get(uri_img)
             #     if i_i is not None:
-            #         self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Image in destination!')
+            #         self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Image in destination!')
             #         break
 
             # send entity definition
@@ -933,13 +1026,13 @@ class KVMLibvirt(RuntimePlugin):
             # colorama.init()
             # print(colorama.Fore.RED + '>>>>>> Registered observer for {} <<<<<<< '.format(uri) + colorama.Style.RESET_ALL)
 
-            self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - check if image is present on destination')
+            self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - check if image is present on destination')
             uri_entity = '{}/{}/runtime/{}/entity/{}'.format(self.agent.aroot, destination_node_uuid, kvm_uuid, entity_uuid)
             if self.agent.astore.get(uri_entity) is None:
-                self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - sending entity to destination')
+                self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - sending entity to destination')
                 uri_entity = '{}/{}/runtime/{}/entity/{}'.format(self.agent.droot, destination_node_uuid, kvm_uuid, entity_uuid)
                 self.agent.dstore.put(uri_entity, json.dumps(entity_info))
-                self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Waiting entity in destination')
+                self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Waiting entity in destination')
                 
 
                 uri_entity = '{}/{}/runtime/{}/entity/{}'.format(self.agent.aroot, destination_node_uuid, kvm_uuid, entity_uuid)
@@ -951,21 +1044,21 @@ class KVMLibvirt(RuntimePlugin):
                     es = entity_info.get('status')
                 self.agent.astore.overlook(subid)
 
-                self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Entity in destination!')
+                self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Entity in destination!')
                 # while True:
                 #     uri_entity = '{}/{}/runtime/{}/entity/{}'.format(self.agent.aroot, destination_node_uuid, kvm_uuid, entity_uuid)
                 #     jdata = self.agent.astore.get(uri_entity)
                 #     if jdata is not None:
-                #         self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Entity in destination!')
+                #         self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Entity in destination!')
                 #         entity_info = json.loads(jdata)
                 #         if entity_info is not None and entity_info.get('status') == 'defined':
                 #             break
 
                 # waiting for destination node to be ready
-            self.agent.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: Waiting destination to be ready')
+            self.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: Waiting destination to be ready')
             uri = '{}/{}/runtime/{}/entity/{}/instance/{}'.format(self.agent.aroot, destination_node_uuid, kvm_uuid, entity_uuid, instance_uuid)
             subid = self.agent.astore.observe(uri, cb)
-            self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Entity in destination!')
+            self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Entity in destination!')
             entity_info = json.loads(local_var.get())
             es = entity_info.get('status')
             while es not in ['landing','error']:
@@ -973,14 +1066,14 @@ class KVMLibvirt(RuntimePlugin):
                 es = entity_info.get('status')
             self.agent.astore.overlook(subid)
             # while True:
-            #     # self.agent.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: Waiting destination to be ready')
+            #     # self.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: Waiting destination to be ready')
             #     uri = '{}/{}/runtime/{}/entity/{}/instance/{}'.format(self.agent.aroot, destination_node_uuid, kvm_uuid, entity_uuid, instance_uuid)
             #     vm_info = self.agent.astore.get(uri)
             #     if vm_info is not None:
             #         vm_info = json.loads(vm_info)
             #         if vm_info is not None and vm_info.get('status') == 'landing':
             #             break
-            self.agent.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: Destination is ready!')
+            self.logger.info('before_migrate_entity_actions()', ' KVM Plugin - Before Migration Source: Destination is ready!')
 
             instance.state = State.TAKING_OFF
             instance_info.update({'status': 'taking_off'})
@@ -993,11 +1086,11 @@ class KVMLibvirt(RuntimePlugin):
             entity_uuid = entity_uuid.get('entity_uuid')
         entity = self.current_entities.get(entity_uuid, None)
         if entity is None:
-            self.agent.logger.error('after_migrate_entity_actions()', 'KVM Plugin - Entity not exists')
+            self.logger.error('after_migrate_entity_actions()', 'KVM Plugin - Entity not exists')
             self.__write_error_entity(entity_uuid, 'Entity not exist')
             raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
         elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('after_migrate_entity_actions()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
+            self.logger.error('after_migrate_entity_actions()', 'KVM Plugin - Entity state is wrong, or transition not allowed')
             self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
             raise StateTransitionNotAllowedException('Entity is not in correct state', 'Entity {} is not in correct state'.format(entity.get_state()))
         else:
@@ -1007,7 +1100,7 @@ class KVMLibvirt(RuntimePlugin):
                 '''
                 Here the plugin also update to the current status, and remove unused keys
                 '''
-                self.agent.logger.info('after_migrate_entity_actions()', ' KVM Plugin - After Migration Destination: Updating state')
+                self.logger.info('after_migrate_entity_actions()', ' KVM Plugin - After Migration Destination: Updating state')
                 instance.on_start()
                 self.current_entities.update({entity_uuid: entity})
 
@@ -1015,6 +1108,10 @@ class KVMLibvirt(RuntimePlugin):
                 vm_info = json.loads(self.agent.dstore.get(uri))
                 vm_info.pop('dst')
                 vm_info.update({'status': 'run'})
+                dom = self.__lookup_by_uuid(instance_uuid)
+                report = None if dom is None else self.__migration_report(dom)
+                if report is not None:
+                    vm_info.update({'migration': report})
 
                 self.__update_actual_store_instance(entity_uuid, instance_uuid, vm_info)
                 self.current_entities.update({entity_uuid: entity})
@@ -1024,74 +1121,176 @@ class KVMLibvirt(RuntimePlugin):
                 '''
                 Source node destroys all information about vm
                 '''
-                self.agent.logger.info('after_migrate_entity_actions()', ' KVM Plugin - After Migration Source: Updating state, destroy vm')
+                self.logger.info('after_migrate_entity_actions()', ' KVM Plugin - After Migration Source: Updating state, destroy vm')
+                if self.migration_storage == 'shared':
+                    self.migrated_out.add(instance_uuid)
                 self.__force_entity_instance_termination(entity_uuid, instance_uuid)
                 return True
 
+    def __migration_policy(self, vm_info, flavor):
+        '''
+        Policy of the instance (migration_policy in the instance data), else of the flavor, else of the plugin
+
+        :param vm_info: entity_data of the instance
+        :param flavor: flavor manifest
+        :return: (name, policy)
+        '''
+        policy = (vm_info or {}).get('migration_policy', None) or flavor.get('migration_policy', None) or self.migration_policy
+        if isinstance(policy, dict):
+            return 'custom', policy
+        if policy not in self.migration_policies:
+            self.logger.warning('__migration_policy()', '[ WARN ] KVM Plugin - Unknown migration policy {}, using default'.format(policy))
+            policy = 'default'
+        return policy, self.migration_policies.get(policy)
+
+    def __migration_params(self, policy, name):
+        '''
+        :param policy: migration policy
+        :param name: name of the domain on the destination
+        :return: (flags, typed parameters) for migrate3
+        '''
+        flags = libvirt.VIR_MIGRATE_LIVE | libvirt.VIR_MIGRATE_PERSIST_DEST
+        if self.migration_storage == 'incremental':
+            # the destination already has the base image and an empty overlay, only the overlay blocks are sent
+            flags = flags | libvirt.VIR_MIGRATE_NON_SHARED_INC
+        params = {libvirt.VIR_MIGRATE_PARAM_DEST_NAME: name}
+        if policy.get('bandwidth') is not None:
+            params.update({libvirt.VIR_MIGRATE_PARAM_BANDWIDTH: int(policy.get('bandwidth'))})
+        if policy.get('compression'):
+            flags = flags | libvirt.VIR_MIGRATE_COMPRESSED
+            params.update({libvirt.VIR_MIGRATE_PARAM_COMPRESSION: policy.get('compression')})
+        if policy.get('auto_converge', False):
+            flags = flags | libvirt.VIR_MIGRATE_AUTO_CONVERGE
+        if policy.get('postcopy', False):
+            flags = flags | libvirt.VIR_MIGRATE_POSTCOPY
+        return flags, params
+
+    def __watch_migration(self, entity_uuid, instance_uuid, dom, policy_name, policy, done):
+        # streams the job statistics in the instance record and switches to post-copy when the policy says so
+        postcopy = False
+        while not done.wait(MIGRATION_PROGRESS_INTERVAL):
+            try:
+                job = dom.jobStats()
+            except libvirt.libvirtError:
+                continue
+            if job.get('type', libvirt.VIR_DOMAIN_JOB_NONE) == libvirt.VIR_DOMAIN_JOB_NONE:
+                continue
+            if policy.get('postcopy', False) and not postcopy and job.get('memory_iteration', 0) >= policy.get('postcopy_after', 2):
+                try:
+                    dom.migrateStartPostCopy()
+                    postcopy = True
+                    self.logger.info('__watch_migration()', ' KVM Plugin - Migration of {} switched to post-copy'.format(instance_uuid))
+                except libvirt.libvirtError as err:
+                    self.logger.warning('__watch_migration()', '[ WARN ] KVM Plugin - Cannot switch to post-copy: {}'.format(err))
+            self.__merge_actual_store_instance(entity_uuid, instance_uuid, {'migration': self.__migration_progress(job, policy_name, postcopy)})
+
+    def __migration_report(self, dom):
+        '''
+        :param dom: domain on the destination after the migration
+        :return: dictionary with bytes transferred and downtime of the completed migration, or None
+        '''
+        try:
+            job = dom.jobStats(libvirt.VIR_DOMAIN_JOB_STATS_COMPLETED)
+        except libvirt.libvirtError as err:
+            self.logger.warning('__migration_report()', '[ WARN ] KVM Plugin - Cannot get migration statistics: {}'.format(err))
+            return None
+        if job.get('type', libvirt.VIR_DOMAIN_JOB_NONE) == libvirt.VIR_DOMAIN_JOB_NONE:
+            return None
+        return {'bytes': job.get('data_processed', 0), 'memory_bytes': job.get('memory_processed', 0),
+                'disk_bytes': job.get('disk_processed', 0), 'downtime_ms': job.get('downtime', 0),
+                'seconds': job.get('time_elapsed', 0) / 1000.0}
+
+    def __migration_progress(self, job, policy_name, postcopy):
+        total = job.get('data_total', 0)
+        progress = {'policy': policy_name, 'postcopy': postcopy,
+                    'percent': None if total == 0 else round(job.get('data_processed', 0) * 100.0 / total, 2)}
+        for k in ['time_elapsed', 'data_total', 'data_processed', 'data_remaining', 'memory_iteration',
+                  'memory_dirty_rate', 'memory_bps', 'downtime', 'auto_converge_throttle', 'compression_bytes',
+                  'compression_overflow', 'disk_total', 'disk_processed', 'disk_remaining']:
+            if k in job:
+                progress.update({k: job.get(k)})
+        return progress
+
     def __add_image(self, manifest):
         url = manifest.get('base_image')
-        if url.startswith('http'):
-            image_name = os.path.join(self.BASE_DIR, self.IMAGE_DIR, url.split('/')[-1])
-            self.agent.get_os_plugin().download_file(url, image_name)
-        elif url.startswith('file://'):
-            image_name = os.path.join(self.BASE_DIR, self.IMAGE_DIR, url.split('/')[-1])
-            cmd = 'cp {} {}'.format(url[len('file://'):], image_name)
-            self.agent.get_os_plugin().execute_command(cmd, True)
+        try:
+            image_name = self.image_store.acquire(self.__image_ref(manifest.get('uuid')), url, manifest.get('checksum'))
+        except (ImageChecksumException, ValueError, OSError) as e:
+            self.logger.error('__add_image()', '[ ERRO ] KVM Plugin - Cannot get image {}: {}'.format(url, e))
+            return
         manifest.update({'path': image_name})
         uri = '{}/{}'.format(self.HOME_IMAGE, manifest.get('uuid'))
         self.__update_actual_store(uri, manifest)
         self.images.update({manifest.get('uuid'): manifest})
+        self.__save_state('image', manifest.get('uuid'), manifest)
 
     def __remove_image(self, image_uuid):
-        self.lock.acquire()
-        image = self.images.get(image_uuid, None)
-        if image is None:
-            self.agent.logger.info('__remove_image()', ' KVM Plugin - Image not found!!')
-            return
-        self.agent.get_os_plugin().remove_file(image.get('path'))
-        self.images.pop(image_uuid)
-        uri = '{}/{}'.format(self.HOME_IMAGE, image_uuid)
-        self.__pop_actual_store(uri)
-        self.lock.release()
+        with self.lock:
+            image = self.images.get(image_uuid, None)
+            if image is None:
+                self.logger.info('__remove_image()', ' KVM Plugin - Image not found!!')
+                return
+            for entity in list(self.current_entities.values()):
+                if any(i.image_uuid == image_uuid for i in list(entity.instances.values())):
+                    # overlays are backed by the image file
+                    self.logger.warning('__remove_image()', '[ WARN ] KVM Plugin - Image {} is in use, not removing it'.format(image_uuid))
+                    return
+            self.image_store.release(self.__image_ref(image_uuid))
+            self.images.pop(image_uuid)
+            self.__drop_state('image', image_uuid)
+            uri = '{}/{}'.format(self.HOME_IMAGE, image_uuid)
+            self.__pop_actual_store(uri)
+
+    def __image_ref(self, image_uuid):
+        return '{}/{}'.format(self.uuid, image_uuid)
 
     def __add_flavor(self, manifest):
-        self.lock.acquire()
-        uri = '{}/{}'.format(self.HOME_FLAVOR, manifest.get('uuid'))
-        self.__update_actual_store(uri, manifest)
-        self.flavors.update({manifest.get('uuid'): manifest})
-        self.lock.release()
+        with self.lock:
+            uri = '{}/{}'.format(self.HOME_FLAVOR, manifest.get('uuid'))
+            self.__update_actual_store(uri, manifest)
+            self.flavors.update({manifest.get('uuid'): manifest})
+            self.__save_state('flavor', manifest.get('uuid'), manifest)
 
     def __remove_flavor(self, flavor_uuid):
         self.flavors.pop(flavor_uuid)
+        self.__drop_state('flavor', flavor_uuid)
         uri = '{}/{}'.format(self.HOME_FLAVOR, flavor_uuid)
         self.__pop_actual_store(uri)
 
     def __react_to_cache_image(self, uri, value, v):
-        self.agent.logger.info('__react_to_cache_image()', 'KVM Plugin - React to to URI: {} Value: {} Version: {}'.format(uri, value, v))
+        self.logger.debug('__react_to_cache_image()', 'KVM Plugin - React to to URI: %s Value: %s Version: %s', uri, value, v)
         if uri.split('/')[-2] == 'image':
             image_uuid = uri.split('/')[-1]
             value = json.loads(value)
             action = value.get('status')
             if action == 'undefine':
-                self.agent.logger.info('__react_to_cache_image()', 'KVM Plugin - This is a remove for URI: {}'.format(uri))
+                self.logger.info('__react_to_cache_image()', 'KVM Plugin - This is a remove for URI: {}'.format(uri))
                 self.__remove_image(image_uuid)
             else:
                 self.__add_image(value)
 
     def __react_to_cache_flavor(self, uri, value, v):
-        self.agent.logger.info('__react_to_cache_flavor()', 'KVM Plugin - React to to URI: {} Value: {} Version: {}'.format(uri, value, v))
+        self.logger.debug('__react_to_cache_flavor()', 'KVM Plugin - React to to URI: %s Value: %s Version: %s', uri, value, v)
         if uri.split('/')[-2] == 'flavor':
             flavor_uuid = uri.split('/')[-1]
             value = json.loads(value)
             action = value.get('status')
             if action == 'undefine':
-                self.agent.logger.info('__react_to_cache_flavor()', 'KVM Plugin - This is a remove for URI: {}'.format(uri))
+                self.logger.info('__react_to_cache_flavor()', 'KVM Plugin - This is a remove for URI: {}'.format(uri))
                 self.__remove_flavor(flavor_uuid)
             else:
                 self.__add_flavor(value)
 
     def __react_to_cache_entity(self, uri, value, v):
-        self.agent.logger.info('__react_to_cache_entity()', 'KVM Plugin - React to to URI: {} Value: {} Version: {}'.format(uri, value, v))
+        self.logger.debug('__react_to_cache_entity()', 'KVM Plugin - React to to URI: %s Value: %s Version: %s', uri, value, v)
+        if value is None:
+            return
+        key = uri.split('/')[-1]
+        if uri.split('/')[-2] == 'instance' and json.loads(value).get('status') == 'clean':
+            self.__cancel(key)
+        self.__submit(key, Tracing.traced(self.__handle_entity), uri, value, v)
+
+    def __handle_entity(self, uri, value, v):
         if uri.split('/')[-2] == 'entity':
             uuid = uri.split('/')[-1]
             value = json.loads(value)
@@ -1114,7 +1313,11 @@ class KVMLibvirt(RuntimePlugin):
             action = value.get('status')
             entity_data = value.get('entity_data')
             react_func = self.__react(action)
-            if action == 'clean':
+            if action == 'clean' and instance_uuid in self.aborted:
+                # the configure was cancelled before the instance existed
+                self.aborted.discard(instance_uuid)
+                self.__pop_actual_store_instance(entity_uuid, instance_uuid)
+            elif action == 'clean':
                 self.__force_entity_instance_termination(entity_uuid, instance_uuid)
             elif react_func is not None and entity_data is None:
                 react_func(entity_uuid, instance_uuid)
@@ -1125,6 +1328,172 @@ class KVMLibvirt(RuntimePlugin):
                 else:
                     react_func(entity_data, instance_uuid=instance_uuid)
 
+    def __monitor_domains(self):
+        self.logger.info('__monitor_domains()', ' KVM Plugin - Collecting domain statistics every {} seconds'.format(self.stats_interval))
+        while not self.monitoring.wait(self.stats_interval):
+            try:
+                self.__collect_stats()
+            except Exception as e:
+                self.logger.error('__monitor_domains()', '[ ERRO ] KVM Plugin - Cannot collect domain statistics: {}'.format(e))
+
+    def __collect_stats(self):
+        # one call for all the running domains instead of one per domain
+        start = time.time()
+        records = self.__libvirt_call(lambda conn: conn.getAllDomainStats(STATS_TYPES, libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE))
+        now = time.time()
+        STATS_LATENCY.observe(now - start)
+        owners = {}
+        for entity in list(self.current_entities.values()):
+            for instance_uuid in list(entity.instances.keys()):
+                owners.update({instance_uuid: entity.uuid})
+
+        seen = set()
+        for dom, raw in records:
+            instance_uuid = dom.UUIDString()
+            entity_uuid = owners.get(instance_uuid, None)
+            if entity_uuid is None:
+                continue
+            seen.add(instance_uuid)
+            previous = self.stats_samples.get(instance_uuid, None)
+            self.stats_samples.update({instance_uuid: (now, raw)})
+            stats = self.__domain_stats(raw, previous, now)
+            self.update_instance_usage(entity_uuid, instance_uuid, cpu_seconds=stats.get('cpu').get('seconds'),
+                                       memory_bytes=stats.get('memory').get('used'))
+            signature = _stats_signature(stats)
+            if self.published_stats.get(instance_uuid) == signature:
+                continue
+            if self.__merge_actual_store_instance(entity_uuid, instance_uuid, {'detailed_state': stats}):
+                self.published_stats.update({instance_uuid: signature})
+
+        for instance_uuid in list(self.stats_samples.keys()):
+            if instance_uuid not in seen:
+                self.stats_samples.pop(instance_uuid)
+                self.published_stats.pop(instance_uuid, None)
+                if instance_uuid in owners:
+                    self.remove_instance_usage(owners.get(instance_uuid), instance_uuid)
+
+    def __domain_stats(self, raw, previous, now):
+        '''
+        :param raw: record of getAllDomainStats
+        :param previous: (time, record) of the previous sample or None
+        :param now: time of the sample
+        :return: dictionary with counters and per second rates, rates are None on the first sample
+        '''
+        elapsed = None if previous is None else now - previous[0]
+        last = {} if previous is None else previous[1]
+
+        def rate(key):
+            if elapsed is None or elapsed <= 0 or key not in raw or key not in last:
+                return None
+            return round(max(raw.get(key) - last.get(key), 0) / elapsed, 2)
+
+        cpu_rate = rate('cpu.time')
+        stats = {'state': raw.get('state.state'),
+                 'cpu': {'seconds': raw.get('cpu.time', 0) / 1e9,
+                         'percent': None if cpu_rate is None else round(cpu_rate / 1e7, 2)},
+                 'vcpu': {'current': raw.get('vcpu.current'), 'maximum': raw.get('vcpu.maximum')}}
+        # balloon values are in KiB, available - unused needs the guest balloon driver
+        memory = {'current': raw.get('balloon.current', 0) * 1024, 'rss': raw.get('balloon.rss', 0) * 1024}
+        if 'balloon.available' in raw and 'balloon.unused' in raw:
+            memory.update({'used': (raw.get('balloon.available') - raw.get('balloon.unused')) * 1024})
+        else:
+            memory.update({'used': memory.get('rss')})
+        stats.update({'memory': memory})
+
+        disks = []
+        for i in range(0, raw.get('block.count', 0)):
+            k = 'block.{}.'.format(i)
+            disks.append({'name': raw.get(k + 'name'), 'capacity': raw.get(k + 'capacity'), 'allocation': raw.get(k + 'allocation'),
+                          'rd_bytes': raw.get(k + 'rd.bytes'), 'wr_bytes': raw.get(k + 'wr.bytes'),
+                          'rd_bytes_rate': rate(k + 'rd.bytes'), 'wr_bytes_rate': rate(k + 'wr.bytes'),
+                          'rd_reqs_rate': rate(k + 'rd.reqs'), 'wr_reqs_rate': rate(k + 'wr.reqs')})
+        stats.update({'disks': disks})
+
+        interfaces = []
+        for i in range(0, raw.get('net.count', 0)):
+            k = 'net.{}.'.format(i)
+            interfaces.append({'name': raw.get(k + 'name'), 'rx_bytes': raw.get(k + 'rx.bytes'), 'tx_bytes': raw.get(k + 'tx.bytes'),
+                               'rx_bytes_rate': rate(k + 'rx.bytes'), 'tx_bytes_rate': rate(k + 'tx.bytes'),
+                               'rx_pkts_rate': rate(k + 'rx.pkts'), 'tx_pkts_rate': rate(k + 'tx.pkts'),
+                               'rx_drop': raw.get(k + 'rx.drop'), 'tx_drop': raw.get(k + 'tx.drop'),
+                               'rx_errs': raw.get(k + 'rx.errs'), 'tx_errs': raw.get(k + 'tx.errs')})
+        stats.update({'network': interfaces})
+        return stats
+
+    def __submit(self, key, func, *args):
+        with self.queues_lock:
+            if self.stopping:
+                return
+            queue = self.queues.get(key, None)
+            if queue is not None:
+                queue.append((func, args))
+                return
+            self.queues.update({key: deque([(func, args)])})
+        self.workers.submit(self.__drain, key)
+
+    def __drain(self, key):
+        # the running action stays at the head of the queue, so new ones are appended behind it
+        while True:
+            with self.queues_lock:
+                queue = self.queues.get(key)
+                if len(queue) == 0:
+                    self.queues.pop(key)
+                    return
+                func, args = queue[0]
+            try:
+                func(*args)
+            except Exception as e:
+                self.logger.error('__drain()', 'KVM Plugin - Action on {} failed: {}'.format(key, e))
+            with self.queues_lock:
+                queue.popleft()
+                self.cancelled.discard(key)
+
+    def __cancel(self, key):
+        # pending actions are dropped, the running one stops at its next checkpoint
+        with self.queues_lock:
+            queue = self.queues.get(key, None)
+            if queue is None:
+                return
+            running = queue.popleft()
+            if len(queue) > 0:
+                self.logger.info('__cancel()', ' KVM Plugin - Dropping {} pending actions on {}'.format(len(queue), key))
+            queue.clear()
+            queue.append(running)
+            self.cancelled.add(key)
+
+    def __checkpoint(self, key):
+        with self.queues_lock:
+            if key in self.cancelled:
+                raise OperationCancelled('Action on {} cancelled'.format(key))
+
+    def __entity_lock(self, entity_uuid):
+        with self.queues_lock:
+            lock = self.entity_locks.get(entity_uuid, None)
+            if lock is None:
+                lock = threading.Lock()
+                self.entity_locks.update({entity_uuid: lock})
+            return lock
+
+    def __record_lock(self, instance_uuid):
+        # serializes the writes of the instance record, the lifecycle actions and the publishers running beside them
+        with self.queues_lock:
+            lock = self.record_locks.get(instance_uuid, None)
+            if lock is None:
+                lock = threading.RLock()
+                self.record_locks.update({instance_uuid: lock})
+            return lock
+
+    def __reserve_name(self, entity):
+        # instances of the same entity can be configured in parallel, libvirt wants unique names
+        with self.__entity_lock(entity.uuid):
+            used = set(i.name for i in list(entity.instances.values())) | self.reserved_names
+            i = len(entity.instances)
+            while '{}{}'.format(entity.name, i) in used:
+                i += 1
+            name = '{}{}'.format(entity.name, i)
+            self.reserved_names.add(name)
+            return name
+
     def __random_mac_generator(self):
         mac = [0x00, 0x16, 0x3e,
                random.randint(0x00, 0x7f),
@@ -1133,57 +1502,155 @@ class KVMLibvirt(RuntimePlugin):
         return ':'.join(map(lambda x: '%02x' % x, mac))
 
     def __lookup_by_uuid(self, uuid):
+        uuid = str(uuid)
+        with self.domains_lock:
+            dom = self.domains.get(uuid, None)
+        if dom is not None:
+            return dom
         try:
-            domains = self.conn.listAllDomains(0)
+            dom = self.__libvirt_call(lambda conn: conn.lookupByUUIDString(uuid))
         except libvirt.libvirtError as err:
-            self.conn = libvirt.open('qemu:///system')
-            domains = self.conn.listAllDomains(0)
+            if err.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+                return None
+            raise
+        with self.domains_lock:
+            self.domains.update({uuid: dom})
+        return dom
+
+    def __forget_domain(self, uuid):
+        with self.domains_lock:
+            self.domains.pop(str(uuid), None)
+
+    def __libvirt_call(self, func):
+        '''
+        Call func with the libvirt connection, if the connection is lost it reconnects and retries once
 
-        if len(domains) != 0:
-            for domain in domains:
-                if str(uuid) == domain.UUIDString():
-                    return domain
-        else:
-            return None
+        :param func: function of the connection
+        :return: what func returns
+        '''
+        conn = self.conn
+        if not self.__is_alive(conn):
+            conn = self.__reconnect(conn)
+        try:
+            return func(conn)
+        except libvirt.libvirtError as err:
+            if self.__is_alive(conn):
+                raise
+            self.logger.warning('__libvirt_call()', '[ WARN ] KVM Plugin - Lost connection to KVM, reconnecting: {}'.format(err))
+            return func(self.__reconnect(conn))
+
+    def __reconnect(self, stale):
+        with self.conn_lock:
+            # another thread could have already replaced the stale connection
+            if self.conn is not stale and self.__is_alive(self.conn):
+                return self.conn
+            conn = libvirt.open(LIBVIRT_URI)
+            conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self.__domain_event, None)
+            conn.registerCloseCallback(self.__connection_closed, None)
+            # domain handles belong to the old connection
+            with self.domains_lock:
+                self.domains = {}
+            self.conn = conn
+            return conn
+
+    def __is_alive(self, conn):
+        if conn is None:
+            return False
+        try:
+            return conn.isAlive() == 1
+        except libvirt.libvirtError:
+            return False
+
+    def __connection_closed(self, conn, reason, opaque):
+        self.logger.warning('__connection_closed()', '[ WARN ] KVM Plugin - Connection to KVM closed, reason {}'.format(reason))
+        with self.domains_lock:
+            self.domains = {}
+
+    def __domain_event(self, conn, dom, event, detail, opaque):
+        # runs in the libvirt event loop thread, nothing blocking here
+        uuid = dom.UUIDString()
+        if event in [libvirt.VIR_DOMAIN_EVENT_DEFINED, libvirt.VIR_DOMAIN_EVENT_UNDEFINED]:
+            self.__forget_domain(uuid)
+        state = EVENT_STATES.get(event, None)
+        if event == libvirt.VIR_DOMAIN_EVENT_STARTED and detail == libvirt.VIR_DOMAIN_EVENT_STARTED_MIGRATED:
+            # incoming migration, the domain is resumed when it is finished
+            state = libvirt.VIR_DOMAIN_PAUSED
+        with self.domain_changed:
+            if event == libvirt.VIR_DOMAIN_EVENT_UNDEFINED:
+                self.domain_states.pop(uuid, None)
+            elif state is not None:
+                self.domain_states.update({uuid: state})
+            self.domain_changed.notify_all()
+            expected = uuid in self.expected
+        if state is not None and not expected:
+            threading.Thread(target=self.__domain_changed, args=(uuid, state), daemon=True).start()
+
+    def __domain_changed(self, instance_uuid, state):
+        # the domain changed without the plugin asking for it (eg. crash, shutdown from the guest)
+        for entity_uuid, entity in list(self.current_entities.items()):
+            if not entity.has_instance(instance_uuid):
+                continue
+            instance = entity.get_instance(instance_uuid)
+            new_state = self.__libvirt_state(state)
+            if instance.get_state() not in [State.CONFIGURED, State.RUNNING, State.PAUSED] or instance.get_state() == new_state:
+                return
+            self.logger.warning('__domain_changed()', '[ WARN ] KVM Plugin - Instance {} was {} now is {}'.format(
+                instance_uuid, instance.get_state().name, new_state.name))
+            instance.set_state(new_state)
+            values = {'status': {State.RUNNING: 'run', State.PAUSED: 'pause'}.get(new_state, 'stop')}
+            if state == libvirt.VIR_DOMAIN_CRASHED:
+                values.update({'reason': 'crashed'})
+            self.__merge_actual_store_instance(entity_uuid, instance_uuid, values, persist=True)
+            return
 
-    def __wait_boot(self, filename, configured=False):
-        time.sleep(5)
-        if configured:
-            boot_regex = r"\[.+?\].+\[.+?\]:.+Cloud-init.+?v..+running.+'modules:final'.+Up.([0-9]*\.?[0-9]+).+seconds.\n"
-        else:
-            boot_regex = r".+?login:()"
-        while True:
-            file = open(filename, 'r')
-            import os
-            # Find the size of the file and move to the end
-            st_results = os.stat(filename)
-            st_size = st_results[6]
-            file.seek(st_size)
-
-            while 1:
-                where = file.tell()
-                line = file.readline()
-                if not line:
-                    time.sleep(1)
-                    file.seek(where)
-                else:
-                    m = re.search(boot_regex, str(line))
-                    if m:
-                        found = m.group(1)
-                        return found
+    @contextmanager
+    def __expecting(self, instance_uuid):
+        # events of the domain are caused by the plugin while in this block
+        with self.domain_changed:
+            self.expected.update({instance_uuid: self.expected.get(instance_uuid, 0) + 1})
+        try:
+            yield
+        finally:
+            with self.domain_changed:
+                n = self.expected.pop(instance_uuid) - 1
+                if n > 0:
+                    self.expected.update({instance_uuid: n})
+
+    def __track_domain(self, dom):
+        # the state before an action, the wait is satisfied only by the events that follow it
+        with self.domain_changed:
+            self.domain_states.update({dom.UUIDString(): dom.state()[0]})
+
+    def __wait_domain(self, dom, states, timeout):
+        '''
+        Wait for a lifecycle event that brings the domain in one of the states
+
+        :param dom: libvirt domain, tracked before the action
+        :param states: libvirt domain states
+        :param timeout: seconds
+        :return: True if the domain is in one of the states
+        '''
+        if self.__wait_domain_uuid(dom.UUIDString(), states, timeout):
+            return True
+        # the event could have been lost, the domain knows
+        return dom.state()[0] in states
+
+    def __wait_domain_uuid(self, uuid, states, timeout):
+        with self.domain_changed:
+            return self.domain_changed.wait_for(lambda: self.domain_states.get(uuid, None) in states, timeout)
 
     def __force_entity_instance_termination(self, entity_uuid, instance_uuid):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('stop_entity()', ' KVM Plugin - Stop a VM uuid {}'.format(entity_uuid))
+        self.logger.info('stop_entity()', ' KVM Plugin - Stop a VM uuid {}'.format(entity_uuid))
         entity = self.current_entities.get(entity_uuid, None)
         if entity is None:
-            self.agent.logger.error('stop_entity()', 'KVM Plugin - Entity not exists')
+            self.logger.error('stop_entity()', 'KVM Plugin - Entity not exists')
             self.__write_error_entity(entity_uuid, 'Entity not exist')
             # raise EntityNotExistingException('Entity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
         else:
             if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'KVM Plugin - Instance not found!!')
+                self.logger.error('run_entity()', 'KVM Plugin - Instance not found!!')
                 self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance not exist')
                 return
             else:
@@ -1199,53 +1666,205 @@ class KVMLibvirt(RuntimePlugin):
                     self.clean_entity(entity_uuid, instance_uuid)
 
     def __generate_dom_xml(self, instance, flavor, image):
-        template_xml = self.agent.get_os_plugin().read_file(os.path.join(self.DIR, 'templates', 'vm.xml'))
-        vm_xml = Environment().from_string(template_xml)
-        vm_xml = vm_xml.render(name=instance.name, uuid=instance.uuid, memory=flavor.get('memory'),
-                               cpu=flavor.get('cpu'), disk_image=instance.disk,
-                               iso_image=instance.cdrom, networks=instance.networks, format=image.get('format'))
+        vm_xml = self.render_template(os.path.join(self.DIR, 'templates', 'vm.xml'), name=instance.name, uuid=instance.uuid,
+                                      memory=flavor.get('memory'), cpu=flavor.get('cpu'), disk_image=instance.disk,
+                                      iso_image=instance.cdrom, networks=instance.networks, format=self.__disk_format(image))
         return vm_xml
 
+    def __disk_format(self, image):
+        # overlays are always qcow2, full clones keep the format of the image
+        if self.provisioning == 'overlay':
+            return 'qcow2'
+        return image.get('format')
+
+    def __shared_disk_format(self, instance_uuid, image):
+        # the disk of the source is named <instance>.<format>, the image may not be known here
+        formats = [self.__disk_format(image)] if self.provisioning == 'overlay' or image.get('format') else list(SHARED_DISK_FORMATS)
+        for f in formats:
+            if self.agent.get_os_plugin().file_exists(os.path.join(self.BASE_DIR, self.DISK_DIR, '{}.{}'.format(instance_uuid, f))):
+                return f
+        return None
+
+    def __provision_disk(self, instance, image, flavor):
+        '''
+        Create the disk of an instance from its base image, as a thin qcow2 overlay
+        backed by the image or as a full clone of it, then grow it to the flavor disk_size
+
+        :param instance: the KVMLibvirtEntityInstance
+        :param image: image manifest
+        :param flavor: flavor manifest
+        :return: seconds spent
+        '''
+        start = time.time()
+        if self.provisioning == 'overlay':
+            cmd = 'qemu-img create -f qcow2 -F {} -b {} {}'.format(image.get('format'), image.get('path'), instance.disk)
+        else:
+            cmd = 'qemu-img convert -f {0} -O {0} {1} {2}'.format(image.get('format'), image.get('path'), instance.disk)
+        with Tracing.span(self.provisioning):
+            self.agent.get_os_plugin().execute_command(cmd, True)
+        if flavor.get('disk_size') is not None:
+            with Tracing.span('qemu-img-resize'):
+                self.__grow_disk(instance.disk, flavor.get('disk_size'))
+        elapsed = time.time() - start
+        PROVISIONING_LATENCY.observe(elapsed, mode=self.provisioning)
+        return elapsed
+
+    def __grow_disk(self, disk, size):
+        # qemu-img does not shrink images, the disk keeps the image size if that is bigger
+        info = self.agent.get_os_plugin().execute_command('qemu-img info --output=json {}'.format(disk), True)
+        try:
+            current = json.loads(info).get('virtual-size', 0)
+        except ValueError:
+            current = 0
+        if float(size) * 1024 ** 3 > current:
+            self.agent.get_os_plugin().execute_command('qemu-img resize {} {}G'.format(disk, size), True)
+
+    def __write_config_drive(self, instance, instance_id, hostname, vendor_data=None):
+        iso = self.config_drive.build(instance_id, hostname, vendor_data, instance.user_file, instance.ssh_key)
+        self.agent.get_os_plugin().store_file(iso, os.path.dirname(instance.cdrom), os.path.basename(instance.cdrom))
+
     def __generate_vendor_data(self, instanceid, entityid, nodeid):
-        vendor_yaml = self.agent.get_os_plugin().read_file(os.path.join(self.DIR, 'templates', 'vendor_data.yaml'))
-        vendor_conf = Environment().from_string(vendor_yaml)
-        vendor_conf = vendor_conf.render(instanceid=instanceid, nodeid=nodeid, entityid=entityid)
+        vendor_conf = self.render_template(os.path.join(self.DIR, 'templates', 'vendor_data.yaml'),
+                                           instanceid=instanceid, nodeid=nodeid, entityid=entityid)
         return vendor_conf
 
     def __update_actual_store(self, uri, value):
         uri = '{}/{}'.format(self.agent.ahome, uri)
-        # self.agent.logger.error('__update_actual_store()', 'Updating Key: {} Value: {}'.format(uri, value))
-        value = json.dumps(value)
+        # self.logger.error('__update_actual_store()', 'Updating Key: {} Value: {}'.format(uri, value))
+        value = json.dumps(Tracing.stamp(value))
         self.agent.astore.put(uri, value)
 
     def __pop_actual_store(self, uri):
-        self.agent.logger.info('__pop_actual_store()', 'Removing Key: {}'.format(uri))
+        self.logger.info('__pop_actual_store()', 'Removing Key: {}'.format(uri))
         uri = '{}/{}'.format(self.agent.ahome, uri)
         self.agent.astore.remove(uri)
 
     def __update_actual_store_entity(self, uri, value):
+        entity = self.current_entities.get(uri, None)
+        if entity is not None and value.get('status') != 'error':
+            data = {'name': entity.name, 'image_id': entity.image_id, 'flavor_id': entity.flavor_id,
+                    'user_file': entity.user_file, 'ssh_key': entity.ssh_key, 'networks': entity.networks}
+            self.__save_state('entity', uri, {'data': data, 'info': value})
+        self.entities_info.update({uri: value})
         uri = '{}/{}'.format(self.HOME_ENTITY, uri)
         # value = json.dumps(value)
         self.__update_actual_store(uri, value)
         # self.agent.astore.put(uri, value)
 
-    def __update_actual_store_instance(self, entity_uuid, instance_uuid, value):
-        uri = '{}/{}/{}/{}'.format(self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
-        # value = json.dumps(value)
-        # self.agent.astore.put(uri, value)
-        self.__update_actual_store(uri, value)
+    def __update_actual_store_instance(self, entity_uuid, instance_uuid, value, persist=True):
+        entity = self.current_entities.get(entity_uuid, None)
+        with self.__record_lock(instance_uuid):
+            if persist and entity is not None and entity.has_instance(instance_uuid) and value.get('status') != 'error':
+                instance = entity.get_instance(instance_uuid)
+                data = {'name': instance.name, 'disk': instance.disk, 'cdrom': instance.cdrom, 'networks': instance.networks,
+                        'user_file': instance.user_file, 'ssh_key': instance.ssh_key,
+                        'flavor_id': instance.flavor_uuid, 'image_id': instance.image_uuid}
+                self.__save_state('instance', instance_uuid, {'entity_uuid': entity_uuid, 'data': data,
+                                                              'state': instance.get_state().name, 'info': value})
+            self.instances_info.update({instance_uuid: value})
+            uri = '{}/{}/{}/{}'.format(self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
+            # value = json.dumps(value)
+            # self.agent.astore.put(uri, value)
+            self.__update_actual_store(uri, value)
+
+    def __merge_actual_store_instance(self, entity_uuid, instance_uuid, values, persist=False):
+        '''
+        Add values to the current record of the instance, for the writers that are not lifecycle actions
+        (statistics, migration progress, libvirt events), so they never put back an older record
+
+        :return: False if the instance has no record
+        '''
+        with self.__record_lock(instance_uuid):
+            info = self.instances_info.get(instance_uuid, None)
+            if info is None:
+                return False
+            info = copy.deepcopy(info)
+            info.update(values)
+            self.__update_actual_store_instance(entity_uuid, instance_uuid, info, persist=persist)
+            return True
 
     def __pop_actual_store_entity(self, entity_uuid):
+        self.__drop_state('entity', entity_uuid)
+        self.entities_info.pop(entity_uuid, None)
         uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid)
         self.agent.astore.remove(uri)
 
     def __pop_actual_store_instance(self, entity_uuid, instance_uuid):
-        uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
-        self.agent.astore.remove(uri)
+        with self.__record_lock(instance_uuid):
+            self.__drop_state('instance', instance_uuid)
+            self.instances_info.pop(instance_uuid, None)
+            uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
+            self.agent.astore.remove(uri)
+        with self.queues_lock:
+            self.record_locks.pop(instance_uuid, None)
+
+    def __save_state(self, kind, key, value):
+        if self.agent.state is not None:
+            self.agent.state.put(self.uuid, kind, key, value)
+
+    def __drop_state(self, kind, key):
+        if self.agent.state is not None:
+            self.agent.state.remove(self.uuid, kind, key)
+
+    def __domain_state(self, dom):
+        return self.__libvirt_state(dom.state()[0])
+
+    def __libvirt_state(self, state):
+        if state in [libvirt.VIR_DOMAIN_RUNNING, libvirt.VIR_DOMAIN_BLOCKED]:
+            return State.RUNNING
+        if state in [libvirt.VIR_DOMAIN_PAUSED, libvirt.VIR_DOMAIN_PMSUSPENDED]:
+            return State.PAUSED
+        return State.CONFIGURED
 
     def __netmask_to_cidr(self, netmask):
         return sum([bin(int(x)).count('1') for x in netmask.split('.')])
 
+    def __get_entity(self, caller, entity_uuid):
+        entity = self.current_entities.get(entity_uuid, None)
+        if entity is None:
+            self.logger.error(caller, 'KVM Plugin - Entity not exists')
+            self.__write_error_entity(entity_uuid, 'Entity not exist')
+            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
+        if entity.get_state() != State.DEFINED:
+            self.logger.error(caller, 'KVM Plugin - Entity state is wrong, or transition not allowed')
+            self.__write_error_entity(entity_uuid, 'Entity state transition not allowed')
+            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
+        return entity
+
+    def __get_instance(self, caller, entity_uuid, instance_uuid):
+        entity = self.__get_entity(caller, entity_uuid)
+        if instance_uuid is None or not entity.has_instance(instance_uuid):
+            self.logger.error(caller, 'KVM Plugin - Instance not found!!')
+            self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance not exist')
+            return entity, None
+        return entity, entity.get_instance(instance_uuid)
+
+    def __begin_transition(self, caller, action, entity_uuid, instance_uuid, instance):
+        try:
+            return self.states.begin(action, instance, entity_uuid, instance_uuid)
+        except StateTransitionNotAllowedException:
+            self.logger.error(caller, 'KVM Plugin - Instance state is wrong, or transition not allowed')
+            self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance state transition not allowed')
+            raise
+
+    def __commit_transition(self, entity_uuid, instance_uuid, transition):
+        # the status is merged in the last document written for the instance and put once
+        vm_info = self.__actual_info(entity_uuid, instance_uuid)
+        vm_info.update({'status': STATUS.get(transition.action)})
+        self.__update_actual_store_instance(entity_uuid, instance_uuid, vm_info)
+        self.states.commit(transition)
+
+    def __actual_info(self, entity_uuid, instance_uuid=None):
+        if instance_uuid is None:
+            info = self.entities_info.get(entity_uuid, None)
+            uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid)
+        else:
+            info = self.instances_info.get(instance_uuid, None)
+            uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
+        if info is None:
+            return json.loads(self.agent.astore.get(uri))
+        return copy.deepcopy(info)
+
     def __write_error_entity(self, entity_uuid, error):
         uri = '{}/{}/{}'.format(self.agent.dhome, self.HOME_ENTITY, entity_uuid)
         jdata = self.agent.dstore.get(uri)
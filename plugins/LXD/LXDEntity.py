@@ -21,6 +21,8 @@ from fog05.interfaces.Entity import Entity
 
 class LXDEntity(Entity):
 
+    __slots__ = ('networks', 'image_url', 'user_file', 'ssh_key', 'storage', 'profiles', 'devices', 'conf', 'image')
+
     def __init__(self, uuid, name, networks, image, user_file, ssh_key, storage, profiles):
 
         super(LXDEntity, self).__init__()
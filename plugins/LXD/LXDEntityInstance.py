@@ -20,6 +20,8 @@ from fog05.interfaces.EntityInstance import EntityInstance
 
 class LXDEntityInstance(EntityInstance):
 
+    __slots__ = ('networks', 'image', 'user_file', 'ssh_key', 'storage', 'profiles', 'devices', 'conf')
+
     def __init__(self, uuid, name, networks, image, user_file, ssh_key, storage, profiles, entity_uuid):
 
         super(LXDEntityInstance, self).__init__(uuid, entity_uuid)
@@ -16,8 +16,11 @@
 import sys
 import os
 import uuid
+import copy
 from packaging import version
-from fog05.interfaces.States import State
+from fog05.interfaces.States import State, STATUS
+from fog05 import Tracing
+from fog05.ImageStore import ImageStore, ImageChecksumException
 from fog05.interfaces.RuntimePlugin import *
 from LXDEntity import LXDEntity
 from LXDEntityInstance import LXDEntityInstance
@@ -40,11 +43,13 @@ import plugins.brctl.brctl_plugin
 
 class LXD(RuntimePlugin):
 
-    def __init__(self, name, version, agent, plugin_uuid):
+    def __init__(self, name, version, agent, plugin_uuid, configuration={}):
         super(LXD, self).__init__(version, plugin_uuid)
         self.name = name
         self.agent = agent
-        self.agent.logger.info('__init__()', ' Hello from LXD Plugin')
+        self.logger = self.agent.logger.component(name)
+        self.configuration = configuration or {}
+        self.logger.info('__init__()', ' Hello from LXD Plugin')
         self.BASE_DIR = '/opt/fos/lxd'
         self.DISK_DIR = 'disks'
         self.IMAGE_DIR = 'images'
@@ -61,26 +66,31 @@ class LXD(RuntimePlugin):
         self.images = {}
         self.flavors = {}
         self.mon_th = {}
+        self.entities_info = {}
+        self.instances_info = {}
+        quota = self.configuration.get('image_cache_quota', None)
+        self.image_store = ImageStore.shared(os.path.join(self.agent.base_path, 'images'),
+                                             None if quota is None else int(float(quota) * 1024 ** 3))
         self.start_runtime()
 
     def start_runtime(self):
-        self.agent.logger.info(
+        self.logger.info(
             'startRuntime()', ' LXD Plugin - Connecting to LXD')
         self.conn = Client()
-        self.agent.logger.info(
+        self.logger.info(
             'startRuntime()', '[ DONE ] LXD Plugin - Connecting to LXD')
         uri = '{}/{}/**'.format(self.agent.dhome, self.HOME)
-        self.agent.logger.info(
+        self.logger.info(
             'startRuntime()', ' LXD Plugin - Observing {} for entity'.format(uri))
-        self.agent.dstore.observe(uri, self.__react_to_cache_entity)
+        self.agent.dstore.observe(uri, Tracing.traced(self.__react_to_cache_entity))
 
         uri = '{}/{}/**'.format(self.agent.dhome, self.HOME_FLAVOR)
-        self.agent.logger.info(
+        self.logger.info(
             'startRuntime()', ' LXD Plugin - Observing {} for flavor'.format(uri))
         self.agent.dstore.observe(uri, self.__react_to_cache_flavor)
 
         uri = '{}/{}/**'.format(self.agent.dhome, self.HOME_IMAGE)
-        self.agent.logger.info(
+        self.logger.info(
             'startRuntime()', ' LXD Plugin - Observing {} for image'.format(uri))
         self.agent.dstore.observe(uri, self.__react_to_cache_image)
 
@@ -107,11 +117,11 @@ class LXD(RuntimePlugin):
         return self.uuid
 
     def stop_runtime(self):
-        self.agent.logger.info(
+        self.logger.info(
             'stopRuntime()', 'LXD Plugin - Destroying {} running domains'.format(len(self.current_entities)))
         keys = list(self.current_entities.keys())
         for k in keys:
-            self.agent.logger.info('stopRuntime()', 'Stopping {}'.format(k))
+            self.logger.info('stopRuntime()', 'Stopping {}'.format(k))
             entity = self.current_entities.get(k)
             for i in list(entity.instances.keys()):
                 self.__force_entity_instance_termination(k, i)
@@ -131,19 +141,74 @@ class LXD(RuntimePlugin):
                 self.undefine_entity(k)
         keys = list(self.images.keys())
         for k in keys:
-            self.agent.logger.info(
+            self.logger.info(
                 'stopRuntime()', 'Removing Image {}'.format(k))
             try:
                 img = self.conn.images.get_by_alias(k)
                 img.delete()
             except LXDAPIException as e:
-                self.agent.logger.error('stopRuntime()', 'Error {}'.format(e))
+                self.logger.error('stopRuntime()', 'Error {}'.format(e))
                 pass
 
         self.conn = None
-        self.agent.logger.info(
+        self.logger.info(
             'stopRuntime()', '[ DONE ] LXD Plugin - Bye Bye')
 
+    def restore_runtime(self):
+        if self.agent.state is None:
+            return
+        self.logger.info('restore_runtime()', ' LXD Plugin - Restoring state from local snapshot')
+        for k, flavor in self.agent.state.get_all(self.uuid, 'flavor').items():
+            self.flavors.update({k: flavor})
+        for k, img in self.agent.state.get_all(self.uuid, 'image').items():
+            try:
+                self.conn.images.get_by_alias(k)
+                self.images.update({k: img})
+            except LXDAPIException as e:
+                self.logger.warning('restore_runtime()', '[ WARN ] LXD Plugin - Image {} is gone, dropping it'.format(k))
+                self.agent.state.remove(self.uuid, 'image', k)
+
+        for k, record in self.agent.state.get_all(self.uuid, 'entity').items():
+            data = record.get('data')
+            entity = LXDEntity(k, data.get('name'), data.get('networks'), data.get('image_url'), data.get('user_file'),
+                               data.get('ssh_key'), data.get('storage'), data.get('profiles'))
+            entity.image = data.get('image')
+            entity.devices = data.get('devices')
+            entity.set_state(State.DEFINED)
+            self.current_entities.update({k: entity})
+            self.__update_actual_store(k, record.get('info'))
+
+        containers = dict((c.name, c) for c in self.conn.containers.all())
+        for k, record in self.agent.state.get_all(self.uuid, 'instance').items():
+            entity_uuid = record.get('entity_uuid')
+            entity = self.current_entities.get(entity_uuid, None)
+            data = record.get('data')
+            c = containers.get(data.get('name'), None)
+            if entity is None or c is None:
+                self.logger.warning('restore_runtime()', '[ WARN ] LXD Plugin - Instance {} is gone, dropping it'.format(k))
+                self.agent.state.remove(self.uuid, 'instance', k)
+                continue
+            instance = LXDEntityInstance(k, data.get('name'), entity.shared('networks', data.get('networks')),
+                                         entity.shared('image', data.get('image')), entity.shared('user_file', data.get('user_file')),
+                                         entity.shared('ssh_key', data.get('ssh_key')), entity.shared('storage', data.get('storage')),
+                                         data.get('profiles'), entity_uuid)
+            instance.devices = entity.shared('devices', data.get('devices'))
+            instance.on_configured(data.get('conf'))
+            state = {'Running': State.RUNNING, 'Frozen': State.PAUSED}.get(c.status, State.CONFIGURED)
+            instance.set_state(state)
+            entity.add_instance(instance)
+            info = record.get('info')
+            if state.name != record.get('state'):
+                self.logger.info('restore_runtime()', ' LXD Plugin - Instance {} was {} now is {}'.format(k, record.get('state'), state.name))
+                info.update({'status': {State.RUNNING: 'run', State.PAUSED: 'pause'}.get(state, 'stop')})
+            self.__update_actual_store_instance(entity_uuid, k, info)
+            if state != State.CONFIGURED:
+                mt = threading.Thread(target=self.__monitor_instance, args=(entity_uuid, k, instance.name), daemon=True)
+                mt.start()
+                self.mon_th.update({k: mt})
+
+        self.logger.info('restore_runtime()', '[ DONE ] LXD Plugin - Restored {} entities'.format(len(self.current_entities)))
+
     def get_entities(self):
         return self.current_entities
 
@@ -152,7 +217,7 @@ class LXD(RuntimePlugin):
         Try defining vm
         generating xml from templates/vm.xml with jinja2
         '''
-        self.agent.logger.info(
+        self.logger.info(
             'defineEntity()', ' LXD Plugin - Defining a Container')
         if len(args) > 0:
             entity_uuid = args[4]
@@ -171,30 +236,27 @@ class LXD(RuntimePlugin):
         if self.is_uuid(entity.image_url):
             img_info = self.images.get(entity.image_url, None)
             if img_info is None:
-                self.agent.logger.error(
+                self.logger.error(
                     'define_entity()', '[ ERRO ] LXD Plugin - Cannot find image {}'.format(entity.image_url))
                 self.__write_error_entity(entity_uuid, 'Image not found!')
 
         else:
-            if entity.image_url.startswith('http'):
-                image_name = os.path.join(
-                    self.BASE_DIR, self.IMAGE_DIR, entity.image_url.split('/')[-1])
-                self.agent.get_os_plugin().download_file(entity.image_url, image_name)
-            elif entity.image_url.startswith('file://'):
-                image_name = os.path.join(
-                    self.BASE_DIR, self.IMAGE_DIR, entity.image_url.split('/')[-1])
-                cmd = 'cp {} {}'.format(
-                    entity.image_url[len('file://'):], image_name)
-                self.agent.get_os_plugin().execute_command(cmd, True)
-            self.agent.logger.info('defineEntity()', '[ INFO ] LXD Plugin - Loading image data from: {}'.format(
+            try:
+                image_name = self.image_store.acquire(self.__image_ref(entity_uuid), entity.image_url)
+            except (ImageChecksumException, ValueError, OSError) as e:
+                self.logger.error(
+                    'define_entity()', '[ ERRO ] LXD Plugin - Cannot get image {}: {}'.format(entity.image_url, e))
+                self.__write_error_entity(entity_uuid, 'Image not found!')
+                return
+            self.logger.info('defineEntity()', '[ INFO ] LXD Plugin - Loading image data from: {}'.format(
                 os.path.join(self.BASE_DIR, self.IMAGE_DIR, image_name)))
             image_data = self.agent.get_os_plugin().read_binary_file(
                 os.path.join(self.BASE_DIR, self.IMAGE_DIR, image_name))
-            self.agent.logger.info('defineEntity()', '[ DONE ] LXD Plugin - Loading image data from: {}'.format(
+            self.logger.info('defineEntity()', '[ DONE ] LXD Plugin - Loading image data from: {}'.format(
                 os.path.join(self.BASE_DIR, self.IMAGE_DIR, image_name)))
             img_info = {}
             try:
-                self.agent.logger.info(
+                self.logger.info(
                     'defineEntity()', '[ INFO ] LXD Plugin - Creating image with alias {}'.format(entity_uuid))
                 try:
                     img = self.conn.images.create(
@@ -202,35 +264,37 @@ class LXD(RuntimePlugin):
                     img.add_alias(entity_uuid, description=entity.name)
                 except LXDAPIException as e:
                     if '{}'.format(e) == 'Image with same fingerprint already exists':
-                        self.agent.logger.info(
+                        self.logger.info(
                             'defineEntity()', '[ INFO ] LXD Plugin - Image with same fingerprint already exists')
                         pass
 
-                self.agent.logger.info(
+                self.logger.info(
                     'defineEntity()', '[ DONE ] LXD Plugin - Created image with alias {}'.format(entity_uuid))
                 img_info = {}
                 img_info.update({'uuid': entity_uuid})
                 img_info.update({'name': '{}_img'.format(entity.name)})
                 img_info.update({'base_image': image_name})
                 img_info.update({'type': 'lxd'})
-                img_info.update({'format': '.'.join(image_name.split('.')[-2:])})
+                img_info.update({'format': '.'.join(entity.image_url.split('.')[-2:])})
                 entity.image = img_info
                 self.images.update({entity_uuid: img_info})
+                self.__save_state('image', entity_uuid, img_info)
                 uri = '{}/{}'.format(self.HOME_IMAGE, entity_uuid)
                 self.__update_actual_store(uri, img_info)
 
             except LXDAPIException as e:
-                self.agent.logger.error('define_entity()', 'Error {}'.format(e))
+                self.logger.error('define_entity()', 'Error {}'.format(e))
                 self.current_entities.update({entity_uuid: entity})
                 uri = '{}/{}/{}'.format(self.agent.dhome, self.HOME, entity_uuid)
                 lxd_info = json.loads(self.agent.dstore.get(uri))
                 lxd_info.update({'status': 'error'})
                 lxd_info.update({'error': '{}'.format(e)})
                 self.__update_actual_store(entity_uuid, lxd_info)
-                self.agent.logger.info('defineEntity()', '[ ERRO ] LXD Plugin - Container uuid: {}'.format(entity_uuid))
+                self.logger.info('defineEntity()', '[ ERRO ] LXD Plugin - Container uuid: {}'.format(entity_uuid))
                 return entity_uuid
 
         entity.image = img_info
+        t = self.states.begin('define', entity, entity_uuid)
         entity.set_state(State.DEFINED)
         if kwargs.get('devices'):
             entity.devices = json.loads(kwargs.get('devices'))
@@ -240,416 +304,316 @@ class LXD(RuntimePlugin):
         lxd_info = json.loads(self.agent.dstore.get(uri))
         e_data = lxd_info.get('entity_data')
         e_data.update({'base_image': img_info.get('uuid')})
-        lxd_info.update({'status': 'defined'})
+        lxd_info.update({'status': STATUS.get('define')})
         lxd_info.update({'entity_data': e_data})
         self.__update_actual_store(entity_uuid, lxd_info)
-        self.agent.logger.info('defineEntity()', '[ DONE ] LXD Plugin - Container uuid: {}'.format(entity_uuid))
+        self.entities_info.update({entity_uuid: lxd_info})
+        data = {'name': entity.name, 'networks': entity.networks, 'image_url': entity.image_url,
+                'user_file': entity.user_file, 'ssh_key': entity.ssh_key, 'storage': entity.storage,
+                'profiles': entity.profiles, 'devices': entity.devices, 'image': entity.image}
+        self.__save_state('entity', entity_uuid, {'data': data, 'info': lxd_info})
+        self.states.commit(t)
+        self.logger.info('defineEntity()', '[ DONE ] LXD Plugin - Container uuid: {}'.format(entity_uuid))
         return entity_uuid
 
     def undefine_entity(self, entity_uuid):
 
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('undefineEntity()', ' LXD Plugin - Undefine a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('undefineEntity()', 'LXD Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('undefineEntity()', 'LXD Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            for i in list(entity.instances.keys()):
-                self.__force_entity_instance_termination(entity_uuid, i)
-
-            # try:
-            #
-            #     img = self.conn.images.get_by_alias(entity_uuid)
-            #     img.delete()
-            # except LXDAPIException as e:
-            #     self.agent.logger.error('undefine_entity()', 'Error {}'.format(e))
-            #     pass
-
-            self.current_entities.pop(entity_uuid, None)
-            # self.agent.get_os_plugin().remove_file(os.path.join(self.BASE_DIR, self.IMAGE_DIR, entity.image.get('base_image')))
-            self.__pop_actual_store(entity_uuid)
-            self.agent.logger.info('undefineEntity()',
-                                   '[ DONE ] LXD Plugin - Undefine a Container uuid {}'.format(entity_uuid))
-            return True
+        self.logger.info('undefineEntity()', ' LXD Plugin - Undefine a Container uuid {}'.format(entity_uuid))
+        entity = self.__get_entity('undefineEntity()', entity_uuid)
+        t = self.states.begin('undefine', entity, entity_uuid)
+        for i in list(entity.instances.keys()):
+            self.__force_entity_instance_termination(entity_uuid, i)
+
+        # try:
+        #
+        #     img = self.conn.images.get_by_alias(entity_uuid)
+        #     img.delete()
+        # except LXDAPIException as e:
+        #     self.logger.error('undefine_entity()', 'Error {}'.format(e))
+        #     pass
+
+        self.current_entities.pop(entity_uuid, None)
+        self.entities_info.pop(entity_uuid, None)
+        self.__drop_state('entity', entity_uuid)
+        # self.agent.get_os_plugin().remove_file(os.path.join(self.BASE_DIR, self.IMAGE_DIR, entity.image.get('base_image')))
+        self.__pop_actual_store(entity_uuid)
+        self.states.commit(t)
+        self.logger.info('undefineEntity()',
+                         '[ DONE ] LXD Plugin - Undefine a Container uuid {}'.format(entity_uuid))
+        return True
 
     def configure_entity(self, entity_uuid, instance_uuid=None):
 
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('configureEntity()', ' LXD Plugin - Configure a Container uuid {} '.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('configureEntity()', 'LXD Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('configureEntity()',
-                                    'LXD Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
+        self.logger.info('configureEntity()', ' LXD Plugin - Configure a Container uuid {} '.format(entity_uuid))
+        entity = self.__get_entity('configureEntity()', entity_uuid)
 
-            ''' 
-                See if is possible to:
-                - Put rootfs and images inside a custom path
-            '''
+        ''' 
+            See if is possible to:
+            - Put rootfs and images inside a custom path
+        '''
 
-            if instance_uuid is None:
-                instance_uuid = str(uuid.uuid4())
+        if instance_uuid is None:
+            instance_uuid = str(uuid.uuid4())
 
-            if entity.has_instance(instance_uuid):
-                print('This instance already existis!!')
-            else:
-                id = len(entity.instances)
-                name = '{0}{1}'.format(entity.name, id)
+        if entity.has_instance(instance_uuid):
+            print('This instance already existis!!')
+        else:
+            id = len(entity.instances)
+            name = '{0}{1}'.format(entity.name, id)
+            t = self.states.begin('configure', None, entity_uuid, instance_uuid)
 
-                instance = LXDEntityInstance(instance_uuid, name, entity.networks, entity.image,
-                                             entity.user_file, entity.ssh_key, entity.storage, entity.profiles,
-                                             entity_uuid)
+            instance = LXDEntityInstance(instance_uuid, name, entity.networks, entity.image,
+                                         entity.user_file, entity.ssh_key, entity.storage, entity.profiles,
+                                         entity_uuid)
 
-                instance.devices = entity.devices
+            instance.devices = entity.devices
 
-                self.agent.logger.info('configureEntity()', '[ INFO ] LXD Plugin - Creating profile...')
-                try:
-                    # img = self.conn.images.create(image_data, public=True, wait=True)
-                    # img.add_alias(entity_uuid, description=entity.name)
-
-                    '''
-                    Should explore how to setup correctly the networking, seems that you can't decide the interface you 
-                    want to attach to the container
-                    Below there is a try using a profile customized for network
-                    '''
-
-                    custom_profile_for_instance = self.conn.profiles.create(instance_uuid)
-
-                    # WAN=$(awk '$2 == 00000000 { print $1 }' /proc/net/route)
-                    # eno1
-                    if instance.user_file is not None and instance.user_file != '':
-                        user_data = self.__generate_custom_profile_userdata_configuration(instance.user_file)
-                        custom_profile_for_instance.config = user_data
-
-                    conf = {'environment.FOSUUID': instance_uuid,
-                            'environment.FOSENTITYUUID': entity_uuid,
-                            'environment.FOSNODEUUID': self.agent.get_os_plugin().get_uuid()
-                            }
-                    dev = self.__generate_custom_profile_devices_configuration(instance)
-                    if instance.devices:
-                        for d in instance.devices:
-                            dev.update(d)
-                    self.agent.logger.info('__generate_custom_profile_devices_configuration()',
-                                           'LXD Plugin - Devices {}'.format(dev))
-                    custom_profile_for_instance.config = conf
-                    custom_profile_for_instance.devices = dev
-                    custom_profile_for_instance.save()
+            self.logger.info('configureEntity()', '[ INFO ] LXD Plugin - Creating profile...')
+            try:
+                # img = self.conn.images.create(image_data, public=True, wait=True)
+                # img.add_alias(entity_uuid, description=entity.name)
 
-                except LXDAPIException as e:
-                    self.agent.logger.error('configureEntity()', 'Error {}'.format(e))
-                    pass
-                self.agent.logger.info('configureEntity()', '[ DONE ] LXD Plugin - Creating profile...')
-                if instance.profiles is None:
-                    instance.profiles = list()
+                '''
+                Should explore how to setup correctly the networking, seems that you can't decide the interface you 
+                want to attach to the container
+                Below there is a try using a profile customized for network
+                '''
+
+                custom_profile_for_instance = self.conn.profiles.create(instance_uuid)
+
+                # WAN=$(awk '$2 == 00000000 { print $1 }' /proc/net/route)
+                # eno1
+                if instance.user_file is not None and instance.user_file != '':
+                    user_data = self.__generate_custom_profile_userdata_configuration(instance.user_file)
+                    custom_profile_for_instance.config = user_data
+
+                conf = {'environment.FOSUUID': instance_uuid,
+                        'environment.FOSENTITYUUID': entity_uuid,
+                        'environment.FOSNODEUUID': self.agent.get_os_plugin().get_uuid()
+                        }
+                dev = self.__generate_custom_profile_devices_configuration(instance)
+                if instance.devices:
+                    for d in instance.devices:
+                        dev.update(d)
+                self.logger.info('__generate_custom_profile_devices_configuration()',
+                                 'LXD Plugin - Devices {}'.format(dev))
+                custom_profile_for_instance.config = conf
+                custom_profile_for_instance.devices = dev
+                custom_profile_for_instance.save()
+
+            except LXDAPIException as e:
+                self.logger.error('configureEntity()', 'Error {}'.format(e))
+                pass
+            self.logger.info('configureEntity()', '[ DONE ] LXD Plugin - Creating profile...')
+            # the profiles list is the entity one, the instance gets its own copy
+            if instance.profiles is None:
+                instance.profiles = list()
+            else:
+                instance.profiles = list(instance.profiles)
 
-                instance.profiles.append(instance_uuid)
+            instance.profiles.append(instance_uuid)
 
-                self.agent.logger.info('configureEntity()',
-                                       '[ INFO ] LXD Plugin - Generating container configuration...')
-                config = self.__generate_container_dict(instance)
-                self.agent.logger.info('configureEntity()',
-                                       '[ DONE ] LXD Plugin - Generating container configuration...')
+            self.logger.info('configureEntity()',
+                             '[ INFO ] LXD Plugin - Generating container configuration...')
+            config = self.__generate_container_dict(instance)
+            self.logger.info('configureEntity()',
+                             '[ DONE ] LXD Plugin - Generating container configuration...')
 
-                self.agent.logger.info('configureEntity()', '[ INFO ] LXD Plugin - Creating Container...')
+            self.logger.info('configureEntity()', '[ INFO ] LXD Plugin - Creating Container...')
+            with Tracing.span('lxd-create'):
                 self.conn.containers.create(config, wait=True)
-                self.agent.logger.info('configureEntity()', '[ DONE ] LXD Plugin - Creating Container...')
+            self.logger.info('configureEntity()', '[ DONE ] LXD Plugin - Creating Container...')
 
-                instance.on_configured(config)
-                entity.add_instance(instance)
+            instance.on_configured(config)
+            entity.add_instance(instance)
 
-                self.current_entities.update({entity_uuid: entity})
+            self.current_entities.update({entity_uuid: entity})
 
-                uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid)
-                container_info = json.loads(self.agent.astore.get(uri))
-                container_info.update({'status': 'configured'})
-                container_info.update({'name': name})
-                e_data = container_info.get('entity_data')
-                e_data.update({'name': name})
-                container_info.update({'entity_data': e_data})
-
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                self.agent.logger.info('configureEntity()',
-                                       '[ DONE ] LXD Plugin - Configure a Container uuid {}'.format(instance_uuid))
-                return True
+            container_info = self.__actual_info(entity_uuid)
+            container_info.update({'status': STATUS.get('configure')})
+            container_info.update({'name': name})
+            e_data = container_info.get('entity_data')
+            e_data.update({'name': name})
+            container_info.update({'entity_data': e_data})
+
+            self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
+            self.states.commit(t, instance)
+            self.logger.info('configureEntity()',
+                             '[ DONE ] LXD Plugin - Configure a Container uuid {}'.format(instance_uuid))
+            return True
 
     def clean_entity(self, entity_uuid, instance_uuid=None):
 
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('clean_entity()', ' LXD Plugin - Clean a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('clean_entity()', 'LXD Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('clean_entity()', 'LXD Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('clean_entity()', 'LXD Plugin - Instance not found!!')
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.CONFIGURED:
-                    self.agent.logger.error('clean_entity()',
-                                            'LXD Plugin - Instance state is wrong, or transition not allowed')
-                    raise StateTransitionNotAllowedException('Instance is not in CONFIGURED state',
-                                                             'Instance {} is not in CONFIGURED state'.format(
-                                                                 instance_uuid))
-                else:
+        self.logger.info('clean_entity()', ' LXD Plugin - Clean a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('clean_entity()', entity_uuid, instance_uuid)
+        if instance is not None:
+            t = self.__begin_transition('clean_entity()', 'clean', entity_uuid, instance_uuid, instance)
+            try:
+                self.logger.info('clean_entity()', '{}'.format(instance))
+                c = self.conn.containers.get(instance.name)
+                c.delete()
 
-                    try:
-                        self.agent.logger.info('clean_entity()', '{}'.format(instance))
-                        c = self.conn.containers.get(instance.name)
-                        c.delete()
-
-                        time.sleep(2)
-                        profile = self.conn.profiles.get(instance_uuid)
-                        profile.sync()
-                        while True:
-                            if len(profile.used_by) == 0:
-                                break
-                            profile.sync()
-                            time.sleep(1)
-                        profile.delete()
+                time.sleep(2)
+                profile = self.conn.profiles.get(instance_uuid)
+                profile.sync()
+                while True:
+                    if len(profile.used_by) == 0:
+                        break
+                    profile.sync()
+                    time.sleep(1)
+                profile.delete()
 
-                    except Exception as e:
-                        self.agent.logger.info('clean_entity()',
-                                               '[ ERRO ] LXD Plugin - Clean a Container Exception raised {}'.format(e))
+            except Exception as e:
+                self.logger.info('clean_entity()',
+                                 '[ ERRO ] LXD Plugin - Clean a Container Exception raised {}'.format(e))
 
-                        '''
-                        {'wan': {'nictype': 'physical', 'name': 'wan', 'type': 'nic', 'parent': 'veth-af90f'}, 
-                        'root': {'type': 'disk', 'pool': 'default', 'path': '/'}, 
-                        'mgmt': {'nictype': 'bridged', 'name': 'mgmt', 'type': 'nic', 'parent': 'br-45873fb0'}}
+                '''
+                {'wan': {'nictype': 'physical', 'name': 'wan', 'type': 'nic', 'parent': 'veth-af90f'}, 
+                'root': {'type': 'disk', 'pool': 'default', 'path': '/'}, 
+                'mgmt': {'nictype': 'bridged', 'name': 'mgmt', 'type': 'nic', 'parent': 'br-45873fb0'}}
 
-                        '''
+                '''
 
-                    instance.on_clean()
-                    entity.remove_instance(instance)
-                    self.current_entities.update({entity_uuid: entity})
+            instance.on_clean()
+            entity.remove_instance(instance)
+            self.current_entities.update({entity_uuid: entity})
 
-                    # uri = '{}/{}/{}' % (self.agent.dhome, self.HOME, entity_uuid))
-                    # container_info = json.loads(self.agent.dstore.get(uri))
-                    # container_info.update({'status': 'cleaned'})
-                    # self.__update_actual_store(entity_uuid, container_info)
-                    self.__pop_actual_store_instance(entity_uuid, instance_uuid)
-                    self.agent.logger.info('clean_entity()',
-                                           '[ DONE ] LXD Plugin - Clean a Container uuid {} '.format(instance_uuid))
+            self.__pop_actual_store_instance(entity_uuid, instance_uuid)
+            self.states.commit(t)
+            self.logger.info('clean_entity()',
+                             '[ DONE ] LXD Plugin - Clean a Container uuid {} '.format(instance_uuid))
 
-            return True
+        return True
 
     def run_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('run_entity()', ' LXD Plugin - Starting a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('run_entity()', 'LXD Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('run_entity()', 'LXD Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            instance = entity.get_instance(instance_uuid)
-            if instance.get_state() == State.RUNNING:
-                self.agent.logger.error('run_entity()',
-                                        'LXD Plugin - Instance already running')
-                return True
-            if instance.get_state() != State.CONFIGURED:
-                self.agent.logger.error('clean_entity()',
-                                        'LXD Plugin - Instance state is wrong, or transition not allowed')
-                raise StateTransitionNotAllowedException('Instance is not in CONFIGURED state',
-                                                         'Instance {} is not in CONFIGURED state'.format(instance_uuid))
-            else:
-                uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
-                container_info = json.loads(self.agent.astore.get(uri))
-                container_info.update({'status': 'starting'})
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                self.current_entities.update({entity_uuid: entity})
+        self.logger.info('run_entity()', ' LXD Plugin - Starting a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('run_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return True
+        if instance.get_state() == State.RUNNING:
+            self.logger.error('run_entity()', 'LXD Plugin - Instance already running')
+            return True
+        t = self.__begin_transition('run_entity()', 'run', entity_uuid, instance_uuid, instance)
+        container_info = self.__actual_info(entity_uuid, instance_uuid)
+        container_info.update({'status': 'starting'})
+        self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
+        self.current_entities.update({entity_uuid: entity})
 
-                c = self.conn.containers.get(instance.name)
+        c = self.conn.containers.get(instance.name)
 
-                network_plugin = list(self.agent.get_network_plugin(None).values()).pop()
-                # TODO: check network_plugin is of brctl_plugin.brctl instance
-                expected_bridges = get_bridge_names_from_instance_networks(instance.networks)
-                network_plugin.create_bridges_if_not_exist(expected_bridges)
-                c.start()
-                while c.status != 'Running':
-                    try:
-                        c.sync()
-                    except Exception as e:
-                        self.agent.logger.info('run_entity()', '[ ERR ] LXD Plugin - {}'.format(e))
-                        pass
+        network_plugin = list(self.agent.get_network_plugin(None).values()).pop()
+        # TODO: check network_plugin is of brctl_plugin.brctl instance
+        expected_bridges = get_bridge_names_from_instance_networks(instance.networks)
+        with Tracing.span('bridges'):
+            network_plugin.create_bridges_if_not_exist(expected_bridges)
+        with Tracing.span('lxd-start'):
+            c.start()
+            while c.status != 'Running':
+                try:
+                    c.sync()
+                except Exception as e:
+                    self.logger.info('run_entity()', '[ ERR ] LXD Plugin - {}'.format(e))
+                    pass
 
-                fm = c.FilesManager(self.conn, c)
-                envs = 'export FOSUUID={} \n' \
-                       'export FOSENTITYUUID={}\n' \
-                       'export FOSNODEUUID={}' \
-                    .format(instance_uuid, entity_uuid, self.agent.get_os_plugin().get_uuid())
-                fm.put('/etc/profile.d/99-fos', envs, mode="0644")
-                instance.on_start()
+        fm = c.FilesManager(self.conn, c)
+        envs = 'export FOSUUID={} \n' \
+               'export FOSENTITYUUID={}\n' \
+               'export FOSNODEUUID={}' \
+            .format(instance_uuid, entity_uuid, self.agent.get_os_plugin().get_uuid())
+        fm.put('/etc/profile.d/99-fos', envs, mode="0644")
+        instance.on_start()
 
-                container_info = json.loads(self.agent.astore.get(uri))
-                container_info.update({'status': 'run'})
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                self.current_entities.update({entity_uuid: entity})
-                self.agent.logger.info('run_entity()',
-                                       '[ DONE ] LXD Plugin - Starting a Container uuid {}'.format(instance_uuid))
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.current_entities.update({entity_uuid: entity})
+        self.logger.info('run_entity()',
+                         '[ DONE ] LXD Plugin - Starting a Container uuid {}'.format(instance_uuid))
 
-                mt = threading.Thread(target=self.__monitor_instance, args=(entity_uuid, instance_uuid, instance.name),
-                                      daemon=True)
-                mt.start()
-                self.mon_th.update({instance_uuid: mt})
-                self.agent.logger.info('run_entity()',
-                                       '[ DONE ] LXD Plugin - Starting a Monitoring of {}'.format(instance_uuid))
-            return True
+        mt = threading.Thread(target=self.__monitor_instance, args=(entity_uuid, instance_uuid, instance.name),
+                              daemon=True)
+        mt.start()
+        self.mon_th.update({instance_uuid: mt})
+        self.logger.info('run_entity()',
+                         '[ DONE ] LXD Plugin - Starting a Monitoring of {}'.format(instance_uuid))
+        return True
 
     def stop_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('stop_entity()', ' LXD Plugin - Stop a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('stop_entity()', 'LXD Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('stop_entity()', 'LXD Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in RUNNING state'.format(entity_uuid))
-        else:
-            instance = entity.get_instance(instance_uuid)
-            if instance.get_state() != State.RUNNING:
-                self.agent.logger.error('clean_entity()',
-                                        'LXD Plugin - Instance state is wrong, or transition not allowed')
-                raise StateTransitionNotAllowedException('Instance is not in RUNNING state',
-                                                         'Instance {} is not in RUNNING state'.format(entity_uuid))
-            else:
+        self.logger.info('stop_entity()', ' LXD Plugin - Stop a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('stop_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return True
+        t = self.__begin_transition('stop_entity()', 'stop', entity_uuid, instance_uuid, instance)
 
-                c = self.conn.containers.get(instance.name)
-                self.mon_th.pop(instance_uuid)
-                c.stop(force=False, wait=True)
-                c.sync()
+        c = self.conn.containers.get(instance.name)
+        self.mon_th.pop(instance_uuid)
+        c.stop(force=False, wait=True)
+        c.sync()
 
-                while c.status != 'Stopped':
-                    c.sync()
+        while c.status != 'Stopped':
+            c.sync()
 
-                instance.on_stop()
-                self.current_entities.update({entity_uuid: entity})
+        instance.on_stop()
+        self.current_entities.update({entity_uuid: entity})
 
-                uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
-                container_info = json.loads(self.agent.astore.get(uri))
-                container_info.update({'status': 'stop'})
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                self.agent.logger.info('stop_entity()',
-                                       '[ DONE ] LXD Plugin - Stop a Container uuid {}'.format(entity_uuid))
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.logger.info('stop_entity()',
+                         '[ DONE ] LXD Plugin - Stop a Container uuid {}'.format(entity_uuid))
 
-            return True
+        return True
 
     def pause_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('pause_entity()', ' LXD Plugin - Pause a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('pause_entity()', 'LXD Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('pause_entity()', 'LXD Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'LXD Plugin - Instance not found!!')
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.RUNNING:
-                    self.agent.logger.error('clean_entity()',
-                                            'LXD Plugin - Instance state is wrong, or transition not allowed')
-                    raise StateTransitionNotAllowedException('Instance is not in RUNNING state',
+        self.logger.info('pause_entity()', ' LXD Plugin - Pause a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('pause_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return
+        t = self.__begin_transition('pause_entity()', 'pause', entity_uuid, instance_uuid, instance)
+        c = self.conn.containers.get(instance.name)
+        c.freeze()
 
-                                                             'Instance {} is not in RUNNING state'.format(
-                                                                 instance_uuid))
-                else:
-                    c = self.conn.containers.get(instance.name)
-                    c.freeze()
-
-                    instance.on_pause()
-                    self.current_entities.update({entity_uuid: entity})
-                    uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE,
-                                                  instance_uuid)
-                    container_info = json.loads(self.agent.astore.get(uri))
-                    container_info.update({'status': 'pause'})
-                    self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                    self.agent.logger.info('pause_entity()',
-                                           '[ DONE ] LXD Plugin - Pause a Container uuid {}'.format(instance_uuid))
-                    return True
+        instance.on_pause()
+        self.current_entities.update({entity_uuid: entity})
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.logger.info('pause_entity()',
+                         '[ DONE ] LXD Plugin - Pause a Container uuid {}'.format(instance_uuid))
+        return True
 
     def resume_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('resume_entity()', ' LXD Plugin - Resume a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('resume_entity()', 'LXD Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('resume_entity()', 'LXD Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'LXD Plugin - Instance not found!!')
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.PAUSED:
-                    self.agent.logger.error('clean_entity()',
-                                            'LXD Plugin - Instance state is wrong, or transition not allowed')
-                    raise StateTransitionNotAllowedException('Instance is not in PAUSED state',
-                                                             'Instance {} is not in PAUSED state'.format(instance_uuid))
-                else:
-                    c = self.conn.containers.get(instance.name)
-                    c.unfreeze()
-
-                    instance.on_resume()
-                    self.current_entities.update({entity_uuid: entity})
-
-                    uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE,
-                                                  instance_uuid)
-                    container_info = json.loads(self.agent.astore.get(uri))
-                    container_info.update({'status': 'run'})
-                    self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                    self.agent.logger.info('resume_entity()',
-                                           '[ DONE ] LXD Plugin - Resume a Container uuid {}'.format(instance_uuid))
-            return True
+        self.logger.info('resume_entity()', ' LXD Plugin - Resume a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('resume_entity()', entity_uuid, instance_uuid)
+        if instance is not None:
+            t = self.__begin_transition('resume_entity()', 'resume', entity_uuid, instance_uuid, instance)
+            c = self.conn.containers.get(instance.name)
+            c.unfreeze()
+
+            instance.on_resume()
+            self.current_entities.update({entity_uuid: entity})
+
+            self.__commit_transition(entity_uuid, instance_uuid, t)
+            self.logger.info('resume_entity()',
+                             '[ DONE ] LXD Plugin - Resume a Container uuid {}'.format(instance_uuid))
+        return True
 
     def migrate_entity(self, entity_uuid, dst=False, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('migrate_entity()', ' LXD Plugin - Migrate a container uuid {}'.format(entity_uuid))
+        self.logger.info('migrate_entity()', ' LXD Plugin - Migrate a container uuid {}'.format(entity_uuid))
         entity = self.current_entities.get(entity_uuid, None)
         if entity is None or entity.get_instance(instance_uuid) is None:
             if dst is True:
-                self.agent.logger.info('migrate_entity()', ' LXD Plugin - I\'m the Destination Node')
+                self.logger.info('migrate_entity()', ' LXD Plugin - I\'m the Destination Node')
                 self.before_migrate_entity_actions(entity_uuid, True, instance_uuid)
 
                 uri_instance = '{}/{}/{}/{}/{}'.format(self.agent.dhome, self.HOME_ENTITY, entity_uuid, self.INSTANCE,
@@ -662,40 +626,40 @@ class LXD(RuntimePlugin):
                         if c.status.upper() == 'running'.upper():
                             break
                         else:
-                            self.agent.logger.info('migrate_entity()',
-                                                   ' LXD Plugin - Container in this host but not running')
+                            self.logger.info('migrate_entity()',
+                                             ' LXD Plugin - Container in this host but not running')
                     except Exception as e:
-                        self.agent.logger.info('migrate_entity()', ' LXD Plugin - Container not already in this host')
+                        self.logger.info('migrate_entity()', ' LXD Plugin - Container not already in this host')
                     time.sleep(2)
 
                 self.after_migrate_entity_actions(entity_uuid, True, instance_uuid)
-                self.agent.logger.info('migrate_entity()',
-                                       '[ DONE ] LXD Plugin - Migrate a Container uuid {}'.format(entity_uuid))
+                self.logger.info('migrate_entity()',
+                                 '[ DONE ] LXD Plugin - Migrate a Container uuid {}'.format(entity_uuid))
                 return True
 
             else:
-                self.agent.logger.error('migrate_entity()', 'LXD Plugin - Entity not exists')
+                self.logger.error('migrate_entity()', 'LXD Plugin - Entity not exists')
                 raise EntityNotExistingException('Enitity not existing',
                                                  'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
         elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('migrate_entity()', 'LXD Plugin - Entity state is wrong, or transition not allowed')
+            self.logger.error('migrate_entity()', 'LXD Plugin - Entity state is wrong, or transition not allowed')
             raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
                                                      'Entity {} is not in DEFINED state'.format(entity_uuid))
         else:
 
             instance = entity.get_instance(instance_uuid)
             if instance.get_state() not in [State.RUNNING, State.TAKING_OFF]:
-                self.agent.logger.error('clean_entity()',
-                                        'LXD Plugin - Instance state is wrong, or transition not allowed')
+                self.logger.error('clean_entity()',
+                                  'LXD Plugin - Instance state is wrong, or transition not allowed')
                 # self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance not exist')
                 raise StateTransitionNotAllowedException('Instance is not in RUNNING state',
                                                          'Instance {} is not in RUNNING state'.format(entity_uuid))
 
-            self.agent.logger.info('migrate_entity()', ' LXD Plugin - I\'m the Source Node')
+            self.logger.info('migrate_entity()', ' LXD Plugin - I\'m the Source Node')
             res = self.before_migrate_entity_actions(entity_uuid, instance_uuid=instance_uuid)
             if not res:
-                self.agent.logger.error('migrate_entity()',
-                                        ' LXD Plugin - Error source node before migration, aborting')
+                self.logger.error('migrate_entity()',
+                                  ' LXD Plugin - Error source node before migration, aborting')
                 # self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance migration error on source')
                 return
 
@@ -761,7 +725,7 @@ class LXD(RuntimePlugin):
             try:
                 cont.migrate(remote_client, wait=True)
             except LXDAPIException as e:
-                self.agent.logger.info('migrate_entity()', ' LXD Plugin - LXD error {}'.format(e))
+                self.logger.info('migrate_entity()', ' LXD Plugin - LXD error {}'.format(e))
                 cont.delete()
             instance.on_stop()
 
@@ -770,22 +734,22 @@ class LXD(RuntimePlugin):
 
     def before_migrate_entity_actions(self, entity_uuid, dst=False, instance_uuid=None):
         if dst is True:
-            self.agent.logger.info('before_migrate_entity_actions()', ' LXD Plugin - Before Migration Destination')
+            self.logger.info('before_migrate_entity_actions()', ' LXD Plugin - Before Migration Destination')
             uri = '{}/{}/{}/{}/{}'.format(self.agent.dhome, self.HOME_ENTITY, entity_uuid, self.INSTANCE, instance_uuid)
             instance_info = json.loads(self.agent.dstore.get(uri))
             lxc_info = instance_info.get('entity_data')
 
-            self.agent.logger.info('before_migrate_entity_actions()', ' LXD Plugin - Waiting image')
+            self.logger.info('before_migrate_entity_actions()', ' LXD Plugin - Waiting image')
             while True:
                 base_image = lxc_info.get('base_image')
                 if base_image in self.images.keys():
                     break
 
-            self.agent.logger.info('before_migrate_entity_actions()', ' LXD Plugin - Waiting entity')
+            self.logger.info('before_migrate_entity_actions()', ' LXD Plugin - Waiting entity')
             while True:
                 if entity_uuid in self.current_entities.keys():
                     break
-            self.agent.logger.info('before_migrate_entity_actions()', ' Entity {} defined!!!'.format(entity_uuid))
+            self.logger.info('before_migrate_entity_actions()', ' Entity {} defined!!!'.format(entity_uuid))
 
             img_info = self.images.get(base_image)
             entity = self.current_entities.get(entity_uuid)
@@ -814,8 +778,8 @@ class LXD(RuntimePlugin):
             return True
 
         else:
-            self.agent.logger.info('before_migrate_entity_actions()',
-                                   ' LXD Plugin - Before Migration Source: get information about destination node')
+            self.logger.info('before_migrate_entity_actions()',
+                             ' LXD Plugin - Before Migration Source: get information about destination node')
 
             local_var = MVar()
 
@@ -848,30 +812,30 @@ class LXD(RuntimePlugin):
             runtimes = [x for x in all_plugins if x.get('type') == 'runtime']
             search = [x for x in runtimes if 'LXD' in x.get('name')]
             if len(search) == 0:
-                self.agent.logger.error('before_migrate_entity_actions()',
-                                        'LXD Plugin - Before Migration Source: No LXD Plugin, Aborting!!!')
+                self.logger.error('before_migrate_entity_actions()',
+                                  'LXD Plugin - Before Migration Source: No LXD Plugin, Aborting!!!')
                 # self.__write_error_instance(entity_uuid, instance_uuid, 'Entity Instance Migration error')
                 return False
             else:
                 lxd_uuid = search[0].get('uuid')
 
-            # self.agent.logger.info('before_migrate_entity_actions()', 'LXD Plugin - check if image is present on destination')
+            # self.logger.info('before_migrate_entity_actions()', 'LXD Plugin - check if image is present on destination')
             # uri_img = '{}/{}/runtime/{}/image/{}'.format(self.agent.aroot, destination_node_uuid, lxd_uuid, img_info)
             # if self.agent.astore.get(uri_img) is None:
-            #     self.agent.logger.info('before_migrate_entity_actions()', 'LXD Plugin - sending image to destination')
+            #     self.logger.info('before_migrate_entity_actions()', 'LXD Plugin - sending image to destination')
             #     uri_img = '{}/{}/runtime/{}/image/{}'.format(self.agent.droot, destination_node_uuid, lxd_uuid, img_info)
             #     self.agent.dstore.put(uri_img, json.dumps(img_info))
 
-            self.agent.logger.info('before_migrate_entity_actions()',
-                                   'LXD Plugin - check if entity is present on destination')
+            self.logger.info('before_migrate_entity_actions()',
+                             'LXD Plugin - check if entity is present on destination')
             uri_entity = '{}/{}/runtime/{}/entity/{}'.format(self.agent.aroot, destination_node_uuid, lxd_uuid,
                                                              entity_uuid)
             if self.agent.astore.get(uri_entity) is None:
-                self.agent.logger.info('before_migrate_entity_actions()', 'LXD Plugin - sending entity to destination')
+                self.logger.info('before_migrate_entity_actions()', 'LXD Plugin - sending entity to destination')
                 uri_entity = '{}/{}/runtime/{}/entity/{}'.format(self.agent.droot, destination_node_uuid, lxd_uuid,
                                                                  entity_uuid)
                 self.agent.dstore.put(uri_entity, json.dumps(entity_info))
-                self.agent.logger.info('before_migrate_entity_actions()', 'LXD Plugin - Waiting entity in destination')
+                self.logger.info('before_migrate_entity_actions()', 'LXD Plugin - Waiting entity in destination')
 
                 uri_entity = '{}/{}/runtime/{}/entity/{}'.format(self.agent.aroot, destination_node_uuid, lxd_uuid,
                                                                  entity_uuid)
@@ -882,24 +846,24 @@ class LXD(RuntimePlugin):
                     entity_info = json.loads(local_var.get())
                     es = entity_info.get('status')
                 self.agent.astore.overlook(subid)
-                self.agent.logger.info('before_migrate_entity_actions()', 'LXD Plugin - Entity in destination!')
+                self.logger.info('before_migrate_entity_actions()', 'LXD Plugin - Entity in destination!')
 
                 # while True:
                 #     uri_entity = '{}/{}/runtime/{}/entity/{}'.format(self.agent.aroot, destination_node_uuid, lxd_uuid, entity_uuid)
                 #     jdata = self.agent.astore.get(uri_entity)
                 #     # print('{}'.format(jdata))
                 #     if jdata is not None:
-                #         self.agent.logger.info('before_migrate_entity_actions()', 'LXD Plugin - Entity in destination!')
+                #         self.logger.info('before_migrate_entity_actions()', 'LXD Plugin - Entity in destination!')
                 #         entity_info = json.loads(jdata)
                 #         if entity_info is not None and entity_info.get('status') == 'defined':
                 #             break
 
-            self.agent.logger.info('before_migrate_entity_actions()',
-                                   ' LXD Plugin - Before Migration Source: Waiting destination to be ready')
+            self.logger.info('before_migrate_entity_actions()',
+                             ' LXD Plugin - Before Migration Source: Waiting destination to be ready')
             uri = '{}/{}/runtime/{}/entity/{}/instance/{}'.format(self.agent.aroot, destination_node_uuid, lxd_uuid,
                                                                   entity_uuid, instance_uuid)
             subid = self.agent.astore.observe(uri, cb)
-            self.agent.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Entity in destination!')
+            self.logger.info('before_migrate_entity_actions()', 'KVM Plugin - Entity in destination!')
             entity_info = json.loads(local_var.get())
             es = entity_info.get('status')
             while es not in ['landing', 'error']:
@@ -907,15 +871,15 @@ class LXD(RuntimePlugin):
                 es = entity_info.get('status')
             self.agent.astore.overlook(subid)
             # while True:
-            #     # self.agent.logger.info('before_migrate_entity_actions()', ' LXD Plugin - Before Migration Source: Waiting destination to be ready')
+            #     # self.logger.info('before_migrate_entity_actions()', ' LXD Plugin - Before Migration Source: Waiting destination to be ready')
             #     uri = '{}/{}/runtime/{}/entity/{}/instance/{}'.format(self.agent.aroot, destination_node_uuid, lxd_uuid, entity_uuid, instance_uuid)
             #     lxc_info = self.agent.astore.get(uri)
             #     if lxc_info is not None:
             #         lxc_info = json.loads(lxc_info)
             #         if lxc_info is not None and lxc_info.get('status') == 'landing':
             #             break
-            self.agent.logger.info('before_migrate_entity_actions()',
-                                   ' LXD Plugin - Before Migration Source: Destination is ready!')
+            self.logger.info('before_migrate_entity_actions()',
+                             ' LXD Plugin - Before Migration Source: Destination is ready!')
 
             instance.state = State.TAKING_OFF
             instance_info.update({'status': 'taking_off'})
@@ -928,12 +892,12 @@ class LXD(RuntimePlugin):
             entity_uuid = entity_uuid.get('entity_uuid')
         entity = self.current_entities.get(entity_uuid, None)
         if entity is None:
-            self.agent.logger.error('after_migrate_entity_actions()', 'LXD Plugin - Entity not exists')
+            self.logger.error('after_migrate_entity_actions()', 'LXD Plugin - Entity not exists')
             raise EntityNotExistingException('Enitity not existing',
                                              'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
         elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('after_migrate_entity_actions()',
-                                    'LXD Plugin - Entity state is wrong, or transition not allowed')
+            self.logger.error('after_migrate_entity_actions()',
+                              'LXD Plugin - Entity state is wrong, or transition not allowed')
             raise StateTransitionNotAllowedException('Entity is not in correct state',
                                                      'Entity {} is not in correct state'.format(entity.get_state()))
         else:
@@ -945,8 +909,8 @@ class LXD(RuntimePlugin):
                 '''
                 Here the plugin also update to the current status, and remove unused keys
                 '''
-                self.agent.logger.info('after_migrate_entity_actions()',
-                                       ' LXD Plugin - After Migration Destination: Updating state')
+                self.logger.info('after_migrate_entity_actions()',
+                                 ' LXD Plugin - After Migration Destination: Updating state')
                 instance.on_start()
                 self.current_entities.update({entity_uuid: entity})
 
@@ -964,14 +928,14 @@ class LXD(RuntimePlugin):
                 '''
                 Source node destroys all information about vm
                 '''
-                self.agent.logger.info('afterMigrateEntityActions()',
-                                       ' LXD Plugin - After Migration Source: Updating state, destroy container')
+                self.logger.info('afterMigrateEntityActions()',
+                                 ' LXD Plugin - After Migration Source: Updating state, destroy container')
                 self.__force_entity_instance_termination(entity_uuid, instance_uuid)
                 return True
 
     def __react_to_cache_entity(self, uri, value, v):
-        self.agent.logger.info('__react_to_cache()',
-                               ' LXD Plugin - React to to URI: {} Value: {} Version: {}'.format(uri, value, v))
+        self.logger.debug('__react_to_cache()',
+                               ' LXD Plugin - React to to URI: %s Value: %s Version: %s', uri, value, v)
         if uri.split('/')[-2] == 'entity':
             uuid = uri.split('/')[-1]
             value = json.loads(value)
@@ -1006,7 +970,7 @@ class LXD(RuntimePlugin):
             elif react_func is not None:
                 entity_data.update({'entity_uuid': entity_uuid})
                 if action in ['landing', 'taking_off']:
-                    self.agent.logger.warning('__react_to_cache_entity()', 'ACTION = {}'.format(action))
+                    self.logger.warning('__react_to_cache_entity()', 'ACTION = {}'.format(action))
                     react_func(entity_data, dst=True, instance_uuid=instance_uuid)
                 else:
                     react_func(entity_data, instance_uuid=instance_uuid)
@@ -1156,37 +1120,90 @@ class LXD(RuntimePlugin):
     def __generate_container_dict(self, instance):
         conf = {'name': instance.name, 'profiles': instance.profiles,
                 'source': {'type': 'image', 'alias': instance.image.get('uuid')}}
-        self.agent.logger.info('__generate_container_dict()', 'LXD Plugin - Container Configuration {}'.format(conf))
+        self.logger.info('__generate_container_dict()', 'LXD Plugin - Container Configuration {}'.format(conf))
         return conf
 
     def __update_actual_store(self, uri, value):
         uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, uri)
-        value = json.dumps(value)
+        value = json.dumps(Tracing.stamp(value))
         self.agent.astore.put(uri, value)
 
     def __pop_actual_store(self, uri, ):
         uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, uri)
         self.agent.astore.remove(uri)
 
-    def __update_actual_store_instance(self, entity_uuid, instance_uuid, value):
+    def __update_actual_store_instance(self, entity_uuid, instance_uuid, value, persist=True):
+        entity = self.current_entities.get(entity_uuid, None)
+        if persist and entity is not None and entity.has_instance(instance_uuid):
+            instance = entity.get_instance(instance_uuid)
+            data = {'name': instance.name, 'networks': instance.networks, 'image': instance.image,
+                    'user_file': instance.user_file, 'ssh_key': instance.ssh_key, 'storage': instance.storage,
+                    'profiles': instance.profiles, 'devices': instance.devices, 'conf': instance.conf}
+            self.__save_state('instance', instance_uuid, {'entity_uuid': entity_uuid, 'data': data,
+                                                          'state': instance.get_state().name, 'info': value})
+        self.instances_info.update({instance_uuid: value})
         uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
-        value = json.dumps(value)
+        value = json.dumps(Tracing.stamp(value))
         self.agent.astore.put(uri, value)
 
     def __pop_actual_store_instance(self, entity_uuid, instance_uuid, ):
+        self.__drop_state('instance', instance_uuid)
+        self.instances_info.pop(instance_uuid, None)
         uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
         self.agent.astore.remove(uri)
 
+    def __get_entity(self, caller, entity_uuid):
+        entity = self.current_entities.get(entity_uuid, None)
+        if entity is None:
+            self.logger.error(caller, 'LXD Plugin - Entity not exists')
+            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
+        if entity.get_state() != State.DEFINED:
+            self.logger.error(caller, 'LXD Plugin - Entity state is wrong, or transition not allowed')
+            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
+        return entity
+
+    def __get_instance(self, caller, entity_uuid, instance_uuid):
+        entity = self.__get_entity(caller, entity_uuid)
+        if instance_uuid is None or not entity.has_instance(instance_uuid):
+            self.logger.error(caller, 'LXD Plugin - Instance not found!!')
+            return entity, None
+        return entity, entity.get_instance(instance_uuid)
+
+    def __begin_transition(self, caller, action, entity_uuid, instance_uuid, instance):
+        try:
+            return self.states.begin(action, instance, entity_uuid, instance_uuid)
+        except StateTransitionNotAllowedException:
+            self.logger.error(caller, 'LXD Plugin - Instance state is wrong, or transition not allowed')
+            raise
+
+    def __commit_transition(self, entity_uuid, instance_uuid, transition):
+        # the status is merged in the last document written for the instance and put once
+        container_info = self.__actual_info(entity_uuid, instance_uuid)
+        container_info.update({'status': STATUS.get(transition.action)})
+        self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
+        self.states.commit(transition)
+
+    def __actual_info(self, entity_uuid, instance_uuid=None):
+        if instance_uuid is None:
+            info = self.entities_info.get(entity_uuid, None)
+            uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid)
+        else:
+            info = self.instances_info.get(instance_uuid, None)
+            uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
+        if info is None:
+            return json.loads(self.agent.astore.get(uri))
+        return copy.deepcopy(info)
+
     def __force_entity_instance_termination(self, entity_uuid, instance_uuid):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('stop_entity()', ' LXD Plugin - Stop a container uuid {}'.format(entity_uuid))
+        self.logger.info('stop_entity()', ' LXD Plugin - Stop a container uuid {}'.format(entity_uuid))
         entity = self.current_entities.get(entity_uuid, None)
         if entity is None:
-            self.agent.logger.error('stop_entity()', 'LXD Plugin - Entity not exists')
+            self.logger.error('stop_entity()', 'LXD Plugin - Entity not exists')
         else:
             if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'LXD Plugin - Instance not found!!')
+                self.logger.error('run_entity()', 'LXD Plugin - Instance not found!!')
             else:
                 instance = entity.get_instance(instance_uuid)
                 if instance.get_state() == State.PAUSED:
@@ -1205,13 +1222,12 @@ class LXD(RuntimePlugin):
                 #    self.undefine_entity(k)
 
     def __monitor_instance(self, entity_id, instance_id, instance_name):
-        self.agent.logger.info('__monitor_instance()',
-                               '[ INFO ] LXD Plugin - Staring monitoring of Container uuid {}'.format(instance_id))
+        self.logger.info('__monitor_instance()',
+                         '[ INFO ] LXD Plugin - Staring monitoring of Container uuid %s', instance_id)
         time.sleep(2)
         while True:
             time.sleep(2)
-            uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_id, self.INSTANCE, instance_id)
-            container_info = json.loads(self.agent.astore.get(uri))
+            container_info = self.__actual_info(entity_id, instance_id)
             try:
                 c = self.conn.containers.get(instance_name)
                 cs = c.state()
@@ -1223,43 +1239,45 @@ class LXD(RuntimePlugin):
                 detailed_state.update({'processes': cs.processes})
                 detailed_state.update({'pid': cs.pid})
                 container_info.update({'detailed_state': detailed_state})
-                self.__update_actual_store_instance(entity_id, instance_id, container_info)
+                self.__update_actual_store_instance(entity_id, instance_id, container_info, persist=False)
+                # cpu usage is in nanoseconds
+                self.update_instance_usage(entity_id, instance_id, cpu_seconds=(cs.cpu or {}).get('usage', 0) / 1e9,
+                                           memory_bytes=(cs.memory or {}).get('usage', 0), processes=cs.processes)
 
                 if c.status == 'Stopped':
-                    self.agent.logger.info('__monitor_instance()',
-                                           '[ INFO ] LXD Plugin - Stopping monitoring of Container uuid {}'.format(
-                                               instance_id))
+                    self.logger.info('__monitor_instance()',
+                                     '[ INFO ] LXD Plugin - Stopping monitoring of Container uuid %s', instance_id)
+                    self.remove_instance_usage(entity_id, instance_id)
                     return
             except Exception as e:
-                self.agent.logger.error('__monitor_instance()',
-                                        '[ ERROR ] LXD Plugin - Stopping monitoring of Container uuid {} Error {}'.format(
-                                            instance_id, e))
+                self.logger.error('__monitor_instance()',
+                                  '[ ERROR ] LXD Plugin - Stopping monitoring of Container uuid %s Error %s', instance_id, e)
+                self.remove_instance_usage(entity_id, instance_id)
                 return
 
     def __add_image(self, manifest):
         url = manifest.get('base_image')
         uuid = manifest.get('uuid')
-        if url.startswith('http'):
-            image_name = os.path.join(self.BASE_DIR, self.IMAGE_DIR, url.split('/')[-1])
-            self.agent.get_os_plugin().download_file(url, image_name)
-        elif url.startswith('file://'):
-            image_name = os.path.join(self.BASE_DIR, self.IMAGE_DIR, url.split('/')[-1])
-            cmd = 'cp {} {}'.format(url[len('file://'):], image_name)
-            self.agent.get_os_plugin().execute_command(cmd, True)
-
-        self.agent.logger.info('__add_image()', '[ INFO ] LXD Plugin - Loading image data from: {}'.format(
+        try:
+            image_name = self.image_store.acquire(self.__image_ref(uuid), url, manifest.get('checksum'))
+        except (ImageChecksumException, ValueError, OSError) as e:
+            self.logger.error('__add_image()', '[ ERRO ] LXD Plugin - Cannot get image {}: {}'.format(url, e))
+            return
+
+        self.logger.info('__add_image()', '[ INFO ] LXD Plugin - Loading image data from: {}'.format(
             os.path.join(self.BASE_DIR, self.IMAGE_DIR, url)))
         image_data = self.agent.get_os_plugin().read_binary_file(
             os.path.join(self.BASE_DIR, self.IMAGE_DIR, image_name))
-        self.agent.logger.info('__add_image()', '[ DONE ] LXD Plugin - Loading image data from: {}'.format(
+        self.logger.info('__add_image()', '[ DONE ] LXD Plugin - Loading image data from: {}'.format(
             os.path.join(self.BASE_DIR, self.IMAGE_DIR, url)))
         img_info = {'url': url, 'path': image_name, 'uuid': uuid}
 
-        self.agent.logger.info('__add_image()', '[ INFO ] LXD Plugin - Creating image with alias {}'.format(uuid))
+        self.logger.info('__add_image()', '[ INFO ] LXD Plugin - Creating image with alias {}'.format(uuid))
         img = self.conn.images.create(image_data, public=True, wait=True)
         img.add_alias(uuid, description=image_name)
-        self.agent.logger.info('__add_image()', '[ DONE ] LXD Plugin - Created image with alias {}'.format(uuid))
+        self.logger.info('__add_image()', '[ DONE ] LXD Plugin - Created image with alias {}'.format(uuid))
         self.images.update({uuid: img_info})
+        self.__save_state('image', uuid, img_info)
         manifest.update({'path': image_name})
         uri = '{}/{}'.format(self.HOME_IMAGE, manifest.get('uuid'))
         self.__update_actual_store(uri, manifest)
@@ -1267,23 +1285,37 @@ class LXD(RuntimePlugin):
     def __remove_image(self, image_uuid):
         image = self.images.get(image_uuid, None)
         if image is None:
-            self.agent.logger.info('__remove_image()', ' LXD Plugin - Image not found!!')
+            self.logger.info('__remove_image()', ' LXD Plugin - Image not found!!')
             return
-        self.agent.get_os_plugin().remove_file(image.get('path'))
+        self.image_store.release(self.__image_ref(image_uuid))
         self.images.pop(image_uuid)
+        self.__drop_state('image', image_uuid)
         uri = '{}/{}'.format(self.HOME_IMAGE, image_uuid)
         self.__pop_actual_store(uri)
 
+    def __image_ref(self, image_uuid):
+        return '{}/{}'.format(self.uuid, image_uuid)
+
     def __add_flavor(self, manifest):
         uri = '{}/{}'.format(self.HOME_FLAVOR, manifest.get('uuid'))
         self.__update_actual_store(uri, manifest)
         self.flavors.update({manifest.get('uuid'): manifest})
+        self.__save_state('flavor', manifest.get('uuid'), manifest)
 
     def __remove_flavor(self, flavor_uuid):
         self.flavors.pop(flavor_uuid)
+        self.__drop_state('flavor', flavor_uuid)
         uri = '{}/{}'.format(self.HOME_FLAVOR, flavor_uuid)
         self.__pop_actual_store(uri)
 
+    def __save_state(self, kind, key, value):
+        if self.agent.state is not None:
+            self.agent.state.put(self.uuid, kind, key, value)
+
+    def __drop_state(self, kind, key):
+        if self.agent.state is not None:
+            self.agent.state.remove(self.uuid, kind, key)
+
     def __write_error_entity(self, entity_uuid, error):
         uri = '{}/{}/{}'.format(self.agent.dhome, self.HOME_ENTITY, entity_uuid)
         jdata = self.agent.dstore.get(uri)
@@ -1297,26 +1329,26 @@ class LXD(RuntimePlugin):
         self.__update_actual_store(entity_uuid, vm_info)
 
     def __react_to_cache_image(self, uri, value, v):
-        self.agent.logger.info('__react_to_cache_image()',
-                               'LXD Plugin - React to to URI: {} Value: {} Version: {}'.format(uri, value, v))
+        self.logger.debug('__react_to_cache_image()',
+                               'LXD Plugin - React to to URI: %s Value: %s Version: %s', uri, value, v)
         if uri.split('/')[-2] == 'image':
             image_uuid = uri.split('/')[-1]
             if value is None and v is None:
-                self.agent.logger.info('__react_to_cache_image()',
-                                       'LXD Plugin - This is a remove for URI: {}'.format(uri))
+                self.logger.info('__react_to_cache_image()',
+                                 'LXD Plugin - This is a remove for URI: {}'.format(uri))
                 self.__remove_image(image_uuid)
             else:
                 value = json.loads(value)
                 self.__add_image(value)
 
     def __react_to_cache_flavor(self, uri, value, v):
-        self.agent.logger.info('__react_to_cache_flavor()',
-                               'LXD Plugin - React to to URI: {} Value: {} Version: {}'.format(uri, value, v))
+        self.logger.debug('__react_to_cache_flavor()',
+                               'LXD Plugin - React to to URI: %s Value: %s Version: %s', uri, value, v)
         if uri.split('/')[-2] == 'flavor':
             flavor_uuid = uri.split('/')[-1]
             if value is None and v is None:
-                self.agent.logger.info('__react_to_cache_flavor()',
-                                       'LXD Plugin - This is a remove for URI: {}'.format(uri))
+                self.logger.info('__react_to_cache_flavor()',
+                                 'LXD Plugin - This is a remove for URI: {}'.format(uri))
                 self.__remove_flavor(flavor_uuid)
             else:
                 value = json.loads(value)
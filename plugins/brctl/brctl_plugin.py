@@ -18,7 +18,6 @@ import uuid
 import struct
 import json
 from fog05.interfaces.NetworkPlugin import *
-from jinja2 import Environment
 import socket
 
 
@@ -29,11 +28,12 @@ class brctl(NetworkPlugin):
         super(brctl, self).__init__(version, plugin_uuid)
         self.name = name
         self.agent = agent
+        self.logger = self.agent.logger.component(name)
         self.interfaces_map = {}
         self.brmap = {}
         self.netmap = {}
         self.configuration = configuration
-        self.agent.logger.info('__init__()', ' Hello from bridge-utils Plugin')
+        self.logger.info('__init__()', ' Hello from bridge-utils Plugin')
         self.BASE_DIR = os.path.join(self.agent.base_path, 'brctl')
         # self.BASE_DIR = '/opt/fos/brctl'
         self.DHCP_DIR = 'dhcp'
@@ -72,7 +72,7 @@ class brctl(NetworkPlugin):
 
         uri = '{}/{}/networks/**'.format(self.agent.dhome, self.HOME)
         self.agent.dstore.observe(uri, self.__react_to_cache_networks)
-        self.agent.logger.info(
+        self.logger.info(
             'startRuntime()', ' bridge-utils Plugin - Observing {}'.format(uri))
 
     def create_virtual_interface(self, name, uuid):
@@ -107,12 +107,12 @@ class brctl(NetworkPlugin):
 
     def create_virtual_network(self, network_name, net_uuid, ip_range=None, has_dhcp=False, gateway=None, manifest=None):
 
-        self.agent.logger.info('create_virtual_network()',
-                               'Parameters network_name:{} net_uudi:{} ip_range:{} has_dhcp:{} gateway:{} manifest:{}'.format(network_name, net_uuid, ip_range, has_dhcp, gateway, manifest))
+        self.logger.info('create_virtual_network()',
+                         'Parameters network_name:{} net_uudi:{} ip_range:{} has_dhcp:{} gateway:{} manifest:{}'.format(network_name, net_uuid, ip_range, has_dhcp, gateway, manifest))
 
         net = self.netmap.get(net_uuid, None)
         if net is not None:
-            self.agent.logger.error(
+            self.logger.error(
                 'create_virtual_network()', '{} network already exists'.format(net_uuid))
             return None
 
@@ -178,8 +178,8 @@ class brctl(NetworkPlugin):
         uri = 'networks/{}'.format(net_uuid)
         self.__update_actual_store(uri, info)
 
-        self.agent.logger.info('createVirtualNetwork()',
-                               'Created {} Network'.format(net_uuid))
+        self.logger.info('createVirtualNetwork()',
+                         'Created {} Network'.format(net_uuid))
 
         return network_name, net_uuid
 
@@ -271,8 +271,8 @@ class brctl(NetworkPlugin):
         uri = 'networks/{}'.format(network_uuid)
         self.__pop_actual_store(uri)
 
-        self.agent.logger.info('deleteVirtualNetwork()',
-                               'Deleted {}'.format(network_uuid))
+        self.logger.info('deleteVirtualNetwork()',
+                         'Deleted {}'.format(network_uuid))
 
         return True
 
@@ -335,8 +335,8 @@ class brctl(NetworkPlugin):
         return '.'.join(net_start) + '/' + self.__get_net_size(mask)
 
     def __react_to_cache_networks(self, key, value, v):
-        self.agent.logger.info('__react_to_cache_networks()',
-                               ' BRCTL Plugin - React to to URI: {} Value: {} Version: {}'.format(key, value, v))
+        self.logger.debug('__react_to_cache_networks()',
+                               ' BRCTL Plugin - React to to URI: %s Value: %s Version: %s', key, value, v)
         uuid = key.split('/')[-1]
         value = json.loads(value)
         action = value.get('status')
@@ -370,15 +370,12 @@ class brctl(NetworkPlugin):
 
     def __generate_vxlan_shutdown_script(self, net_uuid):
 
-        template_sh = self.agent.get_os_plugin().read_file(
-            os.path.join(self.DIR, 'templates', 'vxlan_destroy.sh'))
         br_name = 'br-{}'.format(net_uuid.split('-')[0])
         vxlan_name = 'vxl-{}'.format(net_uuid.split('-')[0])
         file_name = '{}_dnsmasq.pid'.format(br_name)
         pid_file_path = os.path.join(self.BASE_DIR, self.DHCP_DIR, file_name)
-        net_sh = Environment().from_string(template_sh)
-        net_sh = net_sh.render(
-            bridge=br_name, vxlan_intf_name=vxlan_name, dnsmasq_pid_file=pid_file_path)
+        net_sh = self.render_template(os.path.join(self.DIR, 'templates', 'vxlan_destroy.sh'),
+                                      bridge=br_name, vxlan_intf_name=vxlan_name, dnsmasq_pid_file=pid_file_path)
 
         file_name = '{}_stop.sh'.format(br_name)
         self.agent.get_os_plugin().store_file(net_sh, self.BASE_DIR, file_name)
@@ -389,11 +386,8 @@ class brctl(NetworkPlugin):
         return file_name
 
     def __generate_dnsmaq_script(self, br_name, start_addr, end_addr, listen_addr, pid_file):
-        template_sh = self.agent.get_os_plugin().read_file(
-            os.path.join(self.DIR, 'templates', 'dnsmasq.sh'))
-        dnsmasq_sh = Environment().from_string(template_sh)
-        dnsmasq_sh = dnsmasq_sh.render(bridge_name=br_name, dhcp_start=start_addr,
-                                       dhcp_end=end_addr, listen_addr=listen_addr, pid_path=pid_file)
+        dnsmasq_sh = self.render_template(os.path.join(self.DIR, 'templates', 'dnsmasq.sh'), bridge_name=br_name,
+                                          dhcp_start=start_addr, dhcp_end=end_addr, listen_addr=listen_addr, pid_path=pid_file)
         file_name = '{}_dnsmasq.sh'.format(br_name)
         path = os.path.join(self.BASE_DIR, self.DHCP_DIR)
         self.agent.get_os_plugin().store_file(dnsmasq_sh, path, file_name)
@@ -404,12 +398,9 @@ class brctl(NetworkPlugin):
 
     def __generate_vxlan_script(self, net_uuid, manifest=None):
         if not self.overlay_interface:
-            template_sh = self.agent.get_os_plugin().read_file(
-                os.path.join(self.DIR, 'templates', 'vxlan_creation.sh'))
+            template_sh = os.path.join(self.DIR, 'templates', 'vxlan_creation.sh')
         else:
-            template_sh = self.agent.get_os_plugin().read_file(
-                os.path.join(self.DIR, 'templates', 'vxlan_creation_intf.sh'))
-        net_sh = Environment().from_string(template_sh)
+            template_sh = os.path.join(self.DIR, 'templates', 'vxlan_creation_intf.sh')
         br_name = 'br-{}'.format(net_uuid.split('-')[0])
         vxlan_name = 'vxl-{}'.format(net_uuid.split('-')[0])
 
@@ -427,8 +418,8 @@ class brctl(NetworkPlugin):
             vxlan_id = len(self.netmap) + 1
             mcast_addr = '239.0.0.{}'.format(vxlan_id)
 
-        net_sh = net_sh.render(bridge_name=br_name, vxlan_intf_name=vxlan_name,
-                               group_id=vxlan_id, mcast_group_address=mcast_addr, wan=self.overlay_interface)
+        net_sh = self.render_template(template_sh, bridge_name=br_name, vxlan_intf_name=vxlan_name,
+                                      group_id=vxlan_id, mcast_group_address=mcast_addr, wan=self.overlay_interface)
         self.agent.get_os_plugin().store_file(net_sh, self.BASE_DIR,
                                               '{}.sh'.format(net_uuid.split('-')[0]))
         chmod_cmd = 'chmod +x {}'.format(os.path.join(
@@ -21,6 +21,8 @@ from fog05.interfaces.Entity import Entity
 
 class DockEntity(Entity):
 
+    __slots__ = ('image_url', 'ports_mappings', 'image', 'conf')
+
     def __init__(self, uuid, name, image, ports_mappings):
 
         super(DockEntity, self).__init__()
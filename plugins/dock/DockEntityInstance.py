@@ -21,6 +21,8 @@ from fog05.interfaces.EntityInstance import EntityInstance
 
 class DockEntityInstance(EntityInstance):
 
+    __slots__ = ('image', 'ports_mappings', 'cid', 'conf')
+
     def __init__(self, uuid, name, image, ports_mappings, entity_uuid):
 
         super(DockEntityInstance, self).__init__(uuid, entity_uuid)
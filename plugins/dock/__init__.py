@@ -15,13 +15,13 @@
 import sys
 import os
 file_dir = os.path.dirname(__file__)
-sys.path.append(os.path.abspath(file_dir))
+if os.path.abspath(file_dir) not in sys.path:
+    sys.path.append(os.path.abspath(file_dir))
 
 VERSION = 1
 
 
 def run(*args, **kwargs):
-    sys.path.append(os.path.join(sys.path[0], 'plugins', 'dock'))
     from dock_plugin import Dock
     dock = Dock('docker', VERSION, kwargs.get('agent'), kwargs.get('uuid'))
     return dock
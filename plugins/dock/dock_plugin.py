@@ -16,8 +16,10 @@
 import sys
 import os
 import uuid
+import copy
 from packaging import version
-from fog05.interfaces.States import State
+from fog05.interfaces.States import State, STATUS
+from fog05 import Tracing
 from fog05.interfaces.RuntimePlugin import *
 from DockEntity import DockEntity
 from DockEntityInstance import DockEntityInstance
@@ -39,7 +41,8 @@ class Dock(RuntimePlugin):
         super(Dock, self).__init__(version, plugin_uuid)
         self.name = name
         self.agent = agent
-        self.agent.logger.info('__init__()', ' Hello from Docker Plugin')
+        self.logger = self.agent.logger.component(name)
+        self.logger.info('__init__()', ' Hello from Docker Plugin')
         self.BASE_DIR = '/opt/fos/docker'
         self.DISK_DIR = 'disks'
         self.IMAGE_DIR = 'images'
@@ -56,26 +59,28 @@ class Dock(RuntimePlugin):
         self.images = {}
         self.flavors = {}
         self.mon_th = {}
+        self.entities_info = {}
+        self.instances_info = {}
         self.start_runtime()
 
     def start_runtime(self):
-        self.agent.logger.info(
+        self.logger.info(
             'startRuntime()', ' Docker Plugin - Connecting to Docker')
         self.conn = docker.from_env()
-        self.agent.logger.info(
+        self.logger.info(
             'startRuntime()', '[ DONE ] Docker Plugin - Connecting to Docker')
         uri = '{}/{}/**'.format(self.agent.dhome, self.HOME)
-        self.agent.logger.info(
+        self.logger.info(
             'startRuntime()', ' Docker Plugin - Observing {} for entity'.format(uri))
-        self.agent.dstore.observe(uri, self.__react_to_cache_entity)
+        self.agent.dstore.observe(uri, Tracing.traced(self.__react_to_cache_entity))
 
         # uri = '{}/{}/**'.format(self.agent.dhome, self.HOME_FLAVOR)
-        # self.agent.logger.info(
+        # self.logger.info(
         #     'startRuntime()', ' Docker Plugin - Observing {} for flavor'.format(uri))
         # self.agent.dstore.observe(uri, self.__react_to_cache_flavor)
 
         # uri = '{}/{}/**'.format(self.agent.dhome, self.HOME_IMAGE)
-        # self.agent.logger.info(
+        # self.logger.info(
         #     'startRuntime()', ' Docker Plugin - Observing {} for image'.format(uri))
         # self.agent.dstore.observe(uri, self.__react_to_cache_image)
 
@@ -102,11 +107,11 @@ class Dock(RuntimePlugin):
         return self.uuid
 
     def stop_runtime(self):
-        self.agent.logger.info(
+        self.logger.info(
             'stopRuntime()', 'Docker Plugin - Destroying {} running domains'.format(len(self.current_entities)))
         keys = list(self.current_entities.keys())
         for k in keys:
-            self.agent.logger.info('stopRuntime()', 'Stopping {}'.format(k))
+            self.logger.info('stopRuntime()', 'Stopping {}'.format(k))
             entity = self.current_entities.get(k)
             for i in list(entity.instances.keys()):
                 self.__force_entity_instance_termination(k, i)
@@ -114,19 +119,66 @@ class Dock(RuntimePlugin):
                 self.undefine_entity(k)
         keys = list(self.images.keys())
         for k in keys:
-            self.agent.logger.info(
+            self.logger.info(
                 'stopRuntime()', 'Removing Image {}'.format(k))
             try:
                 img = self.images.get(k)
                 self.conn.images.remove(img.get('docker_name'))
             except Exception as e:
-                self.agent.logger.error('stopRuntime()', 'Error {}'.format(e))
+                self.logger.error('stopRuntime()', 'Error {}'.format(e))
                 pass
 
         self.conn = None
-        self.agent.logger.info(
+        self.logger.info(
             'stopRuntime()', '[ DONE ] Docker Plugin - Bye Bye')
 
+    def restore_runtime(self):
+        if self.agent.state is None:
+            return
+        self.logger.info('restore_runtime()', ' Docker Plugin - Restoring state from local snapshot')
+        for k, img in self.agent.state.get_all(self.uuid, 'image').items():
+            try:
+                self.conn.images.get(img.get('docker_name'))
+                self.images.update({k: img})
+            except Exception as e:
+                self.logger.warning('restore_runtime()', '[ WARN ] Docker Plugin - Image {} is gone, dropping it'.format(k))
+                self.agent.state.remove(self.uuid, 'image', k)
+
+        for k, record in self.agent.state.get_all(self.uuid, 'entity').items():
+            data = record.get('data')
+            entity = DockEntity(k, data.get('name'), data.get('image_url'), data.get('ports_mappings'))
+            entity.image = data.get('image')
+            entity.set_state(State.DEFINED)
+            self.current_entities.update({k: entity})
+            self.__update_actual_store(k, record.get('info'))
+
+        containers = dict((c.name, c) for c in self.conn.containers.list(all=True))
+        for k, record in self.agent.state.get_all(self.uuid, 'instance').items():
+            entity_uuid = record.get('entity_uuid')
+            entity = self.current_entities.get(entity_uuid, None)
+            if entity is None:
+                self.logger.warning('restore_runtime()', '[ WARN ] Docker Plugin - Instance {} is gone, dropping it'.format(k))
+                self.agent.state.remove(self.uuid, 'instance', k)
+                continue
+            data = record.get('data')
+            instance = DockEntityInstance(k, data.get('name'), entity.shared('image', data.get('image')),
+                                          entity.shared('ports_mappings', data.get('ports_mappings')), entity_uuid)
+            c = containers.get(instance.name, None)
+            if c is not None and c.status == 'running':
+                instance.on_start(c)
+            elif c is not None and c.status == 'paused':
+                instance.on_start(c)
+                instance.on_pause()
+            entity.add_instance(instance)
+            state = instance.get_state()
+            info = record.get('info')
+            if state.name != record.get('state'):
+                self.logger.info('restore_runtime()', ' Docker Plugin - Instance {} was {} now is {}'.format(k, record.get('state'), state.name))
+                info.update({'status': {State.RUNNING: 'run', State.PAUSED: 'pause'}.get(state, 'stop')})
+            self.__update_actual_store_instance(entity_uuid, k, info)
+
+        self.logger.info('restore_runtime()', '[ DONE ] Docker Plugin - Restored {} entities'.format(len(self.current_entities)))
+
     def get_entities(self):
         return self.current_entities
 
@@ -135,7 +187,7 @@ class Dock(RuntimePlugin):
         Try defining vm
         generating xml from templates/vm.xml with jinja2
         '''
-        self.agent.logger.info(
+        self.logger.info(
             'defineEntity()', ' Docker Plugin - Defining a Container')
         if len(args) > 0:
             entity_uuid = args[4]
@@ -148,19 +200,19 @@ class Dock(RuntimePlugin):
                 'base_image'), kwargs.get('port-mappings'))
         else:
             return None
-        self.agent.logger.info('defineEntity()', ' Docker Plugin - Atomic Entity UUID: {}'.format(entity_uuid))
+        self.logger.info('defineEntity()', ' Docker Plugin - Atomic Entity UUID: {}'.format(entity_uuid))
         if entity.image_url.startswith('file://'):
             image_name = os.path.join(self.BASE_DIR, self.IMAGE_DIR, entity.image_url.split('/')[-1])
             cmd = 'cp {} {}'.format(
                 entity.image_url[len('file://'):], image_name)
             self.agent.get_os_plugin().execute_command(cmd, True)
-            self.agent.logger.info('defineEntity()', '[ INFO ] LXD Plugin - Loading image data from: {}'.format(
+            self.logger.info('defineEntity()', '[ INFO ] LXD Plugin - Loading image data from: {}'.format(
                 os.path.join(self.BASE_DIR, self.IMAGE_DIR, image_name)))
             image_name = os.path.join(
                 self.BASE_DIR, self.IMAGE_DIR, image_name)
             img_data = self.agent.get_os_plugin().read_binary_file(image_name)
             img = self.conn.images.load(img_data)[0]
-            self.agent.logger.info('defineEntity()', '[ DONE ] Docker Plugin - Created image with tags {}'.format(img.tags[0]))
+            self.logger.info('defineEntity()', '[ DONE ] Docker Plugin - Created image with tags {}'.format(img.tags[0]))
             img_info = {}
             img_info.update({'uuid': entity_uuid})
             img_info.update({'name': '{}_img'.format(entity.name)})
@@ -170,7 +222,7 @@ class Dock(RuntimePlugin):
             img_info.update({'format': '.'.join(image_name.split('.')[-2:])})
 
         elif entity.image_url.startswith('http'):
-            self.agent.logger.Error(
+            self.logger.Error(
                  'defineEntity()', 'Error image can be local file or name!')
         else:
             img = self.conn.images.get(entity.image_url)
@@ -184,280 +236,191 @@ class Dock(RuntimePlugin):
             
         entity.image = img_info
         self.images.update({entity_uuid: img_info})
+        self.__save_state('image', entity_uuid, img_info)
         uri = '{}/{}'.format(self.HOME_IMAGE, entity_uuid)
         self.__update_actual_store(uri, img_info)
 
            
 
         entity.image = img_info
+        t = self.states.begin('define', entity, entity_uuid)
         entity.set_state(State.DEFINED)
         
         uri = '{}/{}/{}'.format(self.agent.dhome, self.HOME, entity_uuid)
         docker_info = json.loads(self.agent.dstore.get(uri))
         e_data = docker_info.get('entity_data')
         e_data.update({'base_image': img_info.get('docker_name')})
-        docker_info.update({'status': 'defined'})
+        docker_info.update({'status': STATUS.get('define')})
         docker_info.update({'entity_data': e_data})
         self.current_entities.update({entity_uuid: entity})
         self.__update_actual_store(entity_uuid, docker_info)
-        self.agent.logger.info('defineEntity()', '[ DONE ] Docker Plugin - Container uuid: {}'.format(entity_uuid))
+        self.entities_info.update({entity_uuid: docker_info})
+        data = {'name': entity.name, 'image_url': entity.image_url, 'ports_mappings': entity.ports_mappings,
+                'image': entity.image}
+        self.__save_state('entity', entity_uuid, {'data': data, 'info': docker_info})
+        self.states.commit(t)
+        self.logger.info('defineEntity()', '[ DONE ] Docker Plugin - Container uuid: {}'.format(entity_uuid))
         return entity_uuid
 
     def undefine_entity(self, entity_uuid):
 
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('undefineEntity()', ' Docker Plugin - Undefine a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('undefineEntity()', 'Docker Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('undefineEntity()', 'Docker Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            for i in list(entity.instances.keys()):
-                self.__force_entity_instance_termination(entity_uuid, i)
-            
-            if entity.image.get('format') != 'docker':
-                img = entity.image.get('docker_name')
-                self.conn.images.remove(img)
-            self.current_entities.pop(entity_uuid, None)
-            # self.agent.get_os_plugin().remove_file(os.path.join(self.BASE_DIR, self.IMAGE_DIR, entity.image.get('base_image')))
-            self.__pop_actual_store(entity_uuid)
-            self.agent.logger.info('undefineEntity()', '[ DONE ] Docker Plugin - Undefine a Container uuid {}'.format(entity_uuid))
-            return True
+        self.logger.info('undefineEntity()', ' Docker Plugin - Undefine a Container uuid {}'.format(entity_uuid))
+        entity = self.__get_entity('undefineEntity()', entity_uuid)
+        t = self.states.begin('undefine', entity, entity_uuid)
+        for i in list(entity.instances.keys()):
+            self.__force_entity_instance_termination(entity_uuid, i)
+        
+        if entity.image.get('format') != 'docker':
+            img = entity.image.get('docker_name')
+            self.conn.images.remove(img)
+            self.images.pop(entity_uuid, None)
+            self.__drop_state('image', entity_uuid)
+        self.current_entities.pop(entity_uuid, None)
+        self.entities_info.pop(entity_uuid, None)
+        self.__drop_state('entity', entity_uuid)
+        # self.agent.get_os_plugin().remove_file(os.path.join(self.BASE_DIR, self.IMAGE_DIR, entity.image.get('base_image')))
+        self.__pop_actual_store(entity_uuid)
+        self.states.commit(t)
+        self.logger.info('undefineEntity()', '[ DONE ] Docker Plugin - Undefine a Container uuid {}'.format(entity_uuid))
+        return True
 
     def configure_entity(self, entity_uuid, instance_uuid=None):
 
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('configureEntity()', ' Docker Plugin - Configure a Container uuid {} '.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('configureEntity()', 'Docker Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('configureEntity()', 'Docker Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
+        self.logger.info('configureEntity()', ' Docker Plugin - Configure a Container uuid {} '.format(entity_uuid))
+        entity = self.__get_entity('configureEntity()', entity_uuid)
 
-            ''' 
-                See if is possible to:
-                - Put rootfs and images inside a custom path
-            '''
+        ''' 
+            See if is possible to:
+            - Put rootfs and images inside a custom path
+        '''
 
-            if instance_uuid is None:
-                instance_uuid = str(uuid.uuid4())
+        if instance_uuid is None:
+            instance_uuid = str(uuid.uuid4())
 
-            if entity.has_instance(instance_uuid):
-                print('This instance already existis!!')
-            else:
-                id = len(entity.instances)
-                name = '{0}{1}'.format(entity.name, id)
-                instance = DockEntityInstance(instance_uuid, name, entity.image,entity.ports_mappings, entity_uuid)
+        if entity.has_instance(instance_uuid):
+            print('This instance already existis!!')
+        else:
+            t = self.states.begin('configure', None, entity_uuid, instance_uuid)
+            id = len(entity.instances)
+            name = '{0}{1}'.format(entity.name, id)
+            instance = DockEntityInstance(instance_uuid, name, entity.image,entity.ports_mappings, entity_uuid)
 
-                entity.add_instance(instance)
+            entity.add_instance(instance)
 
-                self.current_entities.update({entity_uuid: entity})
+            self.current_entities.update({entity_uuid: entity})
 
-                uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid)
-                container_info = json.loads(self.agent.astore.get(uri))
-                container_info.update({'status': 'configured'})
-                container_info.update({'name': name})
-                e_data = container_info.get('entity_data')
-                e_data.update({'name': name})
-                container_info.update({'entity_data': e_data})
+            container_info = self.__actual_info(entity_uuid)
+            container_info.update({'status': STATUS.get('configure')})
+            container_info.update({'name': name})
+            e_data = container_info.get('entity_data')
+            e_data.update({'name': name})
+            container_info.update({'entity_data': e_data})
 
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                self.agent.logger.info('configureEntity()', '[ DONE ] Docker Plugin - Configure a Container uuid {}'.format(instance_uuid))
-                return True
+            self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
+            self.states.commit(t, instance)
+            self.logger.info('configureEntity()', '[ DONE ] Docker Plugin - Configure a Container uuid {}'.format(instance_uuid))
+            return True
 
     def clean_entity(self, entity_uuid, instance_uuid=None):
 
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('clean_entity()', ' Docker Plugin - Clean a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('clean_entity()', 'Docker Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('clean_entity()', 'Docker Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('clean_entity()', 'Docker Plugin - Instance not found!!')
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.CONFIGURED:
-                    self.agent.logger.error('clean_entity()',
-                                            'Docker Plugin - Instance state is wrong, or transition not allowed')
-                    raise StateTransitionNotAllowedException('Instance is not in CONFIGURED state',
-                                                             'Instance {} is not in CONFIGURED state'.format(instance_uuid))
-                else:
-                    self.agent.logger.info('clean_entity()', '{}'.format(instance))
-                        
-                    instance.on_clean()
-                    entity.remove_instance(instance)
-                    self.current_entities.update({entity_uuid: entity})
+        self.logger.info('clean_entity()', ' Docker Plugin - Clean a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('clean_entity()', entity_uuid, instance_uuid)
+        if instance is not None:
+            t = self.__begin_transition('clean_entity()', 'clean', entity_uuid, instance_uuid, instance)
+            self.logger.info('clean_entity()', '{}'.format(instance))
 
-                    self.__pop_actual_store_instance(entity_uuid, instance_uuid)
-                    self.agent.logger.info('clean_entity()', '[ DONE ] Docker Plugin - Clean a Container uuid {} '.format(instance_uuid))
+            instance.on_clean()
+            entity.remove_instance(instance)
+            self.current_entities.update({entity_uuid: entity})
 
-            return True
+            self.__pop_actual_store_instance(entity_uuid, instance_uuid)
+            self.states.commit(t)
+            self.logger.info('clean_entity()', '[ DONE ] Docker Plugin - Clean a Container uuid {} '.format(instance_uuid))
+
+        return True
 
     def run_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('run_entity()', ' Docker Plugin - Starting a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('run_entity()', 'Docker Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('run_entity()', 'Docker Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            instance = entity.get_instance(instance_uuid)
-            if instance.get_state() == State.RUNNING:
-                self.agent.logger.error('run_entity()',
-                                        'Docker Plugin - Instance already running')
-                return True
-            if instance.get_state() != State.CONFIGURED:
-                self.agent.logger.error('clean_entity()',
-                                        'Docker Plugin - Instance state is wrong, or transition not allowed')
-                raise StateTransitionNotAllowedException('Instance is not in CONFIGURED state',
-                                                         'Instance {} is not in CONFIGURED state'.format(instance_uuid))
-            else:
-                uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
-                container_info = json.loads(self.agent.astore.get(uri))
-                container_info.update({'status': 'starting'})
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                self.current_entities.update({entity_uuid: entity})
-
-                image_name = instance.image.get('docker_name')
-                pm = {}
-                if instance.ports_mappings is not None:
-                    for k in instance.ports_mappings:
-                        v = instance.ports_mappings.get(k)
-                        pm.update({int(k): v})
-                # ports = list(pm.keys())
-                # hc = self.conn.create_host_config(port_bindings=pm)
-                self.agent.logger.info('run_entity()', '[ INFO ] IMAGE: {}'.format(image_name))
-                self.agent.logger.info('run_entity()', '[ INFO ] PORTS: {}'.format(pm))
-                # self.agent.logger.info('run_entity()', '[ INFO ] Host Config: {}'.format(hc))
-                cid = self.conn.containers.run(image_name, ports=pm, name=instance.name, detach = True)
-                # cid = self.conn.create_container(image=image_name, ports=ports, host_config=hc, name=instance.name)
-                # self.conn.start(cid)
-                instance.on_start(cid)
-
-                container_info = json.loads(self.agent.astore.get(uri))
-                container_info.update({'status': 'run'})
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                self.current_entities.update({entity_uuid: entity})
-                self.agent.logger.info('run_entity()', '[ DONE ] Docker Plugin - Starting a Container uuid {}'.format(instance_uuid))
-
+        self.logger.info('run_entity()', ' Docker Plugin - Starting a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('run_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return True
+        if instance.get_state() == State.RUNNING:
+            self.logger.error('run_entity()', 'Docker Plugin - Instance already running')
             return True
+        t = self.__begin_transition('run_entity()', 'run', entity_uuid, instance_uuid, instance)
+        container_info = self.__actual_info(entity_uuid, instance_uuid)
+        container_info.update({'status': 'starting'})
+        self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
+        self.current_entities.update({entity_uuid: entity})
+
+        image_name = instance.image.get('docker_name')
+        pm = {}
+        if instance.ports_mappings is not None:
+            for k in instance.ports_mappings:
+                v = instance.ports_mappings.get(k)
+                pm.update({int(k): v})
+        # ports = list(pm.keys())
+        # hc = self.conn.create_host_config(port_bindings=pm)
+        self.logger.info('run_entity()', '[ INFO ] IMAGE: {}'.format(image_name))
+        self.logger.info('run_entity()', '[ INFO ] PORTS: {}'.format(pm))
+        # self.logger.info('run_entity()', '[ INFO ] Host Config: {}'.format(hc))
+        cid = self.conn.containers.run(image_name, ports=pm, name=instance.name, detach = True)
+        # cid = self.conn.create_container(image=image_name, ports=ports, host_config=hc, name=instance.name)
+        # self.conn.start(cid)
+        instance.on_start(cid)
+
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.current_entities.update({entity_uuid: entity})
+        self.logger.info('run_entity()', '[ DONE ] Docker Plugin - Starting a Container uuid {}'.format(instance_uuid))
+        return True
 
     def stop_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('stop_entity()', ' Docker Plugin - Stop a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('stop_entity()', 'Docker Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('stop_entity()', 'Docker Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in RUNNING state'.format(entity_uuid))
-        else:
-            instance = entity.get_instance(instance_uuid)
-            if instance.get_state() != State.RUNNING:
-                self.agent.logger.error('clean_entity()',
-                                        'Docker Plugin - Instance state is wrong, or transition not allowed')
-                raise StateTransitionNotAllowedException('Instance is not in RUNNING state',
-                                                         'Instance {} is not in RUNNING state'.format(entity_uuid))
-            else:
-
-                instance.cid.stop()
-                instance.cid.remove()
+        self.logger.info('stop_entity()', ' Docker Plugin - Stop a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('stop_entity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return True
+        t = self.__begin_transition('stop_entity()', 'stop', entity_uuid, instance_uuid, instance)
 
-                instance.on_stop()
-                self.current_entities.update({entity_uuid: entity})
+        instance.cid.stop()
+        instance.cid.remove()
 
-                uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
-                container_info = json.loads(self.agent.astore.get(uri))
-                container_info.update({'status': 'stop'})
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
-                self.agent.logger.info('stop_entity()', '[ DONE ] Docker Plugin - Stop a Container uuid {}'.format(entity_uuid))
+        instance.on_stop()
+        self.current_entities.update({entity_uuid: entity})
 
-            return True
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.logger.info('stop_entity()', '[ DONE ] Docker Plugin - Stop a Container uuid {}'.format(entity_uuid))
+        return True
 
     def pause_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('pause_entity()', ' Docker Plugin - Pause a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('pause_entity()', 'Docker Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('pause_entity()', 'Docker Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'Docker Plugin - Instance not found!!')
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.RUNNING:
-                    self.agent.logger.error('clean_entity()',
-                                            'Docker Plugin - Instance state is wrong, or transition not allowed')
-                    raise StateTransitionNotAllowedException('Instance is not in RUNNING state',
-
-                                                             'Instance {} is not in RUNNING state'.format(instance_uuid))
-                else:
-                    self.agent.logger.info('pause_entity()', '[ DONE ] Docker Plugin - Pause a Container uuid {}'.format(instance_uuid))
-                    return True
+        self.logger.info('pause_entity()', ' Docker Plugin - Pause a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('pause_entity()', entity_uuid, instance_uuid)
+        if instance is not None:
+            # containers are not frozen yet, the transition is only checked and never committed
+            self.__begin_transition('pause_entity()', 'pause', entity_uuid, instance_uuid, instance)
+            self.logger.info('pause_entity()', '[ DONE ] Docker Plugin - Pause a Container uuid {}'.format(instance_uuid))
+            return True
 
     def resume_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('resume_entity()', ' Docker Plugin - Resume a Container uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('resume_entity()', 'Docker Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('resume_entity()', 'Docker Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'Docker Plugin - Instance not found!!')
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance.get_state() != State.PAUSED:
-                    self.agent.logger.error('clean_entity()',
-                                            'Docker Plugin - Instance state is wrong, or transition not allowed')
-                    raise StateTransitionNotAllowedException('Instance is not in PAUSED state',
-                                                             'Instance {} is not in PAUSED state'.format(instance_uuid))
-                else:
-                    self.agent.logger.info('resume_entity()', '[ DONE ] Docker Plugin - Resume a Container uuid {}'.format(instance_uuid))
-            return True
+        self.logger.info('resume_entity()', ' Docker Plugin - Resume a Container uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('resume_entity()', entity_uuid, instance_uuid)
+        if instance is not None:
+            self.__begin_transition('resume_entity()', 'resume', entity_uuid, instance_uuid, instance)
+            self.logger.info('resume_entity()', '[ DONE ] Docker Plugin - Resume a Container uuid {}'.format(instance_uuid))
+        return True
 
     def migrate_entity(self, entity_uuid, dst=False, instance_uuid=None):
         raise NotImplementedError
@@ -469,7 +432,7 @@ class Dock(RuntimePlugin):
         raise NotImplementedError
 
     def __react_to_cache_entity(self, uri, value, v):
-        self.agent.logger.info('__react_to_cache()', ' Docker Plugin - React to to URI: {} Value: {} Version: {}'.format(uri, value, v))
+        self.logger.debug('__react_to_cache()', ' Docker Plugin - React to to URI: %s Value: %s Version: %s', uri, value, v)
         if uri.split('/')[-2] == 'entity':
             uuid = uri.split('/')[-1]
             value = json.loads(value)
@@ -499,7 +462,7 @@ class Dock(RuntimePlugin):
             elif react_func is not None:
                 entity_data.update({'entity_uuid': entity_uuid})
                 if action in ['landing', 'taking_off']:
-                    self.agent.logger.warning('__react_to_cache_entity()', 'ACTION = {}'.format(action))
+                    self.logger.warning('__react_to_cache_entity()', 'ACTION = {}'.format(action))
                     react_func(entity_data, dst=True, instance_uuid=instance_uuid)
                 else:
                     react_func(entity_data, instance_uuid=instance_uuid)
@@ -507,7 +470,7 @@ class Dock(RuntimePlugin):
 
     def __update_actual_store(self, uri, value):
         uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, uri)
-        value = json.dumps(value)
+        value = json.dumps(Tracing.stamp(value))
         self.agent.astore.put(uri, value)
 
     def __pop_actual_store(self, uri, ):
@@ -515,24 +478,83 @@ class Dock(RuntimePlugin):
         self.agent.astore.remove(uri)
 
     def __update_actual_store_instance(self, entity_uuid, instance_uuid, value):
+        entity = self.current_entities.get(entity_uuid, None)
+        if entity is not None and entity.has_instance(instance_uuid):
+            instance = entity.get_instance(instance_uuid)
+            data = {'name': instance.name, 'image': instance.image, 'ports_mappings': instance.ports_mappings}
+            self.__save_state('instance', instance_uuid, {'entity_uuid': entity_uuid, 'data': data,
+                                                          'state': instance.get_state().name, 'info': value})
+        self.instances_info.update({instance_uuid: value})
         uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
-        value = json.dumps(value)
+        value = json.dumps(Tracing.stamp(value))
         self.agent.astore.put(uri, value)
 
     def __pop_actual_store_instance(self, entity_uuid, instance_uuid, ):
+        self.__drop_state('instance', instance_uuid)
+        self.instances_info.pop(instance_uuid, None)
         uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
         self.agent.astore.remove(uri)
 
+    def __save_state(self, kind, key, value):
+        if self.agent.state is not None:
+            self.agent.state.put(self.uuid, kind, key, value)
+
+    def __drop_state(self, kind, key):
+        if self.agent.state is not None:
+            self.agent.state.remove(self.uuid, kind, key)
+
+    def __get_entity(self, caller, entity_uuid):
+        entity = self.current_entities.get(entity_uuid, None)
+        if entity is None:
+            self.logger.error(caller, 'Docker Plugin - Entity not exists')
+            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
+        if entity.get_state() != State.DEFINED:
+            self.logger.error(caller, 'Docker Plugin - Entity state is wrong, or transition not allowed')
+            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
+        return entity
+
+    def __get_instance(self, caller, entity_uuid, instance_uuid):
+        entity = self.__get_entity(caller, entity_uuid)
+        if instance_uuid is None or not entity.has_instance(instance_uuid):
+            self.logger.error(caller, 'Docker Plugin - Instance not found!!')
+            return entity, None
+        return entity, entity.get_instance(instance_uuid)
+
+    def __begin_transition(self, caller, action, entity_uuid, instance_uuid, instance):
+        try:
+            return self.states.begin(action, instance, entity_uuid, instance_uuid)
+        except StateTransitionNotAllowedException:
+            self.logger.error(caller, 'Docker Plugin - Instance state is wrong, or transition not allowed')
+            raise
+
+    def __commit_transition(self, entity_uuid, instance_uuid, transition):
+        # the status is merged in the last document written for the instance and put once
+        container_info = self.__actual_info(entity_uuid, instance_uuid)
+        container_info.update({'status': STATUS.get(transition.action)})
+        self.__update_actual_store_instance(entity_uuid, instance_uuid, container_info)
+        self.states.commit(transition)
+
+    def __actual_info(self, entity_uuid, instance_uuid=None):
+        if instance_uuid is None:
+            info = self.entities_info.get(entity_uuid, None)
+            uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid)
+        else:
+            info = self.instances_info.get(instance_uuid, None)
+            uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
+        if info is None:
+            return json.loads(self.agent.astore.get(uri))
+        return copy.deepcopy(info)
+
     def __force_entity_instance_termination(self, entity_uuid, instance_uuid):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('stop_entity()', ' Docker Plugin - Stop a container uuid {}'.format(entity_uuid))
+        self.logger.info('stop_entity()', ' Docker Plugin - Stop a container uuid {}'.format(entity_uuid))
         entity = self.current_entities.get(entity_uuid, None)
         if entity is None:
-            self.agent.logger.error('stop_entity()', 'Docker Plugin - Entity not exists')
+            self.logger.error('stop_entity()', 'Docker Plugin - Entity not exists')
         else:
             if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('run_entity()', 'Docker Plugin - Instance not found!!')
+                self.logger.error('run_entity()', 'Docker Plugin - Instance not found!!')
             else:
                 instance = entity.get_instance(instance_uuid)
                 if instance.get_state() == State.PAUSED:
@@ -18,7 +18,8 @@ import os
 import uuid
 
 file_dir = os.path.dirname(__file__)
-sys.path.append(os.path.abspath(file_dir))
+if os.path.abspath(file_dir) not in sys.path:
+    sys.path.append(os.path.abspath(file_dir))
 VERSION = 1
 
 def run(*args,**kwargs):
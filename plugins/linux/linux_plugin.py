@@ -46,7 +46,8 @@ class Linux(OSPlugin):
         self.name = name
         self.pm = None
         self.agent = agent
-        self.agent.logger.info('__init__()', ' Hello from GNU\Linux Plugin')
+        self.logger = self.agent.logger.component(name)
+        self.logger.info('__init__()', ' Hello from GNU\Linux Plugin')
         file_dir = os.path.dirname(__file__)
         self.DIR = os.path.abspath(file_dir)
         self.distro = self.__check_distro()
@@ -54,11 +55,11 @@ class Linux(OSPlugin):
         self.nw_devices = []
         self.accelerator_devices = []
         if self.distro == '':
-            self.agent.logger.warning('__init__()', 'Distribution not recognized, cannot install packages')
+            self.logger.warning('__init__()', 'Distribution not recognized, cannot install packages')
         else:
-            self.agent.logger.info('__init__()', ' Running on {}'.format(self.distro))
+            self.logger.info('__init__()', ' Running on {}'.format(self.distro))
             self.pm = self.__get_package_manager(self.distro)
-            self.agent.logger.info('__init__()', ' Package manger {} loaded! '.format(self.pm.name))
+            self.logger.info('__init__()', ' Package manger {} loaded! '.format(self.pm.name))
 
         self.io_devices = self.__get_io_devices()
         self.nw_devices = self.__get_nw_devices()
@@ -68,7 +69,7 @@ class Linux(OSPlugin):
         return '/opt/fos'
 
     def execute_command(self, command, blocking=False, external=False):
-        self.agent.logger.info('executeCommand()', 'OS Plugin executing command {}'.format(command))
+        self.logger.info('executeCommand()', 'OS Plugin executing command {}'.format(command))
         if external:
             os.system(command)
         else:
@@ -77,16 +78,16 @@ class Linux(OSPlugin):
             if blocking:
                 p.wait()
         # for line in p.stdout:
-        #     self.agent.logger.debug('executeCommand()', str(line))
+        #     self.logger.debug('executeCommand()', str(line))
         return p.communicate()[0].decode('utf-8')
 
     def add_know_host(self, hostname, ip):
-        self.agent.logger.info('addKnowHost()', ' OS Plugin add to hosts file')
+        self.logger.info('addKnowHost()', ' OS Plugin add to hosts file')
         add_cmd = 'sudo {} -a {} {}'.format(os.path.join(self.DIR, 'scripts', 'manage_hosts.sh'), hostname, ip)
         self.execute_command(add_cmd, True)
 
     def remove_know_host(self, hostname):
-        self.agent.logger.info('removeKnowHost()', ' OS Plugin remove from hosts file')
+        self.logger.info('removeKnowHost()', ' OS Plugin remove from hosts file')
         del_cmd = 'sudo {} -d {}'.format(os.path.join(self.DIR, 'scripts', 'manage_hosts.sh'), hostname)
         self.execute_command(del_cmd, True)
 
@@ -110,8 +111,8 @@ class Linux(OSPlugin):
         try:
             return os.remove(path)
         except FileNotFoundError as e:
-            self.agent.logger.error('removeFile()',
-                                    'OS Plugin File Not Found {} so don\'t need to remove'.format(e.strerror))
+            self.logger.error('removeFile()',
+                              'OS Plugin File Not Found {} so don\'t need to remove'.format(e.strerror))
             return
 
     def file_exists(self, file_path):
@@ -119,7 +120,7 @@ class Linux(OSPlugin):
 
     def store_file(self, content, file_path, filename):
         full_path = os.path.join(file_path, filename)
-        f = open(full_path, 'w')
+        f = open(full_path, 'wb' if isinstance(content, bytes) else 'w')
         f.write(content)
         f.flush()
         f.close()
@@ -166,7 +167,7 @@ class Linux(OSPlugin):
 
     def send_signal(self, signal, pid):
         if self.check_if_pid_exists(pid) is False:
-            self.agent.logger.error('sendSignal()', 'OS Plugin Process not exists {}'.format(pid))
+            self.logger.error('sendSignal()', 'OS Plugin Process not exists {}'.format(pid))
             # raise ProcessNotExistingException('Process %d not exists' % pid)
         else:
             psutil.Process(pid).send_signal(signal)
@@ -174,7 +175,7 @@ class Linux(OSPlugin):
 
     def send_sig_int(self, pid):
         if self.check_if_pid_exists(pid) is False:
-            self.agent.logger.error('sendSigInt()', 'OS Plugin Process not exists {}'.format(pid))
+            self.logger.error('sendSigInt()', 'OS Plugin Process not exists {}'.format(pid))
             # raise ProcessNotExistingException('Process %d not exists' % pid)
         else:
             psutil.Process(pid).send_signal(2)
@@ -182,7 +183,7 @@ class Linux(OSPlugin):
 
     def send_sig_kill(self, pid):
         if self.check_if_pid_exists(pid) is False:
-            self.agent.logger.error('sendSigInt()', 'OS Plugin Process not exists {}'.format(pid))
+            self.logger.error('sendSigInt()', 'OS Plugin Process not exists {}'.format(pid))
             # raise ProcessNotExistingException('Process %d not exists' % pid)
         else:
             psutil.Process(pid).send_signal(9)
@@ -356,7 +357,7 @@ class Linux(OSPlugin):
 
         default_gw = self.__get_default_gw()
         if default_gw == '':
-            self.agent.logger.warning('__get_nw_devices()', 'Default gw not found!!')
+            self.logger.warning('__get_nw_devices()', 'Default gw not found!!')
         for k in intfs:
             intf_info = psutil.net_if_addrs().get(k)
             if intf_info is not None:
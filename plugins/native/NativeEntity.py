@@ -21,6 +21,9 @@ from fog05.interfaces.Entity import Entity
 
 
 class NativeEntity(Entity):
+
+    __slots__ = ('command', 'args', 'outfile', 'pid', 'source_url', 'process', 'source')
+
     def __init__(self, uuid, name, command, source, args, outfile):
         super(NativeEntity, self).__init__()
         self.uuid = uuid
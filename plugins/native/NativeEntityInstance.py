@@ -20,6 +20,9 @@ from fog05.interfaces.States import State
 from fog05.interfaces.EntityInstance import EntityInstance
 
 class NativeEntityInstance(EntityInstance):
+
+    __slots__ = ('command', 'args', 'outfile', 'pid', 'source', 'process')
+
     def __init__(self, uuid, name, command, source, args, outfile, entity_uuid):
         super(NativeEntityInstance, self).__init__(uuid, entity_uuid)
         self.uuid = uuid
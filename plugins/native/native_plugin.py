@@ -16,13 +16,14 @@
 import sys
 import os
 import uuid
+import copy
 import psutil
 import json
-from fog05.interfaces.States import State
+from fog05.interfaces.States import State, STATUS
+from fog05 import Tracing
 from fog05.interfaces.RuntimePlugin import *
 from NativeEntity import NativeEntity
 from NativeEntityInstance import NativeEntityInstance
-from jinja2 import Environment
 import time
 
 
@@ -33,8 +34,9 @@ class Native(RuntimePlugin):
         super(Native, self).__init__(version, plugin_uuid)
         self.name = name
         self.agent = agent
+        self.logger = self.agent.logger.component(name)
         self.operating_system = self.agent.get_os_plugin().name
-        self.agent.logger.info('__init__()', ' Hello from Native Plugin - Running on {}'.format(self.operating_system))
+        self.logger.info('__init__()', ' Hello from Native Plugin - Running on {}'.format(self.operating_system))
         self.HOME = 'runtime/{}/entity'.format(self.uuid)
         self.INSTANCE = 'instance'
         file_dir = os.path.dirname(__file__)
@@ -42,14 +44,16 @@ class Native(RuntimePlugin):
         self.BASE_DIR = os.path.join(self.agent.base_path, 'native')
         self.LOG_DIR = 'logs'
         self.STORE_DIR = 'apps'
+        self.entities_info = {}
+        self.instances_info = {}
 
         self.start_runtime()
 
     def start_runtime(self):
 
         uri = '{}/{}/**'.format(self.agent.dhome, self.HOME)
-        self.agent.logger.info('startRuntime()', ' Native Plugin - Observing {}'.format(uri))
-        self.agent.dstore.observe(uri, self.__react_to_cache)
+        self.logger.info('startRuntime()', ' Native Plugin - Observing {}'.format(uri))
+        self.agent.dstore.observe(uri, Tracing.traced(self.__react_to_cache))
 
         if self.agent.get_os_plugin().dir_exists(self.BASE_DIR):
             if not self.agent.get_os_plugin().dir_exists(os.path.join(self.BASE_DIR, self.STORE_DIR)):
@@ -64,7 +68,7 @@ class Native(RuntimePlugin):
         return self.uuid
 
     def stop_runtime(self):
-        self.agent.logger.info('stopRuntime()', ' Native Plugin - Destroy running BE')
+        self.logger.info('stopRuntime()', ' Native Plugin - Destroy running BE')
         for k in list(self.current_entities.keys()):
             entity = self.current_entities.get(k)
             for i in list(entity.instances.keys()):
@@ -83,9 +87,47 @@ class Native(RuntimePlugin):
             #     self.undefine_entity(k)
             if entity.get_state() == State.DEFINED:
                 self.undefine_entity(k)
-        self.agent.logger.info('stopRuntime()', '[ DONE ] Native Plugin - Bye')
+        self.logger.info('stopRuntime()', '[ DONE ] Native Plugin - Bye')
         return True
 
+    def restore_runtime(self):
+        if self.agent.state is None:
+            return
+        self.logger.info('restore_runtime()', ' Native Plugin - Restoring state from local snapshot')
+        for k, record in self.agent.state.get_all(self.uuid, 'entity').items():
+            data = record.get('data')
+            entity = NativeEntity(k, data.get('name'), data.get('command'), data.get('source_url'), data.get('args'),
+                                  data.get('outfile'))
+            entity.source = data.get('source')
+            entity.set_state(State.DEFINED)
+            self.current_entities.update({k: entity})
+            self.__update_actual_store(k, record.get('info'))
+
+        for k, record in self.agent.state.get_all(self.uuid, 'instance').items():
+            entity_uuid = record.get('entity_uuid')
+            entity = self.current_entities.get(entity_uuid, None)
+            if entity is None:
+                self.logger.warning('restore_runtime()', '[ WARN ] Native Plugin - Instance {} is gone, dropping it'.format(k))
+                self.agent.state.remove(self.uuid, 'instance', k)
+                continue
+            data = record.get('data')
+            instance = NativeEntityInstance(k, data.get('name'), entity.shared('command', data.get('command')),
+                                            entity.shared('source', data.get('source')), entity.shared('args', data.get('args')),
+                                            data.get('outfile'), entity_uuid)
+            instance.on_configured()
+            pid = data.get('pid', -1)
+            if pid > 0 and self.agent.get_os_plugin().check_if_pid_exists(pid):
+                instance.on_start(pid, None)
+            entity.add_instance(instance)
+            state = instance.get_state()
+            info = record.get('info')
+            if state.name != record.get('state'):
+                self.logger.info('restore_runtime()', ' Native Plugin - Instance {} was {} now is {}'.format(k, record.get('state'), state.name))
+                info.update({'status': 'stop'})
+            self.__update_actual_store_instance(entity_uuid, k, info)
+
+        self.logger.info('restore_runtime()', '[ DONE ] Native Plugin - Restored {} entities'.format(len(self.current_entities)))
+
     def define_entity(self, *args, **kwargs):
 
         if len(kwargs) > 0:
@@ -97,7 +139,7 @@ class Native(RuntimePlugin):
         else:
             return None
 
-        self.agent.logger.info('defineEntity()', ' Native Plugin - Define BE')
+        self.logger.info('defineEntity()', ' Native Plugin - Define BE')
 
         if entity.source_url is not None and entity.source_url.startswith('http'):
             zip_name = entity.source_url.split('/')[-1]
@@ -124,373 +166,308 @@ class Native(RuntimePlugin):
         else:
             entity.source = None
 
+        t = self.states.begin('define', entity, entity_uuid)
         entity.set_state(State.DEFINED)
         self.current_entities.update({entity_uuid: entity})
         uri = '{}/{}/{}'.format(self.agent.dhome, self.HOME, entity_uuid)
         na_info = json.loads(self.agent.dstore.get(uri))
-        na_info.update({'status': 'defined'})
+        na_info.update({'status': STATUS.get('define')})
         self.__update_actual_store(entity_uuid, na_info)
-        self.agent.logger.info('defineEntity()', ' Native Plugin - Defined BE uuid {}'.format(entity_uuid))
+        self.entities_info.update({entity_uuid: na_info})
+        data = {'name': entity.name, 'command': entity.command, 'source_url': entity.source_url, 'args': entity.args,
+                'outfile': entity.outfile, 'source': entity.source}
+        self.__save_state('entity', entity_uuid, {'data': data, 'info': na_info})
+        self.states.commit(t)
+        self.logger.info('defineEntity()', ' Native Plugin - Defined BE uuid {}'.format(entity_uuid))
         return entity_uuid
 
     def undefine_entity(self, entity_uuid):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('undefineEntity()', ' Native Plugin - Undefine BE uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('undefineEntity()', 'Native Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('undefineEntity()', 'Native Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            for i in list(entity.instances.keys()):
-                self.__force_entity_instance_termination(entity_uuid, i)
-            self.agent.get_os_plugin().remove_dir(os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid))
-            self.current_entities.pop(entity_uuid, None)
-            self.__pop_actual_store(entity_uuid)
-            self.agent.logger.info('undefineEntity()', '[ DONE ] Native Plugin - Undefine BE uuid {}'.format(entity_uuid))
-            return True
+        self.logger.info('undefineEntity()', ' Native Plugin - Undefine BE uuid {}'.format(entity_uuid))
+        entity = self.__get_entity('undefineEntity()', entity_uuid)
+        t = self.states.begin('undefine', entity, entity_uuid)
+        for i in list(entity.instances.keys()):
+            self.__force_entity_instance_termination(entity_uuid, i)
+        self.agent.get_os_plugin().remove_dir(os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid))
+        self.current_entities.pop(entity_uuid, None)
+        self.entities_info.pop(entity_uuid, None)
+        self.__drop_state('entity', entity_uuid)
+        self.__pop_actual_store(entity_uuid)
+        self.states.commit(t)
+        self.logger.info('undefineEntity()', '[ DONE ] Native Plugin - Undefine BE uuid {}'.format(entity_uuid))
+        return True
 
     def configure_entity(self, entity_uuid, instance_uuid=None):
 
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('configureEntity()', ' Native Plugin - Configure BE uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('configureEntity()', 'Native Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('configureEntity()', 'Native Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
+        self.logger.info('configureEntity()', ' Native Plugin - Configure BE uuid {}'.format(entity_uuid))
+        entity = self.__get_entity('configureEntity()', entity_uuid)
+        if instance_uuid is None:
+            instance_uuid = str(uuid.uuid4())
+
+        if entity.has_instance(instance_uuid):
+            print('This instance already existis!!')
         else:
-            if instance_uuid is None:
-                instance_uuid = str(uuid.uuid4())
+            t = self.states.begin('configure', None, entity_uuid, instance_uuid)
+            id = len(entity.instances)
+            name = '{0}{1}'.format(entity.name, id)
+            out_file = 'native_{}_{}.log'.format(entity_uuid, instance_uuid)
+            out_file = os.path.join(self.BASE_DIR, self.LOG_DIR, out_file)
 
-            if entity.has_instance(instance_uuid):
-                print('This instance already existis!!')
-            else:
-                id = len(entity.instances)
-                name = '{0}{1}'.format(entity.name, id)
-                out_file = 'native_{}_{}.log'.format(entity_uuid, instance_uuid)
-                out_file = os.path.join(self.BASE_DIR, self.LOG_DIR, out_file)
-
-                # uuid, name, command, source, args, outfile, entity_uuid)
-                instance = NativeEntityInstance(instance_uuid, name, entity.command, entity.source,
-                                                entity.args, out_file, entity_uuid)
-                native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
-                self.agent.get_os_plugin().create_file(instance.outfile)
-                self.agent.get_os_plugin().create_dir(native_dir)
-
-                # if entity.source is not None:
-                #     zip_name = entity.source.split('/')[-1]
-                #     self.agent.getOSPlugin().createDir(os.path.join(self.BASE_DIR, self.STORE_DIR, entity.name))
-                #     #wget_cmd = str('wget {} -O {}/{}/{}/{}' %
-                #     #               (entity.source, self.BASE_DIR, self.STORE_DIR, entity.name, zip_name))
-                #
-                #     zip_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity.name, zip_name)
-                #     dest = os.path.join(self.BASE_DIR, self.STORE_DIR, entity.name)
-                #
-                #     if self.operating_system == 'linux':
-                #         unzip_cmd = str('unzip {} -d {}' % (zip_file, dest))
-                #     elif self.operating_system == 'windows':
-                #         unzip_cmd = str('Expand-Archive -Path {} -DestinationPath {}' % (zip_file, dest))
-                #     else:
-                #         unzip_cmd = ''
-                #
-                #     self.agent.getOSPlugin().downloadFile(entity.image,
-                #                                           os.path.join(self.BASE_DIR, self.STORE_DIR, zip_name))
-                #     # self.agent.getOSPlugin().executeCommand(wget_cmd, True)
-                #     self.agent.getOSPlugin().executeCommand(unzip_cmd, True)
-
-                instance.on_configured()
-                entity.add_instance(instance)
-                self.current_entities.update({entity_uuid: entity})
-                uri = '{}/{}/{}'.format(self.agent.dhome, self.HOME, entity_uuid)
-                na_info = json.loads(self.agent.dstore.get(uri))
-                na_info.update({'status': 'configured'})
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, na_info)
-                self.agent.logger.info('configureEntity()', '[ DONE ] Native Plugin - Configure BE uuid {}'.format(instance_uuid))
-                return True
+            # uuid, name, command, source, args, outfile, entity_uuid)
+            instance = NativeEntityInstance(instance_uuid, name, entity.command, entity.source,
+                                            entity.args, out_file, entity_uuid)
+            native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
+            self.agent.get_os_plugin().create_file(instance.outfile)
+            self.agent.get_os_plugin().create_dir(native_dir)
+
+            # if entity.source is not None:
+            #     zip_name = entity.source.split('/')[-1]
+            #     self.agent.getOSPlugin().createDir(os.path.join(self.BASE_DIR, self.STORE_DIR, entity.name))
+            #     #wget_cmd = str('wget {} -O {}/{}/{}/{}' %
+            #     #               (entity.source, self.BASE_DIR, self.STORE_DIR, entity.name, zip_name))
+            #
+            #     zip_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity.name, zip_name)
+            #     dest = os.path.join(self.BASE_DIR, self.STORE_DIR, entity.name)
+            #
+            #     if self.operating_system == 'linux':
+            #         unzip_cmd = str('unzip {} -d {}' % (zip_file, dest))
+            #     elif self.operating_system == 'windows':
+            #         unzip_cmd = str('Expand-Archive -Path {} -DestinationPath {}' % (zip_file, dest))
+            #     else:
+            #         unzip_cmd = ''
+            #
+            #     self.agent.getOSPlugin().downloadFile(entity.image,
+            #                                           os.path.join(self.BASE_DIR, self.STORE_DIR, zip_name))
+            #     # self.agent.getOSPlugin().executeCommand(wget_cmd, True)
+            #     self.agent.getOSPlugin().executeCommand(unzip_cmd, True)
+
+            instance.on_configured()
+            entity.add_instance(instance)
+            self.current_entities.update({entity_uuid: entity})
+            uri = '{}/{}/{}'.format(self.agent.dhome, self.HOME, entity_uuid)
+            na_info = json.loads(self.agent.dstore.get(uri))
+            na_info.update({'status': STATUS.get('configure')})
+            self.__update_actual_store_instance(entity_uuid, instance_uuid, na_info)
+            self.states.commit(t, instance)
+            self.logger.info('configureEntity()', '[ DONE ] Native Plugin - Configure BE uuid {}'.format(instance_uuid))
+            return True
 
     def clean_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('cleanEntity()', ' Native Plugin - Clean BE uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('cleanEntity()', 'Native Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('cleanEntity()', 'Native Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('clean_entity()', 'Native Plugin - Instance not found!!')
-            else:
-                instance = entity.get_instance(instance_uuid)
-                if instance is None:
-                    self.agent.logger.error('clean_entity()',
-                                            'Instance {} not existing'.format(instance_uuid))
-                    return False
-                if instance.get_state() != State.CONFIGURED:
-                    self.agent.logger.error('clean_entity()',
-                                            'has_instance Plugin - Instance state is wrong, or transition not allowed')
-                    raise StateTransitionNotAllowedException('Instance is not in CONFIGURED state',
-                                                             'Instance {} is not in CONFIGURED state'.format(instance_uuid))
-                else:
-
-                    self.agent.get_os_plugin().remove_file(instance.outfile)
-                    native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
-                    self.agent.get_os_plugin().remove_dir(native_dir)
-
-                    # if entity.source is not None:
-                    #    entity_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, instance.name)
-                    #    self.agent.getOSPlugin().removeDir(entity_dir)
-                    instance.on_clean()
-                    entity.remove_instance(instance)
-                    self.current_entities.update({entity_uuid: entity})
-
-                    # uri = str('{}/{}/{}' % (self.agent.dhome, self.HOME, entity_uuid))
-                    # na_info = json.loads(self.agent.dstore.get(uri))
-                    # na_info.update({'status': 'cleaned'})
-                    # self.__update_actual_store(entity_uuid, na_info)
-                    self.__pop_actual_store_instance(entity_uuid, instance_uuid)
-                    self.agent.logger.info('cleanEntity()', '[ DONE ] Native Plugin - Clean BE uuid {}'.format(instance_uuid))
-                    return True
+        self.logger.info('cleanEntity()', ' Native Plugin - Clean BE uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('cleanEntity()', entity_uuid, instance_uuid)
+        if instance is not None:
+            t = self.__begin_transition('cleanEntity()', 'clean', entity_uuid, instance_uuid, instance)
+            self.agent.get_os_plugin().remove_file(instance.outfile)
+            native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
+            self.agent.get_os_plugin().remove_dir(native_dir)
+
+            # if entity.source is not None:
+            #    entity_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, instance.name)
+            #    self.agent.getOSPlugin().removeDir(entity_dir)
+            instance.on_clean()
+            entity.remove_instance(instance)
+            self.current_entities.update({entity_uuid: entity})
+
+            # uri = str('{}/{}/{}' % (self.agent.dhome, self.HOME, entity_uuid))
+            # na_info = json.loads(self.agent.dstore.get(uri))
+            # na_info.update({'status': 'cleaned'})
+            # self.__update_actual_store(entity_uuid, na_info)
+            self.__pop_actual_store_instance(entity_uuid, instance_uuid)
+            self.states.commit(t)
+            self.logger.info('cleanEntity()', '[ DONE ] Native Plugin - Clean BE uuid {}'.format(instance_uuid))
+            return True
 
     def run_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('runEntity()', ' Native Plugin - Starting BE uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('runEntity()', 'Native Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('runEntity()', 'Native Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            instance = entity.get_instance(instance_uuid)
-            if instance is None:
-                self.agent.logger.error('clean_entity()',
-                                        'Instance {} not existing'.format(instance_uuid))
-                return False
-            if instance.get_state() == State.RUNNING:
-                self.agent.logger.error('run_entity()',
-                                        'Native Plugin - Instance already running')
-                return True
-            if instance.get_state() != State.CONFIGURED:
-                self.agent.logger.error('run_entity()',
-                                        'Native Plugin - Instance state is wrong, or transition not allowed - State: {}'.format(instance.get_state()))
-                raise StateTransitionNotAllowedException('Instance is not in CONFIGURED state',
-                                                         'Instance {} is not in CONFIGURED state'.format(instance_uuid))
+        self.logger.info('runEntity()', ' Native Plugin - Starting BE uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('runEntity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return False
+        if instance.get_state() == State.RUNNING:
+            self.logger.error('run_entity()', 'Native Plugin - Instance already running')
+            return True
+        t = self.__begin_transition('runEntity()', 'run', entity_uuid, instance_uuid, instance)
+
+        if instance.source is not None:
+
+            native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
+
+            source_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid)
+
+            pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid)
+            run_script = self.__generate_run_script(instance.command, instance.args, source_dir, pid_file)
+            if self.operating_system.lower() == 'linux':
+                self.agent.get_os_plugin().store_file(run_script, native_dir, '{}_run.sh'.format(instance_uuid))
+                chmod_cmd = 'chmod +x {}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
+                self.agent.get_os_plugin().execute_command(chmod_cmd, True)
+                cmd = '{}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
+            elif self.operating_system.lower() == 'windows':
+                self.agent.get_os_plugin().store_file(run_script, native_dir, '{}_run.ps1'.format(instance_uuid))
+                cmd = '{}'.format(os.path.join(native_dir, '{}_run.ps1'.format(instance_uuid)))
             else:
+                cmd = ''
 
-                if instance.source is not None:
+            process = self.__execute_command(cmd, instance.outfile)
 
-                    native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
+            time.sleep(1)
+            pid_file = '{}.pid'.format(instance_uuid)
+            pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, pid_file)
+            pid = int(self.agent.get_os_plugin().read_file(pid_file))
+            instance.on_start(pid, process)
+        else:
+            # try to inject the pid file if script use {{pid_file}}
+            '''
 
-                    source_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid)
+            This make possible to add on the launch file of you native application that fog05 can inject the pid output file
+            in this way is possible to fog05 to correct send signal to your application, in the case the {{pid_file}} is not defined the script
+            will not be modified
 
-                    pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid)
-                    run_script = self.__generate_run_script(instance.command, instance.args, source_dir, pid_file)
-                    if self.operating_system.lower() == 'linux':
-                        self.agent.get_os_plugin().store_file(run_script, native_dir, '{}_run.sh'.format(instance_uuid))
-                        chmod_cmd = 'chmod +x {}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
-                        self.agent.get_os_plugin().execute_command(chmod_cmd, True)
-                        cmd = '{}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
-                    elif self.operating_system.lower() == 'windows':
-                        self.agent.get_os_plugin().store_file(run_script, native_dir, '{}_run.ps1'.format(instance_uuid))
-                        cmd = '{}'.format(os.path.join(native_dir, '{}_run.ps1'.format(instance_uuid)))
-                    else:
-                        cmd = ''
+            '''
+            if self.operating_system.lower() == 'linux':
+                native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
+                pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid)
+                cmd = '{} {}'.format(entity.command, ' '.join(entity.args))
+                na_script = self.render_template(os.path.join(self.DIR, 'templates', 'run_native_unix2.sh'), command=cmd, outfile=pid_file)
+                self.agent.get_os_plugin().store_file(na_script, native_dir, '{}_run.sh'.format(instance_uuid))
+                chmod_cmd = 'chmod +x {}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
+                self.agent.get_os_plugin().execute_command(chmod_cmd, True)
+                cmd = '{}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
+                # if instance.command.endswith('.sh'):
+                #     command = self.agent.get_os_plugin().read_file(instance.command)
+                #     pid_file = '{}_{}.pid'.format(os.path.join(self.BASE_DIR, entity_uuid), instance_uuid)
+                #     run_script = self.__generate_run_script(instance.command, instance.args, None, pid_file)
+                #     f_name = '{}_{}.sh'.format(entity_uuid, instance_uuid)
+                #     f_path = self.BASE_DIR
+                #     self.agent.get_os_plugin().store_file(run_script, f_path, f_name)
+                #     cmd = '{} {}'.format('{}_{}.sh'.format(os.path.join(self.BASE_DIR, entity_uuid), instance_uuid), ''.join(entity.args))
+                #     f_path = os.path.join(f_path, f_name)
+                #     self.agent.get_os_plugin().execute_command('chmod +x {}'.format(f_path))
+                # else:
+                #     native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
+                #     pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid)
+                #     template_xml = self.agent.get_os_plugin().read_file(os.path.join(self.DIR, 'templates', 'run_native_unix2.sh'))
+                #     na_script = Environment().from_string(template_xml)
+                #     cmd = '{} {}'.format(entity.command, ' '.join(entity.args))
+                #     na_script = na_script.render(command=cmd, outfile=pid_file)
+                #     self.agent.get_os_plugin().store_file(na_script, native_dir, '{}_run.sh'.format(instance_uuid))
+                #     chmod_cmd = 'chmod +x {}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
+                #     self.agent.get_os_plugin().execute_command(chmod_cmd, True)
+                #     cmd = '{}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
+            elif self.operating_system.lower() == 'windows':
 
-                    process = self.__execute_command(cmd, instance.outfile)
+                native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
+                pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid)
+                run_script = self.__generate_run_script(instance.command, instance.args, None, pid_file)
+                self.logger.info('runEntity()', '[ INFO ] PowerShell script is {}'.format(run_script))
+                self.agent.get_os_plugin().store_file(run_script, native_dir, '{}_run.ps1'.format(instance_uuid))
+                cmd = '{}'.format(os.path.join(native_dir, '{}_run.ps1'.format(instance_uuid)))
 
-                    time.sleep(1)
-                    pid_file = '{}.pid'.format(instance_uuid)
-                    pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, pid_file)
-                    pid = int(self.agent.get_os_plugin().read_file(pid_file))
-                    instance.on_start(pid, process)
-                else:
-                    # try to inject the pid file if script use {{pid_file}}
-                    '''
-
-                    This make possible to add on the launch file of you native application that fog05 can inject the pid output file
-                    in this way is possible to fog05 to correct send signal to your application, in the case the {{pid_file}} is not defined the script
-                    will not be modified
-
-                    '''
-                    if self.operating_system.lower() == 'linux':
-                        native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
-                        pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid)
-                        template_xml = self.agent.get_os_plugin().read_file(os.path.join(self.DIR, 'templates', 'run_native_unix2.sh'))
-                        na_script = Environment().from_string(template_xml)
-                        cmd = '{} {}'.format(entity.command, ' '.join(entity.args))
-                        na_script = na_script.render(command=cmd, outfile=pid_file)
-                        self.agent.get_os_plugin().store_file(na_script, native_dir, '{}_run.sh'.format(instance_uuid))
-                        chmod_cmd = 'chmod +x {}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
-                        self.agent.get_os_plugin().execute_command(chmod_cmd, True)
-                        cmd = '{}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
-                        # if instance.command.endswith('.sh'):
-                        #     command = self.agent.get_os_plugin().read_file(instance.command)
-                        #     pid_file = '{}_{}.pid'.format(os.path.join(self.BASE_DIR, entity_uuid), instance_uuid)
-                        #     run_script = self.__generate_run_script(instance.command, instance.args, None, pid_file)
-                        #     f_name = '{}_{}.sh'.format(entity_uuid, instance_uuid)
-                        #     f_path = self.BASE_DIR
-                        #     self.agent.get_os_plugin().store_file(run_script, f_path, f_name)
-                        #     cmd = '{} {}'.format('{}_{}.sh'.format(os.path.join(self.BASE_DIR, entity_uuid), instance_uuid), ''.join(entity.args))
-                        #     f_path = os.path.join(f_path, f_name)
-                        #     self.agent.get_os_plugin().execute_command('chmod +x {}'.format(f_path))
-                        # else:
-                        #     native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
-                        #     pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid)
-                        #     template_xml = self.agent.get_os_plugin().read_file(os.path.join(self.DIR, 'templates', 'run_native_unix2.sh'))
-                        #     na_script = Environment().from_string(template_xml)
-                        #     cmd = '{} {}'.format(entity.command, ' '.join(entity.args))
-                        #     na_script = na_script.render(command=cmd, outfile=pid_file)
-                        #     self.agent.get_os_plugin().store_file(na_script, native_dir, '{}_run.sh'.format(instance_uuid))
-                        #     chmod_cmd = 'chmod +x {}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
-                        #     self.agent.get_os_plugin().execute_command(chmod_cmd, True)
-                        #     cmd = '{}'.format(os.path.join(native_dir, '{}_run.sh'.format(instance_uuid)))
-                    elif self.operating_system.lower() == 'windows':
-
-                        native_dir = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name)
-                        pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid)
-                        run_script = self.__generate_run_script(instance.command, instance.args, None, pid_file)
-                        self.agent.logger.info('runEntity()', '[ INFO ] PowerShell script is {}'.format(run_script))
-                        self.agent.get_os_plugin().store_file(run_script, native_dir, '{}_run.ps1'.format(instance_uuid))
-                        cmd = '{}'.format(os.path.join(native_dir, '{}_run.ps1'.format(instance_uuid)))
-
-                    self.agent.logger.info('runEntity()', 'Command is {}'.format(cmd))
-
-                    process = self.__execute_command(cmd, instance.outfile)
-                    instance.on_start(process.pid, process)
-
-                entity.add_instance(instance)
-                self.current_entities.update({entity_uuid: entity})
-                uri = '{}/{}/{}/{}/{}'.format(self.agent.dhome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
-                na_info = json.loads(self.agent.dstore.get(uri))
-                na_info.update({'status': 'run'})
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, na_info)
-                self.agent.logger.info('runEntity()', '[ DONE ] Native Plugin - Running BE uuid {}'.format(instance_uuid))
-                return True
+            self.logger.info('runEntity()', 'Command is {}'.format(cmd))
+
+            process = self.__execute_command(cmd, instance.outfile)
+            instance.on_start(process.pid, process)
+
+        entity.add_instance(instance)
+        self.current_entities.update({entity_uuid: entity})
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.logger.info('runEntity()', '[ DONE ] Native Plugin - Running BE uuid {}'.format(instance_uuid))
+        return True
 
     def stop_entity(self, entity_uuid, instance_uuid=None):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('stopEntity()', ' Native Plugin - Stop BE uuid {}'.format(entity_uuid))
-        entity = self.current_entities.get(entity_uuid, None)
-        if entity is None:
-            self.agent.logger.error('stopEntity()', 'Native Plugin - Entity not exists')
-            raise EntityNotExistingException('Enitity not existing',
-                                             'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
-        elif entity.get_state() != State.DEFINED:
-            self.agent.logger.error('stopEntity()', 'Native Plugin - Entity state is wrong, or transition not allowed')
-            raise StateTransitionNotAllowedException('Entity is not in DEFINED state',
-                                                     'Entity {} is not in DEFINED state'.format(entity_uuid))
-        else:
-            instance = entity.get_instance(instance_uuid)
-            if instance.get_state() != State.RUNNING:
-                self.agent.logger.error('clean_entity()',
-                                        'Native Plugin - Instance state is wrong, or transition not allowed')
-                raise StateTransitionNotAllowedException('Instance is not in RUNNING state',
-                                                         'Instance {} is not in RUNNING state'.format(instance_uuid))
-            else:
-                pid_file = '{}.pid'.format(os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid))
+        self.logger.info('stopEntity()', ' Native Plugin - Stop BE uuid {}'.format(entity_uuid))
+        entity, instance = self.__get_instance('stopEntity()', entity_uuid, instance_uuid)
+        if instance is None:
+            return False
+        t = self.__begin_transition('stopEntity()', 'stop', entity_uuid, instance_uuid, instance)
+
+        pid_file = '{}.pid'.format(os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, instance_uuid))
+        pid = int(self.agent.get_os_plugin().read_file(pid_file))
+        self.logger.info('stopEntity()', 'FILE PID: {}'.format(pid))
+
+        proc = psutil.Process(pid)
+        proc.terminate()
+        # os.system("sudo kill -15 {}".format(p.pid))
+        self.logger.info('stopEntity()', 'Sended sigterm - Sleep 3 seconds')
+        # self.logger.info('stopEntity()', 'sigterm - sudo kill -15 {}'.format(pid))
+
+        cmd = '{} {}'.format(entity.command, ' '.join(str(x) for x in entity.args))
+        time.sleep(3)
+        if instance.source is None and proc.is_running():
+
+            self.logger.info('stopEntity()', 'FILE PID: {}'.format(pid))
+            self.logger.info('stopEntity()', 'Instance source is none')
+            self.logger.info('stopEntity()', 'Native Plugin - PID {}'.format(pid))
+            self.logger.info('stopEntity()', 'Still Alive - Sending sigint - Sleep 2 seconds')
+            proc.send_signal(2)
+            f_name = '{}_{}.pid'.format(entity_uuid, instance_uuid)
+            f_path = self.BASE_DIR
+            time.sleep(2)
+            if proc.is_running():
+                self.logger.info('stopEntity()', 'Still Alive!!!!! - Sending sigkill')
+                proc.kill()
+
+            pid_file = os.path.join(f_path, f_name)
+            self.logger.info('stopEntity()', 'Check if PID file exists {}'.format(pid_file))
+            if self.agent.get_os_plugin().file_exists(pid_file):
                 pid = int(self.agent.get_os_plugin().read_file(pid_file))
-                self.agent.logger.info('stopEntity()', 'FILE PID: {}'.format(pid))
-
-                proc = psutil.Process(pid)
-                proc.terminate()
-                # os.system("sudo kill -15 {}".format(p.pid))
-                self.agent.logger.info('stopEntity()', 'Sended sigterm - Sleep 3 seconds')
-                # self.agent.logger.info('stopEntity()', 'sigterm - sudo kill -15 {}'.format(pid))
+                self.logger.info('stopEntity()', 'Native Plugin - PID {}'.format(pid))
+                self.agent.get_os_plugin().execute_command('sudo pkill -9 -P {}'.format(pid))
+                if self.agent.get_os_plugin().check_if_pid_exists(pid):
+                    self.agent.get_os_plugin().send_sig_int(pid)
+                    time.sleep(3)
+                if self.agent.get_os_plugin().check_if_pid_exists(pid):
+                    self.agent.get_os_plugin().send_sig_kill(pid)
+
+            pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, '{}.pid'.format(instance_uuid))
+            self.logger.info('stopEntity()', 'Check if PID file exists {}'.format(pid_file))
+            if self.agent.get_os_plugin().file_exists(pid_file):
+                pid = int(self.agent.get_os_plugin().read_file(pid_file))
+                self.logger.info('stopEntity()', 'Native Plugin - PID {}'.format(pid))
+                self.agent.get_os_plugin().execute_command('sudo pkill -9 -P {}'.format(pid))
+                if self.agent.get_os_plugin().check_if_pid_exists(pid):
+                    self.agent.get_os_plugin().send_sig_int(pid)
+                    time.sleep(3)
+                if self.agent.get_os_plugin().check_if_pid_exists(pid):
+                    self.agent.get_os_plugin().send_sig_kill(pid)
 
-                cmd = '{} {}'.format(entity.command, ' '.join(str(x) for x in entity.args))
+        else:
+            self.logger.info('stopEntity()', 'Instance source is not none')
+            pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, '{}.pid'.format(instance_uuid))
+            pid = int(self.agent.get_os_plugin().read_file(pid_file))
+            if self.operating_system.lower == 'linux':
+                self.logger.info('stopEntity()', 'Native Plugin - PID {}'.format(pid))
+                self.agent.get_os_plugin().execute_command('sudo pkill -9 -P {}'.format(pid))
+            if self.agent.get_os_plugin().check_if_pid_exists(pid):
+                self.agent.get_os_plugin().send_sig_int(pid)
                 time.sleep(3)
-                if instance.source is None and proc.is_running():
-
-                    self.agent.logger.info('stopEntity()', 'FILE PID: {}'.format(pid))
-                    self.agent.logger.info('stopEntity()', 'Instance source is none')
-                    self.agent.logger.info('stopEntity()', 'Native Plugin - PID {}'.format(pid))
-                    self.agent.logger.info('stopEntity()', 'Still Alive - Sending sigint - Sleep 2 seconds')
-                    proc.send_signal(2)
-                    f_name = '{}_{}.pid'.format(entity_uuid, instance_uuid)
-                    f_path = self.BASE_DIR
-                    time.sleep(2)
-                    if proc.is_running():
-                        self.agent.logger.info('stopEntity()', 'Still Alive!!!!! - Sending sigkill')
-                        proc.kill()
-
-                    pid_file = os.path.join(f_path, f_name)
-                    self.agent.logger.info('stopEntity()', 'Check if PID file exists {}'.format(pid_file))
-                    if self.agent.get_os_plugin().file_exists(pid_file):
-                        pid = int(self.agent.get_os_plugin().read_file(pid_file))
-                        self.agent.logger.info('stopEntity()', 'Native Plugin - PID {}'.format(pid))
-                        self.agent.get_os_plugin().execute_command('sudo pkill -9 -P {}'.format(pid))
-                        if self.agent.get_os_plugin().check_if_pid_exists(pid):
-                            self.agent.get_os_plugin().send_sig_int(pid)
-                            time.sleep(3)
-                        if self.agent.get_os_plugin().check_if_pid_exists(pid):
-                            self.agent.get_os_plugin().send_sig_kill(pid)
-
-                    pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, '{}.pid'.format(instance_uuid))
-                    self.agent.logger.info('stopEntity()', 'Check if PID file exists {}'.format(pid_file))
-                    if self.agent.get_os_plugin().file_exists(pid_file):
-                        pid = int(self.agent.get_os_plugin().read_file(pid_file))
-                        self.agent.logger.info('stopEntity()', 'Native Plugin - PID {}'.format(pid))
-                        self.agent.get_os_plugin().execute_command('sudo pkill -9 -P {}'.format(pid))
-                        if self.agent.get_os_plugin().check_if_pid_exists(pid):
-                            self.agent.get_os_plugin().send_sig_int(pid)
-                            time.sleep(3)
-                        if self.agent.get_os_plugin().check_if_pid_exists(pid):
-                            self.agent.get_os_plugin().send_sig_kill(pid)
+            if self.agent.get_os_plugin().check_if_pid_exists(pid):
+                self.agent.get_os_plugin().send_sig_kill(pid)
 
-                else:
-                    self.agent.logger.info('stopEntity()', 'Instance source is not none')
-                    pid_file = os.path.join(self.BASE_DIR, self.STORE_DIR, entity_uuid, instance.name, '{}.pid'.format(instance_uuid))
-                    pid = int(self.agent.get_os_plugin().read_file(pid_file))
-                    if self.operating_system.lower == 'linux':
-                        self.agent.logger.info('stopEntity()', 'Native Plugin - PID {}'.format(pid))
-                        self.agent.get_os_plugin().execute_command('sudo pkill -9 -P {}'.format(pid))
-                    if self.agent.get_os_plugin().check_if_pid_exists(pid):
-                        self.agent.get_os_plugin().send_sig_int(pid)
-                        time.sleep(3)
-                    if self.agent.get_os_plugin().check_if_pid_exists(pid):
-                        self.agent.get_os_plugin().send_sig_kill(pid)
-
-                instance.on_stop()
-                self.current_entities.update({entity_uuid: entity})
-                uri = '{}/{}/{}/{}/{}'.format(self.agent.dhome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
-                na_info = json.loads(self.agent.dstore.get(uri))
-                na_info.update({'status': 'stop'})
-                self.__update_actual_store_instance(entity_uuid, instance_uuid, na_info)
-                self.agent.logger.info('stopEntity()', '[ DONE ] Native Plugin - Stopped BE uuid {}'.format(instance_uuid))
-                return True
+        instance.on_stop()
+        self.current_entities.update({entity_uuid: entity})
+        self.__commit_transition(entity_uuid, instance_uuid, t)
+        self.logger.info('stopEntity()', '[ DONE ] Native Plugin - Stopped BE uuid {}'.format(instance_uuid))
+        return True
 
     def pause_entity(self, entity_uuid, instance_uuid=None):
-        self.agent.logger.warning('pauseEntity()', 'Native Plugin - Cannot pause a BE')
+        self.logger.warning('pauseEntity()', 'Native Plugin - Cannot pause a BE')
         return False
 
     def resume_entity(self, entity_uuid, instance_uuid=None):
-        self.agent.logger.warning('resumeEntity()', 'Native Plugin - Cannot resume a BE')
+        self.logger.warning('resumeEntity()', 'Native Plugin - Cannot resume a BE')
         return False
 
     def __update_actual_store(self, uri, value):
         uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, uri)
-        value = json.dumps(value)
+        value = json.dumps(Tracing.stamp(value))
         self.agent.astore.put(uri, value)
 
     def __pop_actual_store(self, uri, ):
@@ -498,14 +475,74 @@ class Native(RuntimePlugin):
         self.agent.astore.remove(uri)
 
     def __update_actual_store_instance(self, entity_uuid, instance_uuid, value):
+        entity = self.current_entities.get(entity_uuid, None)
+        if entity is not None and entity.has_instance(instance_uuid):
+            instance = entity.get_instance(instance_uuid)
+            data = {'name': instance.name, 'command': instance.command, 'source': instance.source, 'args': instance.args,
+                    'outfile': instance.outfile, 'pid': instance.pid}
+            self.__save_state('instance', instance_uuid, {'entity_uuid': entity_uuid, 'data': data,
+                                                          'state': instance.get_state().name, 'info': value})
+        self.instances_info.update({instance_uuid: value})
         uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
-        value = json.dumps(value)
+        value = json.dumps(Tracing.stamp(value))
         self.agent.astore.put(uri, value)
 
     def __pop_actual_store_instance(self, entity_uuid, instance_uuid, ):
+        self.__drop_state('instance', instance_uuid)
+        self.instances_info.pop(instance_uuid, None)
         uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
         self.agent.astore.remove(uri)
 
+    def __get_entity(self, caller, entity_uuid):
+        entity = self.current_entities.get(entity_uuid, None)
+        if entity is None:
+            self.logger.error(caller, 'Native Plugin - Entity not exists')
+            raise EntityNotExistingException('Enitity not existing', 'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
+        if entity.get_state() != State.DEFINED:
+            self.logger.error(caller, 'Native Plugin - Entity state is wrong, or transition not allowed')
+            raise StateTransitionNotAllowedException('Entity is not in DEFINED state', 'Entity {} is not in DEFINED state'.format(entity_uuid))
+        return entity
+
+    def __get_instance(self, caller, entity_uuid, instance_uuid):
+        entity = self.__get_entity(caller, entity_uuid)
+        if instance_uuid is None or not entity.has_instance(instance_uuid):
+            self.logger.error(caller, 'Native Plugin - Instance {} not existing'.format(instance_uuid))
+            return entity, None
+        return entity, entity.get_instance(instance_uuid)
+
+    def __begin_transition(self, caller, action, entity_uuid, instance_uuid, instance):
+        try:
+            return self.states.begin(action, instance, entity_uuid, instance_uuid)
+        except StateTransitionNotAllowedException:
+            self.logger.error(caller, 'Native Plugin - Instance state is wrong, or transition not allowed - State: {}'.format(instance.get_state()))
+            raise
+
+    def __commit_transition(self, entity_uuid, instance_uuid, transition):
+        # the status is merged in the last document written for the instance and put once
+        na_info = self.__actual_info(entity_uuid, instance_uuid)
+        na_info.update({'status': STATUS.get(transition.action)})
+        self.__update_actual_store_instance(entity_uuid, instance_uuid, na_info)
+        self.states.commit(transition)
+
+    def __actual_info(self, entity_uuid, instance_uuid=None):
+        if instance_uuid is None:
+            info = self.entities_info.get(entity_uuid, None)
+            uri = '{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid)
+        else:
+            info = self.instances_info.get(instance_uuid, None)
+            uri = '{}/{}/{}/{}/{}'.format(self.agent.ahome, self.HOME, entity_uuid, self.INSTANCE, instance_uuid)
+        if info is None:
+            return json.loads(self.agent.astore.get(uri))
+        return copy.deepcopy(info)
+
+    def __save_state(self, kind, key, value):
+        if self.agent.state is not None:
+            self.agent.state.put(self.uuid, kind, key, value)
+
+    def __drop_state(self, kind, key):
+        if self.agent.state is not None:
+            self.agent.state.remove(self.uuid, kind, key)
+
     def __execute_command(self, command, out_file):
         f = open(out_file, 'w')
         if self.operating_system.lower() == 'windows':
@@ -513,44 +550,39 @@ class Native(RuntimePlugin):
         else:
             # cmd = 'sh -c {}'.format(command)
             cmd_splitted = command.split()
-            self.agent.logger.info('__execute_command()', 'CMD SPLIT = {}'.format(cmd_splitted))
+            self.logger.info('__execute_command()', 'CMD SPLIT = {}'.format(cmd_splitted))
             p = psutil.Popen(cmd_splitted, shell=False, stdout=f, stderr=f)
-        self.agent.logger.info('__execute_command()', 'PID = {}'.format(p.pid))
+        self.logger.info('__execute_command()', 'PID = {}'.format(p.pid))
         return p
 
     def __generate_run_script(self, cmd, args, directory, outfile):
         if self.operating_system.lower() == 'windows':
             if len(args) == 0:
-                self.agent.logger.info('__generate_run_script()', ' Native Plugin - Generating run script for Windows')
-                template_script = self.agent.get_os_plugin().read_file(os.path.join(self.DIR, 'templates', 'run_native_windows.ps1'))
-                na_script = Environment().from_string(template_script)
+                self.logger.info('__generate_run_script()', ' Native Plugin - Generating run script for Windows')
                 if directory:
                     cmd = os.path.join(directory,cmd)
-                na_script = na_script.render(command=cmd, outfile=outfile)
+                na_script = self.render_template(os.path.join(self.DIR, 'templates', 'run_native_windows.ps1'), command=cmd, outfile=outfile)
             else:
                 args = json.dumps(args)[1:-1]
-                template_script = self.agent.get_os_plugin().read_file(os.path.join(self.DIR, 'templates', 'run_native_windows_args.ps1'))
-                na_script = Environment().from_string(template_script)
                 if directory:
                     cmd = os.path.join(directory, cmd)
-                na_script = na_script.render(command=cmd,args_list=args, outfile=outfile)
+                na_script = self.render_template(os.path.join(self.DIR, 'templates', 'run_native_windows_args.ps1'),
+                                                 command=cmd, args_list=args, outfile=outfile)
 
         else:
-            self.agent.logger.info('__generate_run_script()', ' Native Plugin - Generating run script for Linux')
-            template_script = self.agent.get_os_plugin().read_file(os.path.join(self.DIR, 'templates', 'run_native_unix.sh'))
-            na_script = Environment().from_string(template_script)
+            self.logger.info('__generate_run_script()', ' Native Plugin - Generating run script for Linux')
             if directory:
                 cmd = os.path.join(directory, cmd)
             if len(args)>0:
                 cmd = cmd + ' {}'.format(' '.join(args))
-            na_script = na_script.render(command=cmd, outfile=outfile)
+            na_script = self.render_template(os.path.join(self.DIR, 'templates', 'run_native_unix.sh'), command=cmd, outfile=outfile)
 
 
-        self.agent.logger.info('__generate_run_script()', 'Script is {}'.format(na_script))
+        self.logger.info('__generate_run_script()', 'Script is {}'.format(na_script))
         return na_script
 
     def __react_to_cache(self, uri, value, v):
-        self.agent.logger.info('__react_to_cache()', ' Native Plugin - React to to URI: {} Value: {} Version: {}'.format(uri, value, v))
+        self.logger.debug('__react_to_cache()', ' Native Plugin - React to to URI: %s Value: %s Version: %s', uri, value, v)
         if uri.split('/')[-2] == 'entity':
             uuid = uri.split('/')[-1]
             value = json.loads(value)
@@ -558,7 +590,7 @@ class Native(RuntimePlugin):
             entity_data = value.get('entity_data')
             react_func = self.__react(action)
             if action == 'undefine':
-                self.agent.logger.info('__react_to_cache()', ' Native Plugin - This is a remove for URI: {}'.format(uri))
+                self.logger.info('__react_to_cache()', ' Native Plugin - This is a remove for URI: {}'.format(uri))
                 self.undefine_entity(uuid)
             elif react_func is not None and entity_data is None:
                 react_func(uuid)
@@ -577,7 +609,7 @@ class Native(RuntimePlugin):
             # print(type(entity_data))
             react_func = self.__react(action)
             if action == 'clean':
-                self.agent.logger.info('__react_to_cache()', ' Native Plugin - This is a remove for URI: {}'.format(uri))
+                self.logger.info('__react_to_cache()', ' Native Plugin - This is a remove for URI: {}'.format(uri))
                 self.__force_entity_instance_termination(entity_uuid, instance_uuid)
             elif react_func is not None and entity_data is None:
                 react_func(entity_uuid, instance_uuid)
@@ -598,15 +630,15 @@ class Native(RuntimePlugin):
     def __force_entity_instance_termination(self, entity_uuid, instance_uuid):
         if type(entity_uuid) == dict:
             entity_uuid = entity_uuid.get('entity_uuid')
-        self.agent.logger.info('__force_entity_instance_termination()', ' Native Plugin - Stop a BE uuid {} '.format(entity_uuid))
+        self.logger.info('__force_entity_instance_termination()', ' Native Plugin - Stop a BE uuid {} '.format(entity_uuid))
         entity = self.current_entities.get(entity_uuid, None)
         if entity is None:
-            self.agent.logger.error('__force_entity_instance_termination()', 'Native Plugin - Entity not exists')
+            self.logger.error('__force_entity_instance_termination()', 'Native Plugin - Entity not exists')
             raise EntityNotExistingException('Native not existing',
                                              'Entity {} not in runtime {}'.format(entity_uuid, self.uuid))
         else:
             if instance_uuid is None or not entity.has_instance(instance_uuid):
-                self.agent.logger.error('__force_entity_instance_termination()', 'Native Plugin - Instance not found!!')
+                self.logger.error('__force_entity_instance_termination()', 'Native Plugin - Instance not found!!')
             else:
                 instance = entity.get_instance(instance_uuid)
                 if instance.get_state() == State.PAUSED:
@@ -33,7 +33,8 @@ class Windows(OSPlugin):
         super(Windows, self).__init__(version, plugin_uuid)
         self.name = name
         self.agent = agent
-        self.agent.logger.info('__init__()', ' Hello from Windows Plugin')
+        self.logger = self.agent.logger.component(name)
+        self.logger.info('__init__()', ' Hello from Windows Plugin')
         file_dir = os.path.dirname(__file__)
         self.DIR = os.path.abspath(file_dir)
         self.io_devices = []
@@ -48,7 +49,7 @@ class Windows(OSPlugin):
         return 'C:\\opt\\fos'
 
     def execute_command(self, command, blocking=False):
-        self.agent.logger.info(
+        self.logger.info(
             'executeCommand()', 'OS Plugin executing command {}'.format(command))
         cmd_splitted = command.split()
         p = psutil.Popen(cmd_splitted, stdout=PIPE)
@@ -56,16 +57,16 @@ class Windows(OSPlugin):
             p.wait()
 
         for line in p.stdout:
-            self.agent.logger.debug('executeCommand()', line)
+            self.logger.debug('executeCommand()', line)
 
     def add_know_host(self, hostname, ip):
-        self.agent.logger.info('addKnowHost()', ' OS Plugin add to hosts file')
+        self.logger.info('addKnowHost()', ' OS Plugin add to hosts file')
         add_cmd = 'runas /noprofile /user:Administrator {} add {} {}'.format(os.path.join(self.DIR, 'scripts',
                                                                                           'manage_hosts.ps1'), hostname, ip)
         self.execute_command(add_cmd, True)
 
     def remove_know_host(self, hostname):
-        self.agent.logger.info(
+        self.logger.info(
             'removeKnowHost()', ' OS Plugin remove from hosts file')
         del_cmd = 'runas /noprofile /user:Administrator {} remove {}'.format(os.path.join(self.DIR, 'scripts',
                                                                                           'manage_hosts.sh'), hostname)
@@ -91,7 +92,7 @@ class Windows(OSPlugin):
         try:
             return os.remove(path)
         except FileNotFoundError as e:
-            self.agent.logger.error(
+            self.logger.error(
                 'removeFile()', "OS Plugin File Not Found {} so don't need to remove".format(e.strerror))
             return
 
@@ -150,7 +151,7 @@ class Windows(OSPlugin):
 
     def send_signal(self, signal, pid):
         if self.checkIfPidExists(pid) is False:
-            self.agent.logger.error(
+            self.logger.error(
                 'sendSignal()', 'OS Plugin Process not exists {}'.format(pid))
             raise ProcessNotExistingException(
                 "Process {} not exists".format(pid))
@@ -160,7 +161,7 @@ class Windows(OSPlugin):
 
     def send_sig_int(self, pid):
         if self.checkIfPidExists(pid) is False:
-            self.agent.logger.error(
+            self.logger.error(
                 'sendSigInt()', 'OS Plugin Process not exists {}'.format(pid))
             raise ProcessNotExistingException(
                 "Process {} not exists".format(pid))
@@ -170,7 +171,7 @@ class Windows(OSPlugin):
 
     def send_sig_kill(self, pid):
         if self.checkIfPidExists(pid) is False:
-            self.agent.logger.error(
+            self.logger.error(
                 'sendSigInt()', 'OS Plugin Process not exists {}'.format(pid))
             raise ProcessNotExistingException(
                 "Process {} not exists".format(pid))
@@ -224,7 +225,7 @@ class Windows(OSPlugin):
                 disks.append({'local_address': dev, 'dimension': dim,
                               'mount_point': mount, 'filesystem': fs})
             except PermissionError as e:
-                self.agent.logger.error(
+                self.logger.error(
                     'getDisksInformation()', 'Device {} not ready'.format(mount))
             finally:
                 pass
@@ -369,7 +370,7 @@ class Windows(OSPlugin):
 
         default_gw = self.__get_default_gw()
         if default_gw == "":
-            self.agent.logger.warning(
+            self.logger.warning(
                 '__get_nw_devices()', 'Default gw not found!!')
         for k in intfs:
             intf_info = psutil.net_if_addrs().get(k)